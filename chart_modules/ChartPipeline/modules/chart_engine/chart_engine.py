@@ -7,7 +7,7 @@ from logging import getLogger
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from modules.chart_engine.template.template_registry import get_template_for_chart_type, get_template_for_chart_name
-from modules.chart_engine.utils.load_charts import render_chart_to_svg
+from modules.chart_engine.utils.load_charts import render_chart_to_svg, render_charts_to_svg
 from modules.chart_engine.utils.file_utils import create_temp_file, cleanup_temp_file, ensure_temp_dir, create_fallback_svg
 import importlib
 
@@ -224,6 +224,60 @@ def process(input: str, output: str, chart_name: str = None, html_output: str =
         logger.error(f"Error in chart generation process: {e}")
         return False
 
+def process_batch(inputs, outputs, chart_name: str = None) -> list:
+    """
+    批量处理多个文件的图表生成，所有浏览器渲染的图表在同一批次中完成
+    
+    Args:
+        inputs: 输入JSON文件路径列表
+        outputs: 输出SVG文件路径列表，与inputs一一对应
+        chart_name: 图表名称（可选），为None时从每个JSON中读取
+        
+    Returns:
+        list: 与inputs一一对应的处理结果
+    """
+    results = [False] * len(inputs)
+    jobs = []
+    job_indices = []
+    
+    for index, (input, output) in enumerate(zip(inputs, outputs)):
+        try:
+            json_data = load_data_from_json(input)
+        except Exception as e:
+            logger.error(f"Error loading JSON data from {input}: {e}")
+            continue
+        
+        name = chart_name or json_data.get("chart_name", "horizontal_group_bar_chart_16")
+        engine, template = get_template_for_chart_name(name)
+        if engine is None:
+            logger.error(f"No template found for chart name '{name}'")
+            continue
+        
+        # VegaLite不经过浏览器，沿用单文件流程
+        if engine == 'vegalite_py':
+            results[index] = process(input=input, output=output, chart_name=name)
+            continue
+        
+        framework, framework_type = ('d3', 'js') if engine == 'd3-js' else \
+            ('echarts', 'py') if engine == 'echarts_py' else ('echarts', 'js')
+        jobs.append({
+            'json_data': json_data,
+            'output_svg_path': output,
+            'js_file': template,
+            'width': json_data.get("variables", {}).get("width", 1200),
+            'height': json_data.get("variables", {}).get("height", 800),
+            'framework': framework,
+            'framework_type': framework_type
+        })
+        job_indices.append(index)
+    
+    svg_files = render_charts_to_svg(jobs)
+    for index, svg_file in zip(job_indices, svg_files):
+        results[index] = svg_file is not None and os.path.exists(svg_file)
+        if not results[index]:
+            logger.error(f"Error: No SVG file was generated for {inputs[index]}")
+    return results
+
 def parse_arguments():
     """
     Parse command-line arguments
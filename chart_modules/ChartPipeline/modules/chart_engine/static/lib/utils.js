@@ -380,4 +380,101 @@ const formatValue = (value) => {
         console.log("formatValue", value, d3.format("~g")(value));
         return d3.format("~g")(value);
     }
-}
\ No newline at end of file
+}
+
+// 标记图表渲染完成：设置window.__chartReady并派发'chart-ready'事件，供渲染器和注入脚本等待
+const markChartReady = () => {
+    if (window.__chartReady) return;
+    window.__chartReady = true;
+    document.dispatchEvent(new Event('chart-ready'));
+};
+
+// 调用makeChart并在绘制真正完成后发出完成信号，替代固定的setTimeout等待
+// 完成条件：makeChart返回（若返回Promise则等待其resolve）、绘制期间注册的短定时器全部执行完毕、
+// 之后再等待两帧让布局稳定。超过maxWait毫秒仍未完成时按当前状态发出信号（仅作兜底）
+const renderChartWithSignal = (makeChartFn, containerSelector, data, options = {}) => {
+    const maxTimerDelay = options.maxTimerDelay ?? 2000;
+    const maxWait = options.maxWait ?? 10000;
+
+    const nativeSetTimeout = window.setTimeout;
+    const nativeClearTimeout = window.clearTimeout;
+    const pendingTimers = new Set();
+    let drawn = false;
+    let resolveTimers;
+    const timersDone = new Promise(resolve => { resolveTimers = resolve; });
+    const checkTimers = () => {
+        if (drawn && pendingTimers.size === 0) resolveTimers();
+    };
+
+    // 跟踪模板在绘制期间注册的定时器（包括定时器回调中再注册的定时器）
+    window.setTimeout = function(fn, delay, ...args) {
+        if (typeof fn !== 'function' || (delay || 0) > maxTimerDelay) {
+            return nativeSetTimeout(fn, delay, ...args);
+        }
+        const id = nativeSetTimeout(() => {
+            pendingTimers.delete(id);
+            try {
+                fn(...args);
+            } finally {
+                checkTimers();
+            }
+        }, delay);
+        pendingTimers.add(id);
+        return id;
+    };
+    window.clearTimeout = function(id) {
+        nativeClearTimeout(id);
+        if (pendingTimers.delete(id)) checkTimers();
+    };
+
+    const restoreTimers = () => {
+        window.setTimeout = nativeSetTimeout;
+        window.clearTimeout = nativeClearTimeout;
+    };
+    const nextFrames = () => new Promise(resolve => {
+        // 后台页面可能不触发requestAnimationFrame，用短定时器兜底
+        const fallback = nativeSetTimeout(resolve, 50);
+        requestAnimationFrame(() => requestAnimationFrame(() => {
+            nativeClearTimeout(fallback);
+            resolve();
+        }));
+    });
+
+    let result;
+    try {
+        result = makeChartFn(containerSelector, data);
+    } catch (e) {
+        console.error("Error creating chart:", e);
+    }
+
+    const finished = Promise.resolve(result)
+        .catch(e => console.error("Error creating chart:", e))
+        .then(() => {
+            drawn = true;
+            checkTimers();
+            return timersDone;
+        })
+        .then(nextFrames);
+    let timeoutId;
+    const timeout = new Promise(resolve => {
+        timeoutId = nativeSetTimeout(() => {
+            console.warn(`Chart did not signal completion within ${maxWait}ms`);
+            resolve();
+        }, maxWait);
+    });
+
+    return Promise.race([finished, timeout]).then(() => {
+        nativeClearTimeout(timeoutId);
+        restoreTimers();
+        const svg = document.querySelector(`${containerSelector} svg`);
+        if (svg && !document.querySelector('#svg-output')) {
+            // 创建一个包含SVG内容的容器供提取使用
+            const svgContainer = document.createElement('div');
+            svgContainer.id = 'svg-output';
+            svgContainer.style.display = 'none';
+            svgContainer.innerHTML = svg.outerHTML;
+            document.body.appendChild(svgContainer);
+        }
+        markChartReady();
+    });
+};
@@ -1,9 +1,13 @@
 import os
 import re
 import json
+import hashlib
+import logging
 import importlib.util
 import random
 
+logger = logging.getLogger(__name__)
+
 # Regular expression to extract requirements JSON from template files
 REQUIREMENTS_PATTERN = re.compile(r'REQUIREMENTS_BEGIN\s*({.*?})\s*REQUIREMENTS_END', re.DOTALL)
 
@@ -18,6 +22,58 @@ templates = {
 # 全局标识符，用于跟踪是否已扫描过模板
 _templates_scanned = False
 
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 模板清单：记录每个模板文件的修改时间、大小、SHA256和解析出的REQUIREMENTS。
+# 再次扫描时只stat文件，未变化的文件直接使用清单中的结果，不再读取和解析。可通过环境变量配置：
+#   TEMPLATE_MANIFEST=0 禁用清单，每次扫描都读取所有模板
+#   TEMPLATE_MANIFEST_PATH 清单文件路径（默认为模板目录下的 templates.manifest.json）
+TEMPLATE_MANIFEST_ENABLED = os.environ.get('TEMPLATE_MANIFEST', '1') != '0'
+TEMPLATE_MANIFEST_PATH = os.environ.get('TEMPLATE_MANIFEST_PATH', os.path.join(TEMPLATE_DIR, 'templates.manifest.json'))
+# 清单格式或解析逻辑发生不兼容变化时递增，使旧清单失效
+TEMPLATE_MANIFEST_VERSION = 1
+
+# 依赖真实浏览器布局或绘制的API，使用这些API的D3模板不能在jsdom中渲染
+# （getBBox/getComputedTextLength/canvas.measureText由jsdom端的shim提供）
+BROWSER_REQUIRED_PATTERN = re.compile(
+    r'svg2roughjs|Svg2Roughjs|getBoundingClientRect|getTotalLength|getPointAtLength|'
+    r'getScreenCTM|getCTM\(|getImageData|toDataURL|drawImage|foreignObject|isPointInFill'
+)
+
+# 渲染后端缓存: file_path -> (mtime, backend)
+_render_backend_cache = {}
+
+def detect_render_backend(file_path, requirements=None):
+    """
+    判断D3模板能否在jsdom中渲染
+
+    Args:
+        file_path: 模板文件路径
+        requirements: 模板的REQUIREMENTS（可选），其中的 "render_backend" 字段优先
+
+    Returns:
+        "jsdom" 或 "browser"
+    """
+    mtime = os.path.getmtime(file_path)
+    cached = _render_backend_cache.get(file_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    if requirements is None:
+        match = REQUIREMENTS_PATTERN.search(content)
+        try:
+            requirements = json.loads(match.group(1)) if match else {}
+        except json.JSONDecodeError:
+            requirements = {}
+
+    backend = requirements.get('render_backend')
+    if backend not in ('jsdom', 'browser'):
+        backend = 'browser' if BROWSER_REQUIRED_PATTERN.search(content) else 'jsdom'
+    _render_backend_cache[file_path] = (mtime, backend)
+    return backend
+
 def load_python_template(file_path):
     """Load a Python template module from a file path"""
     module_name = os.path.basename(file_path).replace('.py', '')
@@ -26,10 +82,44 @@ def load_python_template(file_path):
     spec.loader.exec_module(module)
     return module
 
-def extract_requirements(file_path):
+class LazyTemplateModule:
+    """
+    延迟加载的Python模板
+
+    扫描时只记录文件路径，第一次访问模块属性（如 make_options）时才执行模板文件。
+    __file__ 不触发加载，渲染缓存据此计算模板摘要。
+    """
+
+    def __init__(self, file_path):
+        self.__file__ = file_path
+        self.__name__ = os.path.basename(file_path).replace('.py', '')
+        self._module = None
+
+    def load(self):
+        """加载并返回模板模块"""
+        if self._module is None:
+            self._module = load_python_template(self.__file__)
+        return self._module
+
+    def __getattr__(self, name):
+        # 只有实例上不存在的属性才会走到这里；特殊属性不触发加载（pickle、copy等会探测它们）
+        if name.startswith('__') or name == '_module':
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __reduce__(self):
+        # 传给其他进程时只传路径，在对方进程中按需加载
+        return (LazyTemplateModule, (self.__file__,))
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<LazyTemplateModule {self.__name__} from {self.__file__!r} ({state})>"
+
+def extract_requirements(file_path, content=None):
     """Extract requirements JSON from a template file"""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+    if content is None:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
     
     # Find requirements section
     match = REQUIREMENTS_PATTERN.search(content)
@@ -41,7 +131,69 @@ def extract_requirements(file_path):
             print(f"Warning: Invalid JSON in requirements section of {file_path}")
     return None
 
-def scan_directory(dir_path, engine_type, file_extension):
+def _load_manifest():
+    """读取模板清单，返回 {相对路径: 条目}；清单不存在、损坏或版本不符时返回空字典"""
+    if not TEMPLATE_MANIFEST_ENABLED:
+        return {}
+    try:
+        with open(TEMPLATE_MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # D3模板的渲染后端由BROWSER_REQUIRED_PATTERN判断，规则变化后需要重新检测
+    if manifest.get('version') != TEMPLATE_MANIFEST_VERSION or \
+            manifest.get('browser_pattern') != BROWSER_REQUIRED_PATTERN.pattern:
+        return {}
+    return manifest.get('files', {})
+
+def _save_manifest(files):
+    """原子地写入模板清单（先写临时文件再替换），多个进程同时扫描时不会读到半个文件"""
+    manifest = {
+        'version': TEMPLATE_MANIFEST_VERSION,
+        'browser_pattern': BROWSER_REQUIRED_PATTERN.pattern,
+        'files': files
+    }
+    tmp_path = f"{TEMPLATE_MANIFEST_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp_path, TEMPLATE_MANIFEST_PATH)
+    except OSError as e:
+        logger.warning(f"Failed to write template manifest {TEMPLATE_MANIFEST_PATH}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+def _manifest_entry(item_path, engine_type, stat, manifest, new_manifest):
+    """
+    获取模板文件的清单条目：修改时间和大小未变时直接复用旧条目，否则读取文件重新解析
+
+    Returns:
+        (条目, 是否重新解析)
+    """
+    rel_path = os.path.relpath(item_path, TEMPLATE_DIR)
+    cached = manifest.get(rel_path)
+    if cached and cached.get('mtime_ns') == stat.st_mtime_ns and cached.get('size') == stat.st_size:
+        new_manifest[rel_path] = cached
+        return cached, False
+
+    with open(item_path, 'rb') as f:
+        raw = f.read()
+    content = raw.decode('utf-8')
+    entry = {
+        'engine_type': engine_type,
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': hashlib.sha256(raw).hexdigest(),
+        'requirements': extract_requirements(item_path, content)
+    }
+    if engine_type == 'd3-js' and entry['requirements'] and 'chart_type' in entry['requirements']:
+        entry['render_backend'] = detect_render_backend(item_path, entry['requirements'])
+    new_manifest[rel_path] = entry
+    return entry, True
+
+def scan_directory(dir_path, engine_type, file_extension, manifest=None, new_manifest=None):
     """
     递归扫描目录及其子目录，寻找符合条件的模板文件
     
@@ -49,17 +201,27 @@ def scan_directory(dir_path, engine_type, file_extension):
         dir_path: 要扫描的目录路径
         engine_type: 引擎类型，'echarts_py', 'echarts-js' 或 'd3-js'
         file_extension: 文件扩展名，'.py' 或 '.js'
+        manifest: 上次扫描的模板清单 {相对路径: 条目}，未变化的文件直接使用其中的结果
+        new_manifest: 本次扫描得到的清单条目写入这里
+
+    Returns:
+        重新解析的文件数
     """
+    if manifest is None:
+        manifest = {}
+    if new_manifest is None:
+        new_manifest = {}
     if not os.path.exists(dir_path):
-        return
+        return 0
     
+    parsed_count = 0
     # 遍历目录中的所有文件和子目录
     for item in os.listdir(dir_path):
         item_path = os.path.join(dir_path, item)
         
         # 如果是目录，递归扫描
         if os.path.isdir(item_path):
-            scan_directory(item_path, engine_type, file_extension)
+            parsed_count += scan_directory(item_path, engine_type, file_extension, manifest, new_manifest)
         
         # 如果是符合条件的文件
         elif os.path.isfile(item_path) and item.endswith(file_extension):
@@ -67,8 +229,10 @@ def scan_directory(dir_path, engine_type, file_extension):
             if file_extension == '.py' and item.startswith('__'):
                 continue
                 
-            # 提取需求并注册模板
-            requirements = extract_requirements(item_path)
+            # 提取需求并注册模板（未变化的文件只stat，不读取）
+            entry, parsed = _manifest_entry(item_path, engine_type, os.stat(item_path), manifest, new_manifest)
+            parsed_count += parsed
+            requirements = entry['requirements']
             # if engine_type == 'vegalite_py':
             #     print(f"requirements: {requirements['chart_name']}")
             if requirements and 'chart_type' in requirements:
@@ -81,9 +245,9 @@ def scan_directory(dir_path, engine_type, file_extension):
                 if chart_type not in templates[engine_type]:
                     templates[engine_type][chart_type] = {}
                 
-                # 根据引擎类型处理不同的模板
+                # 根据引擎类型处理不同的模板，Python模板在第一次使用时才加载
                 if engine_type == 'echarts_py':
-                    template = load_python_template(item_path)
+                    template = LazyTemplateModule(item_path)
                 else:  # echarts-js 或 d3-js
                     template = item_path
                 
@@ -93,12 +257,13 @@ def scan_directory(dir_path, engine_type, file_extension):
                     'template': template,
                     'requirements': requirements
                 }
+                if engine_type == 'd3-js':
+                    backend = entry['render_backend']
+                    templates[engine_type][chart_type][chart_name]['render_backend'] = backend
+                    _render_backend_cache[item_path] = (os.path.getmtime(item_path), backend)
                     
-                # 计算相对于模板引擎主目录的路径
-                template_dir = os.path.dirname(os.path.abspath(__file__))
-                engine_dir = os.path.join(template_dir, engine_type)
-                rel_path = os.path.relpath(item_path, engine_dir)
-                # print(f"Registered {engine_type} template: {chart_type} -> {chart_name} -> {rel_path}")
+                # print(f"Registered {engine_type} template: {chart_type} -> {chart_name} -> {item_path}")
+    return parsed_count
 
 def scan_templates(force=False):
     """
@@ -119,23 +284,30 @@ def scan_templates(force=False):
     templates['echarts-js'].clear()
     templates['d3-js'].clear()
     
-    template_dir = os.path.dirname(os.path.abspath(__file__))
+    manifest = _load_manifest()
+    new_manifest = {}
+    parsed_count = 0
     
     # 扫描 echarts_py 目录及子目录
-    echarts_py_dir = os.path.join(template_dir, 'echarts_py')
-    scan_directory(echarts_py_dir, 'echarts_py', '.py')
+    echarts_py_dir = os.path.join(TEMPLATE_DIR, 'echarts_py')
+    parsed_count += scan_directory(echarts_py_dir, 'echarts_py', '.py', manifest, new_manifest)
     
     # 扫描 echarts-js 目录及子目录
-    echarts_js_dir = os.path.join(template_dir, 'echarts-js')
-    scan_directory(echarts_js_dir, 'echarts-js', '.js')
+    echarts_js_dir = os.path.join(TEMPLATE_DIR, 'echarts-js')
+    parsed_count += scan_directory(echarts_js_dir, 'echarts-js', '.js', manifest, new_manifest)
     
     # 扫描 d3-js 目录及子目录
-    d3_js_dir = os.path.join(template_dir, 'd3-js')
-    scan_directory(d3_js_dir, 'd3-js', '.js')
+    d3_js_dir = os.path.join(TEMPLATE_DIR, 'd3-js')
+    parsed_count += scan_directory(d3_js_dir, 'd3-js', '.js', manifest, new_manifest)
     
     # 扫描 vegalite_py 目录及子目录
-    vegalite_py_dir = os.path.join(template_dir, 'vegalite_py')
-    scan_directory(vegalite_py_dir, 'vegalite_py', '.py')
+    vegalite_py_dir = os.path.join(TEMPLATE_DIR, 'vegalite_py')
+    parsed_count += scan_directory(vegalite_py_dir, 'vegalite_py', '.py', manifest, new_manifest)
+    
+    # 有文件新增、修改或删除时才重写清单
+    if TEMPLATE_MANIFEST_ENABLED and (parsed_count or set(new_manifest) != set(manifest)):
+        _save_manifest(new_manifest)
+    logger.debug(f"Scanned {len(new_manifest)} template files, {parsed_count} parsed")
     
     # 标记已完成扫描
     _templates_scanned = True
@@ -252,5 +424,6 @@ if __name__ == '__main__':
         print(f"\n{engine}:")
         for chart_type, chart_names_dict in templates_dict.items():
             print(f"  - {chart_type}:")
-            for chart_name in chart_names_dict:
-                print(f"    * {chart_name}") 
\ No newline at end of file
+            for chart_name, template_info in chart_names_dict.items():
+                backend = template_info.get('render_backend')
+                print(f"    * {chart_name}" + (f" [{backend}]" if backend else "")) 
\ No newline at end of file
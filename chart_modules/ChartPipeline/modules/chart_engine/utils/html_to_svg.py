@@ -1,12 +1,148 @@
 import os
+import json
+import base64
 import subprocess
 import tempfile
 from modules.chart_engine.utils.file_utils import create_temp_file, cleanup_temp_file
+from modules.chart_engine.utils.render_pool import get_render_pool, RenderPoolError, RENDER_READY_TIMEOUT, RENDER_BATCH_SIZE
+from modules.chart_engine.utils.template_bundle import prepare_chart, get_base_page
+
+# 独立Node脚本在stdout中输出的状态行前缀
+_STATUS_MARKER = '__CHART_RENDER_STATUS__'
+
+def _write_screenshot_fallback(screenshot, output_svg, width, height):
+    """
+    Save a base64 PNG screenshot next to the output SVG and write an SVG referencing it
+    
+    Args:
+        screenshot: Base64 encoded PNG screenshot
+        output_svg: Path to save the SVG file
+        width: Width of the SVG
+        height: Height of the SVG
+    """
+    png_path = output_svg.replace('.svg', '.png')
+    with open(png_path, 'wb') as f:
+        f.write(base64.b64decode(screenshot))
+    
+    svg_content = f"""<svg width="{width}" height="{height}" xmlns="http://www.w3.org/2000/svg">
+                    <title>Chart (Fallback)</title>
+                    <desc>This is a fallback SVG using a PNG screenshot.</desc>
+                    <image href="{os.path.basename(png_path)}" width="{width}" height="{height}" />
+                </svg>"""
+    with open(output_svg, 'w', encoding='utf-8') as f:
+        f.write(svg_content)
+
+def _write_render_result(result, output_svg, width, height):
+    """
+    Write a render pool result to output_svg
+    
+    Returns:
+        (path to the SVG file or None, complete), where complete is True only for a real SVG
+        from a chart that signalled ready. Screenshot fallbacks reference a PNG next to
+        output_svg and timed-out charts may be partially drawn, so neither should be cached.
+    """
+    if result.get('svg'):
+        with open(output_svg, 'w', encoding='utf-8') as f:
+            f.write(result['svg'])
+        return output_svg, result.get('ready') is True
+    if result.get('screenshot'):
+        print('Failed to extract SVG content, using screenshot as fallback')
+        _write_screenshot_fallback(result['screenshot'], output_svg, width, height)
+        return output_svg, False
+    return None, False
+
+def _html_to_svg_with_pool(pool, html_file, output_svg, width, height):
+    """
+    Convert an HTML file to SVG using the persistent render pool
+    
+    Returns:
+        (path to the generated SVG file, complete), see _write_render_result
+    """
+    result = pool.render(html_file, width=width, height=height)
+    svg_file, complete = _write_render_result(result, output_svg, width, height)
+    if svg_file is None:
+        raise RenderPoolError("Render server returned neither SVG nor screenshot")
+    return svg_file, complete
+
+def chart_to_svg_inline(json_data, js_file, width, height, framework, framework_type='js', output_svg=None):
+    """
+    Render a chart in a render pool page that already has the chart libraries loaded.
+    Only the precompiled template (once per page) and the JSON data are injected, no HTML file is written.
+    
+    Args:
+        json_data: Chart data
+        js_file: Template file path, or the template module for echarts_py
+        width: Width of the SVG
+        height: Height of the SVG
+        framework: "echarts" or "d3"
+        framework_type: "js" or "py"
+        output_svg: Path to save the SVG file
+    
+    Returns:
+        (path to the generated SVG file, complete); the path is None when the pool is unavailable
+        or rendering failed. complete is True only for a real SVG from a chart that signalled ready.
+    """
+    pool = get_render_pool()
+    if pool is None:
+        return None, False
+    try:
+        compiled, data = prepare_chart(json_data, js_file, framework, framework_type)
+        result = pool.render_inline(get_base_page(compiled.framework), compiled.inline_key, compiled.inline_script,
+                                    data, width=width, height=height)
+    except RenderPoolError as e:
+        print(f"Inline render failed, falling back to HTML rendering: {e}")
+        return None, False
+    
+    return _write_render_result(result, output_svg, width, height)
+
+def html_to_svg_batch(jobs, job_timeout=None):
+    """
+    Convert several HTML files to SVG in one browser page per batch.
+    Each job is mounted in its own iframe; a failing or slow job only affects itself.
+    Falls back to html_to_svg for each job when the render pool is unavailable.
+    
+    Args:
+        jobs: List of dicts with 'html_file', 'output_svg' and optional 'width'/'height'
+        job_timeout: Per-job timeout in seconds (optional)
+    
+    Returns:
+        List of (SVG path, complete) per job; the path is None for jobs that failed.
+        complete is True only for a real SVG from a chart that signalled ready.
+    """
+    outputs = [(None, False)] * len(jobs)
+    if not jobs:
+        return outputs
+    pool = get_render_pool()
+    
+    for start in range(0, len(jobs), RENDER_BATCH_SIZE):
+        chunk = jobs[start:start + RENDER_BATCH_SIZE]
+        results = None
+        if pool is not None:
+            try:
+                results = pool.render_batch(chunk, job_timeout=job_timeout)
+            except RenderPoolError as e:
+                print(f"Batch render failed, falling back to per-chart rendering: {e}")
+        
+        for offset, job in enumerate(chunk):
+            width = job.get('width') or 1200
+            height = job.get('height') or 800
+            if results is None:
+                outputs[start + offset] = render_html_to_svg(job['html_file'], job['output_svg'], width=width, height=height)
+                continue
+            
+            result = results[offset]
+            if not result.get('ok'):
+                print(f"Error rendering {job['html_file']}: {result.get('error')}")
+            else:
+                outputs[start + offset] = _write_render_result(result, job['output_svg'], width, height)
+    
+    return outputs
 
 def html_to_svg(html_file, output_svg=None, width=1200, height=800):
     """
     Convert an HTML file with ECharts or D3.js to SVG using Puppeteer.
-    This requires a Node.js script to perform the conversion.
+    Uses the persistent render pool when available, otherwise falls back to
+    a one-off Node.js script that launches its own browser.
     
     Args:
         html_file: Path to the HTML file
@@ -17,9 +153,27 @@ def html_to_svg(html_file, output_svg=None, width=1200, height=800):
     Returns:
         Path to the generated SVG file
     """
+    return render_html_to_svg(html_file, output_svg, width, height)[0]
+
+def render_html_to_svg(html_file, output_svg=None, width=1200, height=800):
+    """
+    Same as html_to_svg, but also reports whether the result can be reused
+    
+    Returns:
+        (path to the generated SVG file or None, complete); complete is True only for a
+        real SVG from a chart that signalled ready (not a screenshot fallback or a timed-out DOM)
+    """
     if output_svg is None:
         output_svg = os.path.splitext(html_file)[0] + '.svg'
     
+    # Prefer the persistent render pool, which reuses a warm browser between charts
+    pool = get_render_pool()
+    if pool is not None:
+        try:
+            return _html_to_svg_with_pool(pool, html_file, output_svg, width, height)
+        except RenderPoolError as e:
+            print(f"Render pool failed, falling back to standalone browser: {e}")
+    
     # Create a temporary Node.js script for the conversion using CommonJS syntax
     js_script = """
     const puppeteer = require('puppeteer');
@@ -37,10 +191,16 @@ def html_to_svg(html_file, output_svg=None, width=1200, height=800):
         
         try {
             // Load the HTML file
-            await page.goto('file://' + path.resolve('%s'), { waitUntil: 'networkidle0' });
+            await page.goto('file://' + path.resolve('%s'), { waitUntil: 'load' });
             
-            // 减少等待时间
-            await new Promise(resolve => setTimeout(resolve, 1000));
+            // Wait for the chart-ready signal; the timeout is only a fallback
+            let chartReady = true;
+            try {
+                await page.waitForFunction(() => window.__chartReady === true, { timeout: ${READY_TIMEOUT_MS} });
+            } catch (e) {
+                chartReady = false;
+                console.log('Chart did not signal ready in time, extracting current DOM');
+            }
             
             // Check if it's an ECharts or D3.js chart
             const isECharts = await page.evaluate(() => {
@@ -197,6 +357,7 @@ def html_to_svg(html_file, output_svg=None, width=1200, height=800):
                 });
             }
             
+            const usedScreenshot = !svgContent;
             if (!svgContent) {
                 // 尝试最后的方法 - 直接从页面截图
                 console.log('Failed to extract SVG content, attempting screenshot as fallback');
@@ -227,6 +388,8 @@ def html_to_svg(html_file, output_svg=None, width=1200, height=800):
             
             // Write SVG to file
             fs.writeFileSync('%s', svgContent);
+            // 告知调用方结果是否完整（图表已发出ready信号且不是截图回退）
+            console.log('${STATUS_MARKER}' + JSON.stringify({ complete: chartReady && !usedScreenshot }));
         } catch (error) {
             console.error('Error generating SVG:', error);
             process.exit(1);
@@ -240,6 +403,8 @@ def html_to_svg(html_file, output_svg=None, width=1200, height=800):
     js_script = js_script.replace('${OUTPUT_SVG_PATH}', output_svg.replace('\\', '\\\\'))
     js_script = js_script.replace('${WIDTH}', str(width))
     js_script = js_script.replace('${HEIGHT}', str(height))
+    js_script = js_script.replace('${READY_TIMEOUT_MS}', str(int(RENDER_READY_TIMEOUT * 1000)))
+    js_script = js_script.replace('${STATUS_MARKER}', _STATUS_MARKER)
     
     # 应用Python格式化参数
     js_script = js_script % (
@@ -261,18 +426,24 @@ def html_to_svg(html_file, output_svg=None, width=1200, height=800):
             print("Installing puppeteer...")
             subprocess.run(['npm', 'install', 'puppeteer'], check=True)
         
-        # Run the converter script
-        subprocess.run(['node', js_file], check=True)
+        # Run the converter script; its log lines are passed through, the status line is consumed
+        result = subprocess.run(['node', js_file], check=True, stdout=subprocess.PIPE, text=True)
         #print("generate via", js_file)
+        complete = False
+        for line in result.stdout.splitlines():
+            if line.startswith(_STATUS_MARKER):
+                complete = json.loads(line[len(_STATUS_MARKER):]).get('complete') is True
+            else:
+                print(line)
         
         # Clean up - delete the temporary script
         cleanup_temp_file(js_file)
         
-        return output_svg
+        return output_svg, complete
     except subprocess.CalledProcessError as e:
         print(f"Error: {e}")
         
         # Clean up even if there was an error
         cleanup_temp_file(js_file)
             
-        return None 
\ No newline at end of file
+        return None, False 
\ No newline at end of file
@@ -0,0 +1,295 @@
+// jsdom缺少布局引擎，这里为D3模板补充文本测量和几何相关的接口：
+//   - SVGElement.getComputedTextLength / getBBox
+//   - canvas.getContext('2d') 的 font 和 measureText
+// 文本宽度基于title_styler使用的字体度量（由Python端生成的字形宽度表），
+// 度量表缺失时按平均字宽估算。
+const fs = require('fs');
+
+// 度量表缺失时的默认值，宽度按 fontSize / base_size 缩放
+const DEFAULT_METRICS = {
+    base_size: 100,
+    fonts: {
+        default: { advances: {}, default_advance: 55, cjk_advance: 100, ascent: 93, descent: 24 }
+    }
+};
+// 粗体按常见字体的平均加宽比例估算
+const BOLD_FACTOR = 1.06;
+
+function loadFontMetrics(metricsFile) {
+    if (metricsFile && fs.existsSync(metricsFile)) {
+        try {
+            return JSON.parse(fs.readFileSync(metricsFile, 'utf8'));
+        } catch (e) {
+            console.error('[jsdom_shim] Invalid font metrics file:', e.message);
+        }
+    }
+    return DEFAULT_METRICS;
+}
+
+function isCJK(char) {
+    const code = char.codePointAt(0);
+    return (code >= 0x2e80 && code <= 0x9fff) || (code >= 0xac00 && code <= 0xd7af) || (code >= 0xff00 && code <= 0xffef);
+}
+
+function createTextMeasurer(metrics) {
+    const fonts = metrics.fonts || DEFAULT_METRICS.fonts;
+    const baseSize = metrics.base_size || 100;
+    const fontKeys = Object.keys(fonts).filter(key => key !== 'default');
+
+    function resolveFont(fontFamily) {
+        const family = String(fontFamily || '').toLowerCase();
+        const key = fontKeys.find(name => family.includes(name.toLowerCase()));
+        return fonts[key] || fonts.default || DEFAULT_METRICS.fonts.default;
+    }
+
+    function measure(text, fontFamily, fontSize, fontWeight) {
+        const font = resolveFont(fontFamily);
+        let width = 0;
+        for (const char of String(text == null ? '' : text)) {
+            if (font.advances[char] !== undefined) {
+                width += font.advances[char];
+            } else if (isCJK(char)) {
+                width += font.cjk_advance;
+            } else {
+                width += font.default_advance;
+            }
+        }
+        const scale = fontSize / baseSize;
+        const bold = fontWeight === 'bold' || parseInt(fontWeight, 10) >= 600;
+        return {
+            width: width * scale * (bold ? BOLD_FACTOR : 1),
+            ascent: font.ascent * scale,
+            descent: font.descent * scale
+        };
+    }
+
+    return measure;
+}
+
+function parseFontSize(value, fallback) {
+    if (value === null || value === undefined || value === '') return fallback;
+    const text = String(value).trim();
+    const number = parseFloat(text);
+    if (isNaN(number)) return fallback;
+    if (text.endsWith('em') || text.endsWith('rem')) return number * fallback;
+    if (text.endsWith('pt')) return number * 4 / 3;
+    if (text.endsWith('%')) return number / 100 * fallback;
+    return number;
+}
+
+// 按CSS继承规则沿祖先查找字体属性
+function resolveTextStyle(element) {
+    const chain = [];
+    for (let node = element; node && node.nodeType === 1; node = node.parentNode) {
+        chain.unshift(node);
+    }
+    let fontSize = 16;
+    let fontFamily = 'sans-serif';
+    let fontWeight = 'normal';
+    for (const node of chain) {
+        const style = node.style || {};
+        fontSize = parseFontSize(style.fontSize || node.getAttribute('font-size'), fontSize);
+        fontFamily = style.fontFamily || node.getAttribute('font-family') || fontFamily;
+        fontWeight = style.fontWeight || node.getAttribute('font-weight') || fontWeight;
+    }
+    return { fontSize, fontFamily, fontWeight };
+}
+
+function parseCanvasFont(font) {
+    // 例如 "bold 14px Arial" 或 "italic 600 12px 'Helvetica Neue', sans-serif"
+    const match = /(?:^|\s)([\d.]+)(px|pt|em)(?:\/[\d.]+\w*)?\s+(.+)$/.exec(font || '');
+    if (!match) return { fontSize: 10, fontFamily: 'sans-serif', fontWeight: 'normal' };
+    const prefix = font.slice(0, match.index);
+    const weightMatch = /(bold|bolder|[6-9]00)/.exec(prefix);
+    return {
+        fontSize: parseFontSize(match[1] + match[2], 16),
+        fontFamily: match[3].replace(/['"]/g, ''),
+        fontWeight: weightMatch ? 'bold' : 'normal'
+    };
+}
+
+function num(element, name) {
+    const value = parseFloat(element.getAttribute(name));
+    return isNaN(value) ? 0 : value;
+}
+
+function parseTransform(transform) {
+    // 只处理translate和scale，足以覆盖模板中绝大多数用法
+    let tx = 0, ty = 0, sx = 1, sy = 1;
+    const regex = /(translate|scale)\(\s*([-\d.e]+)(?:[\s,]+([-\d.e]+))?\s*\)/g;
+    let match;
+    while ((match = regex.exec(transform || '')) !== null) {
+        const a = parseFloat(match[2]);
+        const b = match[3] !== undefined ? parseFloat(match[3]) : undefined;
+        if (match[1] === 'translate') {
+            tx += a * sx;
+            ty += (b || 0) * sy;
+        } else {
+            sx *= a;
+            sy *= (b === undefined ? a : b);
+        }
+    }
+    return { tx, ty, sx, sy };
+}
+
+function pathPoints(d) {
+    // 收集路径的端点和控制点（控制点包围盒是曲线包围盒的上界）
+    const points = [];
+    const tokens = String(d || '').match(/[a-zA-Z]|-?(?:\d+\.?\d*|\.\d+)(?:e[-+]?\d+)?/g) || [];
+    let i = 0, x = 0, y = 0, startX = 0, startY = 0, command = null;
+    const next = () => parseFloat(tokens[i++]);
+    while (i < tokens.length) {
+        if (/[a-zA-Z]/.test(tokens[i])) command = tokens[i++];
+        if (!command) break;
+        const relative = command === command.toLowerCase();
+        const upper = command.toUpperCase();
+        const ox = relative ? x : 0;
+        const oy = relative ? y : 0;
+        if (upper === 'Z') {
+            x = startX; y = startY;
+            command = null;
+            continue;
+        }
+        if (upper === 'H') {
+            x = next() + (relative ? x : 0);
+        } else if (upper === 'V') {
+            y = next() + (relative ? y : 0);
+        } else if (upper === 'A') {
+            const rx = next(), ry = next();
+            next(); next(); next();
+            const ex = next() + ox, ey = next() + oy;
+            points.push([x - rx, y - ry], [x + rx, y + ry]);
+            points.push([ex - rx, ey - ry], [ex + rx, ey + ry]);
+            x = ex; y = ey;
+        } else {
+            const count = { M: 1, L: 1, T: 1, Q: 2, S: 2, C: 3 }[upper] || 1;
+            for (let k = 0; k < count; k++) {
+                const px = next() + ox, py = next() + oy;
+                points.push([px, py]);
+                x = px; y = py;
+            }
+            if (upper === 'M') {
+                startX = x; startY = y;
+                command = relative ? 'l' : 'L';
+            }
+        }
+        if (isNaN(x) || isNaN(y)) break;
+        points.push([x, y]);
+    }
+    return points.filter(p => !isNaN(p[0]) && !isNaN(p[1]));
+}
+
+function boxFromPoints(points) {
+    if (points.length === 0) return null;
+    // 复杂路径的点数可能很多，避免展开参数导致栈溢出
+    let minX = Infinity, minY = Infinity, maxX = -Infinity, maxY = -Infinity;
+    for (const [px, py] of points) {
+        if (px < minX) minX = px;
+        if (px > maxX) maxX = px;
+        if (py < minY) minY = py;
+        if (py > maxY) maxY = py;
+    }
+    return { x: minX, y: minY, width: maxX - minX, height: maxY - minY };
+}
+
+function unionBoxes(boxes) {
+    const valid = boxes.filter(Boolean);
+    if (valid.length === 0) return null;
+    return boxFromPoints(valid.flatMap(b => [[b.x, b.y], [b.x + b.width, b.y + b.height]]));
+}
+
+function installShim(window, metrics) {
+    const measure = createTextMeasurer(metrics);
+
+    function textBBox(element) {
+        const style = resolveTextStyle(element);
+        const result = measure(element.textContent, style.fontFamily, style.fontSize, style.fontWeight);
+        const anchor = (element.style && element.style.textAnchor) || element.getAttribute('text-anchor') || 'start';
+        const dy = parseFontSize(element.getAttribute('dy'), style.fontSize) || 0;
+        const dx = parseFontSize(element.getAttribute('dx'), style.fontSize) || 0;
+        let x = num(element, 'x') + dx;
+        if (anchor === 'middle') x -= result.width / 2;
+        if (anchor === 'end') x -= result.width;
+        const baseline = element.getAttribute('dominant-baseline') || element.getAttribute('alignment-baseline') || '';
+        let top = num(element, 'y') + dy - result.ascent;
+        if (baseline === 'middle' || baseline === 'central') top += (result.ascent - result.descent) / 2;
+        if (baseline === 'hanging' || baseline === 'text-before-edge') top += result.ascent;
+        return { x: x, y: top, width: result.width, height: result.ascent + result.descent };
+    }
+
+    function localBBox(element) {
+        const tag = (element.tagName || '').toLowerCase();
+        switch (tag) {
+            case 'text':
+            case 'tspan':
+                return textBBox(element);
+            case 'rect':
+            case 'image':
+            case 'use':
+            case 'foreignobject':
+                return { x: num(element, 'x'), y: num(element, 'y'), width: num(element, 'width'), height: num(element, 'height') };
+            case 'circle': {
+                const r = num(element, 'r');
+                return { x: num(element, 'cx') - r, y: num(element, 'cy') - r, width: 2 * r, height: 2 * r };
+            }
+            case 'ellipse': {
+                const rx = num(element, 'rx'), ry = num(element, 'ry');
+                return { x: num(element, 'cx') - rx, y: num(element, 'cy') - ry, width: 2 * rx, height: 2 * ry };
+            }
+            case 'line':
+                return boxFromPoints([[num(element, 'x1'), num(element, 'y1')], [num(element, 'x2'), num(element, 'y2')]]);
+            case 'polyline':
+            case 'polygon': {
+                const values = (element.getAttribute('points') || '').trim().split(/[\s,]+/).map(parseFloat);
+                const points = [];
+                for (let k = 0; k + 1 < values.length; k += 2) points.push([values[k], values[k + 1]]);
+                return boxFromPoints(points);
+            }
+            case 'path':
+                return boxFromPoints(pathPoints(element.getAttribute('d')));
+            default:
+                // g/svg等容器：子元素包围盒（含各自transform）的并集
+                return unionBoxes(Array.from(element.children || []).map(childBBox));
+        }
+    }
+
+    function childBBox(child) {
+        if ((child.tagName || '').toLowerCase() === 'defs') return null;
+        const box = localBBox(child);
+        if (!box) return null;
+        const t = parseTransform(child.getAttribute('transform'));
+        return { x: box.x * t.sx + t.tx, y: box.y * t.sy + t.ty, width: box.width * t.sx, height: box.height * t.sy };
+    }
+
+    const proto = window.SVGElement.prototype;
+    proto.getBBox = function() {
+        return localBBox(this) || { x: 0, y: 0, width: 0, height: 0 };
+    };
+    proto.getComputedTextLength = function() {
+        const style = resolveTextStyle(this);
+        return measure(this.textContent, style.fontFamily, style.fontSize, style.fontWeight).width;
+    };
+
+    // canvas只用于测量文本宽度
+    window.HTMLCanvasElement.prototype.getContext = function(type) {
+        if (type !== '2d') return null;
+        const context = {
+            canvas: this,
+            font: '10px sans-serif',
+            measureText(text) {
+                const font = parseCanvasFont(context.font);
+                const result = measure(text, font.fontFamily, font.fontSize, font.fontWeight);
+                return {
+                    width: result.width,
+                    actualBoundingBoxAscent: result.ascent,
+                    actualBoundingBoxDescent: result.descent,
+                    fontBoundingBoxAscent: result.ascent,
+                    fontBoundingBoxDescent: result.descent
+                };
+            }
+        };
+        return context;
+    };
+}
+
+module.exports = { loadFontMetrics, installShim };
@@ -3,7 +3,10 @@ import json
 import subprocess
 import tempfile
 from modules.chart_engine.utils.file_utils import create_temp_file, create_temp_dir, cleanup_temp_file, cleanup_temp_dir
-from modules.chart_engine.utils.html_to_svg import html_to_svg
+from modules.chart_engine.utils.html_to_svg import render_html_to_svg, html_to_svg_batch, chart_to_svg_inline
+from modules.chart_engine.utils.ssr_renderer import render_without_browser
+from modules.chart_engine.utils.render_cache import render_cache_key, get_cached_svg, store_cached_svg
+from modules.chart_engine.utils.template_bundle import get_compiled_template, prepare_chart
 import importlib
 import logging
 
@@ -73,6 +76,7 @@ def load_js_echarts(json_data=None, output_file=None, js_file=None, width=None,
     """
     Generate an ECharts chart using JavaScript.
     This function directly generates an HTML file with the JavaScript code.
+    The template is precompiled once (see template_bundle) and only the JSON data is filled in per call.
     
     Args:
         json_data: Dict containing the JSON data for the chart
@@ -84,111 +88,10 @@ def load_js_echarts(json_data=None, output_file=None, js_file=None, width=None,
     """
     if json_data is None:
         raise ValueError("JSON data must be provided")
-        
-    # Default HTML template
-    html_template = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="utf-8">
-        <title>ECharts Chart</title>
-        <script src="%s"></script>
-        <style>
-            #chart-container {
-                width: %dpx;
-                height: %dpx;
-            }
-        </style>
-    </head>
-    <body>
-        <div id="chart-container"></div>
-        <script>
-            // 立即初始化图表，使用SVG渲染器并禁用所有动画
-            var chart = echarts.init(document.getElementById('chart-container'), null, {
-                renderer: 'svg',
-                animation: false,
-                useUTC: true
-            });
-            
-            // 禁用全局动画
-            echarts.disableAllAnimation = true;
-            
-            // 准备数据
-            const jsonData = JSON_DATA_PLACEHOLDER;
-            
-            JS_CODE_PLACEHOLDER
-            
-            // 创建图表选项
-            let option;
-            try {
-                option = make_option(jsonData);
-                
-                // 禁用所有动画
-                option.animation = false;
-                option.animationDuration = 0;
-                option.animationDurationUpdate = 0;
-                option.animationDelay = 0;
-                option.animationDelayUpdate = 0;
-                
-            } catch (e) {
-                console.error("Error creating chart:", e);
-                option = {
-                    title: { text: "Error: " + e.message, left: 'center' }
-                };
-            }
-            
-            // 立即设置选项并渲染
-            chart.setOption(option);
-            
-            // 导出SVG的优化函数
-            function exportSvg() {
-                try {
-                    chart.setOption(option, {notMerge: true});
-                    
-                    const svgContent = chart.renderToSVGString();
-                    
-                    if (svgContent && svgContent.length > 0) {
-                        const svgContainer = document.createElement('div');
-                        svgContainer.id = 'svg-output';
-                        svgContainer.style.display = 'none';
-                        svgContainer.innerHTML = svgContent;
-                        document.body.appendChild(svgContainer);
-                    }
-                } catch (e) {
-                    console.error("Error exporting SVG:", e);
-                }
-            }
-            
-            // 立即尝试导出
-            exportSvg();
-            
-            // 设置备用导出计时器，500ms后再尝试一次
-            setTimeout(exportSvg, 500);
-        </script>
-    </body>
-    </html>
-    """
-    
-    # 获取本地库文件的绝对路径
-    echarts_lib_path = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'lib', 'echarts.min.js'))
     
-    # 使用文件协议的URL (用于SVG渲染)
-    echarts_lib_url = f"file://{echarts_lib_path}"
-    
-    # Load JavaScript code
-    if js_file:
-        js_code = _load_js_code(js_file)
-    else:
-        js_code = f"""
-        function make_option(jsonData) {{
-            return JSON.parse(jsonData);
-        }}
-        """
-
-    # Create HTML content
-    formatted_html = html_template % (echarts_lib_url, width, height)
-    formatted_html = formatted_html.replace('JSON_DATA_PLACEHOLDER', json.dumps(json_data))
-    formatted_html = formatted_html.replace('JS_CODE_PLACEHOLDER', js_code)
+    # js_file为空时使用直接解析选项JSON的模板
+    compiled = get_compiled_template('echarts', js_file)
+    formatted_html = compiled.to_html(json_data, width, height)
     
     # Save the HTML to a file
     output_file = _save_to_file(formatted_html, output_file)    
@@ -199,6 +102,7 @@ def load_d3js(json_data=None, output_file=None, js_file=None, width=None, height
     """
     Generate a D3.js chart using JavaScript.
     This function generates an HTML file with the D3.js code.
+    The template and utils.js are precompiled once (see template_bundle) and only the JSON data is filled in per call.
     
     Args:
         json_data: Dict containing the JSON data for the chart
@@ -210,86 +114,10 @@ def load_d3js(json_data=None, output_file=None, js_file=None, width=None, height
     """
     if json_data is None:
         raise ValueError("JSON data must be provided")
-        
-    # Default HTML template for D3.js - use %% to escape % characters
-    html_template = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="utf-8">
-        <title>D3.js Chart</title>
-        %s
-        <style>
-            body {
-                font-family: Arial, sans-serif;
-                margin: 20px;
-            }
-            #chart-container {
-                width: 100%%;
-                max-width: %dpx;
-                height: %dpx;
-                margin: 0 auto;
-                background-color: white;
-                border-radius: 8px;
-                overflow: hidden;
-            }
-        </style>
-    </head>
-    <body>
-        <div id="chart-container"></div>
-        <script>
-            // 准备数据
-            const json_data = JSON_DATA_PLACEHOLDER;
-
-            // 导入utils.js
-            UTILS_LIB_PLACEHOLDER
-            
-            // D3.js实现
-            JS_CODE_PLACEHOLDER
-            
-            // 文档就绪时立即创建图表
-            makeChart('#chart-container', json_data);
-            
-            // 500ms后检查SVG是否已生成
-            setTimeout(function() {
-                const svg = document.querySelector('#chart-container svg');
-                if (svg) {
-                    // 创建一个包含SVG内容的容器供提取使用
-                    const svgContainer = document.createElement('div');
-                    svgContainer.id = 'svg-output';
-                    svgContainer.style.display = 'none';
-                    svgContainer.innerHTML = svg.outerHTML;
-                    document.body.appendChild(svgContainer);
-                }
-            }, 500);
-        </script>
-    </body>
-    </html>
-    """
-    # 获取D3.js库文件的绝对路径
-    d3_lib_path = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'lib', 'd3.min.js'))
-    d3_voronoi_lib_path = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'lib', 'd3-voronoi-map.min.js'))
-    d3_weighted_voronoi_lib_path = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'lib', 'd3-weighted-voronoi.min.js'))
-    d3_sankey_lib_path = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'lib', 'd3-sankey.min.js'))
-    d3_rough_lib_path = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'lib', 'svg2roughjs.umd.min.js'))
-    # 使用文件协议的URL (用于SVG渲染)
-    d3_lib_url = f"file://{d3_lib_path}"
-    d3_voronoi_lib_url = f"file://{d3_voronoi_lib_path}"
-    d3_weighted_voronoi_lib_url = f"file://{d3_weighted_voronoi_lib_path}"
-    d3_sankey_lib_url = f"file://{d3_sankey_lib_path}"
-    d3_rough_lib_url = f"file://{d3_rough_lib_path}"
-
-    lib_urls = [d3_lib_url, d3_voronoi_lib_url, d3_weighted_voronoi_lib_url, d3_sankey_lib_url, d3_rough_lib_url]
-    lib_urls_str = "\n".join([f"<script src='{url}'></script>" for url in lib_urls])
-
-    utils_lib_path = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'lib', 'utils.js'))
-    utils_code = _load_js_code(utils_lib_path)
-    js_code = _load_js_code(js_file)
-    # Create HTML content    
-    formatted_html = html_template % (lib_urls_str, width, height)
-    formatted_html = formatted_html.replace('JSON_DATA_PLACEHOLDER', json.dumps(json_data))
-    formatted_html = formatted_html.replace('JS_CODE_PLACEHOLDER', js_code)
-    formatted_html = formatted_html.replace('UTILS_LIB_PLACEHOLDER', utils_code)
+    
+    compiled = get_compiled_template('d3', js_file)
+    formatted_html = compiled.to_html(json_data, width, height)
+    
     # Save the HTML to a file
     output_file = _save_to_file(formatted_html, output_file, prefix="_d3")
     # 简化日志输出
@@ -311,6 +139,76 @@ def load_py_echarts(json_data=None):
     # 不需要特殊处理，直接返回处理好的选项数据
     return json_data
 
+def _write_chart_html(json_data, html_file, js_file, width, height, framework, framework_type='js'):
+    """
+    根据框架类型生成图表HTML文件
+    
+    Args:
+        json_data (dict): 图表数据
+        html_file (str): HTML文件保存路径
+        js_file: JavaScript文件路径，echarts_py时为模板对象
+        width (int): 图表宽度(像素)
+        height (int): 图表高度(像素)
+        framework (str): 图表框架
+        framework_type (str): 框架类型，'js'或'py'
+    """
+    if framework.lower() not in ("echarts", "d3"):
+        raise ValueError(f"Unsupported framework: {framework}")
+    compiled, data = prepare_chart(json_data, js_file, framework, framework_type)
+    _save_to_file(compiled.to_html(data, width, height), html_file)
+
+def _save_html_output(html_file, html_output_path, framework):
+    """
+    保存中间HTML文件，本地库地址替换为CDN地址便于在浏览器中调试
+    
+    Args:
+        html_file (str): 生成的HTML文件路径
+        html_output_path (str): 保存路径
+        framework (str): 图表框架
+    """
+    import shutil
+    import re
+
+    with open(html_file, 'r', encoding='utf-8') as f:
+        html_content = f.read()
+
+    if framework.lower().startswith('echarts'):
+        lib_file = 'echarts.min.js'
+        file_pattern = r'file://.*?/' + lib_file
+        cdn_url = "https://cdn.jsdelivr.net/npm/echarts@5/dist/echarts.min.js"
+        html_content = re.sub(file_pattern, cdn_url, html_content)
+    else:  # D3.js
+        # For D3.js, we need to replace three different URLs
+        # Replace d3.min.js
+        d3_file_pattern = r'file://.*?/d3\.min\.js'
+        cdn_url = "https://cdn.jsdelivr.net/npm/d3@7/dist/d3.min.js"
+        html_content = re.sub(d3_file_pattern, cdn_url, html_content)
+
+        # Replace d3-voronoi-map.min.js
+        voronoi_file_pattern = r'file://.*?/d3-voronoi-map\.min\.js'
+        cdn_url_voronoi = "https://cdn.jsdelivr.net/npm/d3-voronoi-map@2.1.1/build/d3-voronoi-map.min.js"
+        html_content = re.sub(voronoi_file_pattern, cdn_url_voronoi, html_content)
+
+        # Replace d3-weighted-voronoi.min.js
+        weighted_voronoi_file_pattern = r'file://.*?/d3-weighted-voronoi\.min\.js'
+        cdn_url_weighted_voronoi = "https://cdn.jsdelivr.net/npm/d3-weighted-voronoi@1.1.3/build/d3-weighted-voronoi.min.js"
+        html_content = re.sub(weighted_voronoi_file_pattern, cdn_url_weighted_voronoi, html_content)
+
+        # Replace d3-sankey.min.js
+        sankey_file_pattern = r'file://.*?/d3-sankey\.min\.js'
+        cdn_url_sankey = "https://cdn.jsdelivr.net/npm/d3-sankey@0.12.3/dist/d3-sankey.min.js"
+        html_content = re.sub(sankey_file_pattern, cdn_url_sankey, html_content)
+
+        # Replace svg2roughjs.umd.min.js
+        rough_file_pattern = r'file://.*?/svg2roughjs\.umd\.min\.js'
+        cdn_url_rough = "https://unpkg.com/svg2roughjs@3.2.1/dist/svg2roughjs.umd.min.js"
+        html_content = re.sub(rough_file_pattern, cdn_url_rough, html_content)
+
+    with open(html_output_path, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+
+    print(f"Saved intermediate HTML file to: {html_output_path}")
+
 def render_chart_to_svg(json_data, output_svg_path, \
                         js_file=None, width=None, height=None, \
                         framework="echarts", framework_type='js', html_output_path=None):
@@ -381,67 +279,37 @@ def render_chart_to_svg(json_data, output_svg_path, \
     html_file = os.path.join(temp_dir, 'chart.html')
 
     try:
-        # 根据框架类型生成HTML文件
-        if framework.lower() == "echarts" and framework_type == 'js':
-            load_js_echarts(json_data=json_data, output_file=html_file, js_file=js_file, width=width, height=height)
-        elif framework.lower() == "echarts" and framework_type == 'py':
-            template = js_file
-            options = template.make_options(json_data)
-            option_data = json.dumps(options)
-            load_js_echarts(json_data=option_data, output_file=html_file, width=width, height=height)
-        elif framework.lower() == "d3":
-            load_d3js(json_data=json_data, output_file=html_file, js_file=js_file, width=width, height=height)
-        else:
-            raise ValueError(f"Unsupported framework: {framework}")
+        # 相同模板、数据和尺寸的图表直接使用缓存的SVG
+        cache_key = render_cache_key(json_data, js_file, width, height, framework, framework_type)
+        svg_content = get_cached_svg(cache_key)
         
-        if html_output_path and os.path.exists(html_file):
-            import shutil
-            import re
-            
-            with open(html_file, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-                
-            if framework.lower().startswith('echarts'):
-                lib_file = 'echarts.min.js'
-                file_pattern = r'file://.*?/' + lib_file
-                cdn_url = "https://cdn.jsdelivr.net/npm/echarts@5/dist/echarts.min.js"
-                html_content = re.sub(file_pattern, cdn_url, html_content)
-            else:  # D3.js
-                # For D3.js, we need to replace three different URLs
-                # Replace d3.min.js
-                d3_file_pattern = r'file://.*?/d3\.min\.js'
-                cdn_url = "https://cdn.jsdelivr.net/npm/d3@7/dist/d3.min.js"
-                html_content = re.sub(d3_file_pattern, cdn_url, html_content)
-                
-                # Replace d3-voronoi-map.min.js
-                voronoi_file_pattern = r'file://.*?/d3-voronoi-map\.min\.js'
-                cdn_url_voronoi = "https://cdn.jsdelivr.net/npm/d3-voronoi-map@2.1.1/build/d3-voronoi-map.min.js"
-                html_content = re.sub(voronoi_file_pattern, cdn_url_voronoi, html_content)
-                
-                # Replace d3-weighted-voronoi.min.js
-                weighted_voronoi_file_pattern = r'file://.*?/d3-weighted-voronoi\.min\.js'
-                cdn_url_weighted_voronoi = "https://cdn.jsdelivr.net/npm/d3-weighted-voronoi@1.1.3/build/d3-weighted-voronoi.min.js"
-                html_content = re.sub(weighted_voronoi_file_pattern, cdn_url_weighted_voronoi, html_content)
-                
-                # Replace d3-sankey.min.js
-                sankey_file_pattern = r'file://.*?/d3-sankey\.min\.js'
-                cdn_url_sankey = "https://cdn.jsdelivr.net/npm/d3-sankey@0.12.3/dist/d3-sankey.min.js"
-                html_content = re.sub(sankey_file_pattern, cdn_url_sankey, html_content)
-                
-                # Replace svg2roughjs.umd.min.js
-                rough_file_pattern = r'file://.*?/svg2roughjs\.umd\.min\.js'
-                cdn_url_rough = "https://unpkg.com/svg2roughjs@3.2.1/dist/svg2roughjs.umd.min.js"
-                html_content = re.sub(rough_file_pattern, cdn_url_rough, html_content)
-            
-            with open(html_output_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-                
-            print(f"Saved intermediate HTML file to: {html_output_path}")
+        # 按引擎选择渲染后端，SSR/jsdom失败时回退到浏览器
+        if svg_content is None:
+            svg_content = render_without_browser(json_data, js_file, width, height, framework, framework_type)
+            store_cached_svg(cache_key, svg_content)
+
+        # 需要保存中间HTML时才生成HTML文件
+        if html_output_path:
+            _write_chart_html(json_data, html_file, js_file, width, height, framework, framework_type)
+            _save_html_output(html_file, html_output_path, framework)
+        
+        if svg_content is not None:
+            with open(output_svg_path, 'w', encoding='utf-8') as f:
+                f.write(svg_content)
+            return output_svg_path
         
-        # 使用html_to_svg转换为SVG
-        svg_file = html_to_svg(html_file, output_svg_path, width=width, height=height)
+        # 浏览器渲染：优先在渲染池已加载库文件的页面中注入模板，失败时生成HTML文件再转换
+        svg_file, complete = chart_to_svg_inline(json_data, js_file, width, height, framework, framework_type, output_svg_path)
+        if svg_file is None:
+            if not os.path.exists(html_file):
+                _write_chart_html(json_data, html_file, js_file, width, height, framework, framework_type)
+            svg_file, complete = render_html_to_svg(html_file, output_svg_path, width=width, height=height)
         
         if svg_file is not None and os.path.exists(svg_file):
+            # 截图回退和超时时的部分DOM不缓存
+            if cache_key is not None and complete:
+                with open(svg_file, 'r', encoding='utf-8') as f:
+                    store_cached_svg(cache_key, f.read())
             # 简化日志输出，只返回路径，不打印
             return svg_file
         else:
@@ -455,6 +323,86 @@ def render_chart_to_svg(json_data, output_svg_path, \
         if os.path.exists(temp_dir):
            cleanup_temp_dir(temp_dir)
 
+def render_charts_to_svg(jobs, job_timeout=None):
+    """
+    批量渲染多个图表，浏览器中每个批次只加载一个页面，每个图表挂载在独立的iframe中
+    
+    Args:
+        jobs (list): 任务列表，每项为render_chart_to_svg的关键字参数字典
+            (json_data, output_svg_path, js_file, width, height, framework, framework_type, html_output_path)
+        job_timeout (float, optional): 单个图表的超时时间(秒)
+        
+    Returns:
+        与jobs一一对应的SVG文件路径列表，失败的任务对应None
+    """
+    results = [None] * len(jobs)
+    temp_dir = create_temp_dir(prefix="batch_svg_")
+    batch_jobs = []
+    batch_indices = []
+    batch_cache_keys = []
+    
+    try:
+        for index, job in enumerate(jobs):
+            job = dict(job)
+            framework = job.get('framework', 'echarts')
+            
+            # VegaLite不经过浏览器，逐个渲染
+            if framework.lower() == "vegalite":
+                results[index] = render_chart_to_svg(**job)
+                continue
+            
+            width, height = job.get('width'), job.get('height')
+            if width is None or height is None:
+                w, h = _get_dimensions(job['json_data'])
+                width = width or w
+                height = height or h
+            
+            html_file = os.path.join(temp_dir, f'chart_{index}.html')
+            framework_type = job.get('framework_type', 'js')
+            try:
+                _write_chart_html(job['json_data'], html_file, job.get('js_file'), width, height,
+                                  framework, framework_type)
+                if job.get('html_output_path'):
+                    _save_html_output(html_file, job['html_output_path'], framework)
+            except Exception as e:
+                print(f"Error load charts: {e}")
+                continue
+            
+            # 先查缓存，SSR/jsdom后端的图表直接在Node中渲染，失败的再交给浏览器批次
+            cache_key = render_cache_key(job['json_data'], job.get('js_file'), width, height, framework, framework_type)
+            svg_content = get_cached_svg(cache_key)
+            if svg_content is None:
+                svg_content = render_without_browser(job['json_data'], job.get('js_file'), width, height, framework, framework_type)
+                store_cached_svg(cache_key, svg_content)
+            if svg_content is not None:
+                with open(job['output_svg_path'], 'w', encoding='utf-8') as f:
+                    f.write(svg_content)
+                results[index] = job['output_svg_path']
+                continue
+            
+            batch_jobs.append({
+                'html_file': html_file,
+                'output_svg': job['output_svg_path'],
+                'width': width,
+                'height': height
+            })
+            batch_indices.append(index)
+            batch_cache_keys.append(cache_key)
+        
+        svg_files = html_to_svg_batch(batch_jobs, job_timeout=job_timeout)
+        for index, cache_key, (svg_file, complete) in zip(batch_indices, batch_cache_keys, svg_files):
+            if svg_file is not None and os.path.exists(svg_file):
+                results[index] = svg_file
+                # 截图回退和超时时的部分DOM不缓存
+                if cache_key is not None and complete:
+                    with open(svg_file, 'r', encoding='utf-8') as f:
+                        store_cached_svg(cache_key, f.read())
+        return results
+    
+    finally:
+        if os.path.exists(temp_dir):
+           cleanup_temp_dir(temp_dir)
+
 # 保持向后兼容的函数
 def render_d3js_chart_to_svg(json_data, output_svg_path, js_file=None, width=None, height=None, html_output_path=None):
     """
@@ -3,16 +3,104 @@ import json
 import subprocess
 import tempfile
 from modules.chart_engine.utils.file_utils import create_temp_file, create_temp_dir, cleanup_temp_file, cleanup_temp_dir
+from modules.chart_engine.utils.render_pool import get_render_pool, RenderPoolError, RENDER_READY_TIMEOUT, RENDER_BATCH_SIZE
+from modules.chart_engine.utils.ssr_renderer import render_without_browser
+from modules.chart_engine.utils.render_cache import render_cache_key, get_cached_svg, store_cached_svg
+from modules.chart_engine.utils.template_bundle import get_compiled_template, prepare_chart, get_base_page
 
 import importlib
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 独立Node脚本在stdout中输出的状态行前缀
+_STATUS_MARKER = '__CHART_RENDER_STATUS__'
+
+def _screenshot_svg(screenshot, width, height):
+    """将base64截图包装为SVG内容"""
+    return f"""<svg width="{width}" height="{height}" xmlns="http://www.w3.org/2000/svg">
+                    <image href="data:image/png;base64,{screenshot}" width="100%" height="100%"/>
+                </svg>"""
+
+def _render_result_svg(result, width, height):
+    """
+    将渲染池的结果转换为SVG内容
+
+    Returns:
+        (SVG内容或None, complete)；只有图表发出了ready信号且提取到真正的SVG时complete为True，
+        截图回退和超时时的部分DOM不应缓存
+    """
+    if result.get('svg'):
+        return result['svg'], result.get('ready') is True
+    if result.get('screenshot'):
+        return _screenshot_svg(result['screenshot'], width, height), False
+    return None, False
+
+def _chart_to_svg_inline(json_data, js_file, width, height, framework, framework_type='js'):
+    """
+    在渲染池已加载库文件的页面中注入预编译模板和数据并渲染，不生成HTML文件
+    
+    Returns:
+        (SVG内容, complete)；渲染池不可用或渲染失败时SVG内容为None
+    """
+    pool = get_render_pool()
+    if pool is None:
+        return None, False
+    try:
+        compiled, data = prepare_chart(json_data, js_file, framework, framework_type)
+        result = pool.render_inline(get_base_page(compiled.framework), compiled.inline_key, compiled.inline_script,
+                                    data, width=width, height=height)
+    except RenderPoolError as e:
+        print(f"注入渲染失败，回退到HTML渲染: {e}")
+        return None, False
+    return _render_result_svg(result, width, height)
+
+def html_to_svg_batch(jobs, job_timeout=None):
+    """
+    在同一个浏览器页面中批量转换多个HTML文件，每个任务挂载在独立的iframe中。
+    渲染池不可用时逐个回退到html_to_svg。
+    
+    Args:
+        jobs: 任务列表，每项为 {'html_file': 路径, 'width': 宽, 'height': 高}
+        job_timeout: 单个任务的超时时间(秒)，可选
+    
+    Returns:
+        与jobs一一对应的 (SVG内容, complete) 列表，失败的任务SVG内容为None
+    """
+    outputs = [(None, False)] * len(jobs)
+    if not jobs:
+        return outputs
+    pool = get_render_pool()
+    
+    for start in range(0, len(jobs), RENDER_BATCH_SIZE):
+        chunk = jobs[start:start + RENDER_BATCH_SIZE]
+        results = None
+        if pool is not None:
+            try:
+                results = pool.render_batch(chunk, job_timeout=job_timeout)
+            except RenderPoolError as e:
+                print(f"批量渲染失败，逐个回退渲染: {e}")
+        
+        for offset, job in enumerate(chunk):
+            width = job.get('width') or 1200
+            height = job.get('height') or 800
+            if results is None:
+                outputs[start + offset] = render_html_to_svg(job['html_file'], width=width, height=height)
+                continue
+            
+            result = results[offset]
+            if not result.get('ok'):
+                print(f"渲染失败 {job['html_file']}: {result.get('error')}")
+            else:
+                outputs[start + offset] = _render_result_svg(result, width, height)
+    
+    return outputs
+
 def html_to_svg(html_file, output_svg=None, width=1200, height=800):
     """
     Convert an HTML file with ECharts or D3.js to SVG using Puppeteer.
     Returns SVG content directly instead of saving to file.
+    Uses the persistent render pool when available.
     
     Args:
         html_file: Path to the HTML file
@@ -23,6 +111,25 @@ def html_to_svg(html_file, output_svg=None, width=1200, height=800):
     Returns:
         SVG content as string or None if conversion fails
     """
+    return render_html_to_svg(html_file, output_svg, width, height)[0]
+
+def render_html_to_svg(html_file, output_svg=None, width=1200, height=800):
+    """
+    与html_to_svg相同，同时返回结果是否完整
+
+    Returns:
+        (SVG内容或None, complete)；只有图表发出了ready信号且提取到真正的SVG时complete为True
+    """
+    # 优先使用常驻渲染池，复用已预热的浏览器页面
+    pool = get_render_pool()
+    if pool is not None:
+        try:
+            svg_content, complete = _render_result_svg(pool.render(html_file, width=width, height=height), width, height)
+            if svg_content is not None:
+                return svg_content, complete
+        except RenderPoolError as e:
+            print(f"渲染池不可用，回退到独立浏览器: {e}")
+    
     # 创建Node.js脚本模板
     js_script = """
     const puppeteer = require('puppeteer');
@@ -40,8 +147,15 @@ def html_to_svg(html_file, output_svg=None, width=1200, height=800):
         
         try {
             // 加载HTML文件
-            await page.goto('file://' + path.resolve('%s'), { waitUntil: 'networkidle0' });
-            await new Promise(resolve => setTimeout(resolve, 1000));
+            await page.goto('file://' + path.resolve('%s'), { waitUntil: 'load' });
+            // 等待图表发出chart-ready信号，超时仅作兜底
+            let chartReady = true;
+            try {
+                await page.waitForFunction(() => window.__chartReady === true, { timeout: READY_TIMEOUT_MS });
+            } catch (e) {
+                chartReady = false;
+                console.error('图表未在超时前发出完成信号，直接提取当前DOM');
+            }
             
             // 检查是否是ECharts图表
             const isECharts = await page.evaluate(() => {
@@ -97,6 +211,7 @@ def html_to_svg(html_file, output_svg=None, width=1200, height=800):
             }
             
             // 最终回退 - 截图转SVG
+            const usedScreenshot = !svgContent;
             if (!svgContent) {
                 const screenshot = await page.screenshot({encoding: 'base64'});
                 svgContent = `<svg width="%d" height="%d" xmlns="http://www.w3.org/2000/svg">
@@ -104,8 +219,9 @@ def html_to_svg(html_file, output_svg=None, width=1200, height=800):
                 </svg>`;
             }
             
-            // 输出SVG内容到stdout
+            // 输出SVG内容到stdout，最后一行为结果是否完整的状态行
             console.log(svgContent);
+            console.log('STATUS_MARKER' + JSON.stringify({ complete: chartReady && !usedScreenshot }));
             
         } catch (error) {
             console.error('错误:', error);
@@ -116,6 +232,9 @@ def html_to_svg(html_file, output_svg=None, width=1200, height=800):
     })();
     """
     
+    js_script = js_script.replace('READY_TIMEOUT_MS', str(int(RENDER_READY_TIMEOUT * 1000)))
+    js_script = js_script.replace('STATUS_MARKER', _STATUS_MARKER)
+    
     # 格式化脚本参数（修复了参数数量问题）
     js_script = js_script % (
         width,  # 第一个 %d
@@ -147,17 +266,20 @@ def html_to_svg(html_file, output_svg=None, width=1200, height=800):
         # 清理临时文件
         cleanup_temp_file(js_file)
         
-        # 返回SVG内容
-        return result.stdout
+        # 返回SVG内容，去掉末尾的状态行
+        svg_content, marker, status = result.stdout.rpartition(_STATUS_MARKER)
+        if not marker:
+            return result.stdout, False
+        return svg_content, json.loads(status).get('complete') is True
         
     except subprocess.CalledProcessError as e:
         print(f"转换错误: {e.stderr}")
         cleanup_temp_file(js_file)
-        return None
+        return None, False
     except Exception as e:
         print(f"意外错误: {str(e)}")
         cleanup_temp_file(js_file)
-        return None
+        return None, False
 
 def _save_to_file(content, output_file=None, prefix="", suffix=".html"):
     """
@@ -223,6 +345,7 @@ def load_js_echarts(json_data=None, output_file=None, js_file=None, width=None,
     """
     Generate an ECharts chart using JavaScript.
     This function directly generates an HTML file with the JavaScript code.
+    The template is precompiled once (see template_bundle) and only the JSON data is filled in per call.
     
     Args:
         json_data: Dict containing the JSON data for the chart
@@ -234,111 +357,10 @@ def load_js_echarts(json_data=None, output_file=None, js_file=None, width=None,
     """
     if json_data is None:
         raise ValueError("JSON data must be provided")
-        
-    # Default HTML template
-    html_template = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="utf-8">
-        <title>ECharts Chart</title>
-        <script src="%s"></script>
-        <style>
-            #chart-container {
-                width: %dpx;
-                height: %dpx;
-            }
-        </style>
-    </head>
-    <body>
-        <div id="chart-container"></div>
-        <script>
-            // 立即初始化图表，使用SVG渲染器并禁用所有动画
-            var chart = echarts.init(document.getElementById('chart-container'), null, {
-                renderer: 'svg',
-                animation: false,
-                useUTC: true
-            });
-            
-            // 禁用全局动画
-            echarts.disableAllAnimation = true;
-            
-            // 准备数据
-            const jsonData = JSON_DATA_PLACEHOLDER;
-            
-            JS_CODE_PLACEHOLDER
-            
-            // 创建图表选项
-            let option;
-            try {
-                option = make_option(jsonData);
-                
-                // 禁用所有动画
-                option.animation = false;
-                option.animationDuration = 0;
-                option.animationDurationUpdate = 0;
-                option.animationDelay = 0;
-                option.animationDelayUpdate = 0;
-                
-            } catch (e) {
-                console.error("Error creating chart:", e);
-                option = {
-                    title: { text: "Error: " + e.message, left: 'center' }
-                };
-            }
-            
-            // 立即设置选项并渲染
-            chart.setOption(option);
-            
-            // 导出SVG的优化函数
-            function exportSvg() {
-                try {
-                    chart.setOption(option, {notMerge: true});
-                    
-                    const svgContent = chart.renderToSVGString();
-                    
-                    if (svgContent && svgContent.length > 0) {
-                        const svgContainer = document.createElement('div');
-                        svgContainer.id = 'svg-output';
-                        svgContainer.style.display = 'none';
-                        svgContainer.innerHTML = svgContent;
-                        document.body.appendChild(svgContainer);
-                    }
-                } catch (e) {
-                    console.error("Error exporting SVG:", e);
-                }
-            }
-            
-            // 立即尝试导出
-            exportSvg();
-            
-            // 设置备用导出计时器，500ms后再尝试一次
-            setTimeout(exportSvg, 500);
-        </script>
-    </body>
-    </html>
-    """
-    
-    # 获取本地库文件的绝对路径
-    echarts_lib_path = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'lib', 'echarts.min.js'))
     
-    # 使用文件协议的URL (用于SVG渲染)
-    echarts_lib_url = f"file://{echarts_lib_path}"
-    
-    # Load JavaScript code
-    if js_file:
-        js_code = _load_js_code(js_file)
-    else:
-        js_code = f"""
-        function make_option(jsonData) {{
-            return JSON.parse(jsonData);
-        }}
-        """
-
-    # Create HTML content
-    formatted_html = html_template % (echarts_lib_url, width, height)
-    formatted_html = formatted_html.replace('JSON_DATA_PLACEHOLDER', json.dumps(json_data))
-    formatted_html = formatted_html.replace('JS_CODE_PLACEHOLDER', js_code)
+    # js_file为空时使用直接解析选项JSON的模板
+    compiled = get_compiled_template('echarts', js_file)
+    formatted_html = compiled.to_html(json_data, width, height)
     
     # Save the HTML to a file
     output_file = _save_to_file(formatted_html, output_file)    
@@ -349,6 +371,7 @@ def load_d3js(json_data=None, output_file=None, js_file=None, width=None, height
     """
     Generate a D3.js chart using JavaScript.
     This function generates an HTML file with the D3.js code.
+    The template and utils.js are precompiled once (see template_bundle) and only the JSON data is filled in per call.
     
     Args:
         json_data: Dict containing the JSON data for the chart
@@ -360,91 +383,33 @@ def load_d3js(json_data=None, output_file=None, js_file=None, width=None, height
     """
     if json_data is None:
         raise ValueError("JSON data must be provided")
-        
-    # Default HTML template for D3.js - use %% to escape % characters
-    html_template = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="utf-8">
-        <title>D3.js Chart</title>
-        %s
-        <style>
-            body {
-                font-family: Arial, sans-serif;
-                margin: 20px;
-            }
-            #chart-container {
-                width: 100%%;
-                max-width: %dpx;
-                height: %dpx;
-                margin: 0 auto;
-                background-color: white;
-                border-radius: 8px;
-                overflow: hidden;
-            }
-        </style>
-    </head>
-    <body>
-        <div id="chart-container"></div>
-        <script>
-            // 准备数据
-            const json_data = JSON_DATA_PLACEHOLDER;
-
-            // 导入utils.js
-            UTILS_LIB_PLACEHOLDER
-            
-            // D3.js实现
-            JS_CODE_PLACEHOLDER
-            
-            // 文档就绪时立即创建图表
-            makeChart('#chart-container', json_data);
-            
-            // 500ms后检查SVG是否已生成
-            setTimeout(function() {
-                const svg = document.querySelector('#chart-container svg');
-                if (svg) {
-                    // 创建一个包含SVG内容的容器供提取使用
-                    const svgContainer = document.createElement('div');
-                    svgContainer.id = 'svg-output';
-                    svgContainer.style.display = 'none';
-                    svgContainer.innerHTML = svg.outerHTML;
-                    document.body.appendChild(svgContainer);
-                }
-            }, 500);
-        </script>
-    </body>
-    </html>
-    """
-    # 获取D3.js库文件的绝对路径
-    d3_lib_path = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'lib', 'd3.min.js'))
-    d3_voronoi_lib_path = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'lib', 'd3-voronoi-map.min.js'))
-    d3_weighted_voronoi_lib_path = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'lib', 'd3-weighted-voronoi.min.js'))
-    d3_sankey_lib_path = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'lib', 'd3-sankey.min.js'))
-    d3_rough_lib_path = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'lib', 'svg2roughjs.umd.min.js'))
-    # 使用文件协议的URL (用于SVG渲染)
-    d3_lib_url = f"file://{d3_lib_path}"
-    d3_voronoi_lib_url = f"file://{d3_voronoi_lib_path}"
-    d3_weighted_voronoi_lib_url = f"file://{d3_weighted_voronoi_lib_path}"
-    d3_sankey_lib_url = f"file://{d3_sankey_lib_path}"
-    d3_rough_lib_url = f"file://{d3_rough_lib_path}"
-
-    lib_urls = [d3_lib_url, d3_voronoi_lib_url, d3_weighted_voronoi_lib_url, d3_sankey_lib_url, d3_rough_lib_url]
-    lib_urls_str = "\n".join([f"<script src='{url}'></script>" for url in lib_urls])
-
-    utils_lib_path = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'lib', 'utils.js'))
-    utils_code = _load_js_code(utils_lib_path)
-    js_code = _load_js_code(js_file)
-    # Create HTML content    
-    formatted_html = html_template % (lib_urls_str, width, height)
-    formatted_html = formatted_html.replace('JSON_DATA_PLACEHOLDER', json.dumps(json_data))
-    formatted_html = formatted_html.replace('JS_CODE_PLACEHOLDER', js_code)
-    formatted_html = formatted_html.replace('UTILS_LIB_PLACEHOLDER', utils_code)
+    
+    compiled = get_compiled_template('d3', js_file)
+    formatted_html = compiled.to_html(json_data, width, height)
+    
     # Save the HTML to a file
     output_file = _save_to_file(formatted_html, output_file, prefix="_d3")
     # 简化日志输出
     return output_file
 
+def _write_chart_html(json_data, html_file, js_file, width, height, framework, framework_type='js'):
+    """
+    根据框架类型生成图表HTML文件
+    
+    Args:
+        json_data (dict): 图表数据
+        html_file (str): HTML文件保存路径
+        js_file: JavaScript文件路径，echarts_py时为模板对象
+        width (int): 图表宽度(像素)
+        height (int): 图表高度(像素)
+        framework (str): 图表框架
+        framework_type (str): 框架类型，'js'或'py'
+    """
+    if framework.lower() not in ("echarts", "d3"):
+        raise ValueError(f"Unsupported framework: {framework}")
+    compiled, data = prepare_chart(json_data, js_file, framework, framework_type)
+    _save_to_file(compiled.to_html(data, width, height), html_file)
+
 def render_chart_to_svg(json_data, \
                         js_file=None, width=None, height=None, \
                         framework="echarts", framework_type='js', html_output_path=None):
@@ -513,24 +478,28 @@ def render_chart_to_svg(json_data, \
     html_file = os.path.join(temp_dir, 'chart.html')
 
     try:
-        # 根据框架类型生成HTML文件
-        if framework.lower() == "echarts" and framework_type == 'js':
-            load_js_echarts(json_data=json_data, output_file=html_file, js_file=js_file, width=width, height=height)
-        elif framework.lower() == "echarts" and framework_type == 'py':
-            template = js_file
-            options = template.make_options(json_data)
-            option_data = json.dumps(options)
-            load_js_echarts(json_data=option_data, output_file=html_file, width=width, height=height)
-        elif framework.lower() == "d3":
-            load_d3js(json_data=json_data, output_file=html_file, js_file=js_file, width=width, height=height)
-        else:
-            raise ValueError(f"Unsupported framework: {framework}")
+        # 相同模板、数据和尺寸的图表直接使用缓存的SVG
+        cache_key = render_cache_key(json_data, js_file, width, height, framework, framework_type)
+        svg_content = get_cached_svg(cache_key)
+        if svg_content is not None:
+            return None, svg_content
         
+        # 按引擎选择渲染后端，SSR/jsdom失败时回退到浏览器
+        svg_content = render_without_browser(json_data, js_file, width, height, framework, framework_type)
+        if svg_content is not None:
+            store_cached_svg(cache_key, svg_content)
+            return None, svg_content
         
-        # 使用html_to_svg转换为SVG
-        svg_content = html_to_svg(html_file, width=width, height=height)
+        # 浏览器渲染：优先在渲染池已加载库文件的页面中注入模板，失败时生成HTML文件再转换
+        svg_content, complete = _chart_to_svg_inline(json_data, js_file, width, height, framework, framework_type)
+        if svg_content is None:
+            _write_chart_html(json_data, html_file, js_file, width, height, framework, framework_type)
+            svg_content, complete = render_html_to_svg(html_file, width=width, height=height)
         
         if svg_content is not None:
+            # 截图回退和超时时的部分DOM不缓存
+            if complete:
+                store_cached_svg(cache_key, svg_content)
             # 简化日志输出，只返回路径，不打印
             return None, svg_content
         else:
@@ -544,6 +513,75 @@ def render_chart_to_svg(json_data, \
         if os.path.exists(temp_dir):
            cleanup_temp_dir(temp_dir)
 
+def render_charts_to_svg(jobs, job_timeout=None):
+    """
+    批量渲染多个图表并返回SVG内容，同一批次的图表共用一个浏览器页面
+    
+    Args:
+        jobs (list): 任务列表，每项为render_chart_to_svg的关键字参数字典
+            (json_data, js_file, width, height, framework, framework_type)
+        job_timeout (float, optional): 单个图表的超时时间(秒)
+        
+    Returns:
+        与jobs一一对应的SVG内容列表，失败的任务对应None
+    """
+    results = [None] * len(jobs)
+    temp_dir = create_temp_dir(prefix="batch_svg_")
+    batch_jobs = []
+    batch_indices = []
+    batch_cache_keys = []
+    
+    try:
+        for index, job in enumerate(jobs):
+            framework = job.get('framework', 'echarts')
+            
+            # VegaLite不经过浏览器，逐个渲染
+            if framework.lower() == "vegalite":
+                rendered = render_chart_to_svg(**job)
+                results[index] = rendered[1] if rendered else None
+                continue
+            
+            width, height = job.get('width'), job.get('height')
+            if width is None or height is None:
+                w, h = _get_dimensions(job['json_data'])
+                width = width or w
+                height = height or h
+            
+            # 先查缓存，SSR/jsdom后端的图表直接在Node中渲染，失败的再交给浏览器批次
+            framework_type = job.get('framework_type', 'js')
+            cache_key = render_cache_key(job['json_data'], job.get('js_file'), width, height, framework, framework_type)
+            svg_content = get_cached_svg(cache_key)
+            if svg_content is None:
+                svg_content = render_without_browser(job['json_data'], job.get('js_file'), width, height, framework, framework_type)
+                store_cached_svg(cache_key, svg_content)
+            if svg_content is not None:
+                results[index] = svg_content
+                continue
+            
+            html_file = os.path.join(temp_dir, f'chart_{index}.html')
+            try:
+                _write_chart_html(job['json_data'], html_file, job.get('js_file'), width, height,
+                                  framework, framework_type)
+            except Exception as e:
+                print(f"Error load charts: {e}")
+                continue
+            
+            batch_jobs.append({'html_file': html_file, 'width': width, 'height': height})
+            batch_indices.append(index)
+            batch_cache_keys.append(cache_key)
+        
+        svg_contents = html_to_svg_batch(batch_jobs, job_timeout=job_timeout)
+        for index, cache_key, (svg_content, complete) in zip(batch_indices, batch_cache_keys, svg_contents):
+            results[index] = svg_content
+            # 截图回退和超时时的部分DOM不缓存
+            if complete:
+                store_cached_svg(cache_key, svg_content)
+        return results
+    
+    finally:
+        if os.path.exists(temp_dir):
+           cleanup_temp_dir(temp_dir)
+
 def render_vegalite_specification_to_svg(vegalite_specification, output_svg_path):
     import subprocess
     import json
@@ -0,0 +1,323 @@
+import os
+import json
+import glob
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from modules.chart_engine.utils.file_utils import ensure_temp_dir
+
+logger = logging.getLogger(__name__)
+
+# 渲染结果缓存：相同模板、数据、尺寸的图表直接复用之前生成的SVG
+# 可通过环境变量配置：
+#   CHART_RENDER_CACHE=0 禁用缓存
+#   CHART_RENDER_CACHE_DIR 缓存目录（默认 tmp/render_cache）
+#   CHART_RENDER_CACHE_MAX_MB 缓存总大小上限，超出后按最近最少使用淘汰（默认512）
+RENDER_CACHE_ENABLED = os.environ.get('CHART_RENDER_CACHE', '1') != '0'
+RENDER_CACHE_DIR = os.environ.get('CHART_RENDER_CACHE_DIR', '')
+RENDER_CACHE_MAX_BYTES = int(float(os.environ.get('CHART_RENDER_CACHE_MAX_MB', '512')) * 1024 * 1024)
+# 渲染逻辑发生不兼容变化时递增，使旧缓存全部失效
+RENDER_CACHE_VERSION = 1
+# 淘汰时清理到上限的这一比例，避免每次写入都触发淘汰
+RENDER_CACHE_EVICT_RATIO = 0.9
+
+_UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_LIB_DIR = os.path.join(os.path.dirname(_UTILS_DIR), 'static', 'lib')
+# 影响渲染结果的渲染器脚本，与static/lib中的库一起计入缓存键
+RENDERER_FILES = [
+    os.path.join(_UTILS_DIR, 'render_server.cjs'),
+    os.path.join(_UTILS_DIR, 'ssr_server.cjs'),
+    os.path.join(_UTILS_DIR, 'jsdom_shim.cjs'),
+]
+
+# 文件摘要缓存：{路径: (mtime_ns, size, sha256)}，文件修改后自动重新计算
+_file_digests = {}
+_file_digests_lock = threading.Lock()
+
+
+def file_digest(file_path):
+    """
+    计算文件内容的SHA256，按修改时间和大小缓存
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        十六进制摘要；文件不存在时返回None
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    with _file_digests_lock:
+        cached = _file_digests.get(file_path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+    with open(file_path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    with _file_digests_lock:
+        _file_digests[file_path] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+
+def library_fingerprint():
+    """
+    计算渲染依赖（static/lib中的库和渲染器脚本）的联合摘要
+
+    Returns:
+        十六进制摘要
+    """
+    files = sorted(glob.glob(os.path.join(STATIC_LIB_DIR, '*.js'))) + RENDERER_FILES
+    hasher = hashlib.sha256()
+    for path in files:
+        hasher.update(os.path.basename(path).encode('utf-8'))
+        hasher.update((file_digest(path) or '').encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def _template_digest(js_file, framework_type):
+    # echarts_py模板是已加载的模块对象，使用其源文件
+    if framework_type == 'py' or not isinstance(js_file, str):
+        js_file = getattr(js_file, '__file__', None)
+    if not js_file:
+        return None
+    return file_digest(js_file)
+
+
+def canonical_json(data):
+    """数据的规范化JSON表示：键排序、无多余空白，保证相同内容得到相同的键"""
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+
+
+class RenderCache:
+    """
+    基于内容寻址的SVG渲染缓存
+
+    缓存键是模板文件内容、渲染库版本、规范化输入数据和图表尺寸的SHA256，
+    模板或库文件修改后键随之变化，旧条目不再命中并最终被LRU淘汰。
+    条目以 <key[:2]>/<key>.svg 存放，文件修改时间记录最近一次访问。
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=RENDER_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir or RENDER_CACHE_DIR or os.path.join(ensure_temp_dir(), 'render_cache')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # {key: size}，按访问顺序排列，最久未使用的在最前
+        self._index = None
+        self._total_bytes = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.svg')
+
+    def _load_index(self):
+        # 首次使用时扫描磁盘，按修改时间恢复LRU顺序
+        if self._index is not None:
+            return
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, '*', '*.svg')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, os.path.basename(path)[:-4], stat.st_size))
+        entries.sort()
+        self._index = OrderedDict((key, size) for _, key, size in entries)
+        self._total_bytes = sum(size for _, _, size in entries)
+
+    def make_key(self, json_data, js_file, width, height, framework, framework_type='js'):
+        """
+        生成缓存键
+
+        Args:
+            json_data: 图表数据
+            js_file: 模板文件路径，echarts_py为模板模块
+            width: 图表宽度
+            height: 图表高度
+            framework: 图表框架
+            framework_type: "js" 或 "py"
+
+        Returns:
+            缓存键；模板无法定位到文件时返回None（不缓存）
+        """
+        template_digest = _template_digest(js_file, framework_type)
+        if template_digest is None:
+            return None
+        hasher = hashlib.sha256()
+        for part in (str(RENDER_CACHE_VERSION), template_digest, library_fingerprint(),
+                     (framework or '').lower(), framework_type or 'js', str(width), str(height)):
+            hasher.update(part.encode('utf-8'))
+            hasher.update(b'\0')
+        hasher.update(canonical_json(json_data).encode('utf-8'))
+        return hasher.hexdigest()
+
+    def get(self, key):
+        """
+        读取缓存的SVG
+
+        Args:
+            key: make_key生成的缓存键
+
+        Returns:
+            SVG字符串；未命中时返回None
+        """
+        if key is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                svg_content = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+                if self._index is not None and self._index.pop(key, None) is not None:
+                    # 条目已被其他进程删除
+                    self._total_bytes = sum(self._index.values())
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self._load_index()
+            if key in self._index:
+                self._index.move_to_end(key)
+            else:
+                # 其他进程写入的条目
+                size = len(svg_content.encode('utf-8'))
+                self._index[key] = size
+                self._total_bytes += size
+        return svg_content
+
+    def put(self, key, svg_content):
+        """
+        写入SVG，必要时淘汰最久未使用的条目
+
+        Args:
+            key: make_key生成的缓存键
+            svg_content: SVG字符串
+        """
+        if key is None or not svg_content:
+            return
+        data = svg_content.encode('utf-8')
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再替换，避免并发读取到不完整的内容
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write render cache entry: {e}")
+            return
+
+        with self._lock:
+            self.stores += 1
+            self._load_index()
+            self._total_bytes += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        target = self.max_bytes * RENDER_CACHE_EVICT_RATIO
+        while self._index and self._total_bytes > target:
+            key, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        """删除所有缓存条目"""
+        with self._lock:
+            self._load_index()
+            for key in list(self._index):
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._index.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        """
+        Returns:
+            dict: 命中、未命中、写入、淘汰次数以及当前条目数和总大小
+        """
+        with self._lock:
+            self._load_index()
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'entries': len(self._index),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_render_cache():
+    """
+    获取进程内共享的渲染缓存
+
+    Returns:
+        RenderCache实例；缓存被禁用时返回None
+    """
+    global _cache
+    if not RENDER_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = RenderCache()
+        return _cache
+
+
+def render_cache_key(json_data, js_file, width, height, framework, framework_type='js'):
+    """
+    计算渲染缓存键，缓存禁用或模板无法缓存时返回None
+    """
+    cache = get_render_cache()
+    if cache is None:
+        return None
+    try:
+        return cache.make_key(json_data, js_file, width, height, framework, framework_type)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"Failed to compute render cache key: {e}")
+        return None
+
+
+def get_cached_svg(key):
+    """按缓存键读取SVG，未命中或缓存禁用时返回None"""
+    cache = get_render_cache()
+    return cache.get(key) if cache is not None and key is not None else None
+
+
+def store_cached_svg(key, svg_content):
+    """写入渲染结果，缓存禁用或键为None时忽略"""
+    cache = get_render_cache()
+    if cache is not None and key is not None:
+        cache.put(key, svg_content)
+
+
+def get_render_cache_stats():
+    """
+    Returns:
+        dict: 渲染缓存统计信息；缓存禁用时返回None
+    """
+    cache = get_render_cache()
+    return cache.stats() if cache is not None else None
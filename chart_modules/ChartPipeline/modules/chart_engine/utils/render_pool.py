@@ -0,0 +1,332 @@
+import os
+import json
+import time
+import atexit
+import threading
+import subprocess
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 渲染池配置，可通过环境变量覆盖
+RENDER_POOL_ENABLED = os.environ.get('CHART_RENDER_POOL', '1') != '0'
+RENDER_POOL_SIZE = int(os.environ.get('CHART_RENDER_POOL_SIZE', '4'))
+RENDER_PAGE_MAX_USES = int(os.environ.get('CHART_RENDER_PAGE_MAX_USES', '50'))
+RENDER_TIMEOUT = float(os.environ.get('CHART_RENDER_TIMEOUT', '60'))
+RENDER_STARTUP_TIMEOUT = float(os.environ.get('CHART_RENDER_STARTUP_TIMEOUT', '30'))
+# 等待图表chart-ready信号的最长时间(秒)，超时后直接提取当前DOM
+RENDER_READY_TIMEOUT = float(os.environ.get('CHART_RENDER_READY_TIMEOUT', '10'))
+# 单个批次最多挂载的图表数量，更大的批次会被拆分
+RENDER_BATCH_SIZE = int(os.environ.get('CHART_RENDER_BATCH_SIZE', '16'))
+# 渲染进程启动失败后，等待多少秒再尝试启动（期间回退到一次性脚本），避免每个图表都重复启动失败的进程
+RENDER_RESTART_BACKOFF = float(os.environ.get('CHART_RENDER_RESTART_BACKOFF', '60'))
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'render_server.cjs')
+
+
+class RenderPoolError(Exception):
+    """渲染池不可用或渲染请求失败"""
+
+
+class NodeWorker:
+    """
+    常驻Node进程的通用封装
+
+    子进程通过stdin/stdout按行交换JSON消息：启动完成后输出 {"type": "ready"}，
+    启动失败输出 {"type": "error"}；之后每个请求带有id，响应按id分发，结果通过Future回传，
+    因此多个线程可以同时提交请求。
+    """
+
+    script = None
+    name = 'Node worker'
+
+    def __init__(self, startup_timeout=RENDER_STARTUP_TIMEOUT):
+        self.startup_timeout = startup_timeout
+        self._process = None
+        self._reader = None
+        self._pending = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._startup_error = None
+
+    def _build_env(self):
+        """子进程环境变量，子类可以追加自己的配置"""
+        env = dict(os.environ)
+        # 与旧的临时脚本保持一致：允许从当前工作目录的node_modules中解析依赖
+        node_path = os.path.join(os.getcwd(), 'node_modules')
+        env['NODE_PATH'] = os.pathsep.join(filter(None, [env.get('NODE_PATH'), node_path]))
+        return env
+
+    def start(self):
+        """启动守护进程并等待其就绪"""
+        self._ready.clear()
+        self._startup_error = None
+        self._process = subprocess.Popen(
+            ['node', self.script],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=None,
+            env=self._build_env(),
+            text=True,
+            encoding='utf-8',
+            bufsize=1
+        )
+        self._reader = threading.Thread(target=self._read_loop, args=(self._process,), daemon=True)
+        self._reader.start()
+
+        if not self._ready.wait(self.startup_timeout):
+            self.close()
+            raise RenderPoolError(f"{self.name} did not become ready in time")
+        if self._startup_error is not None:
+            self.close()
+            raise RenderPoolError(f"{self.name} failed to start: {self._startup_error}")
+
+    def is_alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def _read_loop(self, process):
+        for line in process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Unexpected output from {self.name}: {line[:200]}")
+                continue
+
+            if message.get('type') == 'ready':
+                self._ready.set()
+                continue
+            if message.get('type') == 'error':
+                self._startup_error = message.get('error')
+                self._ready.set()
+                continue
+
+            with self._lock:
+                future = self._pending.pop(message.get('id'), None)
+            if future is not None:
+                future.set_result(message)
+
+        # 进程退出：唤醒启动等待并让所有未完成的请求失败
+        self._ready.set()
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            future.set_exception(RenderPoolError(f"{self.name} exited"))
+
+    def _request(self, payload, timeout):
+        if not self.is_alive():
+            raise RenderPoolError(f"{self.name} is not running")
+
+        future = Future()
+        with self._lock:
+            self._next_id += 1
+            request_id = self._next_id
+            self._pending[request_id] = future
+            try:
+                self._process.stdin.write(json.dumps(dict(payload, id=request_id)) + '\n')
+                self._process.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                self._pending.pop(request_id, None)
+                raise RenderPoolError(f"Failed to send request to {self.name}: {e}")
+
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise RenderPoolError(f"{self.name} request {request_id} timed out after {timeout}s")
+
+    def _checked_request(self, payload, timeout):
+        """发送请求并检查响应；超时后做一次健康检查，守护进程无响应则关闭，下次获取时重启"""
+        try:
+            response = self._request(payload, timeout)
+        except RenderPoolError:
+            if self.is_alive() and not self.ping():
+                self.close()
+            raise
+        if not response.get('ok'):
+            raise RenderPoolError(response.get('error', 'Unknown render error'))
+        return response
+
+    def ping(self, timeout=5):
+        """健康检查，守护进程正常响应时返回True"""
+        try:
+            return bool(self._request({'type': 'ping'}, timeout).get('ok'))
+        except RenderPoolError:
+            return False
+
+    def close(self):
+        """关闭守护进程"""
+        process = self._process
+        self._process = None
+        if process is None:
+            return
+        try:
+            if process.poll() is None:
+                process.stdin.write(json.dumps({'type': 'shutdown', 'id': 0}) + '\n')
+                process.stdin.flush()
+                process.stdin.close()
+                process.wait(timeout=10)
+        except Exception:
+            pass
+        finally:
+            if process.poll() is None:
+                process.kill()
+
+
+class RenderPool(NodeWorker):
+    """
+    常驻的无头浏览器渲染池
+
+    启动一个Node守护进程(render_server.cjs)，由它维护一个Chrome实例和N个预热页面。
+    """
+
+    script = SERVER_SCRIPT
+    name = 'Render server'
+
+    def __init__(self, pool_size=RENDER_POOL_SIZE, max_page_uses=RENDER_PAGE_MAX_USES,
+                 startup_timeout=RENDER_STARTUP_TIMEOUT):
+        super().__init__(startup_timeout)
+        self.pool_size = pool_size
+        self.max_page_uses = max_page_uses
+
+    def _build_env(self):
+        env = super()._build_env()
+        env['RENDER_POOL_SIZE'] = str(self.pool_size)
+        env['RENDER_PAGE_MAX_USES'] = str(self.max_page_uses)
+        env['RENDER_READY_TIMEOUT_MS'] = str(int(RENDER_READY_TIMEOUT * 1000))
+        return env
+
+    def start(self):
+        super().start()
+        logger.info(f"Render pool started with {self.pool_size} pages")
+
+    def render(self, html_file, width=1200, height=800, timeout=RENDER_TIMEOUT):
+        """
+        渲染HTML文件并提取SVG
+
+        Args:
+            html_file: HTML文件路径
+            width: 视口宽度
+            height: 视口高度
+            timeout: 请求超时时间(秒)
+
+        Returns:
+            Dict，包含 'svg'（提取失败时为None）、'screenshot'（仅在无法提取SVG时提供的base64 PNG）
+            和 'ready'（图表是否在超时前发出chart-ready信号）
+        """
+        return self._checked_request({
+            'type': 'render',
+            'html_file': os.path.abspath(html_file),
+            'width': int(width),
+            'height': int(height)
+        }, timeout)
+
+    def render_inline(self, base_file, script_key, script, json_data, width=1200, height=800,
+                      timeout=RENDER_TIMEOUT):
+        """
+        在预加载了库文件的页面中注入模板并渲染，页面只在首次使用时加载库文件
+
+        Args:
+            base_file: 预加载页面路径（template_bundle.get_base_page）
+            script_key: 模板工厂函数的摘要，页面据此判断是否已经注入
+            script: 模板工厂函数源码
+            json_data: 图表数据
+            width: 视口宽度
+            height: 视口高度
+            timeout: 请求超时时间(秒)
+
+        Returns:
+            Dict，包含 'svg'、'screenshot' 和 'ready'，与render一致
+        """
+        return self._checked_request({
+            'type': 'render_inline',
+            'base_file': os.path.abspath(base_file),
+            'script_key': script_key,
+            'script': script,
+            'json_data': json_data,
+            'width': int(width),
+            'height': int(height)
+        }, timeout)
+
+    def render_batch(self, jobs, job_timeout=None, timeout=RENDER_TIMEOUT):
+        """
+        在同一个页面中批量渲染多个HTML文件，每个任务挂载在独立的iframe中
+
+        Args:
+            jobs: 任务列表，每项为 {'html_file': 路径, 'width': 宽, 'height': 高}
+            job_timeout: 单个任务的超时时间(秒)，默认为就绪超时再加5秒
+            timeout: 整个批次请求的超时时间(秒)
+
+        Returns:
+            与jobs一一对应的结果列表，每项包含 'ok'，成功时包含 'svg'/'screenshot'/'ready'，失败时包含 'error'
+        """
+        if not jobs:
+            return []
+        payload = {
+            'type': 'render_batch',
+            'jobs': [{
+                'html_file': os.path.abspath(job['html_file']),
+                'width': int(job.get('width') or 1200),
+                'height': int(job.get('height') or 800)
+            } for job in jobs]
+        }
+        if job_timeout is not None:
+            payload['job_timeout_ms'] = int(job_timeout * 1000)
+        return self._checked_request(payload, timeout)['results']
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# 启动失败后在该时间(time.monotonic)之前不再尝试启动
+_pool_retry_at = 0.0
+
+
+def get_render_pool():
+    """
+    获取进程内共享的渲染池，必要时启动或在健康检查失败后重启
+
+    Returns:
+        RenderPool实例；渲染池被禁用或无法启动时返回None，调用方应回退到一次性脚本。
+        启动失败后RENDER_RESTART_BACKOFF秒内直接返回None，之后再次尝试启动
+    """
+    global _pool, _pool_retry_at
+    if not RENDER_POOL_ENABLED or time.monotonic() < _pool_retry_at:
+        return None
+
+    with _pool_lock:
+        if _pool is not None and _pool.is_alive():
+            return _pool
+
+        if _pool is not None:
+            logger.warning("Render server exited, restarting")
+            _pool.close()
+            _pool = None
+
+        pool = RenderPool()
+        try:
+            pool.start()
+        except (RenderPoolError, OSError) as e:
+            logger.warning(f"Render pool unavailable, falling back to per-chart browser "
+                           f"for {RENDER_RESTART_BACKOFF:g}s: {e}")
+            _pool_retry_at = time.monotonic() + RENDER_RESTART_BACKOFF
+            return None
+        _pool = pool
+        return _pool
+
+
+def shutdown_render_pool():
+    """关闭共享渲染池"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+atexit.register(shutdown_render_pool)
@@ -0,0 +1,330 @@
+// 常驻渲染服务：启动一次Chrome并维护N个预热页面，通过stdin/stdout按行收发JSON请求
+//
+// 请求格式（每行一个JSON）:
+//   {"id": 1, "type": "render", "html_file": "/abs/chart.html", "width": 1200, "height": 800}
+//   {"id": 2, "type": "render_batch", "jobs": [{"html_file": "/abs/a.html", "width": 800, "height": 600}, ...]}
+//   {"id": 5, "type": "render_inline", "base_file": "/abs/base.html", "script_key": "...", "script": "(function(data, container) {...})",
+//    "json_data": {...}, "width": 1200, "height": 800}
+//   {"id": 3, "type": "ping"}
+//   {"id": 4, "type": "shutdown"}
+// 响应格式:
+//   {"id": 1, "ok": true, "svg": "<svg ...>", "screenshot": null, "ready": true}
+//   {"id": 1, "ok": false, "error": "..."}
+//   {"id": 2, "ok": true, "results": [{"ok": true, "svg": "...", "screenshot": null, "ready": true}, {"ok": false, "error": "..."}]}
+// ready为false表示图表未在超时前发出chart-ready信号，svg可能是未绘制完成的DOM
+// 启动完成后会先输出一行 {"type": "ready", "pool_size": N}
+const puppeteer = require('puppeteer');
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+const readline = require('readline');
+
+const POOL_SIZE = Math.max(1, parseInt(process.env.RENDER_POOL_SIZE || '4', 10));
+const MAX_PAGE_USES = Math.max(1, parseInt(process.env.RENDER_PAGE_MAX_USES || '50', 10));
+const CHROME_PATH = process.env.RENDER_CHROME_PATH || '/usr/bin/google-chrome';
+// 等待页面发出chart-ready信号的最长时间，超时后按当前DOM状态提取（兜底）
+const READY_TIMEOUT_MS = Math.max(0, parseInt(process.env.RENDER_READY_TIMEOUT_MS || '10000', 10));
+
+let browser = null;
+let livePages = 0;
+const idlePages = [];
+const waiters = [];
+let shuttingDown = false;
+
+function send(message) {
+    process.stdout.write(JSON.stringify(message) + '\n');
+}
+
+function log(...args) {
+    // stdout只用于协议消息，日志统一输出到stderr
+    console.error('[render_server]', ...args);
+}
+
+async function createPage() {
+    const page = await browser.newPage();
+    page.__uses = 0;
+    livePages += 1;
+    return page;
+}
+
+function acquirePage() {
+    if (idlePages.length > 0) {
+        return Promise.resolve(idlePages.pop());
+    }
+    return new Promise(resolve => waiters.push(resolve));
+}
+
+async function releasePage(page, broken) {
+    // 页面出错或使用次数过多时回收并重建，避免内存和状态泄漏
+    if (broken || page.__uses >= MAX_PAGE_USES) {
+        livePages -= 1;
+        await page.close().catch(() => {});
+        try {
+            page = await createPage();
+        } catch (e) {
+            log('Failed to recreate page:', e.message);
+            process.exit(2);
+        }
+    }
+    const waiter = waiters.shift();
+    if (waiter) {
+        waiter(page);
+    } else {
+        idlePages.push(page);
+    }
+}
+
+async function extractSvg(page) {
+    // page也可以是iframe对应的Frame，二者的evaluate接口一致
+    // 优先使用ECharts导出的SVG
+    let svgContent = await page.evaluate(() => {
+        if (typeof echarts === 'undefined') return null;
+        const svgOutput = document.querySelector('#svg-output');
+        if (svgOutput && svgOutput.innerHTML) return svgOutput.innerHTML;
+        const chart = echarts.getInstanceByDom(document.querySelector('#chart-container'));
+        if (!chart) return null;
+        chart.setOption({animation: false});
+        try {
+            return chart.renderToSVGString();
+        } catch (e) {
+            return null;
+        }
+    });
+
+    // 回退到直接从DOM提取SVG
+    if (!svgContent) {
+        svgContent = await page.evaluate(() => {
+            const container = document.querySelector('#chart-container');
+            if (!container) return null;
+            const svg = container.querySelector('svg');
+            if (!svg || svg.childNodes.length === 0) return null;
+
+            const clone = svg.cloneNode(true);
+            if (!clone.hasAttribute('width')) {
+                clone.setAttribute('width', container.clientWidth);
+            }
+            if (!clone.hasAttribute('height')) {
+                clone.setAttribute('height', container.clientHeight);
+            }
+            if (!clone.hasAttribute('viewBox')) {
+                clone.setAttribute('viewBox', `0 0 ${container.clientWidth} ${container.clientHeight}`);
+            }
+            return clone.outerHTML;
+        });
+    }
+    return svgContent;
+}
+
+async function waitForChartReady(page) {
+    // 图表模板在绘制完成后设置window.__chartReady，超时只作为兜底
+    try {
+        await page.waitForFunction(() => window.__chartReady === true, { timeout: READY_TIMEOUT_MS });
+        return true;
+    } catch (e) {
+        log(`Chart did not signal ready within ${READY_TIMEOUT_MS}ms, extracting current DOM`);
+        return false;
+    }
+}
+
+async function handleRenderInline(request) {
+    // 页面导航到预加载了库文件的基础页面后保持不动，每个模板的工厂函数在页面中只注入一次，
+    // 之后的图表只传入数据
+    const page = await acquirePage();
+    let broken = false;
+    try {
+        page.__uses += 1;
+        await page.setViewport({ width: request.width || 1200, height: request.height || 800 });
+        if (page.__baseFile !== request.base_file) {
+            await page.goto('file://' + path.resolve(request.base_file), { waitUntil: 'load' });
+            page.__baseFile = request.base_file;
+            page.__factories = new Set();
+        }
+        if (!page.__factories.has(request.script_key)) {
+            await page.evaluate((key, source) => {
+                // 间接eval在全局作用域中求值，模板的顶层声明封装在工厂函数内部，多个模板互不冲突
+                window.__chartFactories[key] = (0, eval)(source);
+            }, request.script_key, request.script);
+            page.__factories.add(request.script_key);
+        }
+        await page.evaluate((key, data, width, height) => {
+            window.__renderInline(key, data, width, height);
+        }, request.script_key, request.json_data, request.width || 1200, request.height || 800);
+
+        const ready = await waitForChartReady(page);
+        if (!ready) {
+            // 未完成的图表可能仍有定时器在运行，下次使用前重新导航以清理页面状态
+            page.__baseFile = null;
+        }
+        const svg = await extractSvg(page);
+        let screenshot = null;
+        if (!svg) {
+            screenshot = await page.screenshot({ encoding: 'base64', fullPage: true });
+        }
+        send({ id: request.id, ok: true, svg: svg, screenshot: screenshot, ready: ready });
+    } catch (error) {
+        broken = true;
+        send({ id: request.id, ok: false, error: String(error && error.message || error) });
+    } finally {
+        await releasePage(page, broken);
+    }
+}
+
+async function handleRender(request) {
+    const page = await acquirePage();
+    let broken = false;
+    try {
+        page.__uses += 1;
+        await page.setViewport({ width: request.width || 1200, height: request.height || 800 });
+        page.__baseFile = null;
+        await page.goto('file://' + path.resolve(request.html_file), { waitUntil: 'load' });
+        const ready = await waitForChartReady(page);
+
+        const svg = await extractSvg(page);
+        let screenshot = null;
+        if (!svg) {
+            // 最终回退：返回截图，由调用方决定如何包装
+            screenshot = await page.screenshot({ encoding: 'base64', fullPage: true });
+        }
+        send({ id: request.id, ok: true, svg: svg, screenshot: screenshot, ready: ready });
+    } catch (error) {
+        broken = true;
+        send({ id: request.id, ok: false, error: String(error && error.message || error) });
+    } finally {
+        await releasePage(page, broken);
+    }
+}
+
+function buildBatchHtml(jobs) {
+    // 每个任务挂载到独立的iframe中，模板的全局变量(makeChart/make_option等)互不干扰
+    const frames = jobs.map((job, index) => {
+        const src = 'file://' + path.resolve(job.html_file);
+        const width = job.width || 1200;
+        const height = job.height || 800;
+        return `<iframe name="job-${index}" src="${encodeURI(src)}" width="${width}" height="${height}" style="display:block;border:0;"></iframe>`;
+    });
+    return `<!DOCTYPE html><html><head><meta charset="utf-8"></head><body style="margin:0">${frames.join('')}</body></html>`;
+}
+
+async function renderBatchJob(page, index) {
+    const frame = page.frames().find(f => f.name() === `job-${index}`);
+    if (!frame) {
+        throw new Error('Frame failed to load');
+    }
+    let ready = true;
+    try {
+        await frame.waitForFunction(() => window.__chartReady === true, { timeout: READY_TIMEOUT_MS });
+    } catch (e) {
+        ready = false;
+        log(`Batch job ${index} did not signal ready within ${READY_TIMEOUT_MS}ms, extracting current DOM`);
+    }
+    const svg = await extractSvg(frame);
+    let screenshot = null;
+    if (!svg) {
+        const element = await page.$(`iframe[name="job-${index}"]`);
+        screenshot = element ? await element.screenshot({ encoding: 'base64' }) : null;
+    }
+    return { ok: true, svg: svg, screenshot: screenshot, ready: ready };
+}
+
+async function handleRenderBatch(request) {
+    const jobs = request.jobs || [];
+    const page = await acquirePage();
+    let broken = false;
+    const batchFile = path.join(os.tmpdir(), `render_batch_${process.pid}_${request.id}.html`);
+    try {
+        page.__uses += 1;
+        const width = Math.max(...jobs.map(job => job.width || 1200), 1);
+        const height = Math.max(...jobs.map(job => job.height || 800), 1);
+        await page.setViewport({ width: width, height: height });
+        fs.writeFileSync(batchFile, buildBatchHtml(jobs));
+        // 一次导航加载所有iframe，库文件在同一页面内只从磁盘读取一次
+        page.__baseFile = null;
+        await page.goto('file://' + batchFile, { waitUntil: 'load' });
+
+        // 每个任务独立等待和提取，单个任务失败或超时不影响其他任务
+        const jobTimeout = request.job_timeout_ms || (READY_TIMEOUT_MS + 5000);
+        const results = await Promise.all(jobs.map((job, index) => {
+            let timer;
+            const timeout = new Promise((_, reject) => {
+                timer = setTimeout(() => {
+                    // 超时的iframe可能仍在执行脚本，批次结束后回收该页面
+                    broken = true;
+                    reject(new Error(`Job timed out after ${jobTimeout}ms`));
+                }, jobTimeout);
+            });
+            return Promise.race([renderBatchJob(page, index), timeout])
+                .catch(error => ({ ok: false, error: String(error && error.message || error) }))
+                .finally(() => clearTimeout(timer));
+        }));
+        send({ id: request.id, ok: true, results: results });
+    } catch (error) {
+        broken = true;
+        send({ id: request.id, ok: false, error: String(error && error.message || error) });
+    } finally {
+        fs.unlink(batchFile, () => {});
+        await releasePage(page, broken);
+    }
+}
+
+async function shutdown(code) {
+    if (shuttingDown) return;
+    shuttingDown = true;
+    if (browser) {
+        await browser.close().catch(() => {});
+    }
+    process.exit(code);
+}
+
+async function main() {
+    try {
+        browser = await puppeteer.launch({
+            headless: 'new',
+            executablePath: CHROME_PATH,
+            args: ['--no-sandbox', '--disable-setuid-sandbox']
+        });
+        browser.on('disconnected', () => {
+            if (!shuttingDown) {
+                log('Browser disconnected, exiting');
+                process.exit(2);
+            }
+        });
+        for (let i = 0; i < POOL_SIZE; i++) {
+            idlePages.push(await createPage());
+        }
+    } catch (error) {
+        send({ type: 'error', error: String(error && error.message || error) });
+        process.exit(1);
+    }
+
+    send({ type: 'ready', pool_size: POOL_SIZE });
+
+    const rl = readline.createInterface({ input: process.stdin, terminal: false });
+    rl.on('line', line => {
+        if (!line.trim()) return;
+        let request;
+        try {
+            request = JSON.parse(line);
+        } catch (e) {
+            log('Invalid request:', line);
+            return;
+        }
+        if (request.type === 'render') {
+            handleRender(request);
+        } else if (request.type === 'render_inline') {
+            handleRenderInline(request);
+        } else if (request.type === 'render_batch') {
+            handleRenderBatch(request);
+        } else if (request.type === 'ping') {
+            send({ id: request.id, ok: true, pages: livePages, idle: idlePages.length, queued: waiters.length });
+        } else if (request.type === 'shutdown') {
+            send({ id: request.id, ok: true });
+            shutdown(0);
+        } else {
+            send({ id: request.id, ok: false, error: `Unknown request type: ${request.type}` });
+        }
+    });
+    // 父进程退出（stdin关闭）时一并退出
+    rl.on('close', () => shutdown(0));
+}
+
+main();
@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import threading
+import atexit
+import logging
+
+from modules.chart_engine.utils.render_pool import NodeWorker, RenderPoolError, RENDER_TIMEOUT, RENDER_READY_TIMEOUT, RENDER_RESTART_BACKOFF
+from modules.chart_engine.utils.file_utils import ensure_temp_dir
+from modules.chart_engine.template.template_registry import detect_render_backend
+
+logger = logging.getLogger(__name__)
+
+SSR_SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ssr_server.cjs')
+
+# 各引擎使用的渲染后端："ssr" 使用ECharts服务端渲染，"jsdom" 在jsdom中运行D3模板，"browser" 使用无头浏览器
+# 非浏览器后端失败时总是回退到浏览器；可通过环境变量 CHART_RENDER_BACKEND_<ENGINE> 覆盖，
+# 例如 CHART_RENDER_BACKEND_ECHARTS_JS=browser
+RENDER_BACKENDS = {
+    'echarts-js': 'ssr',
+    'echarts_py': 'ssr',
+    'd3-js': 'jsdom',
+}
+
+# title_styler字体度量生成的字形宽度表，供jsdom中的文本测量使用
+FONT_METRICS_FAMILIES = ['Arial', 'Times', 'Courier', 'Verdana', 'Comics']
+FONT_METRICS_BASE_SIZE = 100
+
+
+def get_render_backend(framework, framework_type='js', js_file=None):
+    """
+    根据引擎确定渲染后端
+
+    Args:
+        framework: 图表框架，"echarts" 或 "d3"
+        framework_type: 框架类型，"js" 或 "py"
+        js_file: 模板文件路径（可选），D3模板据此判断能否在jsdom中渲染
+
+    Returns:
+        "ssr"、"jsdom" 或 "browser"
+    """
+    framework = (framework or '').lower()
+    engine = 'echarts_py' if framework == 'echarts' and framework_type == 'py' else \
+        'echarts-js' if framework == 'echarts' else f'{framework}-js'
+    env_key = 'CHART_RENDER_BACKEND_' + engine.upper().replace('-', '_')
+    backend = os.environ.get(env_key, RENDER_BACKENDS.get(engine, 'browser'))
+    if backend == 'jsdom' and (not isinstance(js_file, str) or detect_render_backend(js_file) != 'jsdom'):
+        backend = 'browser'
+    return backend
+
+
+def build_font_metrics(output_path):
+    """
+    使用title_styler的字体加载逻辑生成字形宽度表
+
+    Args:
+        output_path: 输出JSON文件路径
+
+    Returns:
+        输出文件路径；字体加载失败时返回None（jsdom端使用平均字宽估算）
+    """
+    from PIL import ImageFont
+    from modules.title_styler.title_styler import get_font
+
+    fonts = {}
+    for family in FONT_METRICS_FAMILIES + ['Default']:
+        font = get_font(family, FONT_METRICS_BASE_SIZE)
+        # PIL的默认位图字体无法缩放，度量没有意义
+        if not isinstance(font, ImageFont.FreeTypeFont):
+            continue
+        ascent, descent = font.getmetrics()
+        advances = {chr(code): font.getlength(chr(code)) for code in range(32, 127)}
+        fonts[family.lower() if family != 'Default' else 'default'] = {
+            'advances': advances,
+            'default_advance': font.getlength('n'),
+            'cjk_advance': font.getlength('中'),
+            'ascent': ascent,
+            'descent': descent
+        }
+    if not fonts:
+        return None
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump({'base_size': FONT_METRICS_BASE_SIZE, 'fonts': fonts}, f)
+    return output_path
+
+
+class SSRWorker(NodeWorker):
+    """
+    常驻的服务端渲染进程(ssr_server.cjs)，不依赖浏览器
+
+    ECharts使用 `ssr: true` 直接输出SVG字符串，模板按文件缓存编译结果。
+    """
+
+    script = SSR_SERVER_SCRIPT
+    name = 'SSR server'
+
+    def _build_env(self):
+        env = super()._build_env()
+        env['RENDER_READY_TIMEOUT_MS'] = str(int(RENDER_READY_TIMEOUT * 1000))
+        metrics_path = os.path.join(ensure_temp_dir(), 'font_metrics.json')
+        try:
+            if os.path.exists(metrics_path) or build_font_metrics(metrics_path):
+                env['RENDER_FONT_METRICS'] = os.path.abspath(metrics_path)
+        except Exception as e:
+            logger.warning(f"Failed to build font metrics, using estimated text widths: {e}")
+        return env
+
+    def render_echarts(self, json_data=None, js_file=None, options=None, width=1200, height=800,
+                       timeout=RENDER_TIMEOUT):
+        """
+        通过ECharts SSR渲染SVG
+
+        Args:
+            json_data: 图表数据，传给模板的make_option
+            js_file: ECharts模板文件路径
+            options: 已生成的ECharts配置（echarts_py模板），提供时忽略js_file
+            width: 图表宽度
+            height: 图表高度
+            timeout: 请求超时时间(秒)
+
+        Returns:
+            SVG字符串
+        """
+        payload = {'type': 'echarts', 'width': int(width), 'height': int(height)}
+        if options is not None:
+            payload['options'] = options
+        else:
+            payload['js_file'] = os.path.abspath(js_file)
+            payload['json_data'] = json_data
+        return self._checked_request(payload, timeout)['svg']
+
+    def render_d3(self, json_data, js_file, width=1200, height=800, timeout=RENDER_TIMEOUT):
+        """
+        在jsdom中运行D3模板并提取SVG
+
+        Args:
+            json_data: 图表数据，传给模板的makeChart
+            js_file: D3模板文件路径
+            width: 图表宽度
+            height: 图表高度
+            timeout: 请求超时时间(秒)
+
+        Returns:
+            SVG字符串
+        """
+        return self._checked_request({
+            'type': 'd3',
+            'js_file': os.path.abspath(js_file),
+            'json_data': json_data,
+            'width': int(width),
+            'height': int(height)
+        }, timeout)['svg']
+
+
+_worker = None
+_worker_lock = threading.Lock()
+# 启动失败后在该时间(time.monotonic)之前不再尝试启动，期间回退到浏览器
+_worker_retry_at = 0.0
+# jsdom未安装时只提示一次，之后D3模板直接使用浏览器
+_jsdom_missing = False
+
+
+def get_ssr_worker():
+    """
+    获取进程内共享的SSR进程，必要时启动或在退出后重启
+
+    Returns:
+        SSRWorker实例；无法启动时返回None，调用方应回退到浏览器渲染。
+        启动失败后RENDER_RESTART_BACKOFF秒内直接返回None，之后再次尝试启动
+    """
+    global _worker, _worker_retry_at
+    if time.monotonic() < _worker_retry_at:
+        return None
+
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return _worker
+
+        if _worker is not None:
+            logger.warning("SSR server exited, restarting")
+            _worker.close()
+            _worker = None
+
+        worker = SSRWorker()
+        try:
+            worker.start()
+        except (RenderPoolError, OSError) as e:
+            logger.warning(f"SSR server unavailable, falling back to browser rendering "
+                           f"for {RENDER_RESTART_BACKOFF:g}s: {e}")
+            _worker_retry_at = time.monotonic() + RENDER_RESTART_BACKOFF
+            return None
+        _worker = worker
+        return _worker
+
+
+def render_without_browser(json_data, js_file, width, height, framework, framework_type='js'):
+    """
+    按引擎选择的后端在Node中直接渲染图表，不启动浏览器
+
+    Args:
+        json_data: 图表数据
+        js_file: 模板文件路径，echarts_py为模板对象
+        width: 图表宽度
+        height: 图表高度
+        framework: 图表框架，"echarts" 或 "d3"
+        framework_type: "js" 或 "py"
+
+    Returns:
+        SVG字符串；该引擎使用浏览器后端、SSR进程不可用或渲染失败时返回None，调用方应回退到浏览器
+    """
+    global _jsdom_missing
+    backend = get_render_backend(framework, framework_type, js_file)
+    if backend == 'browser' or (backend == 'jsdom' and _jsdom_missing):
+        return None
+    worker = get_ssr_worker()
+    if worker is None:
+        return None
+    try:
+        if backend == 'jsdom':
+            return worker.render_d3(json_data, js_file, width=width, height=height)
+        if framework_type == 'py':
+            return worker.render_echarts(options=js_file.make_options(json_data), width=width, height=height)
+        return worker.render_echarts(json_data=json_data, js_file=js_file, width=width, height=height)
+    except RenderPoolError as e:
+        if backend == 'jsdom' and "Cannot find module 'jsdom'" in str(e):
+            _jsdom_missing = True
+            logger.warning("jsdom is not installed (npm install jsdom), D3 charts will use the browser")
+        else:
+            logger.warning(f"{backend} rendering failed, falling back to browser: {e}")
+        return None
+
+
+def shutdown_ssr_worker():
+    """关闭共享SSR进程"""
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            _worker.close()
+            _worker = None
+
+
+atexit.register(shutdown_ssr_worker)
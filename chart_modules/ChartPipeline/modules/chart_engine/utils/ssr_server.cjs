@@ -0,0 +1,223 @@
+// 常驻服务端渲染(SSR)服务：不启动浏览器，直接在Node中生成图表SVG
+//
+// 请求格式（每行一个JSON）:
+//   {"id": 1, "type": "echarts", "js_file": "/abs/template.js", "json_data": {...}, "width": 800, "height": 600}
+//   {"id": 2, "type": "echarts", "options": {...}, "width": 800, "height": 600}
+//   {"id": 5, "type": "d3", "js_file": "/abs/template.js", "json_data": {...}, "width": 800, "height": 600}
+//   {"id": 3, "type": "ping"}
+//   {"id": 4, "type": "shutdown"}
+// 响应格式:
+//   {"id": 1, "ok": true, "svg": "<svg ...>"}
+//   {"id": 1, "ok": false, "error": "..."}
+// 启动完成后会先输出一行 {"type": "ready"}
+const fs = require('fs');
+const path = require('path');
+const vm = require('vm');
+const readline = require('readline');
+const { loadFontMetrics, installShim } = require('./jsdom_shim.cjs');
+
+const STATIC_LIB_DIR = path.join(__dirname, '..', 'static', 'lib');
+// 与浏览器端load_d3js加载的库保持一致（svg2roughjs依赖真实渲染，使用它的模板走浏览器）
+const D3_LIBS = ['d3.min.js', 'd3-voronoi-map.min.js', 'd3-weighted-voronoi.min.js', 'd3-sankey.min.js', 'utils.js'];
+const D3_READY_TIMEOUT_MS = Math.max(0, parseInt(process.env.RENDER_READY_TIMEOUT_MS || '10000', 10));
+const FONT_METRICS_FILE = process.env.RENDER_FONT_METRICS || '';
+
+function send(message) {
+    process.stdout.write(JSON.stringify(message) + '\n');
+}
+
+function log(...args) {
+    // stdout只用于协议消息，日志统一输出到stderr
+    console.error('[ssr_server]', ...args);
+}
+
+function loadEcharts() {
+    // 优先使用node_modules中的echarts，否则加载与浏览器端相同的本地UMD构建
+    try {
+        return require('echarts');
+    } catch (e) {
+        const source = fs.readFileSync(path.join(STATIC_LIB_DIR, 'echarts.min.js'), 'utf8');
+        const module = { exports: {} };
+        new Function('exports', 'module', source)(module.exports, module);
+        return module.exports;
+    }
+}
+
+let echarts = null;
+
+// 模板编译缓存：按文件路径缓存，文件修改时间变化后重新编译
+const templateCache = new Map();
+
+function compileTemplate(jsFile) {
+    const mtime = fs.statSync(jsFile).mtimeMs;
+    const cached = templateCache.get(jsFile);
+    if (cached && cached.mtime === mtime) {
+        return cached.makeOption;
+    }
+    const code = fs.readFileSync(jsFile, 'utf8');
+    const makeOption = new Function('echarts', `${code}\nreturn make_option;`)(echarts);
+    templateCache.set(jsFile, { mtime: mtime, makeOption: makeOption });
+    return makeOption;
+}
+
+function disableAnimation(option) {
+    // 与浏览器端HTML模板保持一致，禁用所有动画
+    option.animation = false;
+    option.animationDuration = 0;
+    option.animationDurationUpdate = 0;
+    option.animationDelay = 0;
+    option.animationDelayUpdate = 0;
+    return option;
+}
+
+function renderEcharts(request) {
+    const option = request.options
+        ? request.options
+        : compileTemplate(request.js_file)(request.json_data);
+    if (!option || typeof option !== 'object') {
+        throw new Error('make_option did not return an option object');
+    }
+
+    const chart = echarts.init(null, null, {
+        renderer: 'svg',
+        ssr: true,
+        width: request.width || 1200,
+        height: request.height || 800,
+        useUTC: true
+    });
+    try {
+        chart.setOption(disableAnimation(option));
+        return chart.renderToSVGString();
+    } finally {
+        chart.dispose();
+    }
+}
+
+// jsdom按需加载，未安装时只影响D3请求（由调用方回退到浏览器）
+let JSDOM = null;
+let fontMetrics = null;
+let d3LibScripts = null;
+const d3TemplateCache = new Map();
+
+function setupJsdom() {
+    if (JSDOM) return;
+    JSDOM = require('jsdom').JSDOM;
+    fontMetrics = loadFontMetrics(FONT_METRICS_FILE);
+    // 库文件只编译一次，每次渲染在新的jsdom上下文中执行
+    d3LibScripts = D3_LIBS.map(name => new vm.Script(
+        fs.readFileSync(path.join(STATIC_LIB_DIR, name), 'utf8'),
+        { filename: name }
+    ));
+}
+
+function compileD3Template(jsFile) {
+    const mtime = fs.statSync(jsFile).mtimeMs;
+    const cached = d3TemplateCache.get(jsFile);
+    if (cached && cached.mtime === mtime) {
+        return cached.script;
+    }
+    const script = new vm.Script(fs.readFileSync(jsFile, 'utf8'), { filename: jsFile });
+    d3TemplateCache.set(jsFile, { mtime: mtime, script: script });
+    return script;
+}
+
+function extractDomSvg(window, width, height) {
+    // 与浏览器端extractSvg一致：补全width/height/viewBox
+    const svg = window.document.querySelector('#chart-container svg');
+    if (!svg || svg.childNodes.length === 0) return null;
+    const clone = svg.cloneNode(true);
+    if (!clone.hasAttribute('width')) clone.setAttribute('width', width);
+    if (!clone.hasAttribute('height')) clone.setAttribute('height', height);
+    if (!clone.hasAttribute('viewBox')) clone.setAttribute('viewBox', `0 0 ${width} ${height}`);
+    if (!clone.hasAttribute('xmlns')) clone.setAttribute('xmlns', 'http://www.w3.org/2000/svg');
+    return clone.outerHTML;
+}
+
+async function renderD3(request) {
+    setupJsdom();
+    const width = request.width || 1200;
+    const height = request.height || 800;
+    const dom = new JSDOM(
+        `<!DOCTYPE html><html><body><div id="chart-container" style="width:${width}px;height:${height}px"></div></body></html>`,
+        { runScripts: 'outside-only', pretendToBeVisual: true }
+    );
+    const window = dom.window;
+    try {
+        installShim(window, fontMetrics);
+        window.json_data = request.json_data;
+        const context = dom.getInternalVMContext();
+        for (const script of d3LibScripts) {
+            script.runInContext(context);
+        }
+        compileD3Template(request.js_file).runInContext(context);
+
+        let timer;
+        const timeout = new Promise((_, reject) => {
+            timer = setTimeout(() => reject(new Error(`Chart did not finish within ${D3_READY_TIMEOUT_MS}ms`)), D3_READY_TIMEOUT_MS);
+        });
+        try {
+            await Promise.race([
+                window.eval("renderChartWithSignal(makeChart, '#chart-container', json_data)"),
+                timeout
+            ]);
+        } finally {
+            clearTimeout(timer);
+        }
+
+        const svg = extractDomSvg(window, width, height);
+        if (!svg) {
+            throw new Error('Template did not produce an SVG element');
+        }
+        return svg;
+    } finally {
+        window.close();
+    }
+}
+
+function handleRequest(request) {
+    try {
+        if (request.type === 'echarts') {
+            send({ id: request.id, ok: true, svg: renderEcharts(request) });
+        } else if (request.type === 'd3') {
+            renderD3(request)
+                .then(svg => send({ id: request.id, ok: true, svg: svg }))
+                .catch(error => send({ id: request.id, ok: false, error: String(error && error.message || error) }));
+        } else if (request.type === 'ping') {
+            send({ id: request.id, ok: true, templates: templateCache.size });
+        } else if (request.type === 'shutdown') {
+            send({ id: request.id, ok: true });
+            process.exit(0);
+        } else {
+            send({ id: request.id, ok: false, error: `Unknown request type: ${request.type}` });
+        }
+    } catch (error) {
+        send({ id: request.id, ok: false, error: String(error && error.message || error) });
+    }
+}
+
+function main() {
+    try {
+        echarts = loadEcharts();
+    } catch (error) {
+        send({ type: 'error', error: String(error && error.message || error) });
+        process.exit(1);
+    }
+    send({ type: 'ready', echarts: echarts.version });
+
+    const rl = readline.createInterface({ input: process.stdin, terminal: false });
+    rl.on('line', line => {
+        if (!line.trim()) return;
+        let request;
+        try {
+            request = JSON.parse(line);
+        } catch (e) {
+            log('Invalid request:', line);
+            return;
+        }
+        handleRequest(request);
+    });
+    // 父进程退出（stdin关闭）时一并退出
+    rl.on('close', () => process.exit(0));
+}
+
+main();
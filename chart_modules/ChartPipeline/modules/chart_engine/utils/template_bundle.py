@@ -0,0 +1,384 @@
+import os
+import json
+import hashlib
+import threading
+
+from modules.chart_engine.utils.file_utils import ensure_temp_dir
+
+# 模板预编译：每个模板与其依赖（utils.js、库文件地址）只读取和拼接一次，按文件修改时间缓存。
+# 每次渲染只需把JSON数据拼接到预编译好的前后两段HTML之间。
+
+STATIC_LIB_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'lib'))
+UTILS_LIB_PATH = os.path.join(STATIC_LIB_DIR, 'utils.js')
+ECHARTS_LIBS = ['echarts.min.js']
+D3_LIBS = ['d3.min.js', 'd3-voronoi-map.min.js', 'd3-weighted-voronoi.min.js', 'd3-sankey.min.js', 'svg2roughjs.umd.min.js']
+
+JSON_DATA_PLACEHOLDER = 'JSON_DATA_PLACEHOLDER'
+
+ECHARTS_HTML_TEMPLATE = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <title>ECharts Chart</title>
+        <script src="%s"></script>
+        <style>
+            #chart-container {
+                width: %dpx;
+                height: %dpx;
+            }
+        </style>
+    </head>
+    <body>
+        <div id="chart-container"></div>
+        <script>
+            // 立即初始化图表，使用SVG渲染器并禁用所有动画
+            var chart = echarts.init(document.getElementById('chart-container'), null, {
+                renderer: 'svg',
+                animation: false,
+                useUTC: true
+            });
+
+            // 禁用全局动画
+            echarts.disableAllAnimation = true;
+
+            // 准备数据
+            const jsonData = JSON_DATA_PLACEHOLDER;
+
+            JS_CODE_PLACEHOLDER
+
+            ECHARTS_RENDER_PLACEHOLDER
+        </script>
+    </body>
+    </html>
+    """
+
+# 生成选项、渲染并在finished事件中导出SVG；HTML页面和渲染池的预加载页面共用这段代码
+ECHARTS_RENDER_CODE = """// 创建图表选项
+            let option;
+            try {
+                option = make_option(jsonData);
+
+                // 禁用所有动画
+                option.animation = false;
+                option.animationDuration = 0;
+                option.animationDurationUpdate = 0;
+                option.animationDelay = 0;
+                option.animationDelayUpdate = 0;
+
+            } catch (e) {
+                console.error("Error creating chart:", e);
+                option = {
+                    title: { text: "Error: " + e.message, left: 'center' }
+                };
+            }
+
+            // 导出SVG并发出chart-ready信号，只执行一次
+            let svgExported = false;
+            function exportSvg() {
+                if (svgExported) return;
+                svgExported = true;
+                try {
+                    const svgContent = chart.renderToSVGString();
+
+                    if (svgContent && svgContent.length > 0) {
+                        const svgContainer = document.createElement('div');
+                        svgContainer.id = 'svg-output';
+                        svgContainer.style.display = 'none';
+                        svgContainer.innerHTML = svgContent;
+                        document.body.appendChild(svgContainer);
+                    }
+                } catch (e) {
+                    console.error("Error exporting SVG:", e);
+                }
+                window.__chartReady = true;
+                document.dispatchEvent(new Event('chart-ready'));
+            }
+
+            // ECharts在渲染结束后触发finished事件，需在setOption之前注册
+            chart.on('finished', exportSvg);
+
+            // 立即设置选项并渲染
+            chart.setOption(option);
+
+            // 备用导出计时器，仅在finished事件未触发时生效
+            setTimeout(exportSvg, 2000);"""
+
+# echarts_py模板的选项已在Python中生成，页面中只需解析
+ECHARTS_PASSTHROUGH_CODE = """
+        function make_option(jsonData) {
+            return JSON.parse(jsonData);
+        }
+        """
+
+# Default HTML template for D3.js - use %% to escape % characters
+D3_HTML_TEMPLATE = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <title>D3.js Chart</title>
+        %s
+        <style>
+            body {
+                font-family: Arial, sans-serif;
+                margin: 20px;
+            }
+            #chart-container {
+                width: 100%%;
+                max-width: %dpx;
+                height: %dpx;
+                margin: 0 auto;
+                background-color: white;
+                border-radius: 8px;
+                overflow: hidden;
+            }
+        </style>
+    </head>
+    <body>
+        <div id="chart-container"></div>
+        <script>
+            // 准备数据
+            const json_data = JSON_DATA_PLACEHOLDER;
+
+            // 导入utils.js
+            UTILS_LIB_PLACEHOLDER
+
+            // D3.js实现
+            JS_CODE_PLACEHOLDER
+
+            // 文档就绪时立即创建图表，绘制完成后导出#svg-output并发出chart-ready信号
+            renderChartWithSignal(makeChart, '#chart-container', json_data);
+        </script>
+    </body>
+    </html>
+    """
+
+# 渲染池预加载页面：库文件只在页面导航时加载一次，之后每个图表只注入模板和数据。
+# window.__renderInline 在渲染前清理上一个图表的状态，再调用模板工厂函数。
+INLINE_DRIVER_CODE = """
+            window.__chartFactories = {};
+            window.__renderInline = function(key, data, width, height) {
+                window.__chartReady = false;
+                var output = document.getElementById('svg-output');
+                if (output) output.remove();
+                var container = document.getElementById('chart-container');
+                if (window.echarts) {
+                    var previous = echarts.getInstanceByDom(container);
+                    if (previous) previous.dispose();
+                }
+                container.innerHTML = '';
+                container.style.width = INLINE_WIDTH_STYLE;
+                container.style.maxWidth = width + 'px';
+                container.style.height = height + 'px';
+                return window.__chartFactories[key](data, container);
+            };
+"""
+
+BASE_PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    %s
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            margin: %s;
+        }
+        #chart-container {
+            margin: 0 auto;
+            background-color: white;
+            overflow: hidden;
+        }
+    </style>
+</head>
+<body>
+    <div id="chart-container"></div>
+    <script>
+%s
+%s
+    </script>
+</body>
+</html>
+"""
+
+
+def _lib_url(name):
+    # 使用文件协议的URL (用于SVG渲染)
+    return f"file://{os.path.join(STATIC_LIB_DIR, name)}"
+
+
+def _read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def _mtime(path):
+    return os.stat(path).st_mtime_ns if path else None
+
+
+class CompiledTemplate:
+    """
+    预编译的图表模板
+
+    html_head 只包含库地址和尺寸等小段内容，渲染时格式化；
+    html_tail 已经拼接好utils.js和模板代码，渲染时原样复用；
+    inline_script 是供渲染池预加载页面使用的工厂函数源码，inline_key 为其摘要。
+    """
+
+    def __init__(self, framework, html_head, html_tail, inline_script):
+        self.framework = framework
+        self.html_head = html_head
+        self.html_tail = html_tail
+        self.inline_script = inline_script
+        self.inline_key = hashlib.sha1(inline_script.encode('utf-8')).hexdigest()
+
+    def to_html(self, json_data, width, height):
+        """
+        生成完整的HTML页面
+
+        Args:
+            json_data: 注入页面的数据
+            width: 图表宽度
+            height: 图表高度
+
+        Returns:
+            HTML字符串
+        """
+        return ''.join((self.html_head % (width, height), json.dumps(json_data), self.html_tail))
+
+
+def _compile_echarts(js_code):
+    head, tail = ECHARTS_HTML_TEMPLATE.split(JSON_DATA_PLACEHOLDER)
+    # 库地址在编译时填入，尺寸留给每次渲染
+    html_head = head.replace('%s', _lib_url(ECHARTS_LIBS[0]).replace('%', '%%'), 1)
+    html_tail = tail.replace('JS_CODE_PLACEHOLDER', js_code).replace('ECHARTS_RENDER_PLACEHOLDER', ECHARTS_RENDER_CODE)
+    inline_script = f"""(function(jsonData, container) {{
+            var chart = echarts.init(container, null, {{
+                renderer: 'svg',
+                animation: false,
+                useUTC: true
+            }});
+            echarts.disableAllAnimation = true;
+{js_code}
+            {ECHARTS_RENDER_CODE}
+        }})"""
+    return CompiledTemplate('echarts', html_head, html_tail, inline_script)
+
+
+def _compile_d3(js_code, utils_code):
+    head, tail = D3_HTML_TEMPLATE.split(JSON_DATA_PLACEHOLDER)
+    lib_tags = "\n".join([f"<script src='{_lib_url(name)}'></script>" for name in D3_LIBS])
+    # 转义库标签中可能出现的%，只保留尺寸两个占位符
+    html_head = head.replace('%s', lib_tags.replace('%', '%%'), 1)
+    html_tail = tail.replace('UTILS_LIB_PLACEHOLDER', utils_code).replace('JS_CODE_PLACEHOLDER', js_code)
+    # utils.js已在预加载页面中加载，这里只包含模板本身
+    inline_script = f"""(function(json_data, container) {{
+{js_code}
+            return renderChartWithSignal(makeChart, '#chart-container', json_data);
+        }})"""
+    return CompiledTemplate('d3', html_head, html_tail, inline_script)
+
+
+_compiled_cache = {}
+_compiled_lock = threading.Lock()
+
+
+def get_compiled_template(framework, js_file=None):
+    """
+    获取预编译模板，模板文件或utils.js修改后自动重新编译
+
+    Args:
+        framework: "echarts" 或 "d3"
+        js_file: 模板文件路径；echarts为None时使用直接解析选项JSON的模板（echarts_py）
+
+    Returns:
+        CompiledTemplate实例
+    """
+    framework = framework.lower()
+    if framework not in ('echarts', 'd3'):
+        raise ValueError(f"Unsupported framework: {framework}")
+    if framework == 'd3' and not js_file:
+        raise ValueError("D3 templates require a JavaScript file")
+    if js_file and not os.path.exists(js_file):
+        raise ValueError(f"No JavaScript file found for chart path: {js_file}. Please provide a valid JS file.")
+
+    js_file = os.path.abspath(js_file) if js_file else None
+    cache_key = (framework, js_file)
+    version = (_mtime(js_file), _mtime(UTILS_LIB_PATH) if framework == 'd3' else None)
+    with _compiled_lock:
+        cached = _compiled_cache.get(cache_key)
+        if cached and cached[0] == version:
+            return cached[1]
+
+    js_code = _read(js_file) if js_file else ECHARTS_PASSTHROUGH_CODE
+    if framework == 'echarts':
+        compiled = _compile_echarts(js_code)
+    else:
+        compiled = _compile_d3(js_code, _read(UTILS_LIB_PATH))
+    with _compiled_lock:
+        _compiled_cache[cache_key] = (version, compiled)
+    return compiled
+
+
+def prepare_chart(json_data, js_file, framework, framework_type='js'):
+    """
+    根据框架类型获取预编译模板和要注入页面的数据
+
+    Args:
+        json_data: 图表数据
+        js_file: 模板文件路径，echarts_py时为模板对象
+        framework: "echarts" 或 "d3"
+        framework_type: "js" 或 "py"
+
+    Returns:
+        (CompiledTemplate, 页面数据)
+    """
+    framework = framework.lower()
+    if framework == 'echarts' and framework_type == 'py':
+        return get_compiled_template('echarts'), json.dumps(js_file.make_options(json_data))
+    return get_compiled_template(framework, js_file), json_data
+
+
+_base_pages = {}
+_base_pages_lock = threading.Lock()
+
+
+def get_base_page(framework):
+    """
+    获取渲染池预加载页面的路径，页面内容包含库文件和注入驱动，utils.js修改后重新生成
+
+    Args:
+        framework: "echarts" 或 "d3"
+
+    Returns:
+        HTML文件的绝对路径
+    """
+    framework = framework.lower()
+    version = _mtime(UTILS_LIB_PATH) if framework == 'd3' else None
+    with _base_pages_lock:
+        cached = _base_pages.get(framework)
+        if cached and cached[0] == version and os.path.exists(cached[1]):
+            return cached[1]
+
+    if framework == 'echarts':
+        lib_tags = f'<script src="{_lib_url(ECHARTS_LIBS[0])}"></script>'
+        # 与HTML模板一致：ECharts容器宽度固定，D3容器宽度为100%并限制最大宽度
+        driver = INLINE_DRIVER_CODE.replace('INLINE_WIDTH_STYLE', "width + 'px'")
+        content = BASE_PAGE_TEMPLATE % (lib_tags, '8px', '', driver)
+    else:
+        lib_tags = "\n    ".join([f"<script src='{_lib_url(name)}'></script>" for name in D3_LIBS])
+        driver = INLINE_DRIVER_CODE.replace('INLINE_WIDTH_STYLE', "'100%'")
+        content = BASE_PAGE_TEMPLATE % (lib_tags, '20px', _read(UTILS_LIB_PATH), driver)
+
+    # 按内容摘要命名，多个进程可以共用同一个文件
+    digest = hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
+    path = os.path.abspath(os.path.join(ensure_temp_dir(), f'render_base_{framework}_{digest}.html'))
+    if not os.path.exists(path):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    with _base_pages_lock:
+        _base_pages[framework] = (version, path)
+    return path
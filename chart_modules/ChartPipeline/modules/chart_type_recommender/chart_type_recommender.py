@@ -9,7 +9,7 @@
 import json
 import logging
 import argparse
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Tuple, Optional, Union
 import sys
 import os
 from pathlib import Path
@@ -347,22 +347,26 @@ def recommend_chart_types(data_features: Dict[str, Any]) -> List[Dict[str, Any]]
     # 否则使用规则方法
     return recommend_chart_types_fallback(data_features, CHART_TYPES)
 
-def process(input: str, output: str) -> bool:
+def process(input: str = None, output: str = None, input_data: Optional[Dict] = None) -> Union[bool, Dict]:
     """
     处理输入数据并生成图表类型推荐
     
     Args:
         input: 输入JSON文件路径
         output: 输出JSON文件路径
+        input_data: 直接传入的数据（代替input文件），此时不指定output则不写文件
         
     Returns:
-        处理成功返回True，否则返回False
+        写文件时处理成功返回True；未写文件时返回处理后的数据；失败返回False
     """
     try:
-        # 读取输入数据
-        logger.info(f"读取输入文件: {input}")
-        with open(input, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        if input_data is not None:
+            data = input_data
+        else:
+            # 读取输入数据
+            logger.info(f"读取输入文件: {input}")
+            with open(input, 'r', encoding='utf-8') as f:
+                data = json.load(f)
         
         # 分析数据特征
         logger.info("分析数据结构和特征")
@@ -375,6 +379,9 @@ def process(input: str, output: str) -> bool:
         # 添加推荐结果到原始数据
         data["chart_type"] = chart_type_recommendations
         
+        if not output:
+            return data
+
         # 写入输出文件
         logger.info(f"写入输出文件: {output}")
         with open(output, 'w', encoding='utf-8') as f:
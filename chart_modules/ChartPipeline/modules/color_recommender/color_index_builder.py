@@ -1,9 +1,9 @@
 import json
-import numpy as np
-import faiss
 from typing import Dict, List, Optional
 import os
 from utils.model_loader import ModelLoader
+from utils.embedding_cache import encode_cached
+from utils.faiss_index import build_index, read_index, write_index
 
 class ColorIndexBuilder:
     def __init__(self, data_path: str = "./static/color_palette.json", index_path: str = "./static/color_palette.index", embed_model_path: str = "all-MiniLM-L6-v2"):
@@ -13,6 +13,7 @@ class ColorIndexBuilder:
         # Use the global ModelLoader to get the model instance
         self.model = ModelLoader.get_model(embed_model_path)
         self.index = None
+        self.index_config = None
         self.color_palettes = None
         self.index_path = index_path
         self.dimension = 384  # Dimension of the sentence transformer embeddings
@@ -54,22 +55,20 @@ class ColorIndexBuilder:
         self.color_palettes = self.load_color_palettes()
         
         # Create embeddings for each palette
-        embeddings = []
+        texts = []
         self.palette_indices = []
         
         for index, palette in self.color_palettes.items():
             text = self.create_text_for_embedding(palette)
             print('text', text)
-            embedding = self.model.encode(text)
-            embeddings.append(embedding)
+            texts.append(text)
             self.palette_indices.append(index)
             
-        # Convert to numpy array
-        embeddings = np.array(embeddings).astype('float32')
+        # Encode all palettes in one batch (cached across runs)
+        embeddings = encode_cached(self.model, texts).astype('float32')
         
-        # Create and train the index
-        self.index = faiss.IndexFlatL2(self.dimension)
-        self.index.add(embeddings)
+        # Create and train the index (type set by FAISS_INDEX_TYPE, see utils/faiss_index.py)
+        self.index, self.index_config = build_index(embeddings)
 
     def find_similar_palettes(self, query_text: str, k: int = 5) -> List[Dict]:
         """
@@ -86,8 +85,7 @@ class ColorIndexBuilder:
             self.build_index()
             
         # Create embedding for query
-        query_embedding = self.model.encode(query_text)
-        query_embedding = np.array([query_embedding]).astype('float32')
+        query_embedding = encode_cached(self.model, [query_text]).astype('float32')
         
         # Search the index
         distances, indices = self.index.search(query_embedding, k)
@@ -95,7 +93,7 @@ class ColorIndexBuilder:
         # Return similar palettes with their distances
         results = []
         for i, idx in enumerate(indices[0]):
-            if idx < len(self.palette_indices):  # Ensure index is valid
+            if 0 <= idx < len(self.palette_indices):  # Ensure index is valid (ANN indexes pad with -1)
                 palette_index = self.palette_indices[idx]
                 results.append({
                     'palette': self.color_palettes[palette_index],
@@ -111,7 +109,7 @@ class ColorIndexBuilder:
         # Convert relative path to absolute path
         #current_dir = os.path.dirname(os.path.abspath(__file__))
         abs_output_path = output_path
-        faiss.write_index(self.index, abs_output_path)
+        write_index(self.index, abs_output_path, self.index_config)
         
         # Save palette indices mapping
         indices_path = output_path + ".indices"
@@ -123,7 +121,7 @@ class ColorIndexBuilder:
         # Convert relative path to absolute path
         # current_dir = os.path.dirname(os.path.abspath(__file__))
         index_path = self.index_path
-        self.index = faiss.read_index(index_path)
+        self.index = read_index(index_path)
         
         # Load color palettes
         self.color_palettes = self.load_color_palettes()
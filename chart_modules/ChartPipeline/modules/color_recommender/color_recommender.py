@@ -7,6 +7,7 @@ import os
 from copy import deepcopy
 from logging import getLogger
 from modules.color_recommender.color_index_builder import ColorIndexBuilder
+from utils.service_registry import get_service
 
 def rgb_to_hex(r, g, b):
     r = max(0, min(int(r), 255))
@@ -419,7 +420,14 @@ class ColorRecommender:
         
         return color_scheme
 
-def process(input: str, output: str, embed_model_path: str = "all-MiniLM-L6-v2", base_url: str = None, api_key: str = None, data_path: str = None, index_path: str = None) -> bool:
+def get_color_recommender(embed_model_path: str = "all-MiniLM-L6-v2", data_path: str = None, index_path: str = None) -> ColorRecommender:
+    """进程内共享的ColorRecommender，模型和调色板索引只加载一次"""
+    return get_service(
+        ("ColorRecommender", embed_model_path, data_path, index_path),
+        lambda: ColorRecommender(embed_model_path=embed_model_path, data_path=data_path, index_path=index_path)
+    )
+
+def process(input: str = None, output: str = None, embed_model_path: str = "all-MiniLM-L6-v2", base_url: str = None, api_key: str = None, data_path: str = None, index_path: str = None, input_data: Dict = None) -> Union[bool, Dict]:
     """
     Pipeline入口函数，处理单个文件的颜色推荐
     
@@ -427,18 +435,22 @@ def process(input: str, output: str, embed_model_path: str = "all-MiniLM-L6-v2",
         input_path: 输入JSON文件路径
         output_path: 输出JSON文件路径
         embed_model_path: 嵌入模型路径
+        input_data: 直接传入的数据（代替input文件），此时不指定output则不写文件，返回处理后的数据
     """
     print(f"Processing {input} to {output}")
     try:
-        # 读取输入文件
-        with open(input, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        if input_data is not None:
+            data = input_data
+        else:
+            # 读取输入文件
+            with open(input, "r", encoding="utf-8") as f:
+                data = json.load(f)
             
         # 预处理数据，确保类型正确
         processed_data = preprocess_data(data)
         
         # 生成颜色推荐
-        recommender = ColorRecommender(embed_model_path=embed_model_path, data_path=data_path, index_path=index_path)
+        recommender = get_color_recommender(embed_model_path=embed_model_path, data_path=data_path, index_path=index_path)
         color_result = recommender.recommend_colors(processed_data)
         
         lighter_color_result = deepcopy(color_result)
@@ -467,7 +479,10 @@ def process(input: str, output: str, embed_model_path: str = "all-MiniLM-L6-v2",
         # 添加颜色方案到数据中
         processed_data["colors"] = lighter_color_result
         processed_data["colors_dark"] = darker_color_result
-        
+
+        if not output:
+            return processed_data
+
         # 保存结果
         with open(output, "w", encoding="utf-8") as f:
             json.dump(processed_data, f, indent=2, ensure_ascii=False)
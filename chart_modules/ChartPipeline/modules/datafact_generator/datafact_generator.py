@@ -3,7 +3,7 @@ import os
 import json
 from logging import getLogger
 logger = getLogger(__name__)
-from typing import Union, Dict
+from typing import Union, Dict, Optional
 
 from modules.datafact_generator.util import DataFact
 from modules.datafact_generator.value_fact import ValueFact, ValueFactGenerator
@@ -74,18 +74,25 @@ class DatafactGenerator:
 
         return self.datafacts
 
-def process(input: str, output: str) -> None:
+def process(input: str = None, output: str = None, input_data: Dict = None) -> Optional[Dict]:
     """
     Pipeline入口函数，处理单个文件的数据洞察生成
     
     Args:
         input (str): 输入JSON文件路径
         output (str): 输出JSON文件路径
+        input_data (Dict): 直接传入的数据（代替input文件），此时不指定output则不写文件
+
+    Returns:
+        未写文件时返回生成结果，无有效结果时返回None
     """
     try:
-        # 读取输入文件
-        with open(input, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        if input_data is not None:
+            data = input_data
+        else:
+            # 读取输入文件
+            with open(input, "r", encoding="utf-8") as f:
+                data = json.load(f)
             
         # 预处理数据，确保类型正确
         processed_data = preprocess_data(data)
@@ -93,7 +100,9 @@ def process(input: str, output: str) -> None:
         # 调用原有的处理逻辑
         result = generate_datafacts(input_data=processed_data, input_path=None)
         
-        if result:  # 确保有结果才写入
+        if result and not output:
+            return result
+        elif result:  # 确保有结果才写入
             # 保存结果
             with open(output, "w", encoding="utf-8") as f:
                 json.dump(result, f, indent=2, ensure_ascii=False)
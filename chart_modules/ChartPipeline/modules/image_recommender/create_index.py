@@ -2,9 +2,10 @@ import os
 import sys
 import json
 import numpy as np
-import faiss
 from tqdm import tqdm
 from utils.model_loader import ModelLoader
+from utils.embedding_cache import encode_cached
+from utils.faiss_index import build_index, read_index, write_index, index_config_of, read_index_config, reconstruct_all
 
 # Add the project root directory to Python path
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -16,10 +17,13 @@ class ImageRecommender:
     def __init__(self, embed_model_path: str):
         self.model = ModelLoader.get_model(embed_model_path)
         self.index = None
+        self.index_config = None
         self.image_paths = []
         self.image_data = []
         self.icon_indices = []  # Store indices of icon images
         self.clipart_indices = []  # Store indices of clipart images
+        # Per image type: (source index, number of entries, subset index)
+        self._subset_indices = {}
         
     def create_index(self, image_list_path: str, image_resource_path: str):
         """Create FAISS index from image embeddings"""
@@ -87,14 +91,12 @@ class ImageRecommender:
         self.image_paths = [image_path for image_path, _ in self.image_paths]
         embeddings = np.array(embeddings).astype('float32')
         
-        # Create and train FAISS index
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(dimension)
-        self.index.add(embeddings)
+        # Create and train FAISS index (type set by FAISS_INDEX_TYPE, see utils/faiss_index.py)
+        self.index, self.index_config = build_index(embeddings)
         
     def save_index(self, index_path, data_path):
         """Save the FAISS index and associated data"""
-        faiss.write_index(self.index, index_path)
+        write_index(self.index, index_path, self.index_config)
         
         # Save image data and indices
         with open(data_path, 'w') as f:
@@ -107,7 +109,8 @@ class ImageRecommender:
             
     def load_index(self, index_path, data_path):
         """Load the FAISS index and associated data"""
-        self.index = faiss.read_index(index_path)
+        self.index = read_index(index_path)
+        self.index_config = read_index_config(index_path, self.index)
         
         with open(data_path, 'r') as f:
             data = json.load(f)
@@ -116,6 +119,18 @@ class ImageRecommender:
             self.icon_indices = data['icon_indices']
             self.clipart_indices = data['clipart_indices']
             
+    def _get_subset_index(self, image_type: str, search_indices: List[int]):
+        """Return the FAISS index restricted to one image type, rebuilt only when the main index changes"""
+        cached = self._subset_indices.get(image_type)
+        if cached is None or cached[0] is not self.index or cached[1] != len(search_indices):
+            # 子索引与主索引类型相同，聚类数按子集大小重新选择（子集太小时build_index退回flat）
+            index_config = self.index_config or index_config_of(self.index)
+            params = {key: value for key, value in index_config['params'].items() if key != 'nlist'}
+            subset_index, _ = build_index(reconstruct_all(self.index)[search_indices], index_config['index_type'], **params)
+            cached = (self.index, len(search_indices), subset_index)
+            self._subset_indices[image_type] = cached
+        return cached[2]
+
     def search(self, query_text: str, new_index = None, new_data = None, top_k: int = 5, image_type: Optional[str] = None) -> List[Dict]:
         """
         Search for similar images based on query text
@@ -130,14 +145,30 @@ class ImageRecommender:
         Returns:
             List of dictionaries containing image information and similarity scores
         """
+        return self.search_batch([query_text], new_index=new_index, new_data=new_data, top_k=top_k, image_type=image_type)[0]
+
+    def search_batch(self, query_texts: List[str], new_index = None, new_data = None, top_k: int = 5, image_type: Optional[str] = None) -> List[List[Dict]]:
+        """
+        Search for similar images for several queries at once: the queries are encoded
+        in one batch and each FAISS index is searched with the whole query matrix.
+
+        Args:
+            query_texts: The text queries to search for
+            new_index: Optional new FAISS index to search in addition
+            new_data: Optional new data associated with new_index
+            top_k: Number of results to return per query
+            image_type: Optional filter for image type ('icon' or 'clipart')
+
+        Returns:
+            One result list per query, in the same format as search()
+        """
         if self.index is None:
             raise ValueError("Index not loaded. Please load the index first.")
-            
-        # Generate query embedding
-        query_embedding = self.model.encode(query_text)
-        query_embedding = np.array([query_embedding]).astype('float32')
-        
-        results = []
+        if not query_texts:
+            return []
+
+        # Generate query embeddings
+        query_embeddings = encode_cached(self.model, list(query_texts)).astype('float32')
         
         # 搜索旧索引
         # Determine which indices to search in
@@ -149,50 +180,46 @@ class ImageRecommender:
             search_indices = None
             
         if search_indices:
-            # Create a subset index for the specific image type
-            subset_index = faiss.IndexFlatL2(self.index.d)
-            subset_index.add(self.index.reconstruct_n(0, self.index.ntotal)[search_indices])
-            
-            # Search in the subset index
-            distances, indices = subset_index.search(query_embedding, top_k)
+            # Search in the subset index of the specific image type
+            distances, indices = self._get_subset_index(image_type, search_indices).search(query_embeddings, top_k)
             # Map back to original indices
-            indices = [search_indices[i] for i in indices[0]]
-            distances = distances[0]
+            indices = [[search_indices[i] if i >= 0 else -1 for i in row] for row in indices]
         else:
             # Search in the full index
-            distances, indices = self.index.search(query_embedding, top_k)
-            indices = indices[0]
-            distances = distances[0]
-        
-        # 添加旧索引结果
-        for idx, distance in zip(indices, distances):
-            if idx < len(self.image_paths):  # Ensure index is valid
-                results.append({
-                    'image_path': self.image_paths[idx],
-                    'image_data': self.image_data[idx],
-                    'distance': float(distance)
-                })
-                
+            distances, indices = self.index.search(query_embeddings, top_k)
+
         # 如果是icon类型且有新索引,搜索新索引
-        if image_type == 'icon' and new_index is not None and new_data is not None:
-            new_distances, new_indices = new_index.search(query_embedding, top_k)
-            new_indices = new_indices[0]
-            new_distances = new_distances[0]
-            
-            # 添加新索引结果
-            for idx, distance in zip(new_indices, new_distances):
-                if idx < len(new_data['index']):
-                    data = new_data['index'][str(idx)]
-                    # print("data: ", data)
+        search_new_index = image_type == 'icon' and new_index is not None and new_data is not None
+        if search_new_index:
+            new_distances, new_indices = new_index.search(query_embeddings, top_k)
+
+        all_results = []
+        for row in range(len(query_texts)):
+            results = []
+            # 添加旧索引结果
+            for idx, distance in zip(indices[row], distances[row]):
+                if 0 <= idx < len(self.image_paths):  # Ensure index is valid (ANN indexes pad with -1)
                     results.append({
-                        'image_path': data["path"],
-                        'image_data': data["data"],
-                        'distance': float(distance) + 0.1
+                        'image_path': self.image_paths[idx],
+                        'image_data': self.image_data[idx],
+                        'distance': float(distance)
                     })
-                    
-        # 按距离排序并返回前top_k个结果
-        results.sort(key=lambda x: x['distance'])
-        return results[:top_k]
+
+            # 添加新索引结果
+            if search_new_index:
+                for idx, distance in zip(new_indices[row], new_distances[row]):
+                    if 0 <= idx < len(new_data['index']):
+                        data = new_data['index'][str(idx)]
+                        results.append({
+                            'image_path': data["path"],
+                            'image_data': data["data"],
+                            'distance': float(distance) + 0.1
+                        })
+
+            # 按距离排序并返回前top_k个结果
+            results.sort(key=lambda x: x['distance'])
+            all_results.append(results[:top_k])
+        return all_results
 
 def main(image_list_path: str = None, 
          image_resource_path: str = None,
@@ -1,13 +1,37 @@
 import json
 import os
 import requests
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
 import pandas as pd
-import faiss
+import numpy as np
 from logging import getLogger
 from utils.model_loader import ModelLoader
+from utils.service_registry import get_service
+from utils.embedding_cache import encode_cached
+from utils.faiss_index import read_index
 logger = getLogger(__name__)
 
+def get_image_semantic_text(image_data: Dict) -> str:
+    """
+    Get semantic text from image data (also used to precompute icon embeddings offline)
+    """
+    semantic_text = ""
+    image_content = image_data.get('image_content', '')
+    topic = image_data.get('topic', '')
+    color_style = image_data.get('color_style', '')
+    name = image_data.get('name', '')
+
+    if image_content:
+        semantic_text += f"{image_content}"
+    if topic:
+        semantic_text += f". {topic}"
+    if color_style:
+        semantic_text += f". {color_style}"
+    if name:
+        semantic_text += f". {name}"
+        
+    return semantic_text
+
 class ImageRecommender:
     def __init__(self, embed_model_path: str = None, resource_path: str = None, data_path: str = None, index_path: str = None, base_url: str = None, api_key: str = None):
         self.index_builder = None
@@ -27,7 +51,7 @@ class ImageRecommender:
         self.newicon_data_path = os.path.join(self.newicon_path, 'index.json')
         self.newicon_data = json.load(open(self.newicon_data_path))
         self.newicon_faiss = os.path.join(self.newicon_path, 'faiss.index')
-        self.newicon_index = faiss.read_index(self.newicon_faiss)
+        self.newicon_index = read_index(self.newicon_faiss)
         self.special_categories = ["country", "emotion"]
         
     def create_query_text_for_value(self, input_data: Dict, group_value: str, group_col: str) -> str:
@@ -76,9 +100,10 @@ class ImageRecommender:
         Returns:
             Dictionary mapping group values to selected optimal icons
         """
-        from scipy.spatial.distance import cosine
-        import numpy as np
-        
+        # Unit-normalize once so cosine distances become a matrix product
+        unit_embeddings = {path: normalize_rows(np.asarray(embedding, dtype=np.float64)[None, :])[0]
+                           for path, embedding in embeddings.items()}
+
         selected_icons = {}
         used_images = set()
         
@@ -86,37 +111,30 @@ class ImageRecommender:
         sorted_groups = sorted(group_icons.keys(), key=lambda x: len(group_icons[x]))
         
         for group_value in sorted_groups:
-            candidates = group_icons[group_value]
-            best_score = float('-inf')
-            best_candidate = None
-            
-            for candidate in candidates:
-                if candidate['image_path'] in used_images:
-                    continue
-                    
+            candidates = [candidate for candidate in group_icons[group_value]
+                          if candidate['image_path'] not in used_images]
+            if not candidates:
+                continue
+
+            similarity_scores = np.array([candidate['similarity_score'] for candidate in candidates], dtype=np.float64)
+            if not selected_icons:
                 # If this is the first selection, just use similarity score
-                if not selected_icons:
-                    if candidate['similarity_score'] > best_score:
-                        best_score = candidate['similarity_score']
-                        best_candidate = candidate
-                    continue
-                
-                # Calculate average dissimilarity with previously selected icons
-                candidate_embedding = embeddings[candidate['image_path']]
-                dissimilarities = []
-                for selected in selected_icons.values():
-                    selected_embedding = embeddings[selected['image_path']]
-                    # Use cosine distance directly as dissimilarity measure
-                    dissimilarity = cosine(candidate_embedding, selected_embedding)
-                    dissimilarities.append(dissimilarity)
-                
+                scores = similarity_scores
+            else:
+                # Average cosine distance to the previously selected icons, for all candidates at once
+                candidate_matrix = np.stack([unit_embeddings[candidate['image_path']] for candidate in candidates])
+                selected_matrix = np.stack([unit_embeddings[selected['image_path']] for selected in selected_icons.values()])
+                avg_dissimilarity = 1 - (candidate_matrix @ selected_matrix.T).mean(axis=1)
                 # Combine original similarity score with average dissimilarity
                 # Higher dissimilarity is better for diversity
-                avg_dissimilarity = np.mean(dissimilarities)
-                combined_score = 0.3 * candidate['similarity_score'] + 0.7 * avg_dissimilarity
-                
-                if combined_score > best_score:
-                    best_score = combined_score
+                scores = 0.3 * similarity_scores + 0.7 * avg_dissimilarity
+
+            # First candidate with the highest score wins, as in a sequential scan
+            best_score = float('-inf')
+            best_candidate = None
+            for candidate, score in zip(candidates, scores):
+                if score > best_score:
+                    best_score = score
                     best_candidate = candidate
             
             if best_candidate:
@@ -128,22 +146,7 @@ class ImageRecommender:
         """
         Get semantic text from image data
         """
-        semantic_text = ""
-        image_content = image_data.get('image_content', '')
-        topic = image_data.get('topic', '')
-        color_style = image_data.get('color_style', '')
-        name = image_data.get('name', '')
-
-        if image_content:
-            semantic_text += f"{image_content}"
-        if topic:
-            semantic_text += f". {topic}"
-        if color_style:
-            semantic_text += f". {color_style}"
-        if name:
-            semantic_text += f". {name}"
-            
-        return semantic_text
+        return get_image_semantic_text(image_data)
 
     def process_special_icons(self, category: str, unique_values: List) -> Optional[Dict]:
         """
@@ -176,22 +179,22 @@ class ImageRecommender:
             model = self.model
             
             icon_names = [icon["name"] for icon in icons]
-            icon_embeddings = model.encode(icon_names)
+            icon_embeddings = normalize_rows(encode_cached(model, icon_names))
+
+            # Convert numpy types to Python native types
+            value_strs = [str(value.item() if hasattr(value, 'item') else value) for value in unique_values]
+            if not value_strs:
+                return {}
+            # Encode all values in one batch and compute the cosine similarity matrix
+            value_embeddings = normalize_rows(encode_cached(model, value_strs))
+            similarities = value_embeddings @ icon_embeddings.T
+            best_indices = np.argmax(similarities, axis=1)
             
             result = {}
-            for value in unique_values:
-                # Convert numpy types to Python native types
-                value_str = str(value.item() if hasattr(value, 'item') else value)
-                value_embedding = model.encode([value_str])[0]
-                
-                # Calculate similarities
-                from scipy.spatial.distance import cosine
-                similarities = [1 - cosine(value_embedding, icon_emb) for icon_emb in icon_embeddings]
-                best_idx = max(range(len(similarities)), key=lambda i: similarities[i])
-                
+            for row, (value_str, best_idx) in enumerate(zip(value_strs, best_indices)):
                 result[value_str] = {
                     "image_path": os.path.join(self.special_icons, icons[best_idx]["path"]),
-                    "similarity_score": similarities[best_idx]
+                    "similarity_score": float(similarities[row, best_idx])
                 }
             
             return result
@@ -212,10 +215,10 @@ class ImageRecommender:
             Dictionary mapping values to icons
         """
         all_group_icons = {}
-        for value in unique_values:
-            group_query = self.create_query_text_for_value(input_data, str(value), group_col)
-            group_icons = self.index_builder.search(group_query, top_k=20, new_index=self.newicon_index, new_data=self.newicon_data, image_type='icon')
-
+        group_queries = [self.create_query_text_for_value(input_data, str(value), group_col) for value in unique_values]
+        # One batched encode and one FAISS search per index for all values
+        all_search_results = self.index_builder.search_batch(group_queries, top_k=20, new_index=self.newicon_index, new_data=self.newicon_data, image_type='icon')
+        for value, group_icons in zip(unique_values, all_search_results):
             all_group_icons[str(value)] = [
                 {
                     "image_path": img["image_path"],
@@ -230,8 +233,9 @@ class ImageRecommender:
                      for group_candidates in all_group_icons.values()
                      for img in group_candidates}
         
-        for key in all_images:
-            all_images[key] = self.model.encode(self.get_semantic_text(all_images[key]))
+        if all_images:
+            image_embeddings = encode_cached(self.model, [self.get_semantic_text(image_data) for image_data in all_images.values()])
+            all_images = dict(zip(all_images.keys(), image_embeddings))
         
         # Select optimal icons
         return self.select_optimal_icons(all_group_icons, all_images)
@@ -616,6 +620,14 @@ Please respond in JSON format:
             # value["icon"]["image_path"] = result["image_path"]
         return data_values
 
+def normalize_rows(matrix) -> np.ndarray:
+    """Scale each row to unit length so that cosine similarity is a dot product"""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
 def scale_icon(icon: Dict, height: float) -> Dict:
     """
     Scale the icon to the given height.
@@ -631,7 +643,21 @@ def scale_icon(icon: Dict, height: float) -> Dict:
         logger.error(f"Image not found: {abs_path}")
         return ""
 
-def process(input: str, output: str, embed_model_path: str = None, resource_path: str = None, data_path: str = None, index_path: str = None, base_url: str = None, api_key: str = None) -> bool:
+def get_image_recommender(embed_model_path: str = None, resource_path: str = None, data_path: str = None, index_path: str = None, base_url: str = None, api_key: str = None) -> ImageRecommender:
+    """进程内共享的ImageRecommender，模型、图像索引和图标元数据只加载一次"""
+    return get_service(
+        ("ImageRecommender", embed_model_path, resource_path, data_path, index_path, base_url, api_key),
+        lambda: ImageRecommender(
+            embed_model_path=embed_model_path,
+            data_path=data_path,
+            index_path=index_path,
+            resource_path=resource_path,
+            base_url=base_url,
+            api_key=api_key
+        )
+    )
+
+def process(input: str = None, output: str = None, embed_model_path: str = None, resource_path: str = None, data_path: str = None, index_path: str = None, base_url: str = None, api_key: str = None, input_data: Dict = None) -> Union[bool, Dict]:
     """
     Pipeline入口函数，处理单个文件的图像推荐
     
@@ -641,18 +667,22 @@ def process(input: str, output: str, embed_model_path: str = None, resource_path
         embed_model_path: 嵌入模型路径
         data_path: 图像数据路径
         index_path: 索引文件路径
+        input_data: 直接传入的数据（代替input文件），此时不指定output则不写文件，返回处理后的数据
     """
     # print("process")
     try:
-        # 读取输入文件
-        with open(input, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        if input_data is not None:
+            data = input_data
+        else:
+            # 读取输入文件
+            with open(input, "r", encoding="utf-8") as f:
+                data = json.load(f)
         # print("input")
         # 预处理数据
         processed_data = preprocess_data(data)
         # print("processed_data")
         # 生成图像推荐
-        recommender = ImageRecommender(
+        recommender = get_image_recommender(
             embed_model_path=embed_model_path,
             data_path=data_path,
             index_path=index_path,
@@ -665,7 +695,10 @@ def process(input: str, output: str, embed_model_path: str = None, resource_path
         # print("image_result")
         # 添加图像推荐到数据中
         processed_data["images"] = image_result
-        
+
+        if not output:
+            return processed_data
+
         # 保存结果
         with open(output, "w", encoding="utf-8") as f:
             json.dump(processed_data, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,488 @@
+import re
+import math
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from lxml import etree
+from PIL import Image, ImageChops, ImageColor, ImageDraw, ImageFont
+from svgpathtools import parse_path
+
+from .mask_utils import binarize_grid
+
+logger = logging.getLogger(__name__)
+
+# 不直接绘制的元素（定义、样式、元数据等），其子树整体跳过
+SKIPPED_TAGS = {
+    'defs', 'clipPath', 'mask', 'pattern', 'marker', 'symbol', 'linearGradient', 'radialGradient',
+    'filter', 'style', 'script', 'title', 'desc', 'metadata', 'foreignObject'
+}
+# 沿父元素继承的表现属性
+INHERITED_PROPS = (
+    'fill', 'stroke', 'stroke-width', 'fill-opacity', 'stroke-opacity', 'visibility', 'color',
+    'font-size', 'font-family', 'font-weight', 'text-anchor', 'dominant-baseline'
+)
+DEFAULT_STYLE = {
+    'fill': 'black',
+    'stroke': 'none',
+    'stroke-width': '1',
+    'fill-opacity': '1',
+    'stroke-opacity': '1',
+    'visibility': 'visible',
+    'color': 'black',
+    'font-size': '16',
+    'font-family': 'Arial',
+    'font-weight': 'normal',
+    'text-anchor': 'start',
+    'dominant-baseline': 'auto',
+    'opacity': 1.0,
+}
+# calculate_mask_v2把渐变填充替换为#333333，这里保持一致
+GRADIENT_COLOR = (51, 51, 51)
+# 文本框相对于基线的上下范围（以字号为单位），与get_svg_actual_bbox一致
+TEXT_ASCENT = 0.8
+TEXT_DESCENT = 0.2
+# 无法加载字体时的平均字宽（以字号为单位）
+AVERAGE_CHAR_WIDTH = 0.6
+# 字宽表的基准字号，其它字号按比例缩放
+FONT_BASE_SIZE = 100
+# 曲线段的采样间距(px)和采样点数范围
+CURVE_SAMPLE_SPACING = 4
+CURVE_MIN_SAMPLES = 4
+CURVE_MAX_SAMPLES = 64
+# <use>引用的最大嵌套层数
+MAX_USE_DEPTH = 8
+
+NUMBER_PATTERN = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+TRANSFORM_PATTERN = re.compile(r'(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)')
+
+
+def parse_transform(transform: Optional[str]) -> np.ndarray:
+    """
+    解析SVG transform属性
+
+    Args:
+        transform: transform属性值，如 "translate(10, 20) rotate(45)"
+
+    Returns:
+        3x3仿射矩阵
+    """
+    matrix = np.identity(3)
+    if not transform:
+        return matrix
+    for name, args in TRANSFORM_PATTERN.findall(transform):
+        values = [float(v) for v in NUMBER_PATTERN.findall(args)]
+        if name == 'matrix' and len(values) == 6:
+            a, b, c, d, e, f = values
+            step = np.array([[a, c, e], [b, d, f], [0, 0, 1]])
+        elif name == 'translate' and values:
+            tx = values[0]
+            ty = values[1] if len(values) > 1 else 0.0
+            step = np.array([[1, 0, tx], [0, 1, ty], [0, 0, 1]])
+        elif name == 'scale' and values:
+            sx = values[0]
+            sy = values[1] if len(values) > 1 else sx
+            step = np.array([[sx, 0, 0], [0, sy, 0], [0, 0, 1]])
+        elif name == 'rotate' and values:
+            angle = math.radians(values[0])
+            cos, sin = math.cos(angle), math.sin(angle)
+            step = np.array([[cos, -sin, 0], [sin, cos, 0], [0, 0, 1]])
+            if len(values) == 3:
+                cx, cy = values[1], values[2]
+                step = np.array([[1, 0, cx], [0, 1, cy], [0, 0, 1]]) @ step @ np.array([[1, 0, -cx], [0, 1, -cy], [0, 0, 1]])
+        elif name == 'skewX' and values:
+            step = np.array([[1, math.tan(math.radians(values[0])), 0], [0, 1, 0], [0, 0, 1]])
+        elif name == 'skewY' and values:
+            step = np.array([[1, 0, 0], [math.tan(math.radians(values[0])), 1, 0], [0, 0, 1]])
+        else:
+            continue
+        matrix = matrix @ step
+    return matrix
+
+
+def _parse_length(value, base: float = 0.0, default: float = 0.0) -> float:
+    # 支持px、百分比和纯数字，列表取第一个值（如text的x="10 20 30"）
+    if value is None:
+        return default
+    value = str(value).strip()
+    if value.endswith('%'):
+        try:
+            return base * float(value[:-1]) / 100
+        except ValueError:
+            return default
+    match = NUMBER_PATTERN.match(value)
+    return float(match.group(0)) if match else default
+
+
+def _parse_float(value, default: float) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _parse_color(value: Optional[str], current_color: str = 'black') -> Optional[Tuple[int, int, int]]:
+    # 返回RGB，none/transparent返回None
+    if value is None:
+        return None
+    value = value.strip()
+    if not value or value in ('none', 'transparent'):
+        return None
+    if value.startswith('url('):
+        return GRADIENT_COLOR
+    if value == 'currentColor':
+        value = current_color
+    try:
+        return ImageColor.getrgb(value)[:3]
+    except ValueError:
+        return GRADIENT_COLOR
+
+
+def _element_style(elem, inherited: Dict) -> Dict:
+    # 表现属性 < style属性，未指定的属性沿用父元素
+    style = {key: inherited[key] for key in INHERITED_PROPS}
+    for key in INHERITED_PROPS:
+        value = elem.get(key)
+        if value is not None and value != 'inherit':
+            style[key] = value
+    inline = elem.get('style')
+    declarations = {}
+    if inline:
+        for declaration in inline.split(';'):
+            if ':' in declaration:
+                key, value = declaration.split(':', 1)
+                declarations[key.strip()] = value.strip()
+        for key in INHERITED_PROPS:
+            if key in declarations and declarations[key] != 'inherit':
+                style[key] = declarations[key]
+    opacity = _parse_float(declarations.get('opacity', elem.get('opacity')), 1.0)
+    style['opacity'] = inherited['opacity'] * opacity
+    style['display'] = declarations.get('display', elem.get('display'))
+    return style
+
+
+@lru_cache(maxsize=32)
+def _font_for(font_family: str, font_weight: str):
+    # 使用title_styler的字体加载逻辑，失败时返回None（按平均字宽估算）
+    try:
+        from modules.title_styler.title_styler import get_font
+        family = font_family.split(',')[0].strip().strip('\'"') or 'Arial'
+        font = get_font(family, FONT_BASE_SIZE, 'bold' if font_weight in ('bold', '600', '700', '800', '900') else 'normal')
+    except Exception as e:
+        logger.debug(f"Failed to load font {font_family}: {e}")
+        return None
+    return font if isinstance(font, ImageFont.FreeTypeFont) else None
+
+
+def measure_text(text: str, font_size: float, font_family: str = 'Arial', font_weight: str = 'normal') -> float:
+    """
+    按字体度量估算文本宽度
+
+    Args:
+        text: 文本内容
+        font_size: 字号(px)
+        font_family: 字体名称
+        font_weight: 字重
+
+    Returns:
+        文本宽度(px)
+    """
+    font = _font_for(font_family, font_weight)
+    if font is None:
+        return font_size * AVERAGE_CHAR_WIDTH * len(text)
+    # 按字体实际的字号缩放：title_styler回退到ImageFont.load_default()时得到的是字号10的字体，而不是FONT_BASE_SIZE
+    return font.getlength(text) * font_size / font.size
+
+
+class _GeometryRasterizer:
+    """遍历SVG元素树，把可见图元按累积变换直接绘制到占用画布上"""
+
+    def __init__(self, root, width: int, height: int, background_color: Tuple[int, int, int], max_difference: float):
+        self.root = root
+        self.width = width
+        self.height = height
+        self.background_color = np.array(background_color, dtype=np.float64)
+        self.max_difference = max_difference
+        self.canvas = Image.new('L', (width, height), 0)
+        self.draw = ImageDraw.Draw(self.canvas)
+        self.ids = {elem.get('id'): elem for elem in root.iter() if isinstance(elem.tag, str) and elem.get('id')}
+
+    # ---- 可见性 ----
+
+    def _visible(self, color, opacity: float) -> bool:
+        # 与背景混合后和背景色的差异达到max_difference才会在栅格mask中被识别为内容
+        if color is None or opacity <= 0:
+            return False
+        blended = self.background_color + (np.array(color, dtype=np.float64) - self.background_color) * min(opacity, 1.0)
+        return float(np.sqrt(np.sum((blended - self.background_color) ** 2))) >= self.max_difference
+
+    def _paint(self, style: Dict) -> Tuple[bool, float]:
+        # 返回 (填充是否可见, 描边宽度)，描边不可见时宽度为0
+        if style['visibility'] in ('hidden', 'collapse'):
+            return False, 0.0
+        fill = _parse_color(style['fill'], style['color'])
+        stroke = _parse_color(style['stroke'], style['color'])
+        fill_visible = self._visible(fill, style['opacity'] * _parse_float(style['fill-opacity'], 1.0))
+        stroke_width = _parse_length(style['stroke-width'], default=1.0)
+        stroke_visible = self._visible(stroke, style['opacity'] * _parse_float(style['stroke-opacity'], 1.0))
+        return fill_visible, stroke_width if stroke_visible and stroke_width > 0 else 0.0
+
+    # ---- 绘制 ----
+
+    @staticmethod
+    def _apply(matrix: np.ndarray, points: np.ndarray) -> List[Tuple[float, float]]:
+        transformed = points @ matrix[:2, :2].T + matrix[:2, 2]
+        return [tuple(p) for p in transformed]
+
+    @staticmethod
+    def _stroke_scale(matrix: np.ndarray) -> float:
+        return math.sqrt(abs(np.linalg.det(matrix[:2, :2]))) or 1.0
+
+    def _fill_polygons(self, polygons: List[List[Tuple[float, float]]]):
+        polygons = [p for p in polygons if len(p) >= 3]
+        if len(polygons) == 1:
+            self.draw.polygon(polygons[0], fill=255)
+        elif polygons:
+            # 多个子路径按奇偶规则合成，保留环形图等的镂空
+            combined = Image.new('1', self.canvas.size, 0)
+            for polygon in polygons:
+                layer = Image.new('1', self.canvas.size, 0)
+                ImageDraw.Draw(layer).polygon(polygon, fill=1)
+                combined = ImageChops.logical_xor(combined, layer)
+            self.canvas.paste(255, mask=combined)
+
+    def _stroke_polylines(self, polylines: List[List[Tuple[float, float]]], width: float, closed: bool):
+        line_width = max(1, int(round(width)))
+        for points in polylines:
+            if len(points) < 2:
+                if points:
+                    self.draw.point(points, fill=255)
+                continue
+            if closed:
+                points = points + [points[0]]
+            self.draw.line(points, fill=255, width=line_width, joint='curve')
+
+    def _draw_shape(self, polygons_local: List[np.ndarray], matrix: np.ndarray, style: Dict, closed: bool = True):
+        fill_visible, stroke_width = self._paint(style)
+        if not fill_visible and not stroke_width:
+            return
+        polygons = [self._apply(matrix, p) for p in polygons_local if len(p)]
+        if fill_visible:
+            self._fill_polygons(polygons)
+        if stroke_width:
+            self._stroke_polylines(polygons, stroke_width * self._stroke_scale(matrix), closed)
+
+    # ---- 图元 ----
+
+    @staticmethod
+    def _rect_points(x, y, w, h) -> np.ndarray:
+        return np.array([(x, y), (x + w, y), (x + w, y + h), (x, y + h)], dtype=np.float64)
+
+    @staticmethod
+    def _ellipse_points(cx, cy, rx, ry) -> np.ndarray:
+        samples = int(np.clip(max(rx, ry) * 2 * math.pi / CURVE_SAMPLE_SPACING, 12, CURVE_MAX_SAMPLES))
+        angles = np.linspace(0, 2 * math.pi, samples, endpoint=False)
+        return np.stack([cx + rx * np.cos(angles), cy + ry * np.sin(angles)], axis=1)
+
+    @staticmethod
+    def _path_polylines(d: str) -> List[np.ndarray]:
+        path = parse_path(d)
+        polylines = []
+        for subpath in path.continuous_subpaths():
+            points = []
+            for segment in subpath:
+                if type(segment).__name__ == 'Line':
+                    ts = np.array([0.0, 1.0])
+                else:
+                    xmin, xmax, ymin, ymax = segment.bbox()
+                    extent = math.hypot(xmax - xmin, ymax - ymin)
+                    ts = np.linspace(0, 1, int(np.clip(extent / CURVE_SAMPLE_SPACING, CURVE_MIN_SAMPLES, CURVE_MAX_SAMPLES)))
+                values = [segment.point(t) for t in ts]
+                points.extend((v.real, v.imag) for v in values)
+            if points:
+                polylines.append(np.array(points, dtype=np.float64))
+        return polylines
+
+    def _text_runs(self, elem, style: Dict):
+        # 把text拆分为若干段：带有x/y的tspan另起一段
+        x = _parse_length(elem.get('x'), self.width)
+        y = _parse_length(elem.get('y'), self.height)
+        runs = []
+        current = [x, y, style, elem.text or '']
+        for child in elem:
+            if not isinstance(child.tag, str):
+                current[3] += child.tail or ''
+                continue
+            child_style = _element_style(child, style)
+            if child.get('x') is not None or child.get('y') is not None:
+                runs.append(current)
+                current = [_parse_length(child.get('x'), self.width, current[0]),
+                           _parse_length(child.get('y'), self.height, current[1]),
+                           child_style, ''.join(child.itertext())]
+            else:
+                current[3] += ''.join(child.itertext())
+            current[3] += child.tail or ''
+        runs.append(current)
+        return runs
+
+    def _draw_text(self, elem, matrix: np.ndarray, style: Dict):
+        for x, y, run_style, text in self._text_runs(elem, style):
+            text = ' '.join(text.split())
+            if not text:
+                continue
+            fill_visible, stroke_width = self._paint(run_style)
+            if not fill_visible and not stroke_width:
+                continue
+            font_size = _parse_length(run_style['font-size'], default=16.0)
+            text_width = measure_text(text, font_size, run_style['font-family'], run_style['font-weight'])
+            anchor = run_style['text-anchor']
+            left = x - text_width / 2 if anchor == 'middle' else x - text_width if anchor == 'end' else x
+            baseline = run_style['dominant-baseline']
+            if baseline in ('middle', 'central'):
+                top = y - font_size / 2
+            elif baseline in ('hanging', 'text-before-edge', 'text-top'):
+                top = y
+            else:
+                top = y - TEXT_ASCENT * font_size
+            polygon = self._apply(matrix, self._rect_points(left, top, text_width, (TEXT_ASCENT + TEXT_DESCENT) * font_size))
+            self.draw.polygon(polygon, fill=255)
+
+    def _viewport_matrix(self, elem) -> np.ndarray:
+        # 嵌套svg：先平移到(x, y)，再按viewBox以xMidYMid meet方式缩放
+        x = _parse_length(elem.get('x'), self.width)
+        y = _parse_length(elem.get('y'), self.height)
+        matrix = np.array([[1, 0, x], [0, 1, y], [0, 0, 1]], dtype=np.float64)
+        view_box = [float(v) for v in NUMBER_PATTERN.findall(elem.get('viewBox', ''))]
+        width = _parse_length(elem.get('width'), self.width, self.width)
+        height = _parse_length(elem.get('height'), self.height, self.height)
+        if len(view_box) == 4 and view_box[2] > 0 and view_box[3] > 0:
+            scale = min(width / view_box[2], height / view_box[3])
+            tx = (width - view_box[2] * scale) / 2 - view_box[0] * scale
+            ty = (height - view_box[3] * scale) / 2 - view_box[1] * scale
+            matrix = matrix @ np.array([[scale, 0, tx], [0, scale, ty], [0, 0, 1]])
+        return matrix
+
+    def visit(self, elem, matrix: np.ndarray, inherited: Dict, depth: int = 0):
+        if not isinstance(elem.tag, str):
+            return
+        tag = etree.QName(elem).localname
+        if tag in SKIPPED_TAGS:
+            return
+        # 与calculate_mask_v2的预处理一致：删除背景元素、细线条和几乎透明的元素
+        if elem.get('class') == 'background':
+            return
+        opacity = elem.get('opacity')
+        if opacity and _parse_float(opacity, 1.0) <= 0.1:
+            return
+        if tag == 'line':
+            stroke_width = elem.get('stroke-width')
+            if not stroke_width or _parse_float(stroke_width, 0.0) <= 1:
+                return
+
+        style = _element_style(elem, inherited)
+        if style['display'] == 'none':
+            return
+        matrix = matrix @ parse_transform(elem.get('transform'))
+
+        try:
+            if tag == 'svg':
+                if elem is not self.root:
+                    matrix = matrix @ self._viewport_matrix(elem)
+            elif tag == 'rect':
+                x = _parse_length(elem.get('x'), self.width)
+                y = _parse_length(elem.get('y'), self.height)
+                w = _parse_length(elem.get('width'), self.width)
+                h = _parse_length(elem.get('height'), self.height)
+                if w > 0 and h > 0:
+                    self._draw_shape([self._rect_points(x, y, w, h)], matrix, style)
+            elif tag in ('circle', 'ellipse'):
+                cx = _parse_length(elem.get('cx'), self.width)
+                cy = _parse_length(elem.get('cy'), self.height)
+                if tag == 'circle':
+                    rx = ry = _parse_length(elem.get('r'), self.width)
+                else:
+                    rx = _parse_length(elem.get('rx'), self.width)
+                    ry = _parse_length(elem.get('ry'), self.height)
+                if rx > 0 and ry > 0:
+                    self._draw_shape([self._ellipse_points(cx, cy, rx, ry)], matrix, style)
+            elif tag == 'line':
+                points = np.array([
+                    (_parse_length(elem.get('x1'), self.width), _parse_length(elem.get('y1'), self.height)),
+                    (_parse_length(elem.get('x2'), self.width), _parse_length(elem.get('y2'), self.height))
+                ])
+                _, stroke_width = self._paint(style)
+                if stroke_width:
+                    self._stroke_polylines([self._apply(matrix, points)], stroke_width * self._stroke_scale(matrix), False)
+            elif tag in ('polygon', 'polyline'):
+                values = [float(v) for v in NUMBER_PATTERN.findall(elem.get('points', ''))]
+                if len(values) >= 4:
+                    points = np.array(values[:len(values) // 2 * 2], dtype=np.float64).reshape(-1, 2)
+                    self._draw_shape([points], matrix, style, closed=tag == 'polygon')
+            elif tag == 'path':
+                d = elem.get('d')
+                if d:
+                    closed = d.rstrip()[-1:] in ('z', 'Z')
+                    self._draw_shape(self._path_polylines(d), matrix, style, closed=closed)
+            elif tag == 'text':
+                self._draw_text(elem, matrix, style)
+                return
+            elif tag == 'image':
+                x = _parse_length(elem.get('x'), self.width)
+                y = _parse_length(elem.get('y'), self.height)
+                w = _parse_length(elem.get('width'), self.width)
+                h = _parse_length(elem.get('height'), self.height)
+                if w > 0 and h > 0 and style['visibility'] not in ('hidden', 'collapse'):
+                    self.draw.polygon(self._apply(matrix, self._rect_points(x, y, w, h)), fill=255)
+            elif tag == 'use':
+                href = elem.get('href') or elem.get('{http://www.w3.org/1999/xlink}href') or ''
+                target = self.ids.get(href.lstrip('#'))
+                if target is not None and depth < MAX_USE_DEPTH:
+                    offset = np.array([[1, 0, _parse_length(elem.get('x'), self.width)],
+                                       [0, 1, _parse_length(elem.get('y'), self.height)], [0, 0, 1]])
+                    target_tag = etree.QName(target).localname
+                    if target_tag == 'symbol':
+                        for child in target:
+                            self.visit(child, matrix @ offset, style, depth + 1)
+                    else:
+                        self.visit(target, matrix @ offset, style, depth + 1)
+                return
+        except Exception as e:
+            # 无法解析的单个元素不影响整体mask
+            logger.debug(f"Skipping <{tag}> in geometry mask: {e}")
+
+        for child in elem:
+            self.visit(child, matrix, style, depth)
+
+
+def calculate_geometry_mask(svg_content: str, width: int, height: int, background_color: str,
+                            grid_size: int = 5, max_difference=15) -> np.ndarray:
+    """
+    不经过栅格化，直接由SVG几何计算与calculate_mask_v2相同含义的占用mask
+
+    按累积变换遍历元素树，把矩形、圆、路径多边形、按字体度量估算的文本框等图元绘制到二值画布上，
+    再按grid_size网格二值化（网格内背景占比超过95%记为0）。适合只需要粗粒度占用信息的布局计算；
+    滤镜、裁剪、CSS样式表和位图内容中的透明区域不会被考虑。
+
+    Args:
+        svg_content: SVG字符串
+        width: mask宽度
+        height: mask高度
+        background_color: 背景色，如 "#ffffff"，与背景几乎相同的图元视为不可见
+        grid_size: 网格大小
+        max_difference: 与背景色的差异小于该值的颜色视为背景
+
+    Returns:
+        形状为 (height, width) 的uint8数组，1表示内容
+    """
+    width = int(width)
+    height = int(height)
+    parser = etree.XMLParser(recover=True, huge_tree=True, remove_comments=True)
+    root = etree.fromstring(svg_content.encode('utf-8'), parser=parser)
+    if root is None:
+        return np.zeros((height, width), dtype=np.uint8)
+
+    rasterizer = _GeometryRasterizer(root, width, height, ImageColor.getrgb(background_color)[:3], max_difference)
+    rasterizer.visit(root, np.identity(3), DEFAULT_STYLE)
+    occupied = np.array(rasterizer.canvas) > 0
+    return binarize_grid(~occupied, grid_size)
@@ -1,8 +1,65 @@
 import numpy as np
 from typing import Tuple
-from .mask_utils import calculate_mask, expand_mask
+from functools import lru_cache
+from .mask_utils import expand_mask, binarize_grid, render_svg_rgb
 import os
 from PIL import Image
+import scipy.ndimage as ndimage
+
+def downsample_mask(mask: np.ndarray, grid_size: int) -> np.ndarray:
+    """
+    将mask降采样到1/grid_size大小，降采样后的每个点覆盖原图中以对应grid为中心的3x3个grid
+
+    先按grid求块内最大值，再在块网格上做3x3最大值滤波，等价于逐点检查
+    mask[(i-1)*grid_size:(i+2)*grid_size, (j-1)*grid_size:(j+2)*grid_size] 中是否有内容（1）
+
+    Args:
+        mask: 原始mask，1表示内容
+        grid_size: 降采样倍数
+
+    Returns:
+        形状为 (h // grid_size, w // grid_size) 的uint8数组
+    """
+    h, w = mask.shape
+    grid_rows = -(-h // grid_size)
+    grid_cols = -(-w // grid_size)
+    # 补齐到grid_size的整数倍，补齐部分视为无内容
+    padded = np.zeros((grid_rows * grid_size, grid_cols * grid_size), dtype=bool)
+    padded[:h, :w] = mask == 1
+    block_max = padded.reshape(grid_rows, grid_size, grid_cols, grid_size).any(axis=(1, 3))
+    dilated = ndimage.maximum_filter(block_max, size=3, mode='constant', cval=0)
+    return dilated[:h // grid_size, :w // grid_size].astype(np.uint8)
+
+@lru_cache(maxsize=4)
+def _render_image_rgb(image_content: str, size: int) -> np.ndarray:
+    # 同一张图片在side/overlay/background三种模式中复用同一次栅格化结果
+    temp_svg = f"""<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{size}" height="{size}">
+            <image width="{size}" height="{size}" href="{image_content}"/>
+        </svg>"""
+    img_array = render_svg_rgb(temp_svg, size, size, "#ffffff")
+    img_array.setflags(write=False)
+    return img_array
+
+def calculate_image_mask(image_content: str, size: int, base_size: int, grid_size: int = 5, bg_threshold: float = 220) -> np.ndarray:
+    """
+    计算图片在指定尺寸下的mask
+
+    图片只在base_size下栅格化一次，其它尺寸由栅格化结果缩放得到，避免二分查找中反复栅格化
+
+    Args:
+        image_content: base64图片内容
+        size: 需要的mask边长
+        base_size: 栅格化的边长，应不小于size
+        grid_size: 网格大小
+        bg_threshold: 背景判定阈值，各通道都不低于该值视为背景
+
+    Returns:
+        形状为 (size, size) 的uint8数组
+    """
+    img_array = _render_image_rgb(image_content, base_size)
+    if size != base_size:
+        img_array = np.array(Image.fromarray(img_array).resize((size, size), Image.LANCZOS))
+    return binarize_grid(np.all(img_array >= bg_threshold, axis=2), grid_size)
 
 def find_best_size_and_position(main_mask: np.ndarray, image_content: str, padding: int, mode: str = "side", chart_bbox: dict = None, avoid_mask: np.ndarray = None) -> Tuple[int, int, int]:
     """
@@ -30,30 +87,13 @@ def find_best_size_and_position(main_mask: np.ndarray, image_content: str, paddi
     h, w = main_mask.shape
     downsampled_h = h // grid_size
     downsampled_w = w // grid_size
-    downsampled_main = np.zeros((downsampled_h, downsampled_w), dtype=np.uint8)
-        
-    # 对每个grid进行降采样，只要原grid中有内容（1）就标记为1
-    for i in range(downsampled_h):
-        for j in range(downsampled_w):
-            y_start = max(0, (i - 1) * (grid_size))
-            x_start = max(0, (j - 1) * (grid_size))
-            y_end = min((i + 2) * (grid_size), h)
-            x_end = min((j + 2) * (grid_size), w)
-            grid = main_mask[y_start:y_end, x_start:x_end]
-            downsampled_main[i, j] = 1 if np.any(grid == 1) else 0
+    # 只要原grid及其相邻grid中有内容（1）就标记为1
+    downsampled_main = downsample_mask(main_mask, grid_size)
     
     # 如果有avoid_mask，也进行降采样
     downsampled_avoid = None
     if avoid_mask is not None:
-        downsampled_avoid = np.zeros((downsampled_h, downsampled_w), dtype=np.uint8)
-        for i in range(downsampled_h):
-            for j in range(downsampled_w):
-                y_start = max(0, (i - 1) * (grid_size))
-                x_start = max(0, (j - 1) * (grid_size))
-                y_end = min((i + 2) * (grid_size), h)
-                x_end = min((j + 2) * (grid_size), w)
-                grid = avoid_mask[y_start:y_end, x_start:x_end]
-                downsampled_avoid[i, j] = 1 if np.any(grid == 1) else 0
+        downsampled_avoid = downsample_mask(avoid_mask, grid_size)
     
     # 调整padding到降采样尺度
     downsampled_padding = max(1, padding // grid_size)
@@ -80,15 +120,18 @@ def find_best_size_and_position(main_mask: np.ndarray, image_content: str, paddi
     elif mode == "overlay":
         overlap_threshold = 0.97
     
+    # 图片只按最大候选尺寸栅格化一次
+    base_image_size = max_size * grid_size
+    
+    mask_center_x = np.mean(np.where(downsampled_main == 1)[1]) if np.any(downsampled_main == 1) else downsampled_w // 2
+    mask_center_y = np.mean(np.where(downsampled_main == 1)[0]) if np.any(downsampled_main == 1) else downsampled_h // 2
+    
     while max_size - min_size >= 2:  # 由于降采样，可以用更小的阈值
         mid_size = (min_size + max_size) // 2
         
         # 生成当前尺寸的图片mask并降采样
         original_size = mid_size * grid_size
-        temp_svg = f"""<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{original_size}" height="{original_size}">
-            <image width="{original_size}" height="{original_size}" href="{image_content}"/>
-        </svg>"""
-        image_mask = calculate_mask(temp_svg, original_size, original_size, 0, grid_size=grid_size, bg_threshold=240)
+        image_mask = calculate_image_mask(image_content, original_size, base_image_size, grid_size=grid_size, bg_threshold=240)
         if mode == "background":
             image_mask = expand_mask(image_mask, 10)
         # Save the original image mask to PNG for debugging
@@ -96,15 +139,8 @@ def find_best_size_and_position(main_mask: np.ndarray, image_content: str, paddi
         mask_image = Image.fromarray((image_mask * 255).astype(np.uint8))
         mask_image.save('tmp/image_mask.png')
         # 将image_mask降采样
-        downsampled_image = np.zeros((mid_size, mid_size), dtype=np.uint8)
-        for i in range(mid_size):
-            for j in range(mid_size):
-                y_start = max(0, (i - 1) * (grid_size))
-                x_start = max(0, (j - 1) * (grid_size))
-                y_end = min((i + 2) * (grid_size), original_size)
-                x_end = min((j + 2) * (grid_size), original_size)
-                grid = image_mask[y_start:y_end, x_start:x_end]
-                downsampled_image[i, j] = 1 if np.any(grid == 1) else 0
+        downsampled_image = downsample_mask(image_mask, grid_size)
+        total = np.sum(downsampled_image == 1)
         
         # 计算有效的搜索范围
         if mode == "background" and chart_bbox is not None:
@@ -138,8 +174,6 @@ def find_best_size_and_position(main_mask: np.ndarray, image_content: str, paddi
         current_x = downsampled_padding
         current_y = downsampled_padding
         min_distance = float('inf')
-        mask_center_x = np.mean(np.where(downsampled_main == 1)[1]) if np.any(downsampled_main == 1) else downsampled_w // 2
-        mask_center_y = np.mean(np.where(downsampled_main == 1)[0]) if np.any(downsampled_main == 1) else downsampled_h // 2
 
         if mode == "background" and chart_bbox is not None:
             y_start = chart_y + downsampled_padding
@@ -157,7 +191,6 @@ def find_best_size_and_position(main_mask: np.ndarray, image_content: str, paddi
                 region = downsampled_main[y:y + mid_size, x:x + mid_size]
                 
                 overlap = np.sum((region == 1) & (downsampled_image == 1))
-                total = np.sum(downsampled_image == 1)
                 overlap_ratio = overlap / total if total > 0 else 1.0
                 
                 # 检查与avoid_mask的重叠
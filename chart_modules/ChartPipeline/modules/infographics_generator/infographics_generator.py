@@ -6,13 +6,11 @@ from logging import getLogger
 import logging
 import time
 import numpy as np
-import subprocess
 import re
 from lxml import etree
 from PIL import Image
 import base64
 import io
-import tempfile
 import random
 #import fcntl
 
@@ -43,9 +41,12 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from modules.chart_engine.chart_engine import get_template_for_chart_name, render_chart_to_svg
 from modules.chart_engine.template.template_registry import scan_templates
 from modules.title_styler.title_styler import process as title_styler_process
-from modules.infographics_generator.mask_utils import fill_columns_between_bounds, calculate_mask_v2, expand_mask, calculate_mask_v3
+from modules.infographics_generator.mask_utils import fill_columns_between_bounds, expand_mask
 from modules.infographics_generator.svg_utils import extract_svg_content, extract_large_rect, adjust_and_get_bbox, add_gradient_to_rect, extract_background_element
 from modules.infographics_generator.image_utils import find_best_size_and_position
+from modules.infographics_generator.rasterizer import rasterize_svg_to_png
+from modules.infographics_generator.raster_context import RasterContext, RasterLayer, SVG_ROOT_STYLE, make_layer_svg
+from modules.infographics_generator.layout_search import MaskProfiles, scan_from_middle, search_title_placements
 from modules.infographics_generator.template_utils import (
     analyze_templates,
     check_template_compatibility,
@@ -77,14 +78,16 @@ def make_infographic(
             data["colors"]["background_color"] = background_color
     else:
         background_color = data["colors_dark"].get("background_color", "#000000")
-    chart_content, chart_width, chart_height, chart_offset_x, chart_offset_y = adjust_and_get_bbox(chart_svg_content, background_color)
+    # 同一次布局中的栅格都经过raster_context缓存，合成画布的mask由图表和标题图层平移叠加得到
+    raster_context = RasterContext(background_color)
+    chart_content, chart_width, chart_height, chart_offset_x, chart_offset_y = adjust_and_get_bbox(chart_svg_content, background_color, raster_context=raster_context)
     chart_aspect_ratio = chart_width / chart_height
     thin_chart_flag = False
     if chart_aspect_ratio < 0.9:
         thin_chart_flag = True
     
-    chart_svg_content = f"<svg xmlns='http://www.w3.org/2000/svg' xmlns:xlink='http://www.w3.org/1999/xlink' width='{chart_width}' height='{chart_height}'>{chart_content}</svg>"
-    mask = calculate_mask_v2(chart_svg_content, chart_width, chart_height, background_color)
+    chart_svg_content = make_layer_svg(chart_content, chart_width, chart_height)
+    mask = raster_context.mask_v2(chart_svg_content, chart_width, chart_height)
     mask = expand_mask(mask, 10)
     title_candidates = []
     min_title_width = max(250, chart_width / 2)
@@ -94,7 +97,7 @@ def make_infographic(
         max_title_width = chart_width
     steps = np.ceil((max_title_width - min_title_width) / 100).astype(int)
     
-    # Visualize the mask for debugging
+    # 将mask渲染为图片，用于输出 chart.mask.png（见下方mask_path）
     import matplotlib.pyplot as plt
     
     def visualize_mask(mask, title="Mask Visualization"):
@@ -129,9 +132,6 @@ def make_infographic(
         # Convert to base64
         img_str = base64.b64encode(buf.read()).decode('utf-8')
         return img_str
-    
-    # 把mask保存为png
-    mask_img = visualize_mask(mask, "Mask")
 
     for i in range(steps + 1):
         width = min_title_width + i * (max_title_width - min_title_width) / steps
@@ -151,28 +151,11 @@ def make_infographic(
             "height": height,
         })
         
-    mask_top = np.argmax(mask, axis=0)
-    mask_bottom = mask.shape[0] - 1 - np.argmax(np.flip(mask, axis=0), axis=0)
-    mask_left = np.argmax(mask, axis=1)
-    mask_right = mask.shape[1] - 1 - np.argmax(np.flip(mask, axis=1), axis=1)
+    # 四个方向的轮廓及区间最值表，供标题位置搜索使用
+    profiles = MaskProfiles(mask)
     
     # 从中间列开始,计算每行向左和向右第一个1的位置
-    mid_col = mask.shape[1] // 2
-    mask_left_from_mid = np.zeros(mask.shape[0], dtype=np.int32)
-    mask_right_from_mid = np.zeros(mask.shape[0], dtype=np.int32)
-    
-    for row in range(mask.shape[0]):
-        # 向左搜索第一个1
-        left_pos = mid_col
-        while left_pos >= 0 and mask[row][left_pos] == 0:
-            left_pos -= 1
-        mask_left_from_mid[row] = left_pos if left_pos >= 0 else -1
-        
-        # 向右搜索第一个1
-        right_pos = mid_col
-        while right_pos < mask.shape[1] and mask[row][right_pos] == 0:
-            right_pos += 1
-        mask_right_from_mid[row] = right_pos if right_pos < mask.shape[1] else -1
+    mask_left_from_mid, mask_right_from_mid = scan_from_middle(mask)
 
     smooth_threshold = 50
     # 从中间开始对mask_right_from_mid进行平滑
@@ -206,11 +189,6 @@ def make_infographic(
     mask = np.zeros(mask.shape)
     for i in range(len(mask)):
         mask[i][mask_left_from_mid[i]:mask_right_from_mid[i]] = 1
-    mask_img = visualize_mask(mask, "Mask after smoothing")
-    
-    # 使用临时文件替代固定路径
-    with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-        temp_file.write(base64.b64decode(mask_img))
     
     mask_1_count = np.sum(mask)
     mask_0_count = np.sum(1 - mask)
@@ -262,220 +240,9 @@ def make_infographic(
         }
         area_threshold = 1.05
         default_area = default_title["area"] * area_threshold
-        other_title = {}
-
-        for title in title_candidates:
-            title_width = title["width"] + between_padding
-            title_height = title["height"] + between_padding
-            offset_list = [0, 25, 50, 75, 100, 125, 150]
-
-            # for top
-            range_start = max(0, chart_width // 2 - title_width // 2)
-            range_end = min(chart_width, range_start + title_width)
-            min_top = int(np.min(mask_top[range_start:range_end]))
-            area = (max(title_height - min_top, 0) + chart_height) * chart_width
-            best_area = other_title["top"]["area"] if "top" in other_title else default_area
-            if area < best_area:
-                other_title["top"] = {
-                    "title": (range_start, 0),
-                    "chart": (0, max(title_height - min_top, 0)),
-                    "text-align": "center",
-                    "title-to-chart": "T",
-                    "width": title["width"],
-                    "height": title["height"],
-                    "total_height": max(title_height - min_top, 0) + chart_height,
-                    "total_width": max(range_start + title_width, chart_width),
-                    "area": area
-                }
-
-            # for bottom
-            range_start = max(0,chart_width // 2 - title_width // 2)
-            range_end = min(chart_width, range_start + title_width)
-            max_bottom = int(np.max(mask_bottom[range_start:range_end]))
-            area = (max(title_height - (chart_height - max_bottom), 0) + chart_height) * chart_width
-            best_area = other_title["bottom"]["area"] if "bottom" in other_title else default_area
-            title_y = chart_height - title_height + max(title_height - (chart_height - max_bottom), 0) + between_padding
-            if area < best_area:
-                other_title["bottom"] = {
-                    "title": (range_start, title_y),
-                    "chart": (0, 0),
-                    "text-align": "center",
-                    "title-to-chart": "B",
-                    "width": title["width"],
-                    "height": title["height"],
-                    "total_height": max(title_y + title_height, chart_height),
-                    "total_width": max(range_start + title_width, chart_width),
-                    "area": area
-                }
-            if thin_chart_flag:
-                continue
-            
-            # for Left-Top 
-            for offset in offset_list:
-                width = title_width - offset
-                min_top = int(np.min(mask_top[:width]))
-                area = (max(title_height - min_top, 0) + chart_height) * (chart_width + offset)
-                best_area = other_title["left-top"]["area"] if "left-top" in other_title else default_area
-                if area < best_area:
-                    other_title["left-top"] = {
-                        "title": (0, 0),
-                        "title-to-chart": "TL",
-                        "chart": (offset, max(title_height - min_top, 0)),
-                        "text-align": "left",
-                        "width": title["width"],
-                        "height": title["height"],
-                        "total_height": max(title_height - min_top, 0) + chart_height,
-                        "total_width": max(chart_width + offset, title_width),
-                        "area": area
-                    }
-                
-            # for Left-Bottom
-            for offset in offset_list:
-                width = title_width - offset
-                max_bottom = int(np.max(mask_bottom[:width]))
-                area = (max(title_height - (chart_height - max_bottom), 0) + chart_height) * (chart_width + offset)
-                best_area = other_title["left-bottom"]["area"] if "left-bottom" in other_title else default_area
-                if area < best_area:
-                    other_title["left-bottom"] = {
-                        "title": (0, chart_height - title_height + max(title_height - (chart_height - max_bottom), 0) + between_padding),
-                        "chart": (offset, 0),
-                        "text-align": "left",
-                        "title-to-chart": "BL",
-                        "width": title["width"],
-                        "height": title["height"],
-                        "total_height": max(title_height - (chart_height - max_bottom), 0) + chart_height,
-                        "total_width": max(chart_width + offset, title_width),
-                        "area": area
-                    }
-
-            # for Right-Top
-            for offset in offset_list:
-                width = title_width - offset
-                min_top = int(np.min(mask_top[-width:]))
-                area = (max(title_height - min_top, 0) + chart_height) * (chart_width + offset)
-                best_area = other_title["right-top"]["area"] if "right-top" in other_title else default_area
-                if area < best_area:
-                    other_title["right-top"] = {
-                        "title": (chart_width - width, 0),
-                        "chart": (0, max(title_height - min_top, 0)),
-                        "text-align": "right",
-                        "title-to-chart": "TR",
-                        "width": title["width"],
-                        "height": title["height"],
-                        "total_height": max(title_height - min_top, 0) + chart_height,
-                        "total_width": max(chart_width + offset, title_width),
-                        "area": area
-                    }
-            
-            # for Right-Bottom
-            for offset in offset_list:
-                width = title_width - offset
-                max_bottom = int(np.max(mask_bottom[-width:]))
-                area = (max(title_height - (chart_height - max_bottom), 0) + chart_height) * (chart_width + offset)
-                best_area = other_title["right-bottom"]["area"] if "right-bottom" in other_title else default_area
-                if area < best_area:
-                    other_title["right-bottom"] = {
-                        "title": (chart_width - width, chart_height - title_height + max(title_height - (chart_height - max_bottom), 0) + between_padding),
-                        "chart": (0, 0),
-                        "text-align": "right",
-                        "title-to-chart": "BR",
-                        "width": title["width"],
-                        "height": title["height"],
-                        "total_height": max(title_height - (chart_height - max_bottom), 0) + chart_height,
-                        "total_width": max(chart_width + offset, title_width),
-                        "area": area
-                    }
-                
-            if title_height > chart_height:
-                continue
-
-            offset_list = [50, 75, 100, 125, 150]
-            # for left
-            for offset in offset_list:
-                range_start = offset
-                range_end = range_start + title_height
-                if range_end > chart_height - offset_list[0]:
-                    continue
-                min_left = int(np.min(mask_left[range_start:range_end]))
-                area = (max(title_width - min_left, 0) + chart_width) * (chart_height)
-                best_area = other_title["left"]["area"] if "left" in other_title else default_area
-                if area < best_area:
-                    other_title["left"] = {
-                        "title": (0, range_start),
-                        "chart": (max(title_width - min_left, 0), 0),
-                        "text-align": "left",
-                        "title-to-chart": "L",
-                        "width": title["width"],
-                        "height": title["height"],
-                        "total_height": chart_height,
-                        "total_width": max(title_width - min_left, 0) + chart_width,
-                        "area": area
-                    }
-
-            for offset in offset_list:
-                range_start = chart_height - title_height - offset
-                range_end = range_start + title_height
-                if range_start < offset_list[0]:
-                    continue
-                min_left = int(np.min(mask_left[range_start:range_end]))
-                area = (max(title_width - min_left, 0) + chart_width) * (chart_height)
-                best_area = other_title["left"]["area"] if "left" in other_title else default_area
-                if area < best_area:
-                    other_title["left"] = {
-                        "title": (0, range_start),
-                        "chart": (max(title_width - min_left, 0), 0),
-                        "text-align": "left",
-                        "title-to-chart": "L",
-                        "width": title["width"],
-                        "height": title["height"],
-                        "total_height": chart_height,
-                        "total_width": max(title_width - min_left, 0) + chart_width,
-                        "area": area
-                    }
-
-            # for right
-            for offset in offset_list:
-                range_start = offset
-                range_end = range_start + title_height
-                if range_end > chart_height - offset_list[0]:
-                    continue
-                max_right = int(np.max(mask_right[range_start:range_end]))
-                area = (max(title_width - (chart_width - max_right), 0) + chart_width) * (chart_height)
-                best_area = other_title["right"]["area"] if "right" in other_title else default_area
-                title_x = max(chart_width - title_width, max_right + between_padding)
-                if area < best_area:
-                    other_title["right"] = {
-                        "title": (title_x, range_start + between_padding),
-                        "chart": (0, 0),
-                        "text-align": "right",
-                        "title-to-chart": "R",
-                        "width": title["width"],
-                        "height": title["height"],
-                        "total_height": chart_height,
-                        "total_width": max(title_x + title_width, chart_width),
-                        "area": area
-                    }
-            for offset in offset_list:
-                range_start = chart_height - title_height - offset
-                range_end = range_start + title_height
-                if range_start < offset_list[0]:
-                    continue
-                max_right = int(np.max(mask_right[range_start:range_end]))
-                area = (max(title_width - (chart_width - max_right), 0) + chart_width) * (chart_height)
-                best_area = other_title["right"]["area"] if "right" in other_title else default_area
-                title_x = max(chart_width - title_width, max_right + between_padding)
-                if area < best_area:
-                    other_title["right"] = {
-                        "title": (title_x, range_start),
-                        "chart": (0, 0),
-                        "text-align": "right",
-                        "title-to-chart": "R",
-                        "width": title["width"],
-                        "height": title["height"],
-                        "total_height": chart_height,
-                        "total_width": max(title_x + title_width, chart_width),
-                        "area": area
-                    }
+        # 一次性评估所有标题尺寸、方位和偏移的组合
+        other_title = search_title_placements(profiles, title_candidates, chart_width, chart_height,
+                                              between_padding, thin_chart_flag, default_area)
 
         if len(other_title.values()) == 0:
             best_title = default_title
@@ -499,7 +266,7 @@ def make_infographic(
     
     image_mode = "side"
     
-    final_svg = f"""<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{total_width}" height="{total_height}" style="font-family: Arial, 'Liberation Sans', 'DejaVu Sans', sans-serif;">
+    final_svg = f"""<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{total_width}" height="{total_height}" style="{SVG_ROOT_STYLE}">
     <g class="chart" transform="translate({padding + best_title['chart'][0]}, {padding + best_title['chart'][1]})">{chart_content}</g>
     <g class="text" transform="translate({padding + best_title['title'][0]}, {padding + best_title['title'][1]})">{title_inner_content}</g>"""
     chart_bbox = {
@@ -509,10 +276,23 @@ def make_infographic(
         "height": chart_height
     }
 
-    original_mask = calculate_mask_v2(final_svg + "\n</svg>", total_width, total_height, background_color)
+    chart_layer = RasterLayer(chart_svg_content, chart_width, chart_height,
+                              padding + best_title['chart'][0], padding + best_title['chart'][1])
+    title_x = padding + best_title['title'][0]
+    title_y = padding + best_title['title'][1]
+    # 标题图层比标题SVG的尺寸多留padding的余量，容纳稍微超出的装饰，但不超过画布
+    title_tree = etree.fromstring(title_content.encode())
+    title_layer_width = max(int(min(float(title_tree.get("width", 0)) + padding, total_width - title_x)), 1)
+    title_layer_height = max(int(min(float(title_tree.get("height", 0)) + padding, total_height - title_y)), 1)
+    title_layer = RasterLayer(make_layer_svg(title_inner_content, title_layer_width, title_layer_height),
+                              title_layer_width, title_layer_height, title_x, title_y)
+    layers = [chart_layer, title_layer]
+
+    original_mask = raster_context.mask_v2(final_svg + "\n</svg>", total_width, total_height, layers=layers)
     original_mask = fill_columns_between_bounds(original_mask, padding + best_title['title'][0], padding + best_title['title'][0] + best_title['width'], \
                                 padding + best_title['title'][1], padding + best_title['title'][1] + best_title['height'])
 
+    # visualize_mask唯一的调用处：mask图片是输出文件之一，供检查标题/图片的可放置区域
     mask_img = visualize_mask(original_mask, "Chart Mask")
     with open(mask_path, "wb") as f:
         f.write(base64.b64decode(mask_img))
@@ -531,7 +311,7 @@ def make_infographic(
         side_image_size, side_best_x, side_best_y = find_best_size_and_position(side_mask, primary_image, padding, mode="side")
         measure_side_size = min(side_image_size, 256)
 
-        overlay_mask, overlay_mask_only_text = calculate_mask_v3(final_svg + "\n</svg>", total_width, total_height, background_color)
+        overlay_mask, overlay_mask_only_text = raster_context.mask_v3(final_svg + "\n</svg>", total_width, total_height, layers=layers)
         overlay_mask = expand_mask(overlay_mask, 5)
         overlay_mask_only_text = expand_mask(overlay_mask_only_text, 5)
         # 将overlay_mask保存为PNG文件
@@ -687,13 +467,13 @@ def make_infographic(
         title_inner_content = ""
 
     if image_mode == "side" or image_mode == "overlay":
-        final_svg = f"""<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{total_width}" height="{total_height}" style="font-family: Arial, 'Liberation Sans', 'DejaVu Sans', sans-serif;">
+        final_svg = f"""<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{total_width}" height="{total_height}" style="{SVG_ROOT_STYLE}">
         {background_element}
         <g class="chart" transform="translate({padding * 2 + best_title['chart'][0]}, {padding * 2 + best_title['chart'][1]})">{chart_content}</g>
         <g class="text" fill="{text_color}" transform="translate({padding * 2 + best_title['title'][0]}, {padding * 2 + best_title['title'][1]})">{title_inner_content}</g>
         {image_element}\n</svg>"""
     elif image_mode == "background":
-        final_svg = f"""<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{total_width}" height="{total_height}" style="font-family: Arial, 'Liberation Sans', 'DejaVu Sans', sans-serif;">
+        final_svg = f"""<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{total_width}" height="{total_height}" style="{SVG_ROOT_STYLE}">
         {background_element}
         {image_element}\n
         <g class="chart" transform="translate({padding * 2 + best_title['chart'][0]}, {padding * 2 + best_title['chart'][1]})">{chart_content}</g>
@@ -723,23 +503,34 @@ def make_infographic(
     with open(html_path, 'r', encoding='utf-8') as f:
         html_content = f.read()
     
-    # Find the last script tag and inject the setTimeout code at the end
+    # Find the last script tag and inject the layout code, run once the chart signals completion
     src_end = html_content.rfind('</script>')
     if src_end != -1:
         inject_code = """
-        // 500ms后检查SVG是否已生成
-        setTimeout(function() {
-            const svg = document.querySelector('#chart-container svg');
-            if (svg) {
-                const originalContent = svg.innerHTML;
-                svg.setAttribute('width', '%d');
-                svg.setAttribute('height', '%d');
-                svg.innerHTML = `%s` +
-                '<g class="chart" transform="translate(%d, %d)">' + originalContent + '</g>' +
-                '<g class="text" fill="%s" transform="translate(%d, %d)">' + `%s` + '</g>' +
-                `%s`;
+        // 图表渲染完成(chart-ready)后再叠加标题和图片，定时器仅作兜底
+        (function() {
+            let applied = false;
+            function applyLayout() {
+                if (applied) return;
+                applied = true;
+                const svg = document.querySelector('#chart-container svg');
+                if (svg) {
+                    const originalContent = svg.innerHTML;
+                    svg.setAttribute('width', '%d');
+                    svg.setAttribute('height', '%d');
+                    svg.innerHTML = `%s` +
+                    '<g class="chart" transform="translate(%d, %d)">' + originalContent + '</g>' +
+                    '<g class="text" fill="%s" transform="translate(%d, %d)">' + `%s` + '</g>' +
+                    `%s`;
+                }
+            }
+            if (window.__chartReady) {
+                applyLayout();
+            } else {
+                document.addEventListener('chart-ready', applyLayout, { once: true });
+                setTimeout(applyLayout, 3000);
             }
-        }, 1000);
+        })();
         """ % (total_width, total_height, background_element, html_chart_x, html_chart_y, text_color, html_text_x, html_text_y, title_inner_content, image_element)
         
         new_html_content = html_content[:src_end] + inject_code + html_content[src_end:]
@@ -747,6 +538,7 @@ def make_infographic(
         with open(html_path, 'w', encoding='utf-8') as f:
             f.write(new_html_content)
 
+    logger.debug(f"Raster context: {raster_context.render_count} renders, {raster_context.reuse_count} reuses")
     return final_svg, layout_info
 
 
@@ -994,16 +786,8 @@ def process(input: str, output: str, base_url: str, api_key: str, chart_name: st
                         #fcntl.flock(f, fcntl.LOCK_UN)
                         pass
 
-                # 转换为PNG
-                subprocess.run([
-                    'rsvg-convert',
-                    '-f', 'png',
-                    '-o', png_path,
-                    '--dpi-x', '300',
-                    '--dpi-y', '300',
-                    '--background-color', '#ffffff',
-                    output_path
-                ], check=True)
+                # 转换为PNG（直接使用内存中的SVG，不再调用rsvg-convert读取文件）
+                rasterize_svg_to_png(final_svg, png_path, background_color='#ffffff', dpi=300)
                 
                 # 如果所有操作都成功,跳出循环
                 break
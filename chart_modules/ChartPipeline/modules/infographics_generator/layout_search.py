@@ -0,0 +1,353 @@
+import numpy as np
+from typing import Dict, List, Tuple
+
+# 标题放在图表上下方（TL/BL/TR/BR）时图表的水平偏移候选
+CORNER_OFFSETS = [0, 25, 50, 75, 100, 125, 150]
+# 标题放在图表左右两侧时与上下边界的距离候选
+SIDE_OFFSETS = [50, 75, 100, 125, 150]
+# 候选方位的遍历顺序，与逐个比较时写入结果的顺序一致
+DIRECTIONS = ["top", "bottom", "left-top", "left-bottom", "right-top", "right-bottom", "left", "right"]
+
+
+class SparseTable:
+    """
+    静态数组的区间最值查询表
+
+    预处理 O(n log n)，每次查询 O(1)：第k层保存以每个位置开头、长度为2^k的区间的最值，
+    任意区间 [start, stop) 由两个覆盖它的2^k区间合并得到。
+    """
+
+    def __init__(self, values: np.ndarray, op=np.minimum):
+        values = np.asarray(values)
+        self.op = op
+        self.size = len(values)
+        levels = [values]
+        span = 1
+        while span * 2 <= self.size:
+            prev = levels[-1]
+            levels.append(op(prev[:len(prev) - span], prev[span:]))
+            span *= 2
+        # 各层补齐到相同长度，越界部分不会被查询到
+        self.table = np.empty((len(levels), self.size), dtype=values.dtype)
+        for k, level in enumerate(levels):
+            self.table[k, :len(level)] = level
+            self.table[k, len(level):] = level[-1] if len(level) else 0
+
+    def query(self, starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+        """
+        批量查询区间 [starts[i], stops[i]) 的最值
+
+        Args:
+            starts: 区间起点数组（已规范化到 [0, size]）
+            stops: 区间终点数组（已规范化到 [0, size]）
+
+        Returns:
+            每个区间的最值；任一区间为空时与np.min一样抛出ValueError
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        stops = np.asarray(stops, dtype=np.int64)
+        lengths = stops - starts
+        if np.any(lengths <= 0):
+            raise ValueError(f"zero-size array to reduction operation {self.op.__name__} which has no identity")
+        # floor(log2(length))，对整数精确
+        levels = np.frexp(lengths.astype(np.float64))[1] - 1
+        return self.op(self.table[levels, starts], self.table[levels, stops - (1 << levels)])
+
+
+def _normalize_index(index: np.ndarray, size: int) -> np.ndarray:
+    # 按Python切片的规则处理负数和越界下标
+    index = np.asarray(index, dtype=np.int64)
+    return np.where(index < 0, np.maximum(index + size, 0), np.minimum(index, size))
+
+
+class MaskProfiles:
+    """
+    mask在四个方向上的轮廓（每列最上/最下、每行最左/最右的内容位置）及其区间最值查询表
+
+    Args:
+        mask: 图表mask，非零表示内容
+    """
+
+    def __init__(self, mask: np.ndarray):
+        self.top = np.argmax(mask, axis=0)
+        self.bottom = mask.shape[0] - 1 - np.argmax(np.flip(mask, axis=0), axis=0)
+        self.left = np.argmax(mask, axis=1)
+        self.right = mask.shape[1] - 1 - np.argmax(np.flip(mask, axis=1), axis=1)
+        self._top_min = SparseTable(self.top, np.minimum)
+        self._bottom_max = SparseTable(self.bottom, np.maximum)
+        self._left_min = SparseTable(self.left, np.minimum)
+        self._right_max = SparseTable(self.right, np.maximum)
+
+    @staticmethod
+    def _query(table: SparseTable, starts, stops) -> np.ndarray:
+        return table.query(_normalize_index(starts, table.size), _normalize_index(stops, table.size))
+
+    def min_top(self, starts, stops) -> np.ndarray:
+        """每个列区间 top[starts:stops] 的最小值，下标语义与切片相同"""
+        return self._query(self._top_min, starts, stops)
+
+    def max_bottom(self, starts, stops) -> np.ndarray:
+        """每个列区间 bottom[starts:stops] 的最大值"""
+        return self._query(self._bottom_max, starts, stops)
+
+    def min_left(self, starts, stops) -> np.ndarray:
+        """每个行区间 left[starts:stops] 的最小值"""
+        return self._query(self._left_min, starts, stops)
+
+    def max_right(self, starts, stops) -> np.ndarray:
+        """每个行区间 right[starts:stops] 的最大值"""
+        return self._query(self._right_max, starts, stops)
+
+
+def scan_from_middle(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    从中间列开始，计算每行向左和向右第一个内容像素的位置
+
+    Args:
+        mask: 图表mask，非零表示内容
+
+    Returns:
+        (mask_left_from_mid, mask_right_from_mid)：int32数组，该方向没有内容的行为-1
+    """
+    mid_col = mask.shape[1] // 2
+    content = mask != 0
+
+    left_part = content[:, :mid_col + 1]
+    left_pos = mid_col - np.argmax(left_part[:, ::-1], axis=1)
+    mask_left_from_mid = np.where(left_part.any(axis=1), left_pos, -1).astype(np.int32)
+
+    right_part = content[:, mid_col:]
+    right_pos = mid_col + np.argmax(right_part, axis=1)
+    mask_right_from_mid = np.where(right_part.any(axis=1), right_pos, -1).astype(np.int32)
+    return mask_left_from_mid, mask_right_from_mid
+
+
+def _collect_candidates(title_candidates: List[Dict], chart_width: int, chart_height: int,
+                        between_padding: int, thin_chart_flag: bool) -> Dict[str, list]:
+    # 按原有的遍历顺序列出每个方位的候选：(标题序号, 区间起点, 区间终点, 偏移, 变体)，区间语义与切片相同
+    candidates = {direction: [] for direction in DIRECTIONS}
+    for index, title in enumerate(title_candidates):
+        title_width = title["width"] + between_padding
+        title_height = title["height"] + between_padding
+
+        range_start = max(0, chart_width // 2 - title_width // 2)
+        range_end = min(chart_width, range_start + title_width)
+        candidates["top"].append((index, range_start, range_end, 0, 0))
+        candidates["bottom"].append((index, range_start, range_end, 0, 0))
+        if thin_chart_flag:
+            continue
+
+        for offset in CORNER_OFFSETS:
+            width = title_width - offset
+            # 左侧对应切片 [:width]，右侧对应切片 [-width:]
+            candidates["left-top"].append((index, 0, width, offset, 0))
+            candidates["left-bottom"].append((index, 0, width, offset, 0))
+            candidates["right-top"].append((index, -width, None, offset, 0))
+            candidates["right-bottom"].append((index, -width, None, offset, 0))
+
+        if title_height > chart_height:
+            continue
+
+        # 变体0：从上边界向下偏移；变体1：从下边界向上偏移
+        for direction in ("left", "right"):
+            for offset in SIDE_OFFSETS:
+                range_start = offset
+                range_end = range_start + title_height
+                if range_end > chart_height - SIDE_OFFSETS[0]:
+                    continue
+                candidates[direction].append((index, range_start, range_end, offset, 0))
+            for offset in SIDE_OFFSETS:
+                range_start = chart_height - title_height - offset
+                range_end = range_start + title_height
+                if range_start < SIDE_OFFSETS[0]:
+                    continue
+                candidates[direction].append((index, range_start, range_end, offset, 1))
+    return candidates
+
+
+def search_title_placements(
+    profiles: MaskProfiles,
+    title_candidates: List[Dict],
+    chart_width: int,
+    chart_height: int,
+    between_padding: int,
+    thin_chart_flag: bool,
+    default_area: float
+) -> Dict[str, Dict]:
+    """
+    对所有标题尺寸和偏移一次性计算各方位的占用面积，选出每个方位面积最小的布局
+
+    结果与逐个候选比较（面积严格小于当前最优才替换）完全一致：每个方位取面积最小且最早出现的候选，
+    方位在结果中的顺序为其首个优于默认布局的候选出现的顺序，因此相同随机种子下选出的布局不变。
+
+    Args:
+        profiles: 图表mask的轮廓
+        title_candidates: 标题候选，每项包含 width 和 height
+        chart_width: 图表宽度
+        chart_height: 图表高度
+        between_padding: 标题与图表的间距
+        thin_chart_flag: 是否为瘦高图表（只尝试上下居中放置）
+        default_area: 默认布局面积乘以阈值，只保留面积小于它的布局
+
+    Returns:
+        {方位: 布局}
+    """
+    candidates = _collect_candidates(title_candidates, chart_width, chart_height, between_padding, thin_chart_flag)
+    title_widths = np.array([title["width"] + between_padding for title in title_candidates], dtype=np.int64)
+    title_heights = np.array([title["height"] + between_padding for title in title_candidates], dtype=np.int64)
+
+    first_hits = []
+    winners = {}
+    for direction_index, direction in enumerate(DIRECTIONS):
+        items = candidates[direction]
+        if not items:
+            continue
+        title_index = np.array([item[0] for item in items], dtype=np.int64)
+        starts = np.array([item[1] for item in items], dtype=np.int64)
+        stops = np.array([len(profiles.top) if item[2] is None else item[2] for item in items], dtype=np.int64)
+        offsets = np.array([item[3] for item in items], dtype=np.int64)
+        title_width = title_widths[title_index]
+        title_height = title_heights[title_index]
+
+        if direction in ("top", "left-top", "right-top"):
+            values = profiles.min_top(starts, stops)
+            areas = (np.maximum(title_height - values, 0) + chart_height) * (chart_width + offsets)
+        elif direction in ("bottom", "left-bottom", "right-bottom"):
+            values = profiles.max_bottom(starts, stops)
+            areas = (np.maximum(title_height - (chart_height - values), 0) + chart_height) * (chart_width + offsets)
+        elif direction == "left":
+            values = profiles.min_left(starts, stops)
+            areas = (np.maximum(title_width - values, 0) + chart_width) * chart_height
+        else:
+            values = profiles.max_right(starts, stops)
+            areas = (np.maximum(title_width - (chart_width - values), 0) + chart_width) * chart_height
+
+        better = areas < default_area
+        if not np.any(better):
+            continue
+        # 严格小于才替换，因此最终结果是最小面积中最早出现的候选
+        best = int(np.argmin(areas))
+        first_hits.append((int(title_index[np.argmax(better)]), direction_index, direction))
+        winners[direction] = (items[best], int(values[best]))
+
+    other_title = {}
+    for _, _, direction in sorted(first_hits):
+        (index, range_start, _, offset, variant), value = winners[direction]
+        other_title[direction] = _build_placement(direction, title_candidates[index], range_start, offset, variant,
+                                                  value, chart_width, chart_height, between_padding)
+    return other_title
+
+
+def _build_placement(direction, title, range_start, offset, variant, value, chart_width, chart_height, between_padding):
+    # 与逐个比较时构造的布局字典完全相同
+    title_width = title["width"] + between_padding
+    title_height = title["height"] + between_padding
+
+    if direction == "top":
+        min_top = value
+        return {
+            "title": (range_start, 0),
+            "chart": (0, max(title_height - min_top, 0)),
+            "text-align": "center",
+            "title-to-chart": "T",
+            "width": title["width"],
+            "height": title["height"],
+            "total_height": max(title_height - min_top, 0) + chart_height,
+            "total_width": max(range_start + title_width, chart_width),
+            "area": (max(title_height - min_top, 0) + chart_height) * chart_width
+        }
+    if direction == "bottom":
+        max_bottom = value
+        title_y = chart_height - title_height + max(title_height - (chart_height - max_bottom), 0) + between_padding
+        return {
+            "title": (range_start, title_y),
+            "chart": (0, 0),
+            "text-align": "center",
+            "title-to-chart": "B",
+            "width": title["width"],
+            "height": title["height"],
+            "total_height": max(title_y + title_height, chart_height),
+            "total_width": max(range_start + title_width, chart_width),
+            "area": (max(title_height - (chart_height - max_bottom), 0) + chart_height) * chart_width
+        }
+    if direction == "left-top":
+        min_top = value
+        return {
+            "title": (0, 0),
+            "title-to-chart": "TL",
+            "chart": (offset, max(title_height - min_top, 0)),
+            "text-align": "left",
+            "width": title["width"],
+            "height": title["height"],
+            "total_height": max(title_height - min_top, 0) + chart_height,
+            "total_width": max(chart_width + offset, title_width),
+            "area": (max(title_height - min_top, 0) + chart_height) * (chart_width + offset)
+        }
+    if direction == "left-bottom":
+        max_bottom = value
+        return {
+            "title": (0, chart_height - title_height + max(title_height - (chart_height - max_bottom), 0) + between_padding),
+            "chart": (offset, 0),
+            "text-align": "left",
+            "title-to-chart": "BL",
+            "width": title["width"],
+            "height": title["height"],
+            "total_height": max(title_height - (chart_height - max_bottom), 0) + chart_height,
+            "total_width": max(chart_width + offset, title_width),
+            "area": (max(title_height - (chart_height - max_bottom), 0) + chart_height) * (chart_width + offset)
+        }
+    if direction == "right-top":
+        min_top = value
+        width = title_width - offset
+        return {
+            "title": (chart_width - width, 0),
+            "chart": (0, max(title_height - min_top, 0)),
+            "text-align": "right",
+            "title-to-chart": "TR",
+            "width": title["width"],
+            "height": title["height"],
+            "total_height": max(title_height - min_top, 0) + chart_height,
+            "total_width": max(chart_width + offset, title_width),
+            "area": (max(title_height - min_top, 0) + chart_height) * (chart_width + offset)
+        }
+    if direction == "right-bottom":
+        max_bottom = value
+        width = title_width - offset
+        return {
+            "title": (chart_width - width, chart_height - title_height + max(title_height - (chart_height - max_bottom), 0) + between_padding),
+            "chart": (0, 0),
+            "text-align": "right",
+            "title-to-chart": "BR",
+            "width": title["width"],
+            "height": title["height"],
+            "total_height": max(title_height - (chart_height - max_bottom), 0) + chart_height,
+            "total_width": max(chart_width + offset, title_width),
+            "area": (max(title_height - (chart_height - max_bottom), 0) + chart_height) * (chart_width + offset)
+        }
+    if direction == "left":
+        min_left = value
+        return {
+            "title": (0, range_start),
+            "chart": (max(title_width - min_left, 0), 0),
+            "text-align": "left",
+            "title-to-chart": "L",
+            "width": title["width"],
+            "height": title["height"],
+            "total_height": chart_height,
+            "total_width": max(title_width - min_left, 0) + chart_width,
+            "area": (max(title_width - min_left, 0) + chart_width) * (chart_height)
+        }
+    max_right = value
+    title_x = max(chart_width - title_width, max_right + between_padding)
+    return {
+        # 从上边界偏移的候选额外下移between_padding
+        "title": (title_x, range_start + between_padding if variant == 0 else range_start),
+        "chart": (0, 0),
+        "text-align": "right",
+        "title-to-chart": "R",
+        "width": title["width"],
+        "height": title["height"],
+        "total_height": chart_height,
+        "total_width": max(title_x + title_width, chart_width),
+        "area": (max(title_width - (chart_width - max_right), 0) + chart_width) * (chart_height)
+    }
@@ -1,20 +1,23 @@
 import os
-import random
-import subprocess
 import re
 from PIL import Image
 import numpy as np
-from typing import Tuple
-import tempfile
+from typing import Optional, Tuple
 from bs4 import BeautifulSoup
 import scipy.ndimage as ndimage
-import time
 import logging
 
+from .rasterizer import rasterize_svg
+
 # 设置日志
 logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# calculate_mask_v2的默认计算方式，可通过环境变量 LAYOUT_MASK_MODE 配置：
+#   raster   栅格化SVG后按像素颜色判断（默认）
+#   geometry 直接由SVG元素几何计算，不进行栅格化
+LAYOUT_MASK_MODE = os.environ.get('LAYOUT_MASK_MODE', 'raster')
+
 def validate_svg_file(file_path):
     """验证SVG文件是否存在且内容有效"""
     if not os.path.exists(file_path):
@@ -28,23 +31,103 @@ def validate_svg_file(file_path):
     
     return True
 
-def calculate_mask_v3(svg_content: str, width: int, height: int, background_color: str, grid_size: int = 5, max_difference = 15) -> np.ndarray:
-    """将SVG转换为基于背景色的二值化mask数组"""
-    width = int(width)
-    height = int(height)
+def render_svg_rgba(svg_content: str, width: int, height: int, background_color: Optional[str] = None) -> np.ndarray:
+    """
+    以300 DPI在内存中栅格化SVG并返回RGBA数组，尺寸与预期不符时缩放到 width x height
+
+    Args:
+        svg_content: SVG字符串
+        width: 预期宽度
+        height: 预期高度
+        background_color: 背景色，如 "#ffffff"；None表示透明背景
+
+    Returns:
+        形状为 (height, width, 4) 的uint8数组
+    """
+    img_array = rasterize_svg(svg_content, background_color=background_color, dpi=300)
     
-    # 将背景色转换为RGB格式
-    original_background_color = background_color
-    background_color = tuple(int(background_color[i:i+2], 16) for i in (1, 3, 5))
+    # 确保图像尺寸匹配预期尺寸
+    actual_height, actual_width = img_array.shape[:2]
+    if actual_width != width or actual_height != height:
+        img = Image.fromarray(img_array, 'RGBA').resize((width, height), Image.LANCZOS)
+        img_array = np.array(img)
+    return img_array
+
+def render_svg_rgb(svg_content: str, width: int, height: int, background_color: str) -> np.ndarray:
+    """
+    以300 DPI在内存中栅格化SVG并返回RGB数组，尺寸与预期不符时缩放到 width x height
+
+    Args:
+        svg_content: SVG字符串
+        width: 预期宽度
+        height: 预期高度
+        background_color: 背景色，如 "#ffffff"
+
+    Returns:
+        形状为 (height, width, 3) 的uint8数组
+    """
+    return render_svg_rgba(svg_content, width, height, background_color)[:, :, :3]
+
+def binarize_grid(is_background: np.ndarray, grid_size: int = 5, background_ratio: float = 0.95) -> np.ndarray:
+    """
+    按网格将逐像素的背景判定转换为二值mask
+
+    将图像补齐到grid_size的整数倍后按块求和，一次计算所有网格的背景像素占比，
+    结果与逐网格计算np.mean完全一致（边缘不完整的网格按实际像素数计算占比）。
+
+    Args:
+        is_background: 形状为 (height, width) 的布尔数组，True表示背景像素
+        grid_size: 网格边长
+        background_ratio: 背景像素占比超过该值的网格记为0，否则为1
+
+    Returns:
+        形状为 (height, width) 的uint8数组
+    """
+    height, width = is_background.shape
+    grid_rows = -(-height // grid_size)
+    grid_cols = -(-width // grid_size)
     
-    # 预处理SVG内容，删除背景元素和细线条
+    padded = np.zeros((grid_rows * grid_size, grid_cols * grid_size), dtype=np.int64)
+    padded[:height, :width] = is_background
+    counts = padded.reshape(grid_rows, grid_size, grid_cols, grid_size).sum(axis=(1, 3))
     
-    # 解析SVG内容
-    soup = BeautifulSoup(svg_content, 'xml')
+    # 每个网格内的实际像素数
+    row_sizes = np.minimum(grid_size, height - np.arange(grid_rows) * grid_size)
+    col_sizes = np.minimum(grid_size, width - np.arange(grid_cols) * grid_size)
+    ratios = counts / np.outer(row_sizes, col_sizes)
+    
+    grid_mask = (ratios <= background_ratio).astype(np.uint8)
+    return np.repeat(np.repeat(grid_mask, grid_size, axis=0), grid_size, axis=1)[:height, :width]
+
+def fill_small_gaps(mask: np.ndarray) -> np.ndarray:
+    """
+    填充mask中水平或竖直方向上两侧都是1的单个0像素
+
+    Args:
+        mask: 形状为 (height, width) 的0/1数组
+
+    Returns:
+        填充后的uint8数组
+    """
+    mask = mask.astype(bool)
+    filled = mask.copy()
+    filled[:, 1:-1] |= mask[:, :-2] & mask[:, 2:]
+    filled[1:-1, :] |= mask[:-2, :] & mask[2:, :]
+    return filled.astype(np.uint8)
+
+def _remove_mask_elements(soup: BeautifulSoup, remove_text: bool = False) -> int:
+    """
+    删除对布局mask没有意义的元素：背景元素、细线条、几乎透明的元素，可选删除文本
+
+    Returns:
+        删除的元素个数
+    """
+    removed = 0
     # 删除class="background"的所有元素
     background_elements = soup.select('[class="background"]')
     for element in background_elements:
         element.decompose()
+        removed += 1
     
     # 删除stroke-width<=1或没有stroke-width的所有line元素
     thin_lines = soup.find_all('line')
@@ -52,6 +135,7 @@ def calculate_mask_v3(svg_content: str, width: int, height: int, background_colo
         stroke_width = line.get('stroke-width')
         if not stroke_width or float(stroke_width) <= 1:
             line.decompose()
+            removed += 1
             
     # 删除opacity<=0.1的所有元素
     all_elements = soup.find_all()
@@ -59,74 +143,110 @@ def calculate_mask_v3(svg_content: str, width: int, height: int, background_colo
         opacity = element.get('opacity')
         if opacity and float(opacity) <= 0.1:
             element.decompose()
-    # 删除所有text元素
-    text_elements = soup.find_all('text')
-    for text in text_elements:
-        text.decompose()
-    
+            removed += 1
+    
+    if remove_text:
+        # 删除所有text元素
+        text_elements = soup.find_all('text')
+        for text in text_elements:
+            text.decompose()
+            removed += 1
+    return removed
+
+def _rewrap_mask_svg(mask_svg_content: str, width: int, height: int, background_color: Optional[str]) -> str:
+    """提取SVG内容并添加新的SVG标签，background_color不为None时在最底层铺背景矩形"""
+    svg_content_match = re.search(r'<svg[^>]*>(.*?)</svg>', mask_svg_content, re.DOTALL)
+    if svg_content_match:
+        inner_content = svg_content_match.group(1)
+        background_rect = f'<rect width="{width}" height="{height}" fill="{background_color}" />' if background_color else ''
+        # 创建新的SVG标签
+        mask_svg_content = f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{width}" height="{height}"> \
+        {background_rect} \
+        {inner_content} \
+        </svg>'
+    return mask_svg_content
+
+def prepare_mask_svg_v2(svg_content: str, width: int, height: int, background_color: Optional[str] = None) -> str:
+    """
+    calculate_mask_v2的SVG预处理：删除背景元素和细线条，渐变替换为纯色
+
+    Args:
+        svg_content: SVG字符串
+        width: 画布宽度
+        height: 画布高度
+        background_color: 背景矩形的颜色；None表示不加背景矩形（透明图层）
+
+    Returns:
+        用于栅格化的SVG字符串
+    """
+    # 解析SVG内容
+    soup = BeautifulSoup(svg_content, 'xml')
+    _remove_mask_elements(soup)
     # 重新获取处理后的SVG内容
-    svg_content_without_text = str(soup)
+    svg_content = str(soup)
     
-    # 创建临时文件
-    with tempfile.NamedTemporaryFile(suffix='.svg', delete=False) as mask_svg_file_without_text, \
-         tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_mask_png_file_without_text:
-        mask_svg_without_text = mask_svg_file_without_text.name
-        temp_mask_png_without_text = temp_mask_png_file_without_text.name
-        
-        # 修改SVG内容，移除渐变
-        # 将渐变填充替换为可见的纯色填充，而不是none
-        mask_svg_content = svg_content_without_text
-        # mask_svg_content = re.sub(r'fill="url\(#[^"]*\)"', 'fill="#333333"', mask_svg_content)
-        # mask_svg_content = re.sub(r'stroke="url\(#[^"]*\)"', 'stroke="#333333"', mask_svg_content)
-        mask_svg_content = mask_svg_content.replace('&', '&amp;')
-        
-        # 提取SVG内容并添加新的SVG标签
-        svg_content_match = re.search(r'<svg[^>]*>(.*?)</svg>', mask_svg_content, re.DOTALL)
-        if svg_content_match:
-            inner_content = svg_content_match.group(1)
-            # 创建新的SVG标签
-            mask_svg_content = f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{width}" height="{height}"> \
-            <rect width="{width}" height="{height}" fill="{original_background_color}" /> \
-            {inner_content} \
-            </svg>'
-        
-        mask_svg_file_without_text.write(mask_svg_content.encode('utf-8'))
-        mask_svg_file_without_text.flush()
-        
-        # 验证SVG文件
-        if not validate_svg_file(mask_svg_without_text):
-            logger.error(f"无效的SVG文件: {mask_svg_without_text}")
-        
-        retry_count = 0
-        max_retries = 3
-        while retry_count < max_retries:
-            try:
-                subprocess.run([
-                    'rsvg-convert',
-                    '-f', 'png',
-                    '-o', temp_mask_png_without_text,
-                    '--dpi-x', '300',
-                    '--dpi-y', '300',
-                    '--background-color', f"{original_background_color}",
-                    mask_svg_without_text
-                ], check=True)
-                break
-            except Exception as e:
-                retry_count += 1
-                logger.error(f"rsvg-convert执行失败 (尝试 {retry_count}/{max_retries}): {str(e)}")
-                if retry_count >= max_retries:
-                    raise e
-                time.sleep(1)
-                
-    img_without_text = Image.open(temp_mask_png_without_text).convert('RGB')
-    img_array_without_text = np.array(img_without_text)
+    # 修改SVG内容，移除渐变
+    # 将渐变填充替换为可见的纯色填充，而不是none
+    mask_svg_content = re.sub(r'fill="url\(#[^"]*\)"', 'fill="#333333"', svg_content)
+    mask_svg_content = re.sub(r'stroke="url\(#[^"]*\)"', 'stroke="#333333"', mask_svg_content)
+    mask_svg_content = mask_svg_content.replace('&', '&amp;')
     
-    # 确保图像尺寸匹配预期尺寸
-    actual_height, actual_width = img_array_without_text.shape[:2]
-    if actual_width != width or actual_height != height:
-        img_without_text = img_without_text.resize((width, height), Image.LANCZOS)
-        img_array_without_text = np.array(img_without_text)
+    return _rewrap_mask_svg(mask_svg_content, width, height, background_color)
+
+def mask_v2_changes_rendering(svg_content: str) -> bool:
+    """
+    判断calculate_mask_v2的预处理是否会改变SVG的渲染结果
+
+    不改变时，mask可以直接由原始SVG的栅格结果计算（例如复用求bbox时的栅格）。
+    判断偏保守：含渐变、&、物理单位（与DPI有关）或任何会被删除的元素时都视为改变。
+    """
+    if '&' in svg_content or re.search(r'(?:fill|stroke)="url\(#', svg_content):
+        return True
+    if re.search(r'\d(?:pt|pc|mm|cm|in)\b', svg_content):
+        return True
+    return _remove_mask_elements(BeautifulSoup(svg_content, 'xml')) > 0
+
+def mask_from_rgb_v2(img_array: np.ndarray, background_color: str, grid_size: int = 5, max_difference = 15) -> np.ndarray:
+    """
+    由栅格结果计算calculate_mask_v2的mask
+
+    Args:
+        img_array: 形状为 (height, width, 3) 的RGB数组
+        background_color: 背景色，如 "#ffffff"
+
+    Returns:
+        形状为 (height, width) 的uint8数组
+    """
+    background_color = tuple(int(background_color[i:i+2], 16) for i in (1, 3, 5))
+    # 转换为二值mask：与背景色差异小于max_difference的像素占比超过95%的网格视为背景
+    background_diff = np.sqrt(np.sum((img_array - background_color) ** 2, axis=2))
+    return binarize_grid(background_diff < max_difference, grid_size)
+
+def prepare_mask_svgs_v3(svg_content: str, width: int, height: int, background_color: Optional[str] = None) -> Tuple[str, str]:
+    """
+    calculate_mask_v3的SVG预处理
+
+    Args:
+        svg_content: SVG字符串
+        width: 画布宽度
+        height: 画布高度
+        background_color: 背景矩形的颜色；None表示不加背景矩形（透明图层）
+
+    Returns:
+        (删除文本后的SVG, 仅保留文本、分组和图片的SVG)
+    """
+    # 预处理SVG内容，删除背景元素、细线条和文本
+    soup = BeautifulSoup(svg_content, 'xml')
+    _remove_mask_elements(soup, remove_text=True)
+    
+    # 重新获取处理后的SVG内容
+    svg_content_without_text = str(soup)
     
+    # 与v2不同，这里保留渐变
+    # mask_svg_content = re.sub(r'fill="url\(#[^"]*\)"', 'fill="#333333"', mask_svg_content)
+    # mask_svg_content = re.sub(r'stroke="url\(#[^"]*\)"', 'stroke="#333333"', mask_svg_content)
+    mask_svg_content = svg_content_without_text.replace('&', '&amp;')
+    mask_svg_content = _rewrap_mask_svg(mask_svg_content, width, height, background_color)
     
     # 解析SVG内容
     soup = BeautifulSoup(svg_content, 'xml')
@@ -136,52 +256,23 @@ def calculate_mask_v3(svg_content: str, width: int, height: int, background_colo
             element.decompose()
     
     svg_content_only_text = str(soup)
+    return mask_svg_content, svg_content_only_text
+
+def masks_from_rgb_v3(img_array_without_text: np.ndarray, img_array_only_text: np.ndarray, background_color: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    由两次栅格结果计算calculate_mask_v3的mask
+
+    Args:
+        img_array_without_text: 删除文本后的RGB栅格
+        img_array_only_text: 仅保留文本的RGB栅格
+        background_color: 背景色，如 "#ffffff"
+
+    Returns:
+        (主色区域mask, 文本mask)
+    """
+    height, width = img_array_without_text.shape[:2]
+    background_color = tuple(int(background_color[i:i+2], 16) for i in (1, 3, 5))
     
-    # 创建临时文件
-    with tempfile.NamedTemporaryFile(suffix='.svg', delete=False) as mask_svg_file_only_text, \
-         tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_mask_png_file_only_text:
-        mask_svg_only_text = mask_svg_file_only_text.name
-        temp_mask_png_only_text = temp_mask_png_file_only_text.name
-        mask_svg_file_only_text.write(svg_content_only_text.encode('utf-8'))
-        mask_svg_file_only_text.flush()
-        
-        # 验证SVG文件
-        if not validate_svg_file(mask_svg_only_text):
-            logger.error(f"无效的SVG文件: {mask_svg_only_text}")
-            
-        retry_count = 0
-        max_retries = 3
-        while retry_count < max_retries:
-            try:
-                subprocess.run([
-                    'rsvg-convert',
-                    '-f', 'png', 
-                    '-o', temp_mask_png_only_text,
-                    '--dpi-x', '300',
-                    '--dpi-y', '300',
-                    '--background-color', f"{original_background_color}",
-                    mask_svg_only_text
-                ], check=True)
-                break
-            except Exception as e:
-                retry_count += 1
-                logger.error(f"rsvg-convert执行失败 (尝试 {retry_count}/{max_retries}): {str(e)}")
-                if retry_count >= max_retries:
-                    raise e
-                time.sleep(1)
-        
-        
-    img_only_text = Image.open(temp_mask_png_only_text).convert('RGB')
-    img_array_only_text = np.array(img_only_text)
-    
-    # 确保图像尺寸匹配预期尺寸
-    actual_height, actual_width = img_array_only_text.shape[:2]
-    if actual_width != width or actual_height != height:
-        img_only_text = img_only_text.resize((width, height), Image.LANCZOS)
-        img_array_only_text = np.array(img_only_text)
-    
-    # 转换为二值mask
-    mask = np.ones((height, width), dtype=np.uint8)
     # 随机采样300个点
     total_pixels = height * width
     sample_indices = np.random.choice(total_pixels, min(1000, total_pixels), replace=False)
@@ -209,276 +300,81 @@ def calculate_mask_v3(svg_content: str, width: int, height: int, background_colo
     color_diff_only_text = np.sqrt(np.sum((img_array_only_text - background_color) ** 2, axis=2))
     mask_only_text[color_diff_only_text >= 15] = 1  # 提高阈值从10到15,要求与背景色差异更大
     
-    # 初始化填充mask
-    fill_mask = np.zeros((height, width), dtype=np.uint8)
-    fill_mask_only_text = np.zeros((height, width), dtype=np.uint8)
-    mask_padding = 3
-    for i in range(height):
-        last_j = -mask_padding
-        for j in range(width):
-            if mask[i, j] == 1:
-                if j - last_j < mask_padding:
-                    fill_mask[i, last_j:j+1] = 1
-                else:
-                    fill_mask[i, j] = 1
-                last_j = j
-
-    for j in range(width):
-        last_i = -mask_padding
-        for i in range(height):
-            if mask[i, j] == 1:
-                if i - last_i < mask_padding:
-                    fill_mask[last_i:i+1, j] = 1
-                else:
-                    fill_mask[i, j] = 1
-                last_i = i
-
-    for j in range(width):
-        last_i = -mask_padding
-        for i in range(height):
-            if mask_only_text[i, j] == 1:
-                if i - last_i < mask_padding:
-                    fill_mask_only_text[last_i:i+1, j] = 1
-                else:
-                    fill_mask_only_text[i, j] = 1
-                last_i = i
-
-    for i in range(height):
-        last_j = -mask_padding
-        for j in range(width):
-            if mask_only_text[i, j] == 1:
-                if j - last_j < mask_padding:
-                    fill_mask_only_text[i, last_j:j+1] = 1
-                else:
-                    fill_mask_only_text[i, j] = 1
-                last_j = j
-
-    mask = fill_mask
-    mask_only_text = fill_mask_only_text
-    os.remove(mask_svg_without_text)
-    os.remove(temp_mask_png_without_text)
-    os.remove(mask_svg_only_text)
-    os.remove(temp_mask_png_only_text)
+    # 填充水平和竖直方向上仅隔一个像素的空隙
+    mask = fill_small_gaps(mask)
+    mask_only_text = fill_small_gaps(mask_only_text)
     
     return mask, mask_only_text
 
-
-
-def calculate_mask_v2(svg_content: str, width: int, height: int, background_color: str, grid_size: int = 5, max_difference = 15) -> np.ndarray:
+def calculate_mask_v3(svg_content: str, width: int, height: int, background_color: str, grid_size: int = 5, max_difference = 15) -> np.ndarray:
     """将SVG转换为基于背景色的二值化mask数组"""
     width = int(width)
     height = int(height)
     
-    # 将背景色转换为RGB格式
-    original_background_color = background_color
-    background_color = tuple(int(background_color[i:i+2], 16) for i in (1, 3, 5))
-    
-    # 预处理SVG内容，删除背景元素和细线条
-    
-    # 解析SVG内容
-    soup = BeautifulSoup(svg_content, 'xml')
+    mask_svg_content, svg_content_only_text = prepare_mask_svgs_v3(svg_content, width, height, background_color)
+    img_array_without_text = render_svg_rgb(mask_svg_content, width, height, background_color)
+    img_array_only_text = render_svg_rgb(svg_content_only_text, width, height, background_color)
     
-    background_elements = soup.select('[class="background"]')
-    for element in background_elements:
-        element.decompose()
-    
-    # 删除stroke-width<=1或没有stroke-width的所有line元素
-    thin_lines = soup.find_all('line')
-    for line in thin_lines:
-        stroke_width = line.get('stroke-width')
-        if not stroke_width or float(stroke_width) <= 1:
-            line.decompose()
-            
-    # 删除opacity<=0.1的所有元素
-    all_elements = soup.find_all()
-    for element in all_elements:
-        opacity = element.get('opacity')
-        if opacity and float(opacity) <= 0.1:
-            element.decompose()
-            
-    # 重新获取处理后的SVG内容
-    svg_content = str(soup)
-    
-    # 创建临时文件
-    with tempfile.NamedTemporaryFile(suffix='.svg', delete=False) as mask_svg_file, \
-         tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_mask_png_file:
-        mask_svg = mask_svg_file.name
-        temp_mask_png = temp_mask_png_file.name
-        
-        # 修改SVG内容，移除渐变
-        # 将渐变填充替换为可见的纯色填充，而不是none
-        mask_svg_content = re.sub(r'fill="url\(#[^"]*\)"', 'fill="#333333"', svg_content)
-        mask_svg_content = re.sub(r'stroke="url\(#[^"]*\)"', 'stroke="#333333"', mask_svg_content)
-        mask_svg_content = mask_svg_content.replace('&', '&amp;')
-        
-        # 提取SVG内容并添加新的SVG标签
-        svg_content_match = re.search(r'<svg[^>]*>(.*?)</svg>', mask_svg_content, re.DOTALL)
-        if svg_content_match:
-            inner_content = svg_content_match.group(1)
-            # 创建新的SVG标签
-            mask_svg_content = f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{width}" height="{height}"> \
-            <rect width="{width}" height="{height}" fill="{original_background_color}" /> \
-            {inner_content} \
-            </svg>'
-        
-        mask_svg_file.write(mask_svg_content.encode('utf-8'))
-        mask_svg_file.flush()
-        
-        # 验证SVG文件
-        if not validate_svg_file(mask_svg):
-            logger.error(f"无效的SVG文件: {mask_svg}")
-        
-    max_retries = 3
-    retry_count = 0
-    while retry_count < max_retries:
-        try:
-            subprocess.run([
-                'rsvg-convert',
-                '-f', 'png', 
-                '-o', temp_mask_png,
-                '--dpi-x', '300',
-                '--dpi-y', '300',
-                '--background-color', f"{original_background_color}",
-                mask_svg
-            ], check=True)
-            break
-        except Exception as e:
-            retry_count += 1
-            logger.error(f"rsvg-convert执行失败 (尝试 {retry_count}/{max_retries}): {str(e)}")
-            if retry_count >= max_retries:
-                raise Exception(f"重试{max_retries}次后仍然失败: {str(e)}")
-            time.sleep(1)  # 等待1秒后重试
-    
-    # 读取为numpy数组并处理
-    img = Image.open(temp_mask_png).convert('RGB')
-    img_array = np.array(img)
-    
-    # 确保图像尺寸匹配预期尺寸
-    actual_height, actual_width = img_array.shape[:2]
-    if actual_width != width or actual_height != height:
-        img = img.resize((width, height), Image.LANCZOS)
-        img_array = np.array(img)
+    return masks_from_rgb_v3(img_array_without_text, img_array_only_text, background_color)
+
+
+
+def calculate_mask_v2(svg_content: str, width: int, height: int, background_color: str, grid_size: int = 5, max_difference = 15, mode: Optional[str] = None) -> np.ndarray:
+    """
+    将SVG转换为基于背景色的二值化mask数组
+
+    Args:
+        mode: "raster" 栅格化后计算，"geometry" 由SVG几何直接计算；默认使用 LAYOUT_MASK_MODE
+    """
+    width = int(width)
+    height = int(height)
     
-    # 转换为二值mask
-    mask = np.ones((height, width), dtype=np.uint8)
+    if (mode or LAYOUT_MASK_MODE) == 'geometry':
+        from .geometry_mask import calculate_geometry_mask
+        return calculate_geometry_mask(svg_content, width, height, background_color, grid_size, max_difference)
     
-    for y in range(0, height, grid_size):
-        for x in range(0, width, grid_size):
-            y_end = min(y + grid_size, height)
-            x_end = min(x + grid_size, width)
-            
-            if y_end > y and x_end > x:
-                grid = img_array[y:y_end, x:x_end]
-                if grid.size > 0:
-                    # 计算与背景色的差异
-                    background_diff = np.sqrt(np.sum((grid - background_color) ** 2, axis=2))
-                    white_ratio = np.mean(background_diff < max_difference)
-                    mask[y:y_end, x:x_end] = 0 if white_ratio > 0.95 else 1
-    
-    # 删除临时文件
-    os.remove(mask_svg)
-    os.remove(temp_mask_png)
+    mask_svg_content = prepare_mask_svg_v2(svg_content, width, height, background_color)
+    img_array = render_svg_rgb(mask_svg_content, width, height, background_color)
     
-    return mask
+    return mask_from_rgb_v2(img_array, background_color, grid_size, max_difference)
 
 def calculate_mask(svg_content: str, width: int, height: int, padding: int, grid_size: int = 5, bg_threshold: float = 220) -> np.ndarray:
     """将SVG转换为二值化的mask数组"""
     width = int(width)
     height = int(height)
     
-    # 创建临时文件
-    tmp_dir = "./tmp"
-    os.makedirs(tmp_dir, exist_ok=True)
-    mask_svg = os.path.join(tmp_dir, f"temp_mask_{random.randint(0, 999999)}.svg")
-    temp_mask_png = os.path.join(tmp_dir, f"temp_mask_{random.randint(0, 999999)}.png")
-    
-    try:
-        # 修改SVG内容，移除渐变
-        # 将渐变填充替换为可见的纯色填充，而不是none
-        mask_svg_content = re.sub(r'fill="url\(#[^"]*\)"', 'fill="#333333"', svg_content)
-        mask_svg_content = re.sub(r'stroke="url\(#[^"]*\)"', 'stroke="#333333"', mask_svg_content)
-        mask_svg_content = mask_svg_content.replace('&', '&amp;')
-        
-        # 提取SVG内容并添加新的SVG标签
-        svg_content_match = re.search(r'<svg[^>]*>(.*?)</svg>', mask_svg_content, re.DOTALL)
-        if svg_content_match:
-            inner_content = svg_content_match.group(1)
-            # 创建新的SVG标签
-            mask_svg_content = f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{width}" height="{height}">{inner_content}</svg>'
-        
-        # 添加padding
-        if padding > 0:
-            svg_tag_match = re.search(r'<svg[^>]*>', mask_svg_content)
-            if svg_tag_match:
-                svg_tag = svg_tag_match.group(0)
-                svg_tag_end = svg_tag_match.end()
-                svg_content_part = mask_svg_content[svg_tag_end:]
-                svg_end_tag = '</svg>'
-                svg_content_without_end = svg_content_part.replace(svg_end_tag, '')
-                
-                # 添加transform group
-                mask_svg_content = svg_tag + f'<g transform="translate({padding}, {padding})">' + svg_content_without_end + '</g>' + svg_end_tag
-        
-        with open(mask_svg, "w", encoding="utf-8") as f:
-            f.write(mask_svg_content)
+    # 修改SVG内容，移除渐变
+    # 将渐变填充替换为可见的纯色填充，而不是none
+    mask_svg_content = re.sub(r'fill="url\(#[^"]*\)"', 'fill="#333333"', svg_content)
+    mask_svg_content = re.sub(r'stroke="url\(#[^"]*\)"', 'stroke="#333333"', mask_svg_content)
+    mask_svg_content = mask_svg_content.replace('&', '&amp;')
+    
+    # 提取SVG内容并添加新的SVG标签
+    svg_content_match = re.search(r'<svg[^>]*>(.*?)</svg>', mask_svg_content, re.DOTALL)
+    if svg_content_match:
+        inner_content = svg_content_match.group(1)
+        # 创建新的SVG标签
+        mask_svg_content = f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{width}" height="{height}">{inner_content}</svg>'
+    
+    # 添加padding
+    if padding > 0:
+        svg_tag_match = re.search(r'<svg[^>]*>', mask_svg_content)
+        if svg_tag_match:
+            svg_tag = svg_tag_match.group(0)
+            svg_tag_end = svg_tag_match.end()
+            svg_content_part = mask_svg_content[svg_tag_end:]
+            svg_end_tag = '</svg>'
+            svg_content_without_end = svg_content_part.replace(svg_end_tag, '')
             
-        # 验证SVG文件
-        if not validate_svg_file(mask_svg):
-            logger.error(f"无效的SVG文件: {mask_svg}")
-            
-        retry_count = 0
-        max_retries = 3
-        while retry_count < max_retries:
-            try:
-                subprocess.run([
-                    'rsvg-convert',
-                    '-f', 'png',
-                    '-o', temp_mask_png,
-                    '--dpi-x', '300',
-                    '--dpi-y', '300',
-                    '--background-color', "#ffffff",
-                    mask_svg
-                ], check=True)
-                break
-            except Exception as e:
-                retry_count += 1
-                logger.error(f"rsvg-convert执行失败 (尝试 {retry_count}/{max_retries}): {str(e)}")
-                if retry_count >= max_retries:
-                    raise e
-                time.sleep(1)
-        
-        # 读取为numpy数组并处理
-        img = Image.open(temp_mask_png).convert('RGB')
-        img_array = np.array(img)
-        
-        # 确保图像尺寸匹配预期尺寸
-        actual_height, actual_width = img_array.shape[:2]
-        if actual_width != width or actual_height != height:
-            img = img.resize((width, height), Image.LANCZOS)
-            img_array = np.array(img)
-        
-        # 转换为二值mask
-        mask = np.ones((height, width), dtype=np.uint8)
-        
-        for y in range(0, height, grid_size):
-            for x in range(0, width, grid_size):
-                y_end = min(y + grid_size, height)
-                x_end = min(x + grid_size, width)
-                
-                if y_end > y and x_end > x:
-                    grid = img_array[y:y_end, x:x_end]
-                    if grid.size > 0:
-                        white_pixels = np.all(grid >= bg_threshold, axis=2)
-                        white_ratio = np.mean(white_pixels)
-                        mask[y:y_end, x:x_end] = 0 if white_ratio > 0.95 else 1
-        
-        return mask
-        
-    finally:
-        if os.path.exists(mask_svg):
-            os.remove(mask_svg)
-        if os.path.exists(temp_mask_png):
-            os.remove(temp_mask_png)
+            # 添加transform group
+            mask_svg_content = svg_tag + f'<g transform="translate({padding}, {padding})">' + svg_content_without_end + '</g>' + svg_end_tag
+    
+    img_array = render_svg_rgb(mask_svg_content, width, height, "#ffffff")
+    
+    # 转换为二值mask：各通道都不低于bg_threshold的像素占比超过95%的网格视为背景
+    mask = binarize_grid(np.all(img_array >= bg_threshold, axis=2), grid_size)
+    
+    return mask
 
 def calculate_bbox(mask: np.ndarray) -> Tuple[int, int, int, int]:
     """计算mask的bbox"""
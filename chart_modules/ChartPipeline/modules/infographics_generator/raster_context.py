@@ -0,0 +1,222 @@
+import hashlib
+import logging
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import mask_utils
+from .mask_utils import (
+    render_svg_rgba,
+    prepare_mask_svg_v2,
+    prepare_mask_svgs_v3,
+    mask_v2_changes_rendering,
+    mask_from_rgb_v2,
+    masks_from_rgb_v3,
+    calculate_mask_v2,
+    calculate_mask_v3,
+)
+
+logger = logging.getLogger(__name__)
+
+# 图层的栅格变体：
+#   raw    原始SVG
+#   mask   calculate_mask_v2的预处理（删除背景和细线条，渐变替换为纯色）
+#   shapes calculate_mask_v3删除文本后的部分
+#   text   calculate_mask_v3仅保留文本的部分
+RASTER_VARIANTS = ('raw', 'mask', 'shapes', 'text')
+
+
+class RasterLayer(NamedTuple):
+    """合成画布中的一个图层：独立的SVG，放在画布的 (x, y) 处（纯平移）"""
+    svg_content: str
+    width: int
+    height: int
+    x: float = 0
+    y: float = 0
+
+
+# 信息图根<svg>的样式，图层SVG使用相同的样式，继承字体的文本在图层和最终信息图中渲染一致
+SVG_ROOT_STYLE = "font-family: Arial, 'Liberation Sans', 'DejaVu Sans', sans-serif;"
+
+
+def make_layer_svg(inner_content: str, width: int, height: int) -> str:
+    """将SVG片段包装为图层SVG，adjust_and_get_bbox和make_infographic使用同一种包装以共享缓存"""
+    return f"<svg xmlns='http://www.w3.org/2000/svg' xmlns:xlink='http://www.w3.org/1999/xlink' width='{width}' height='{height}' style=\"{SVG_ROOT_STYLE}\">{inner_content}</svg>"
+
+
+def _is_integral(value) -> bool:
+    return float(value).is_integer()
+
+
+def _alpha_over(canvas: np.ndarray, rgba: np.ndarray, x: int, y: int) -> None:
+    """将RGBA图层按非预乘alpha叠加到uint8画布的 (x, y) 处，超出画布的部分裁掉"""
+    canvas_height, canvas_width = canvas.shape[:2]
+    layer_height, layer_width = rgba.shape[:2]
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + layer_width, canvas_width), min(y + layer_height, canvas_height)
+    if x0 >= x1 or y0 >= y1:
+        return
+    source = rgba[y0 - y:y1 - y, x0 - x:x1 - x]
+    alpha = source[:, :, 3]
+    region = canvas[y0:y1, x0:x1]
+    # 图层大部分像素完全透明或完全不透明，只有边缘的抗锯齿像素需要混合
+    opaque = alpha == 255
+    region[opaque] = source[:, :, :3][opaque]
+    partial = (alpha > 0) & ~opaque
+    if np.any(partial):
+        weight = alpha[partial][:, None].astype(np.float32) / 255
+        blended = region[partial] * (1 - weight) + source[:, :, :3][partial] * weight
+        region[partial] = np.floor(blended + 0.5).astype(np.uint8)
+
+
+class RasterContext:
+    """
+    一次信息图布局过程中的栅格缓存
+
+    每个图层的每种栅格变体只渲染一次并缓存RGBA结果；合成画布上的mask由各图层的栅格按整数偏移
+    叠加得到，不再把整个合成SVG重新栅格化。偏移不是整数（子像素平移会改变抗锯齿结果）时，
+    退回到对完整SVG栅格化。
+
+    Args:
+        background_color: 画布背景色，如 "#ffffff"
+    """
+
+    def __init__(self, background_color: str):
+        self.background_color = background_color
+        self._background_rgb = np.array([int(background_color[i:i+2], 16) for i in (1, 3, 5)], dtype=np.uint8)
+        self._buffers: Dict[Tuple[str, int, int, str], np.ndarray] = {}
+        # 统计实际栅格化和复用的次数，便于确认缓存生效
+        self.render_count = 0
+        self.reuse_count = 0
+
+    @staticmethod
+    def _key(svg_content: str, width: int, height: int, variant: str) -> Tuple[str, int, int, str]:
+        digest = hashlib.sha1(svg_content.encode('utf-8')).hexdigest()
+        return digest, int(width), int(height), variant
+
+    def add_layer(self, svg_content: str, width: int, height: int, rgba: np.ndarray, variant: str = 'raw') -> None:
+        """
+        登记已经渲染好的图层栅格（例如adjust_and_get_bbox中裁剪出的图表区域）
+
+        Args:
+            svg_content: 图层SVG
+            width: 图层宽度
+            height: 图层高度
+            rgba: 形状为 (height, width, 4) 的uint8数组
+            variant: 栅格变体
+        """
+        if rgba.shape[:2] != (int(height), int(width)):
+            raise ValueError(f"Layer raster shape {rgba.shape[:2]} does not match {int(width)}x{int(height)}")
+        self._buffers[self._key(svg_content, width, height, variant)] = rgba
+
+    def _render(self, svg_content: str, width: int, height: int, background_color: Optional[str] = None) -> np.ndarray:
+        self.render_count += 1
+        return render_svg_rgba(svg_content, width, height, background_color)
+
+    def layer(self, svg_content: str, width: int, height: int, variant: str = 'raw') -> np.ndarray:
+        """
+        获取图层的栅格，未缓存时渲染
+
+        mask变体在预处理不改变渲染结果时直接复用raw栅格；其余变体以透明背景渲染，便于叠加。
+
+        Returns:
+            形状为 (height, width, 4) 的uint8 RGBA数组
+        """
+        if variant not in RASTER_VARIANTS:
+            raise ValueError(f"Unknown raster variant: {variant}")
+        width, height = int(width), int(height)
+        key = self._key(svg_content, width, height, variant)
+        if key in self._buffers:
+            self.reuse_count += 1
+            return self._buffers[key]
+
+        if variant == 'raw':
+            self._buffers[key] = self._render(svg_content, width, height, self.background_color)
+        elif variant == 'mask':
+            raw_key = self._key(svg_content, width, height, 'raw')
+            # raw栅格铺有背景色、不透明，复用后该图层应作为最底层参与合成
+            if raw_key in self._buffers and not mask_v2_changes_rendering(svg_content):
+                self.reuse_count += 1
+                self._buffers[key] = self._buffers[raw_key]
+            else:
+                mask_svg_content = prepare_mask_svg_v2(svg_content, width, height)
+                self._buffers[key] = self._render(mask_svg_content, width, height)
+        else:
+            # shapes和text来自同一次预处理，一起渲染
+            mask_svg_content, svg_content_only_text = prepare_mask_svgs_v3(svg_content, width, height)
+            self._buffers[self._key(svg_content, width, height, 'shapes')] = self._render(mask_svg_content, width, height)
+            self._buffers[self._key(svg_content, width, height, 'text')] = self._render(svg_content_only_text, width, height)
+        return self._buffers[key]
+
+    def compose(self, layers: Sequence[RasterLayer], width: int, height: int, variant: str = 'raw') -> Optional[np.ndarray]:
+        """
+        按图层顺序将各图层的栅格平移叠加到背景色画布上
+
+        Args:
+            layers: 图层列表，靠后的图层在上
+            width: 画布宽度
+            height: 画布高度
+            variant: 栅格变体
+
+        Returns:
+            形状为 (height, width, 3) 的uint8 RGB数组；存在非整数偏移时返回None
+        """
+        if not all(_is_integral(layer.x) and _is_integral(layer.y) for layer in layers):
+            return None
+        width, height = int(width), int(height)
+        canvas = np.empty((height, width, 3), dtype=np.uint8)
+        canvas[:] = self._background_rgb
+        for layer in layers:
+            rgba = self.layer(layer.svg_content, layer.width, layer.height, variant)
+            _alpha_over(canvas, rgba, int(layer.x), int(layer.y))
+        return canvas
+
+    def mask_v2(self, svg_content: str, width: int, height: int, layers: Optional[List[RasterLayer]] = None,
+                grid_size: int = 5, max_difference = 15, mode: Optional[str] = None) -> np.ndarray:
+        """
+        与calculate_mask_v2结果等价的mask，优先由缓存的图层栅格合成
+
+        Args:
+            svg_content: 完整的SVG，图层无法合成时使用
+            width: 画布宽度
+            height: 画布高度
+            layers: 组成该SVG的图层；None表示整个SVG就是一个图层
+            mode: 同calculate_mask_v2
+
+        Returns:
+            形状为 (height, width) 的uint8数组
+        """
+        width, height = int(width), int(height)
+        if (mode or mask_utils.LAYOUT_MASK_MODE) == 'geometry':
+            return calculate_mask_v2(svg_content, width, height, self.background_color, grid_size, max_difference, mode='geometry')
+        if layers is None:
+            layers = [RasterLayer(svg_content, width, height)]
+        img_array = self.compose(layers, width, height, 'mask')
+        if img_array is None:
+            logger.debug("Layer offsets are not integral, rasterizing the full SVG for mask_v2")
+            return calculate_mask_v2(svg_content, width, height, self.background_color, grid_size, max_difference, mode='raster')
+        return mask_from_rgb_v2(img_array, self.background_color, grid_size, max_difference)
+
+    def mask_v3(self, svg_content: str, width: int, height: int,
+                layers: Optional[List[RasterLayer]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        与calculate_mask_v3结果等价的mask，优先由缓存的图层栅格合成
+
+        Args:
+            svg_content: 完整的SVG，图层无法合成时使用
+            width: 画布宽度
+            height: 画布高度
+            layers: 组成该SVG的图层；None表示整个SVG就是一个图层
+
+        Returns:
+            (主色区域mask, 文本mask)
+        """
+        width, height = int(width), int(height)
+        if layers is None:
+            layers = [RasterLayer(svg_content, width, height)]
+        img_array_without_text = self.compose(layers, width, height, 'shapes')
+        if img_array_without_text is None:
+            logger.debug("Layer offsets are not integral, rasterizing the full SVG for mask_v3")
+            return calculate_mask_v3(svg_content, width, height, self.background_color)
+        img_array_only_text = self.compose(layers, width, height, 'text')
+        return masks_from_rgb_v3(img_array_without_text, img_array_only_text, self.background_color)
@@ -0,0 +1,177 @@
+import io
+import os
+import time
+import subprocess
+import logging
+from typing import Callable, Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# SVG栅格化后端，可通过环境变量 SVG_RASTERIZER 指定：
+#   auto     优先使用进程内的cairosvg，不可用时回退到rsvg-convert子进程（默认）
+#   cairosvg 只使用cairosvg
+#   rsvg     只使用rsvg-convert子进程
+SVG_RASTERIZER = os.environ.get('SVG_RASTERIZER', 'auto').lower()
+# rsvg-convert偶发失败时的重试次数和间隔(秒)
+RSVG_MAX_RETRIES = 3
+RSVG_RETRY_DELAY = 1
+
+
+class RasterizeError(RuntimeError):
+    """SVG栅格化失败"""
+
+
+# cairosvg模块；None表示尚未尝试加载，False表示不可用
+_cairosvg = None
+
+
+def _load_cairosvg():
+    # cairosvg依赖系统的libcairo，缺失时导入会抛出OSError而不是ImportError
+    global _cairosvg
+    if _cairosvg is None:
+        try:
+            import cairosvg
+            import cairosvg.parser
+            import cairosvg.surface
+            _cairosvg = cairosvg
+        except (ImportError, OSError) as e:
+            logger.info(f"cairosvg unavailable, using rsvg-convert: {e}")
+            _cairosvg = False
+    return _cairosvg or None
+
+
+def _to_bytes(svg_content):
+    return svg_content.encode('utf-8') if isinstance(svg_content, str) else svg_content
+
+
+def _png_to_array(png_bytes):
+    return np.array(Image.open(io.BytesIO(png_bytes)).convert('RGBA'))
+
+
+def _rasterize_cairosvg(svg_bytes: bytes, background_color: Optional[str], dpi: float) -> np.ndarray:
+    cairosvg = _load_cairosvg()
+    if cairosvg is None:
+        raise RasterizeError("cairosvg is not available")
+    try:
+        # 直接读取cairo表面的像素，省去PNG编码和解码
+        tree = cairosvg.parser.Tree(bytestring=svg_bytes)
+        surface = cairosvg.surface.PNGSurface(tree, io.BytesIO(), dpi, background_color=background_color)
+        cairo_surface = surface.cairo
+        cairo_surface.flush()
+        width, height = cairo_surface.get_width(), cairo_surface.get_height()
+        stride = cairo_surface.get_stride()
+        buffer = np.frombuffer(cairo_surface.get_data(), dtype=np.uint8).reshape(height, stride)
+        # ARGB32在小端机器上按BGRA存储，且颜色已预乘alpha
+        bgra = buffer[:, :width * 4].reshape(height, width, 4).astype(np.uint16)
+        alpha = bgra[:, :, 3]
+        rgba = np.empty((height, width, 4), dtype=np.uint8)
+        rgba[:, :, 3] = alpha
+        safe_alpha = np.maximum(alpha, 1)
+        for target, source in ((0, 2), (1, 1), (2, 0)):
+            # 与cairo写PNG时的反预乘公式一致
+            channel = (bgra[:, :, source] * 255 + alpha // 2) // safe_alpha
+            rgba[:, :, target] = np.where(alpha == 0, 0, np.minimum(channel, 255))
+        return rgba
+    except (AttributeError, TypeError):
+        # cairosvg版本不支持直接访问表面时，退回PNG字节
+        png_bytes = cairosvg.svg2png(bytestring=svg_bytes, dpi=dpi, background_color=background_color)
+        return _png_to_array(png_bytes)
+
+
+def _rasterize_rsvg(svg_bytes: bytes, background_color: Optional[str], dpi: float) -> np.ndarray:
+    # SVG通过stdin传入、PNG从stdout读取，不再经过临时文件
+    cmd = ['rsvg-convert', '-f', 'png', '--dpi-x', str(dpi), '--dpi-y', str(dpi)]
+    if background_color:
+        cmd += ['--background-color', background_color]
+    retry_count = 0
+    while True:
+        try:
+            result = subprocess.run(cmd, input=svg_bytes, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+            return _png_to_array(result.stdout)
+        except (subprocess.CalledProcessError, OSError) as e:
+            retry_count += 1
+            logger.error(f"rsvg-convert执行失败 (尝试 {retry_count}/{RSVG_MAX_RETRIES}): {str(e)}")
+            if retry_count >= RSVG_MAX_RETRIES:
+                raise RasterizeError(f"重试{RSVG_MAX_RETRIES}次后仍然失败: {str(e)}") from e
+            time.sleep(RSVG_RETRY_DELAY)
+
+
+# 可用的栅格化后端：{名称: fn(svg_bytes, background_color, dpi) -> HxWx4 uint8 RGBA数组}
+RASTERIZERS: Dict[str, Callable[[bytes, Optional[str], float], np.ndarray]] = {
+    'cairosvg': _rasterize_cairosvg,
+    'rsvg': _rasterize_rsvg,
+}
+
+
+def register_rasterizer(name: str, fn: Callable[[bytes, Optional[str], float], np.ndarray]) -> None:
+    """
+    注册自定义栅格化后端
+
+    Args:
+        name: 后端名称，可通过 SVG_RASTERIZER 或 backend 参数选择
+        fn: fn(svg_bytes, background_color, dpi)，返回HxWx4的uint8 RGBA数组
+    """
+    RASTERIZERS[name] = fn
+
+
+def get_rasterizer_backend() -> str:
+    """
+    Returns:
+        当前实际使用的栅格化后端名称
+    """
+    if SVG_RASTERIZER != 'auto':
+        return SVG_RASTERIZER
+    return 'cairosvg' if _load_cairosvg() is not None else 'rsvg'
+
+
+def rasterize_svg(svg_content, background_color: Optional[str] = None, dpi: float = 96,
+                  backend: Optional[str] = None) -> np.ndarray:
+    """
+    在内存中将SVG栅格化为RGBA数组
+
+    Args:
+        svg_content: SVG字符串或字节
+        background_color: 背景色，如 "#ffffff"；None表示透明背景
+        dpi: 物理单位(pt/mm等)的换算分辨率，像素单位的尺寸不受影响
+        backend: 指定后端，默认按 SVG_RASTERIZER 选择
+
+    Returns:
+        形状为 (height, width, 4) 的uint8 RGBA数组
+    """
+    backend = backend or get_rasterizer_backend()
+    if backend not in RASTERIZERS:
+        raise RasterizeError(f"Unknown SVG rasterizer: {backend}")
+    svg_bytes = _to_bytes(svg_content)
+    try:
+        return RASTERIZERS[backend](svg_bytes, background_color, dpi)
+    except RasterizeError:
+        raise
+    except Exception as e:
+        if backend == 'rsvg' or SVG_RASTERIZER != 'auto':
+            raise RasterizeError(f"{backend} failed to rasterize SVG: {e}") from e
+        # 自动模式下cairosvg不支持的SVG交给rsvg-convert
+        logger.warning(f"{backend} failed to rasterize SVG, falling back to rsvg-convert: {e}")
+        return _rasterize_rsvg(svg_bytes, background_color, dpi)
+
+
+def rasterize_svg_to_png(svg_content, png_path: str, background_color: Optional[str] = None,
+                         dpi: float = 96, backend: Optional[str] = None) -> str:
+    """
+    将SVG栅格化并保存为PNG文件
+
+    Args:
+        svg_content: SVG字符串或字节
+        png_path: 输出PNG路径
+        background_color: 背景色；None表示透明背景
+        dpi: 物理单位的换算分辨率，同时写入PNG元数据
+        backend: 指定后端，默认按 SVG_RASTERIZER 选择
+
+    Returns:
+        输出PNG路径
+    """
+    rgba = rasterize_svg(svg_content, background_color=background_color, dpi=dpi, backend=backend)
+    Image.fromarray(rgba, 'RGBA').save(png_path, dpi=(dpi, dpi))
+    return png_path
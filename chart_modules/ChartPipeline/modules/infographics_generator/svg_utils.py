@@ -5,12 +5,12 @@ from svgpathtools import parse_path
 import re
 import numpy as np
 from PIL import Image
-import subprocess
-import tempfile
-import os
+import io
 import re
 import colorsys
 
+from .rasterizer import rasterize_svg, rasterize_svg_to_png
+
 def add_gradient_to_rect(rect_svg):
     """
     将普通填充的矩形SVG转换为带有渐变效果的矩形
@@ -276,54 +276,53 @@ def parse_translate(transform_str):
     return 0.0, 0.0
 
 
-def adjust_and_get_bbox(svg_content, background_color = "#FFFFFF"):
-    """Adjust SVG and get precise bounding box."""
-    # Create temporary files for SVG and PNG
-    with tempfile.NamedTemporaryFile(suffix='.svg', delete=False) as temp_svg, \
-         tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_png:
-        temp_svg_path = temp_svg.name
-        temp_png_path = temp_png.name
+def adjust_and_get_bbox(svg_content, background_color = "#FFFFFF", raster_context=None):
+    """
+    Adjust SVG and get precise bounding box.
 
-        svg_container = f"<svg \
-            width='1000' \
-            height='1000' \
-            xmlns='http://www.w3.org/2000/svg' xmlns:xlink='http://www.w3.org/1999/xlink'> \
-            {svg_content}</svg>"
-        with open(temp_svg_path, 'w', encoding='utf-8') as f:
-            f.write(svg_container)
-            f.flush()
-        print("temp_svg_path: ", temp_svg_path)
-        bbox = get_svg_actual_bbox(temp_svg_path)
-        # print("bbox: ", bbox)
-        padding = 150
-        new_width = bbox['width'] + padding * 2
-        new_height = bbox['height'] + padding * 2
-        svg_container = f"<svg \
-            width='{new_width}' \
-            height='{new_height}' \
-            xmlns='http://www.w3.org/2000/svg' xmlns:xlink='http://www.w3.org/1999/xlink'> \
-            <rect width='{new_width}' height='{new_height}' fill='{background_color}' /> \
-            <g transform='translate({padding - bbox['min_x']}, {padding - bbox['min_y']})'> \
-                {svg_content} \
-            </g> \
-            </svg>"
-    
-        with open(temp_svg_path, 'w', encoding='utf-8') as f:
-            f.write(svg_container)
-            f.flush()
-        svg_to_png(temp_svg_path, temp_png_path, background_color)
-        x_min, y_min, x_max, y_max = get_precise_bbox(temp_png_path, background_color)
-        width = x_max - x_min + 1
-        height = y_max - y_min + 1
-        offset_x = padding - bbox['min_x'] - x_min
-        offset_y = padding - bbox['min_y'] - y_min
-        svg_container = f"<g transform='translate({offset_x}, {offset_y})'> \
+    If a RasterContext is given, the raster cropped to the bbox is registered as the
+    raw layer of make_layer_svg(svg_container, width, height) so that later masks of
+    the chart can reuse it instead of rasterizing the chart again.
+    """
+    # SVG parsing and rasterization both happen in memory, no temporary files
+    svg_container = f"<svg \
+        width='1000' \
+        height='1000' \
+        xmlns='http://www.w3.org/2000/svg' xmlns:xlink='http://www.w3.org/1999/xlink'> \
+        {svg_content}</svg>"
+    bbox = get_svg_actual_bbox(io.BytesIO(svg_container.encode('utf-8')))
+    # print("bbox: ", bbox)
+    padding = 150
+    new_width = bbox['width'] + padding * 2
+    new_height = bbox['height'] + padding * 2
+    # 与make_layer_svg使用相同的根样式，下面登记的图层栅格与图层SVG的渲染结果一致
+    from .raster_context import SVG_ROOT_STYLE, make_layer_svg
+    svg_container = f"<svg \
+        width='{new_width}' \
+        height='{new_height}' \
+        style=\"{SVG_ROOT_STYLE}\" \
+        xmlns='http://www.w3.org/2000/svg' xmlns:xlink='http://www.w3.org/1999/xlink'> \
+        <rect width='{new_width}' height='{new_height}' fill='{background_color}' /> \
+        <g transform='translate({padding - bbox['min_x']}, {padding - bbox['min_y']})'> \
             {svg_content} \
-        </g>"
+        </g> \
+        </svg>"
+
+    img_array = rasterize_svg(svg_container, background_color=background_color)
+    x_min, y_min, x_max, y_max = get_precise_bbox_from_array(img_array, background_color)
+    width = x_max - x_min + 1
+    height = y_max - y_min + 1
+    offset_x = padding - bbox['min_x'] - x_min
+    offset_y = padding - bbox['min_y'] - y_min
+    svg_container = f"<g transform='translate({offset_x}, {offset_y})'> \
+        {svg_content} \
+    </g>"
+
+    layer_raster = img_array[y_min:y_max + 1, x_min:x_max + 1]
+    if raster_context is not None and layer_raster.shape[:2] == (height, width):
+        # 图表图层相对padding画布只差整数平移(x_min, y_min)，裁剪结果即为图层的栅格
+        raster_context.add_layer(make_layer_svg(svg_container, width, height), width, height, layer_raster)
 
-        os.unlink(temp_svg_path)
-        os.unlink(temp_png_path)
-    
     return svg_container, width, height, offset_x, offset_y
     
 def remove_image_element(svg_content: str) -> str:
@@ -351,22 +350,22 @@ def remove_image_element(svg_content: str) -> str:
         return svg_content
 
 def svg_to_png(svg_path, png_path, background_color = "#FFFFFF"):
-    """Convert SVG to PNG using rsvg-convert with a white background."""
-    # Add --background-color=#FFFFFF to set white background
-    cmd = ['rsvg-convert', '--background-color=' + background_color, svg_path, '-o', png_path]
-    subprocess.run(cmd, check=True)
+    """Convert SVG to PNG with the given background color."""
+    with open(svg_path, 'rb') as f:
+        rasterize_svg_to_png(f.read(), png_path, background_color=background_color)
 
 def get_precise_bbox(png_path, background_color = "#FFFFFF"):
     """Get precise bounding box by detecting the exact non-transparent pixels."""
     img = Image.open(png_path).convert("RGBA")
-    width, height = img.size
-    
-    # Convert image to numpy array for efficient processing
-    img_array = np.array(img)
+    return get_precise_bbox_from_array(np.array(img), background_color)
+
+def get_precise_bbox_from_array(img_array, background_color = "#FFFFFF"):
+    """Get precise bounding box from an RGBA array (height x width x 4)."""
+    height, width = img_array.shape[:2]
     
     # Get alpha channel and RGB values
     alpha = img_array[:, :, 3]
-    rgb = img_array[:, :, :3]
+    rgb = img_array[:, :, :3].astype(np.int16)
     
     # Consider pixels close to the background color as transparent too
     bg_rgb = np.array([int(background_color[i:i+2], 16) for i in (1, 3, 5)])  # Convert hex to RGB
@@ -1,7 +1,9 @@
 from typing import Dict, List, Tuple, Optional, Union
 import random
 import json
+import itertools
 from modules.infographics_generator.color_utils import get_contrast_color, has_indistinguishable_colors, generate_distinct_palette
+from modules.infographics_generator.usage_stats import get_usage_stats
 import os
 
 # 添加全局字典来跟踪模板使用频率
@@ -150,25 +152,219 @@ def check_field_icon_compatibility(requirements: Dict, data: Dict) -> bool:
                 return False
     return True
 
+# 数据类型 -> 可以接受该类型的模板字段类型（categorical字段也接受temporal数据）
+COMPATIBLE_FIELD_TYPES = {
+    "categorical": ("categorical",),
+    "temporal": ("categorical", "temporal"),
+    "numerical": ("numerical",),
+}
+
+class DatasetProfile:
+    """
+    单个数据集的统计信息，供兼容性检查在所有模板之间共享
+
+    唯一值数量、最小/最大值、列组合的基数以及颜色/图标检查结果都在第一次用到时计算并缓存。
+    计算出错时缓存异常并在每次访问时重新抛出，使逐模板的检查与原来逐次计算时一样被跳过。
+
+    Args:
+        data: 输入数据
+    """
+
+    def __init__(self, data: Dict):
+        self.data = data
+        self._memo = {}
+
+    def _get(self, key, compute):
+        if key not in self._memo:
+            try:
+                self._memo[key] = (True, compute())
+            except Exception as e:
+                self._memo[key] = (False, e)
+        ok, value = self._memo[key]
+        if not ok:
+            raise value
+        return value
+
+    @property
+    def rows(self) -> List[Dict]:
+        return self.data["data"]["data"]
+
+    def unique_count(self, name: str) -> int:
+        """列的唯一值数量"""
+        return self._get(('unique', name), lambda: len(set(value[name] for value in self.rows)))
+
+    def min_max(self, name: str) -> Tuple:
+        """数值列的 (最小值, 最大值)"""
+        def compute():
+            return min(value[name] for value in self.rows), max(value[name] for value in self.rows)
+        return self._get(('min_max', name), compute)
+
+    def combination_count(self, names: Tuple[str, ...]) -> int:
+        """多列取值以空格拼接后的唯一组合数量"""
+        return self._get(('combination', names),
+                         lambda: len(set(' '.join(str(value[name]) for name in names) for value in self.rows)))
+
+    def field_color_compatible(self, requirements: Dict) -> bool:
+        key = ('colors', tuple(get_flatten_fields(requirements.get('required_fields', []))),
+               tuple(requirements.get('required_fields_colors', [])))
+        return self._get(key, lambda: check_field_color_compatibility(requirements, self.data))
+
+    def field_icon_compatible(self, requirements: Dict) -> bool:
+        key = ('icons', tuple(get_flatten_fields(requirements.get('required_fields', []))),
+               tuple(requirements.get('required_fields_icons', [])))
+        return self._get(key, lambda: check_field_icon_compatibility(requirements, self.data))
+
+
+class TemplateEntry:
+    """索引中的一个模板：预先解析好的字段顺序、类型和取值范围"""
+
+    __slots__ = ('order', 'template_key', 'chart_name', 'requirements', 'hierarchy',
+                 'ordered_fields', 'data_types', 'ordered_ranges')
+
+    def __init__(self, order: int, template_key: str, chart_name: str, requirements: Dict):
+        self.order = order
+        self.template_key = template_key
+        self.chart_name = chart_name
+        self.requirements = requirements
+        self.hierarchy = requirements.get('hierarchy', [])
+        self.ordered_fields, field_types, self.ordered_ranges = get_unique_fields_and_types(
+            requirements['required_fields'],
+            requirements['required_fields_type'],
+            requirements.get('required_fields_range', None)
+        )
+        self.data_types = tuple(field_types[field] for field in self.ordered_fields)
+
+
+class TemplateCompatibilityIndex:
+    """
+    按字段类型签名分桶的模板索引
+
+    数据的类型签名（各列data_type组成的元组）按COMPATIBLE_FIELD_TYPES展开成所有可接受的模板签名，
+    只有这些桶里的模板才需要做颜色、图标、取值范围和层级检查。
+
+    Args:
+        templates: scan_templates返回的模板字典
+    """
+
+    def __init__(self, templates: Dict):
+        self.buckets = {}
+        self.size = 0
+        order = 0
+        for engine, templates_dict in templates.items():
+            for chart_type, chart_names_dict in templates_dict.items():
+                for chart_name, template_info in chart_names_dict.items():
+                    if 'base' in chart_name or engine == 'vegalite_py':
+                        continue
+                    order += 1
+                    req = template_info.get('requirements') if isinstance(template_info, dict) else None
+                    if not req or 'required_fields' not in req or 'required_fields_type' not in req:
+                        continue
+                    try:
+                        entry = TemplateEntry(order, f"{engine}/{chart_type}/{chart_name}", chart_name, req)
+                    except Exception:
+                        # 需求格式有误的模板永远不兼容，与逐个检查时被跳过一致
+                        continue
+                    self.buckets.setdefault(entry.data_types, []).append(entry)
+                    self.size += 1
+
+    def candidates(self, combination_types: List[str]) -> List[TemplateEntry]:
+        """返回类型签名与数据兼容的模板，保持模板字典中的顺序"""
+        accepted = []
+        for data_type in combination_types:
+            if data_type not in COMPATIBLE_FIELD_TYPES:
+                return []
+            accepted.append(COMPATIBLE_FIELD_TYPES[data_type])
+        entries = []
+        for signature in itertools.product(*accepted):
+            entries.extend(self.buckets.get(signature, []))
+        entries.sort(key=lambda entry: entry.order)
+        return entries
+
+
+_compatibility_index_cache = {}
+
+def _templates_fingerprint(templates: Dict) -> Tuple:
+    """模板字典的结构指纹，模板重新扫描或被替换后索引随之重建"""
+    return tuple(
+        (engine, chart_type, chart_name, id(template_info), id(template_info.get('requirements')) if isinstance(template_info, dict) else None)
+        for engine, templates_dict in templates.items()
+        for chart_type, chart_names_dict in templates_dict.items()
+        for chart_name, template_info in chart_names_dict.items()
+    )
+
+def get_compatibility_index(templates: Dict) -> TemplateCompatibilityIndex:
+    """获取模板字典对应的兼容性索引，模板字典未变化时复用"""
+    fingerprint = _templates_fingerprint(templates)
+    cached = _compatibility_index_cache.get(id(templates))
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    index = TemplateCompatibilityIndex(templates)
+    # 只保留最近一个模板字典的索引
+    _compatibility_index_cache.clear()
+    _compatibility_index_cache[id(templates)] = (fingerprint, index)
+    return index
+
+def _check_entry_compatibility(entry: TemplateEntry, data: Dict, profile: DatasetProfile) -> bool:
+    """对类型签名已匹配的模板检查颜色、图标、取值范围和层级"""
+    req = entry.requirements
+    if len(req.get('required_fields_colors', [])) > 0 and len(data.get("colors", {}).get("field", [])) == 0:
+        return False
+    if not profile.field_color_compatible(req):
+        return False
+    if not profile.field_icon_compatible(req):
+        return False
+
+    columns = data["data"]["columns"]
+    for i, range in enumerate(entry.ordered_ranges):
+        if i >= len(columns):
+            return False
+        if columns[i]["data_type"] in ["temporal", "categorical"]:
+            num_unique = profile.unique_count(columns[i]["name"])
+            if num_unique > range[1] or num_unique < range[0]:
+                return False
+        elif columns[i]["data_type"] in ["numerical"]:
+            min_value, max_value = profile.min_max(columns[i]["name"])
+            if min_value < range[0] or max_value > range[1]:
+                return False
+            elif "diverging" in entry.chart_name and min_value >= 0 and range[0] < 0:
+                return False
+            elif "scatterplot" in entry.chart_name and min_value >= 0 and range[0] < 0:
+                return False
+
+    ordered_fields = entry.ordered_fields
+    for i, field in enumerate(ordered_fields):
+        if field == "group":
+            x_name = columns[ordered_fields.index("x")]["name"]
+            field_name = columns[i]["name"]
+            num_unique_x = profile.unique_count(x_name)
+            num_unique_comb = profile.combination_count((x_name, field_name))
+        elif field == "group2":
+            x_name = columns[ordered_fields.index("x")]["name"]
+            group_name = columns[ordered_fields.index("group")]["name"]
+            field_name = columns[i]["name"]
+            num_unique_x = profile.combination_count((x_name, group_name))
+            num_unique_comb = profile.combination_count((x_name, group_name, field_name))
+        else:
+            continue
+        if field in entry.hierarchy:
+            if num_unique_comb > num_unique_x:
+                return False
+        elif num_unique_comb == num_unique_x:
+            return False
+    return True
+
 def check_template_compatibility(data: Dict, templates: Dict, specific_chart_name: str = None) -> List[str]:
-    """Check which templates are compatible with the given data"""
+    """
+    Check which templates are compatible with the given data
+
+    模板按类型签名建立索引（模板字典不变时跨调用复用），数据集的统计信息只计算一次，
+    每个候选模板只需做几次区间比较。
+
+    Returns:
+        [(template_key, ordered_fields), ...]，顺序与模板字典一致
+    """
     compatible_templates = []
 
-    # print(data)
-    # print(templates)
-    # print(specific_chart_name)
-    
-    # try:
-        # 模拟出错的条件
-    # raise ValueError("这是一个自定义错误示例")
-    # except Exception:
-    #     # 捕获异常并打印完整traceback
-    #     with open('output.txt', 'w', encoding='utf-8') as f:
-    #         f.write(traceback.format_exc())
-    #         f.write(f"Data:\n{data}\n\n")
-    #         f.write(f"Templates:\n{templates}\n\n")
-    #         f.write(f"Chart Name:\n{specific_chart_name}\n")
- 
     # Get the combination type from the data
     combination_type = data.get("data", {}).get("type_combination", "")
     combination_types = [col["data_type"] for col in data["data"]["columns"]]
@@ -178,145 +374,24 @@ def check_template_compatibility(data: Dict, templates: Dict, specific_chart_nam
     if not combination_type:
         return compatible_templates
 
-    for engine, templates_dict in templates.items():
-        for chart_type, chart_names_dict in templates_dict.items():
-            for chart_name, template_info in chart_names_dict.items():
-                if 'base' in chart_name:
-                    continue
-                if engine == 'vegalite_py':
-                    continue
-
-                template_key = f"{engine}/{chart_type}/{chart_name}"
-
-                if specific_chart_name and specific_chart_name != chart_name:
-                    continue
-
-                try:
-                    if 'requirements' in template_info:
-                        req = template_info['requirements']
-                        hierarchy = req.get('hierarchy', [])
-                        if 'required_fields' in req and 'required_fields_type' in req:
-                            ordered_fields, field_types, ordered_ranges = get_unique_fields_and_types(
-                                req['required_fields'],
-                                req['required_fields_type'],
-                                req.get('required_fields_range', None)
-                            )
-                            data_types = [field_types[field] for field in ordered_fields]
-                            data_type_str = ' + '.join(data_types)
-                            if len(req.get('required_fields_colors', [])) > 0 and len(data.get("colors", {}).get("field", [])) == 0:
-                                # print(f"template {template_key} failed color compatibility check")
-                                continue
-
-                            # if len(req.get('required_fields_icons', [])) > 0 and len(data.get("images", {}).get("field", [])) == 0:
-                            #     print(f"template {template_key} failed icon compatibility check")
-                            #     continue
-
-                            if not check_field_color_compatibility(req, data):
-                                # print(f"template {template_key} failed color compatibility check")
-                                continue
-
-                            if not check_field_icon_compatibility(req, data):
-                                # print(f"template {template_key} failed icon compatibility check")
-                                continue
-                            # print("data_types", data_types)
-                            # print("combination_types", combination_types)
-                            # 如果data_types和combination_types相同，或者data_types是combination_types的一个子序列
-                            if len(data_types) == len(combination_types):# or all(data_type in combination_types for data_type in data_types):
-                                check_flag = True
-                                for data_type, combination_type in zip(data_types, combination_types[:len(data_types)]):
-                                    if data_type == "categorical" and (combination_type == "temporal" or combination_type == "categorical"):
-                                        pass
-                                    elif data_type == "numerical" and combination_type == "numerical":
-                                        pass
-                                    elif data_type == "temporal" and combination_type == "temporal":
-                                        pass
-                                    else:
-                                        check_flag = False
-                                        break
-                                if not check_flag:
-                                    # print(f"template {template_key} failed data type compatibility check")
-                                    continue
-                            else:
-                                # print(f"template {template_key} failed data type compatibility check")
-                                continue
-
-                            flag = True
-                            # print("check compatibility")
-                            for i, range in enumerate(ordered_ranges):
-                                if i >= len(data["data"]["columns"]):
-                                    flag = False
-                                    break
-
-                                if data["data"]["columns"][i]["data_type"] in ["temporal", "categorical"]:
-                                    key = data["data"]["columns"][i]["name"]
-                                    unique_values = list(set(value[key] for value in data["data"]["data"]))
-                                    if len(unique_values) > range[1] or len(unique_values) < range[0]:
-                                        flag = False
-                                        break
-                                    else:
-                                        pass
-                                        #if specific_chart_name and specific_chart_name == chart_name:
-                                        #    print(f"template {template_key} matched", data["name"], len(unique_values), range)
-                                elif data["data"]["columns"][i]["data_type"] in ["numerical"]:
-                                    key = data["data"]["columns"][i]["name"]
-                                    min_value = min(value[key] for value in data["data"]["data"])
-                                    max_value = max(value[key] for value in data["data"]["data"])
-                                    if min_value < range[0] or max_value > range[1]:
-                                        flag = False
-                                        break
-                                    elif "diverging" in chart_name and min_value >= 0 and range[0] < 0:
-                                        flag = False
-                                        break
-                                    elif "scatterplot" in chart_name and min_value >= 0 and range[0] < 0:
-                                        flag = False
-                                        break
-                            for i, field in enumerate(ordered_fields):
-                                if field == "group":
-                                    x_col = [j for j, field2 in enumerate(ordered_fields) if field2 == "x"][0]
-                                    x_name = data["data"]["columns"][x_col]["name"]
-                                    field_name = data["data"]["columns"][i]["name"]
-                                    num_unique_x  = len(list(set(value[x_name] for value in data["data"]["data"])))
-                                    num_unique_comb = len(list(set(str(value[x_name]) + ' ' + str(value[field_name]) for value in data["data"]["data"])))
-                                    if field in hierarchy:
-                                        if num_unique_comb > num_unique_x:
-                                            flag = False
-                                            break
-                                    else:
-                                        if num_unique_comb == num_unique_x:
-                                            flag = False
-                                            break
-                                elif field == "group2":
-                                    x_col = [j for j, field2 in enumerate(ordered_fields) if field2 == "x"][0]
-                                    group_col = [j for j, field2 in enumerate(ordered_fields) if field2 == "group"][0]
-                                    x_name = data["data"]["columns"][x_col]["name"]
-                                    group_name = data["data"]["columns"][group_col]["name"]
-                                    field_name = data["data"]["columns"][i]["name"]
-                                    num_unique_x  = len(list(set(str(value[x_name]) + ' ' + str(value[group_name]) for value in data["data"]["data"])))
-                                    num_unique_comb = len(list(set(str(value[x_name]) + ' ' + str(value[group_name]) + ' ' + str(value[field_name]) for value in data["data"]["data"])))
-                                    if field in hierarchy:
-                                        if num_unique_comb > num_unique_x:
-                                            flag = False
-                                            break
-                                    else:
-                                        if num_unique_comb == num_unique_x:
-                                            flag = False
-                                            break
-                            if flag:
-                                if specific_chart_name == None or specific_chart_name == chart_name:
-                                    compatible_templates.append((template_key, ordered_fields))
-                except:
-                    pass
-    #print("compatible_templates", compatible_templates)
+    index = get_compatibility_index(templates)
+    profile = DatasetProfile(data)
+    for entry in index.candidates(combination_types):
+        if specific_chart_name and specific_chart_name != entry.chart_name:
+            continue
+        try:
+            if _check_entry_compatibility(entry, data, profile):
+                compatible_templates.append((entry.template_key, list(entry.ordered_fields)))
+        except Exception:
+            pass
     return compatible_templates
 
 
-#import fcntl  # 用于文件锁
 def select_template(compatible_templates: List[str]) -> Tuple[str, str, str]:
     """
-    根据variation.json中的使用统计选择模板
-    按照使用频率分为4个level，优先选择使用较少的level
-    同level内按照具体使用次数加权随机选择
-    使用文件锁确保多线程安全
+    根据模板使用统计选择模板
+    选择使用次数最少的模板（次数相同时取列表中靠前的一个），并将其使用次数加一
+    统计保存在usage_stats的SQLite数据库中，多进程/多线程并发选择时计数不会丢失
     """
     # 过滤掉block_list中的模板
     filtered_templates = []
@@ -335,96 +410,22 @@ def select_template(compatible_templates: List[str]) -> Tuple[str, str, str]:
 
     compatible_templates = filtered_templates
 
-    # 读取variation.json，使用文件锁
-    try:
-        with open('variation.json', 'r') as f:
-            # 获取文件锁
-            #fcntl.flock(f, fcntl.LOCK_EX)
-            try:
-                variation_stats = json.load(f)
-            finally:
-                # 释放文件锁
-                #fcntl.flock(f, fcntl.LOCK_UN)
-                pass
-    except:
-        variation_stats = {}
-
-    # 获取所有模板的使用次数
-    template_counts = []
-    for template_info in compatible_templates:
-        template_key = template_info[0]
-        _, chart_type, chart_name = template_key.split('/')
-
-        # 如果variation_stats为空,所有模板使用次数都为0
-        if not variation_stats:
-            count = 0
-        else:
-            if chart_type not in variation_stats:
-                variation_stats[chart_type] = {"total_count": 0}
-
-            if chart_name not in variation_stats[chart_type]:
-                variation_stats[chart_type][chart_name] = 0
-
-            count = variation_stats[chart_type][chart_name]
-
-        template_counts.append((template_info, count))
-
-    # 按使用次数排序并分level
-    template_counts.sort(key=lambda x: x[1])
-    n = len(template_counts)
-    level_size = max(1, n // 4)
-    # 找出使用次数最少的模板
-    min_count = min(c for _, c in template_counts)
-    min_level_templates = [(t, c) for t, c in template_counts if c == min_count]
+    # 一次查询所有候选模板的使用次数
+    usage_stats = get_usage_stats()
+    template_keys = [tuple(template_info[0].split('/')[1:]) for template_info in compatible_templates]
+    counts = usage_stats.get_counts(template_keys)
 
-    # 固定选择第一个最少使用的模板
-    selected_index = 0
-
-    selected_template, _ = min_level_templates[selected_index]
+    # 固定选择第一个使用次数最少的模板
+    selected_index = min(range(len(compatible_templates)), key=lambda i: counts[template_keys[i]])
+    selected_template = compatible_templates[selected_index]
     [template_key, ordered_fields] = selected_template
     print("selected_template", selected_template)
 
-    # 更新variation.json，使用文件锁
+    # 原子地更新使用次数
     engine, chart_type, chart_name = template_key.split('/')
-    try:
-        with open('variation.json', 'r+') as f:
-            # 获取文件锁
-            #fcntl.flock(f, fcntl.LOCK_EX)
-            try:
-                # 重新读取以确保获取最新数据
-                variation_stats = json.load(f)
-
-                # 初始化如果不存在
-                if chart_type not in variation_stats:
-                    variation_stats[chart_type] = {"total_count": 0}
-                if chart_name not in variation_stats[chart_type]:
-                    variation_stats[chart_type][chart_name] = 0
-
-                # 更新计数
-                variation_stats[chart_type][chart_name] += 1
-                variation_stats[chart_type]["total_count"] += 1
-
-                # 写入更新后的数据
-                f.seek(0)
-                json.dump(variation_stats, f, indent=2)
-                f.truncate()
-            finally:
-                # 释放文件锁
-                #fcntl.flock(f, fcntl.LOCK_UN)
-                pass
-    except FileNotFoundError:
-        # 如果文件不存在,创建新的variation_stats
-        variation_stats = {
-            chart_type: {
-                "total_count": 1,
-                chart_name: 1
-            }
-        }
-        with open('variation.json', 'w') as f:
-            json.dump(variation_stats, f, indent=2)
+    usage_stats.increment(chart_type, chart_name)
     return engine, chart_type, chart_name, ordered_fields
 
-
 def process_template_requirements(requirements: Dict, data: Dict, engine: str, chart_name: str) -> None:
     """处理模板的颜色要求"""
     if len(data["colors"]["field"]) > 1:
@@ -0,0 +1,213 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 模板使用统计数据库的路径，可通过环境变量 TEMPLATE_USAGE_DB 指定（相对路径以当前工作目录为准，与原来的variation.json一致）
+TEMPLATE_USAGE_DB = os.environ.get('TEMPLATE_USAGE_DB', 'variation.db')
+# 数据库首次创建时从该文件导入已有的统计
+LEGACY_VARIATION_JSON = 'variation.json'
+# 每累计多少次计数就把统计导出为variation.json格式的快照，0表示不导出
+TEMPLATE_USAGE_SNAPSHOT_EVERY = int(os.environ.get('TEMPLATE_USAGE_SNAPSHOT_EVERY', '0'))
+# 等待其他进程释放写锁的秒数
+SQLITE_BUSY_TIMEOUT = 30
+
+
+class TemplateUsageStats:
+    """
+    模板使用次数统计，保存在WAL模式的SQLite数据库中
+
+    所有进程和线程共享同一个数据库文件，计数在一个写事务中原子地递增，不会像反复读写
+    variation.json那样丢失并发的更新。按 (chart_type, count) 建有索引，
+    查询某一图表类型中使用最少的模板不需要对全部模板排序。
+
+    Args:
+        db_path: 数据库文件路径
+        legacy_json_path: 数据库首次创建时导入的variation.json，None表示不导入
+        snapshot_every: 每累计多少次计数导出一次快照，0表示不导出
+        snapshot_path: 快照文件路径
+    """
+
+    def __init__(self, db_path: str = None, legacy_json_path: Optional[str] = LEGACY_VARIATION_JSON,
+                 snapshot_every: int = None, snapshot_path: str = LEGACY_VARIATION_JSON):
+        self.db_path = db_path or TEMPLATE_USAGE_DB
+        self.legacy_json_path = legacy_json_path
+        self.snapshot_every = TEMPLATE_USAGE_SNAPSHOT_EVERY if snapshot_every is None else snapshot_every
+        self.snapshot_path = snapshot_path
+        # 每个线程一个连接；fork出的子进程不能复用父进程的连接，按pid区分
+        self._local = threading.local()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        with self._init_lock:
+            if not self._initialized:
+                self._create_schema(conn)
+                self._initialized = True
+        return conn
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'template_usage'"
+            ).fetchone()
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS template_usage ('
+                ' chart_type TEXT NOT NULL,'
+                ' chart_name TEXT NOT NULL,'
+                ' count INTEGER NOT NULL DEFAULT 0,'
+                ' PRIMARY KEY (chart_type, chart_name))'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS template_usage_by_count ON template_usage (chart_type, count, chart_name)')
+            if not exists:
+                self._import_legacy_json(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _import_legacy_json(self, conn: sqlite3.Connection) -> None:
+        """把原有variation.json中的统计导入新建的数据库"""
+        if not self.legacy_json_path or not os.path.exists(self.legacy_json_path):
+            return
+        try:
+            with open(self.legacy_json_path, 'r') as f:
+                variation_stats = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to import {self.legacy_json_path}: {e}")
+            return
+        rows = [
+            (chart_type, chart_name, int(count))
+            for chart_type, counts in variation_stats.items() if isinstance(counts, dict)
+            for chart_name, count in counts.items() if chart_name != 'total_count'
+        ]
+        conn.executemany('INSERT OR REPLACE INTO template_usage (chart_type, chart_name, count) VALUES (?, ?, ?)', rows)
+        logger.info(f"Imported {len(rows)} template usage counts from {self.legacy_json_path}")
+
+    def increment(self, chart_type: str, chart_name: str, amount: int = 1) -> int:
+        """
+        原子地增加模板的使用次数
+
+        Returns:
+            增加后的使用次数
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT OR IGNORE INTO template_usage (chart_type, chart_name, count) VALUES (?, ?, 0)',
+                         (chart_type, chart_name))
+            conn.execute('UPDATE template_usage SET count = count + ? WHERE chart_type = ? AND chart_name = ?',
+                         (amount, chart_type, chart_name))
+            count = conn.execute('SELECT count FROM template_usage WHERE chart_type = ? AND chart_name = ?',
+                                 (chart_type, chart_name)).fetchone()[0]
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._maybe_snapshot()
+        return count
+
+    def get_counts(self, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+        """
+        批量查询模板的使用次数，未使用过的模板计为0
+
+        Args:
+            keys: [(chart_type, chart_name), ...]
+        """
+        keys = list(dict.fromkeys(keys))
+        counts = {key: 0 for key in keys}
+        if not keys:
+            return counts
+        conn = self._connect()
+        # SQLite对单条语句的参数数量有限制，分批查询
+        batch_size = 400
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            placeholders = ', '.join(['(?, ?)'] * len(batch))
+            params = [value for key in batch for value in key]
+            rows = conn.execute(
+                f'SELECT chart_type, chart_name, count FROM template_usage '
+                f'WHERE (chart_type, chart_name) IN (VALUES {placeholders})', params
+            ).fetchall()
+            for chart_type, chart_name, count in rows:
+                counts[(chart_type, chart_name)] = count
+        return counts
+
+    def least_used(self, chart_type: str, limit: int = 1) -> List[Tuple[str, int]]:
+        """
+        某一图表类型中使用次数最少的模板（只包含已有记录的模板）
+
+        Returns:
+            [(chart_name, count), ...]，按使用次数升序
+        """
+        conn = self._connect()
+        return conn.execute(
+            'SELECT chart_name, count FROM template_usage WHERE chart_type = ? ORDER BY count, chart_name LIMIT ?',
+            (chart_type, limit)
+        ).fetchall()
+
+    def to_dict(self) -> Dict[str, Dict[str, int]]:
+        """导出为variation.json的格式：{chart_type: {"total_count": n, chart_name: count}}"""
+        conn = self._connect()
+        variation_stats = {}
+        for chart_type, chart_name, count in conn.execute(
+                'SELECT chart_type, chart_name, count FROM template_usage ORDER BY chart_type, chart_name'):
+            stats = variation_stats.setdefault(chart_type, {"total_count": 0})
+            stats[chart_name] = count
+            stats["total_count"] += count
+        return variation_stats
+
+    def export_json(self, path: str = None) -> None:
+        """将统计写为variation.json格式的快照（先写临时文件再替换）"""
+        path = path or self.snapshot_path
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(temp_path, path)
+
+    def _maybe_snapshot(self) -> None:
+        if self.snapshot_every <= 0:
+            return
+        self._local.pending = getattr(self._local, 'pending', 0) + 1
+        if self._local.pending >= self.snapshot_every:
+            self._local.pending = 0
+            try:
+                self.export_json()
+            except OSError as e:
+                logger.warning(f"Failed to write template usage snapshot: {e}")
+
+    def close(self) -> None:
+        """关闭当前线程的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+_usage_stats = None
+_usage_stats_lock = threading.Lock()
+
+
+def get_usage_stats() -> TemplateUsageStats:
+    """获取进程内共享的模板使用统计（数据库路径由 TEMPLATE_USAGE_DB 决定）"""
+    global _usage_stats
+    if _usage_stats is None:
+        with _usage_stats_lock:
+            if _usage_stats is None:
+                _usage_stats = TemplateUsageStats()
+    return _usage_stats
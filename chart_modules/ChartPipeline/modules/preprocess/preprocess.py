@@ -1,8 +1,7 @@
 #!/usr/bin/env python3
 import json
 import logging
-from typing import Dict, Any
-from pathlib import Path
+from typing import Dict, Any, Optional
 
 # Configure logging
 logging.basicConfig(
@@ -265,32 +264,31 @@ def update_data_format(data: Dict[str, Any]) -> Dict[str, Any]:
     
     return updated_data
 
-def process(input: str, output: str = None) -> None:
+def process(input: str = None, output: str = None, input_data: Dict = None) -> Optional[Dict]:
     """
     Pipeline入口函数，处理单个文件的数据预处理
     
     Args:
         input (str): 输入JSON文件路径
         output (str): 输出JSON文件路径，如果为None则原地修改输入文件
+        input_data (Dict): 直接传入的数据（代替input文件），此时不指定output则不写文件
+
+    Returns:
+        未写文件时返回处理后的数据
     """
     try:
         # 如果没有指定输出路径，则原地修改
         if output is None:
             output = input
-            
-        logger.info(f"处理文件: {input}")
-        
-        # 检查是否需要处理
-        if Path(output).exists():
-            with open(output) as f:
+
+        if input_data is not None:
+            data = input_data
+        else:
+            logger.info(f"处理文件: {input}")
+
+            # 读取输入数据
+            with open(input, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                #if "metadata" in data and "data" in data and "variables" in data and "processed" in data:
-                #    logger.info(f"跳过处理: {output} 已包含必要字段")
-                #    return
-        
-        # 读取输入数据
-        with open(input, 'r', encoding='utf-8') as f:
-            data = json.load(f)
         
         # 更新数据格式
         updated_data = update_data_format(data)
@@ -305,6 +303,9 @@ def process(input: str, output: str = None) -> None:
         deduplicate_combinations(updated_data)
         updated_data["processed"] = True
         
+        if not output:
+            return updated_data
+
         # 保存更新后的数据
         with open(output, 'w', encoding='utf-8') as f:
             json.dump(updated_data, f, indent=2, ensure_ascii=False)
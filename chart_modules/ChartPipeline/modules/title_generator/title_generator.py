@@ -1,13 +1,15 @@
 import os
 import json
-import faiss
 import numpy as np
 from tqdm import tqdm
 import argparse
 import logging
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, Iterable, List, Tuple, Union
 from openai import OpenAI
 from utils.model_loader import ModelLoader
+from utils.service_registry import get_service
+from utils.embedding_cache import encode_cached
+from utils.faiss_index import METADATA_SUFFIX, build_index, read_index, read_index_config, write_index
 import sys
 
 # Add project root to sys.path to import config
@@ -24,6 +26,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger("RagTitleGenerator")
 
+# 批量导入训练数据时每批编码的样本数
+TITLE_INGEST_BATCH_SIZE = int(os.environ.get('TITLE_INGEST_BATCH_SIZE', '64'))
+# 批量导入时每累计多少个样本追加写入一次日志（见 RagTitleGenerator._append_journal），0表示只在结束时保存
+TITLE_INGEST_CHECKPOINT_EVERY = int(os.environ.get('TITLE_INGEST_CHECKPOINT_EVERY', '1000'))
+
 class RagTitleGenerator:
     """
     RagTitleGenerator is a class that handles both:
@@ -51,6 +58,9 @@ class RagTitleGenerator:
         """
         self.index_path = index_path
         self.data_path = data_path
+        # 追加日志：向量按行追加到可内存映射的float32文件，样本追加到JSONL，保存时合并进索引和数据文件
+        self.journal_vectors_path = index_path + ".journal.f32"
+        self.journal_data_path = data_path + ".journal.jsonl"
         if embed_model_path:
             self.embed_model = ModelLoader.get_model(embed_model_path)
         else:
@@ -59,7 +69,9 @@ class RagTitleGenerator:
         #    self.embed_model = SentenceTransformer("all-MiniLM-L6-v2")
 
         self.index = None
+        self.index_config = None
         self.training_data = []  # List of tuples: (input_text, title, description)
+        self._journal_rows = 0
 
         print(api_key, base_url)
         self.client = OpenAI(
@@ -70,10 +82,13 @@ class RagTitleGenerator:
         # Try loading an existing FAISS index and data
         if os.path.exists(self.index_path) and os.path.exists(self.data_path):
             print("Load existing FAISS index from disk.")
-            self.index = faiss.read_index(self.index_path)
+            self.index = read_index(self.index_path)
+            self.index_config = read_index_config(self.index_path, self.index)
             with open(self.data_path, "rb") as f:
                 self.training_data = np.load(f, allow_pickle=True).tolist()
-        else:
+        self._replay_journal()
+        self._check_consistency()
+        if self.index is None:
             print("No existing FAISS index found; you can build a new one via build_faiss_index().")
 
     def build_faiss_index(self, data_json_path):
@@ -91,11 +106,15 @@ class RagTitleGenerator:
             print("dataset", type(dataset))
             # Build the FAISS index from scratch
             if isinstance(dataset, dict):
-                for name, details in tqdm(dataset.items(), desc="Building new FAISS index"):
-                    processed_text = self.process_single_data(details)
-                    title = details.get("metadata", {}).get("title", "")
-                    description = details.get("metadata", {}).get("description", "")
-                    self.add_training_data(processed_text, title, description)
+                samples = (
+                    (
+                        self.process_single_data(details),
+                        details.get("metadata", {}).get("title", ""),
+                        details.get("metadata", {}).get("description", "")
+                    )
+                    for details in tqdm(dataset.values(), desc="Building new FAISS index")
+                )
+                self.add_training_data_batch(samples)
             else:
                 raise ValueError("Dataset must be a dictionary")
 
@@ -107,9 +126,13 @@ class RagTitleGenerator:
         """Remove existing FAISS index and training data from disk."""
         if os.path.exists(self.index_path):
             os.remove(self.index_path)
+        if os.path.exists(self.index_path + METADATA_SUFFIX):
+            os.remove(self.index_path + METADATA_SUFFIX)
         if os.path.exists(self.data_path):
             os.remove(self.data_path)
+        self._clear_journal()
         self.index = None
+        self.index_config = None
         self.training_data = []
         print("Original FAISS has been cleared.")
 
@@ -183,27 +206,187 @@ class RagTitleGenerator:
     ) -> None:
         """
         Add a single training sample into the in-memory list and FAISS index.
-        After adding, it writes the updated index and data to disk.
+        The sample is appended to the on-disk journal instead of rewriting the
+        whole index and data files; call save() to compact.
 
         Args:
             input_text (str): Concatenated text derived from chart data.
             title (str): Ground truth or known title from the data's metadata.
             description (str): Ground truth or known description from the data's metadata.
         """
-        self.training_data.append((input_text, title, description))
+        self.add_training_data_batch([(input_text, title, description)], compact=False)
+
+    def add_training_data_batch(
+        self,
+        samples: Iterable[Tuple[str, str, str]],
+        batch_size: int = None,
+        checkpoint_every: int = None,
+        compact: bool = True
+    ) -> int:
+        """
+        Bulk-add training samples: texts are embedded in batches and the new vectors
+        are added to the FAISS index in one call at the end.
+
+        While ingesting, every `checkpoint_every` samples are appended to the journal
+        (vectors to a memory-mappable float32 file, samples to a JSONL file), so an
+        interrupted run keeps what it has embedded. With compact=True the index and
+        training data are then written once, each via a temporary file and atomic rename.
 
-        embedding = self.embed_model.encode([input_text])
+        Args:
+            samples: Iterable of (input_text, title, description).
+            batch_size (int, optional): Samples per embedding batch. Defaults to TITLE_INGEST_BATCH_SIZE.
+            checkpoint_every (int, optional): Samples between journal appends, 0 to only persist at the end.
+                Defaults to TITLE_INGEST_CHECKPOINT_EVERY.
+            compact (bool, optional): Rewrite the index and data files at the end; otherwise only append to the journal.
 
+        Returns:
+            int: Number of samples added.
+        """
+        batch_size = batch_size or TITLE_INGEST_BATCH_SIZE
+        checkpoint_every = TITLE_INGEST_CHECKPOINT_EVERY if checkpoint_every is None else checkpoint_every
+        start_row = len(self.training_data)
+        new_samples = []
+        new_embeddings = []
+        # 已写入日志的样本数和对应的批次数，检查点只合并其后新增的批次
+        journaled = 0
+        journaled_batches = 0
+
+        batch = []
+        for sample in samples:
+            batch.append(tuple(sample))
+            if len(batch) < batch_size:
+                continue
+            new_embeddings.append(encode_cached(self.embed_model, [text for text, _, _ in batch]))
+            new_samples.extend(batch)
+            batch = []
+            if checkpoint_every > 0 and len(new_samples) - journaled >= checkpoint_every:
+                self._append_journal(start_row + journaled, new_samples[journaled:],
+                                     np.vstack(new_embeddings[journaled_batches:]))
+                journaled = len(new_samples)
+                journaled_batches = len(new_embeddings)
+        if batch:
+            new_embeddings.append(encode_cached(self.embed_model, [text for text, _, _ in batch]))
+            new_samples.extend(batch)
+        if not new_samples:
+            return 0
+
+        embeddings = np.vstack(new_embeddings).astype(np.float32)
         if self.index is None:
-            dim = embedding.shape[1]
-            self.index = faiss.IndexFlatL2(dim)
+            # 新建索引时用全部向量训练（索引类型由FAISS_INDEX_TYPE决定）
+            self.index, self.index_config = build_index(embeddings)
+        else:
+            self.index.add(embeddings)
+        self.training_data.extend(new_samples)
 
-        self.index.add(np.array(embedding))
+        if compact:
+            self.save()
+        elif journaled < len(new_samples):
+            self._append_journal(start_row + journaled, new_samples[journaled:], embeddings[journaled:])
+        return len(new_samples)
 
-        faiss.write_index(self.index, self.index_path)
+    def save(self) -> None:
+        """
+        Write the training data and FAISS index (atomic rename) and clear the journal they now contain.
 
-        with open(self.data_path, "wb") as f:
+        The data file is written before the index, so after a crash in between the saved
+        index never has more vectors than there are training rows; _replay_journal adds
+        the missing vectors from the journal.
+        """
+        if self.index is None:
+            return
+        temp_path = f"{self.data_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
             np.save(f, np.array(self.training_data, dtype=object))
+        os.replace(temp_path, self.data_path)
+        write_index(self.index, self.index_path, self.index_config)
+        self._clear_journal()
+
+    def _append_journal(self, start_row: int, samples: List[Tuple[str, str, str]], embeddings: np.ndarray) -> None:
+        """Append samples to the journal; rows are absolute positions in training_data."""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        # 先写向量再写样本，回放时以完整的样本行为准；从已有的完整行之后写，覆盖中断时多写的向量
+        with open(self.journal_vectors_path, "ab") as f:
+            f.truncate(self._journal_rows * embeddings.shape[1] * 4)
+            f.write(embeddings.tobytes())
+        with open(self.journal_data_path, "a", encoding="utf-8") as f:
+            for offset, (input_text, title, description) in enumerate(samples):
+                f.write(json.dumps({
+                    "row": start_row + offset,
+                    "dim": embeddings.shape[1],
+                    "input_text": input_text,
+                    "title": title,
+                    "description": description
+                }, ensure_ascii=False) + "\n")
+        self._journal_rows += len(samples)
+
+    def _replay_journal(self) -> None:
+        """Add journal entries that are not yet in the saved index and data (e.g. after an interrupted build)."""
+        if not os.path.exists(self.journal_data_path) or not os.path.exists(self.journal_vectors_path):
+            return
+        records = []
+        line_ends = []
+        with open(self.journal_data_path, "rb") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # 写入中断留下的不完整行
+                    break
+                line_ends.append(f.tell())
+        vectors_size = os.path.getsize(self.journal_vectors_path)
+        if not records or vectors_size == 0:
+            self._clear_journal()
+            return
+        dim = records[0]["dim"]
+        rows = min(len(records), vectors_size // (dim * 4))
+        # 截掉不完整的部分，之后的追加与样本行对齐
+        with open(self.journal_data_path, "r+b") as f:
+            f.truncate(line_ends[rows - 1] if rows else 0)
+        with open(self.journal_vectors_path, "r+b") as f:
+            f.truncate(rows * dim * 4)
+        self._journal_rows = rows
+        if not rows:
+            return
+        vectors = np.memmap(self.journal_vectors_path, dtype=np.float32, mode="r", shape=(rows, dim))
+        # 索引和数据文件分别保存，可能只有其中一个已包含日志中的行，两者分别按各自的行数跳过
+        ntotal = self.index.ntotal if self.index is not None else 0
+        pending_vectors = [j for j in range(rows) if records[j]["row"] >= ntotal]
+        pending_samples = [j for j in range(rows) if records[j]["row"] >= len(self.training_data)]
+        if pending_vectors:
+            embeddings = np.array(vectors[pending_vectors], dtype=np.float32)
+            if self.index is None:
+                self.index, self.index_config = build_index(embeddings)
+            else:
+                self.index.add(embeddings)
+        self.training_data.extend(
+            (records[j]["input_text"], records[j]["title"], records[j]["description"]) for j in pending_samples
+        )
+        if pending_vectors or pending_samples:
+            logger.info(f"Replayed {len(pending_samples)} training samples and {len(pending_vectors)} vectors "
+                        f"from {self.journal_data_path}")
+
+    def _check_consistency(self) -> None:
+        """The i-th index vector must belong to training_data[i]; rebuild the index from the data otherwise."""
+        if self.index is None or self.index.ntotal == len(self.training_data):
+            return
+        logger.warning(f"FAISS index has {self.index.ntotal} vectors but there are {len(self.training_data)} "
+                       f"training samples, rebuilding the index")
+        if not self.training_data:
+            self.clear_faiss_data()
+            return
+        texts = [sample[0] for sample in self.training_data]
+        embeddings = np.vstack([
+            encode_cached(self.embed_model, texts[start:start + TITLE_INGEST_BATCH_SIZE])
+            for start in range(0, len(texts), TITLE_INGEST_BATCH_SIZE)
+        ]).astype(np.float32)
+        self.index, self.index_config = build_index(embeddings)
+        self.save()
+
+    def _clear_journal(self) -> None:
+        for path in (self.journal_vectors_path, self.journal_data_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._journal_rows = 0
 
     def retrieve_similar(
         self,
@@ -223,12 +406,15 @@ class RagTitleGenerator:
         if self.index is None or len(self.training_data) == 0:
             return []
 
-        new_embedding = self.embed_model.encode([new_input])
+        new_embedding = encode_cached(self.embed_model, [new_input])
         topk = min(topk, len(self.training_data))
         _, I = self.index.search(np.array(new_embedding), k=topk)
 
         retrieved_list = []
         for idx in I[0]:
+            if idx < 0:
+                # ANN indexes pad with -1 when fewer than topk neighbours are found
+                continue
             data = self.training_data[idx]
             retrieved_list.append((data[0], data[1], data[2]))
 
@@ -327,6 +513,25 @@ class RagTitleGenerator:
 
         return generated_title, generated_description
 
+def get_title_generator(
+    index_path: str = "faiss_infographics.index",
+    data_path: str = "infographics_data.npy",
+    embed_model_path = "",
+    api_key: str="",
+    base_url: str=""
+) -> RagTitleGenerator:
+    """Return the process-wide RagTitleGenerator for these settings, loading the index on first use."""
+    return get_service(
+        ("RagTitleGenerator", index_path, data_path, embed_model_path, api_key, base_url),
+        lambda: RagTitleGenerator(
+            index_path=index_path,
+            data_path=data_path,
+            embed_model_path=embed_model_path,
+            api_key=api_key,
+            base_url=base_url
+        )
+    )
+
 def process(
     input: str = None,
     output: str = None,
@@ -355,8 +560,8 @@ def process(
           - Otherwise, returns the updated data dictionary with generated titles.
     """
     try:
-        # Initialize the generator and load any existing index/data
-        generator = RagTitleGenerator(
+        # Reuse the generator (and its loaded index/data) across calls in this process
+        generator = get_title_generator(
             index_path=index_path,
             data_path=data_path,
             embed_model_path=embed_model_path,
@@ -387,7 +592,7 @@ def process(
                 json.dump(data, f, ensure_ascii=False, indent=2)
             return True
 
-        return True
+        return data
 
     except Exception as e:
         print(f"Error in title generation: {str(e)}")
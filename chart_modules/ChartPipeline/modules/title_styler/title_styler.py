@@ -1,8 +1,21 @@
 from typing import Dict, Union
+import os
 import json
+from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont
 import argparse
 
+# 字体对象缓存的容量，按(字体族, 字号, 字重)区分，可通过环境变量 TITLE_FONT_CACHE_SIZE 配置
+FONT_CACHE_SIZE = int(os.environ.get('TITLE_FONT_CACHE_SIZE', '64'))
+# 文本边界框测量结果的缓存容量
+TEXT_BOUNDS_CACHE_SIZE = 4096
+# 折行引擎（每段文本一次测量）的缓存容量
+LINE_BREAKER_CACHE_SIZE = 256
+# 标题折行方式，可通过环境变量 TITLE_LINE_BREAK_MODE 配置：
+#   greedy  逐词贪心折行（默认）
+#   optimal Knuth–Plass式的最优折行，各行长度更均匀
+TITLE_LINE_BREAK_MODE = os.environ.get('TITLE_LINE_BREAK_MODE', 'greedy')
+
 def merge_bounding_boxes(bounding_boxes):
     """合并所有有实际文字内容的boundingbox"""
     min_x = min(box['x'] for box in bounding_boxes)
@@ -20,17 +33,80 @@ def merge_bounding_boxes(bounding_boxes):
         'descent': descent
     }
 
-def measure_text_bounds(text, font_family, font_size, font_weight="normal"):
-    """测量文本的边界框尺寸"""
-    # 创建临时图像用于测量文本
-    img = Image.new('RGB', (1, 1), color=(255, 255, 255))
-    draw = ImageDraw.Draw(img)
+# 测量文本用的1x1画布，整个进程共用一个
+_measure_draw = None
+
+def get_measure_draw():
+    """获取共享的测量用ImageDraw对象"""
+    global _measure_draw
+    if _measure_draw is None:
+        _measure_draw = ImageDraw.Draw(Image.new('RGB', (1, 1), color=(255, 255, 255)))
+    return _measure_draw
+
+class FontMetrics:
+    """
+    单个字体的字形度量表：缓存每个字符的步进宽度和相邻字符对的字距调整
+
+    PIL的基础排版(Layout.BASIC)下，整串宽度等于各字符步进宽度与字距调整之和，
+    因此常见字符串的宽度可以直接查表计算，不必每次调用PIL。
+    使用raqm排版（连字、复杂文字整形）或位图字体时无法逐字相加，退回到PIL测量。
+    """
+
+    def __init__(self, font):
+        self.font = font
+        self.exact = isinstance(font, ImageFont.FreeTypeFont) and font.layout_engine == ImageFont.Layout.BASIC
+        self._advances = {}
+        self._kerning = {}
+
+    def advance(self, char: str) -> float:
+        """单个字符的步进宽度"""
+        width = self._advances.get(char)
+        if width is None:
+            width = get_measure_draw().textlength(char, font=self.font)
+            self._advances[char] = width
+        return width
+
+    def kerning(self, left: str, right: str) -> float:
+        """相邻字符对的字距调整"""
+        pair = left + right
+        delta = self._kerning.get(pair)
+        if delta is None:
+            delta = get_measure_draw().textlength(pair, font=self.font) - self.advance(left) - self.advance(right)
+            self._kerning[pair] = delta
+        return delta
+
+    def text_length(self, text: str) -> float:
+        """文本的步进宽度，与ImageDraw.textlength一致"""
+        if not self.exact:
+            return get_measure_draw().textlength(text, font=self.font)
+        width = 0
+        previous = None
+        for char in text:
+            width += self.advance(char)
+            if previous is not None:
+                width += self.kerning(previous, char)
+            previous = char
+        return width
+
+def _normalize_font_args(font_family, font_size, font_weight="normal"):
+    # 处理特殊字体名称
+    if font_family and font_family.lower() == 'comics':
+        font_family = 'Comic Sans MS, cursive'
     
-    # 获取字体
+    # 从字体大小中提取数字部分
+    if isinstance(font_size, str):
+        font_size = int(font_size.replace('px', ''))
+    return font_family, font_size, font_weight
+
+@lru_cache(maxsize=TEXT_BOUNDS_CACHE_SIZE)
+def _text_bounds(text, font_family, font_size, font_weight):
     font = get_font(font_family, font_size, font_weight)
-    
-    # 获取文本尺寸
-    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    return get_measure_draw().textbbox((0, 0), text, font=font)
+
+def measure_text_bounds(text, font_family, font_size, font_weight="normal"):
+    """测量文本的边界框尺寸"""
+    # 相同的标题在每个候选宽度下都会重复测量，结果按(文本, 字体)缓存
+    left, top, right, bottom = _text_bounds(text, *_normalize_font_args(font_family, font_size, font_weight))
     width = right - left
     height = bottom - top
     
@@ -46,21 +122,23 @@ def measure_text_bounds(text, font_family, font_size, font_weight="normal"):
     return result
 
 def get_font(font_family, font_size, font_weight="normal"):
-    """获取字体对象，处理各种字体格式和降级情况"""
-    # 处理特殊字体名称
-    if font_family and font_family.lower() == 'comics':
-        font_family = 'Comic Sans MS, cursive'
-    
-    # 从字体大小中提取数字部分
-    if isinstance(font_size, str):
-        font_size = int(font_size.replace('px', ''))
-    
+    """获取字体对象，处理各种字体格式和降级情况；同一(字体族, 字号, 字重)在进程内只加载一次"""
+    return _load_font(*_normalize_font_args(font_family, font_size, font_weight))
+
+def get_font_metrics(font_family, font_size, font_weight="normal") -> FontMetrics:
+    """获取字体对应的字形度量表，与字体对象一起缓存"""
+    return _load_font_metrics(*_normalize_font_args(font_family, font_size, font_weight))
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def _load_font_metrics(font_family, font_size, font_weight):
+    return FontMetrics(_load_font(font_family, font_size, font_weight))
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def _load_font(font_family, font_size, font_weight):
     try:
         # 首先尝试加载系统字体
-        if font_weight == "bold":
-            font = ImageFont.truetype(font_family, size=font_size, weight="bold")
-        else:
-            font = ImageFont.truetype(font_family, size=font_size)
+        # ImageFont.truetype不能按字重选择字体，粗体也加载同一个字体文件
+        font = ImageFont.truetype(font_family, size=font_size)
     except (OSError, IOError):
         try:
             # 如果直接加载失败，尝试一些常见的系统字体
@@ -91,90 +169,199 @@ def get_font(font_family, font_size, font_weight="normal"):
     
     return font
 
-def split_text_into_lines(text, max_width, font_family="Arial", font_size=16, font_weight="normal"):
-    """将文本按照给定的宽度限制拆分成多行"""
-    # 创建临时图像用于测量文本宽度
-    img = Image.new('RGB', (1, 1), color=(255, 255, 255))
-    draw = ImageDraw.Draw(img)
-    
-    # 获取字体
-    font = get_font(font_family, font_size, font_weight)
-    
-    lines = []
-    
-    # 检测是否包含中文字符
-    has_chinese = any('\u4e00' <= char <= '\u9fff' for char in text)
-    
-    if has_chinese:
-        # 中文文本按字符切分
-        current_line = ("", 0)
-        for char in text:
-            test_line = current_line[0] + char
-            # 获取文本宽度
-            text_width = draw.textlength(test_line, font=font)
-            
-            if text_width <= max_width:
-                current_line = (test_line, text_width)
+class LineBreaker:
+    """
+    标题折行引擎：每个词（中文为每个字符）和空格只测量一次，之后可以对任意最大宽度计算折行
+
+    折行方式：
+        greedy  逐词贪心折行，结果与原有的逐行测量实现一致
+        optimal Knuth–Plass式的最优折行，使除最后一行外各行剩余宽度的平方和最小，行长更均匀
+    """
+
+    def __init__(self, text: str, metrics: FontMetrics):
+        self.text = text
+        self.metrics = metrics
+        # 检测是否包含中文字符：中文文本按字符切分，英文文本按单词切分
+        self.has_chinese = any('\u4e00' <= char <= '\u9fff' for char in text)
+        self.separator = "" if self.has_chinese else " "
+        self.tokens = list(text) if self.has_chinese else text.split()
+        self.widths = [metrics.text_length(token) for token in self.tokens]
+        # 相邻两个词之间的附加宽度（分隔符及两侧的字距调整），供最优折行计算整行宽度
+        self.glues = [
+            self._join_width(left, left_width, right, right_width) - left_width - right_width
+            for left, left_width, right, right_width in zip(self.tokens, self.widths, self.tokens[1:], self.widths[1:])
+        ]
+
+    def _join_width(self, left: str, left_width: float, right: str, right_width: float, separator: str = None) -> float:
+        """left与right以separator拼接后的宽度，left为空时不加分隔符"""
+        if separator is None:
+            separator = self.separator
+        if not left:
+            return right_width
+        if not self.metrics.exact:
+            return self.metrics.text_length(left + separator + right)
+        # 基础排版下宽度可以逐字相加，只需补上接缝处的步进宽度和字距调整
+        width = left_width
+        previous = left[-1]
+        for char in separator:
+            width += self.metrics.kerning(previous, char) + self.metrics.advance(char)
+            previous = char
+        return width + self.metrics.kerning(previous, right[0]) + right_width
+
+    def _char_width(self, char: str) -> float:
+        return self.metrics.advance(char) if self.metrics.exact else self.metrics.text_length(char)
+
+    def _split_long_word(self, word: str, max_width: float):
+        """
+        将超过最大宽度的单词逐字拆开，除最后一段外每段末尾加连字符
+
+        Returns:
+            [(片段, 宽度)]，最后一段不带连字符
+        """
+        pieces = []
+        word_line, word_line_width = "", 0
+        for char in word:
+            char_width = self._char_width(char)
+            test_width = self._join_width(word_line, word_line_width, char, char_width, separator="")
+            if test_width <= max_width:
+                word_line, word_line_width = word_line + char, test_width
             else:
-                lines.append(current_line)
-                current_line = (char, draw.textlength(char, font=font))
-        
-        # 添加最后一行
-        if current_line:
-            lines.append(current_line)
-    else:
-        # 英文文本按单词切分
-        words = text.split()
+                hyphen_width = self._join_width(word_line, word_line_width, "-", self._char_width("-"), separator="")
+                pieces.append((word_line + "-", hyphen_width))
+                word_line, word_line_width = char, char_width
+        pieces.append((word_line, word_line_width))
+        return pieces
+
+    def _greedy(self, max_width: float):
+        lines = []
         current_line = ("", 0)
-        
-        for word in words:
-            # 测试添加这个单词后是否超出宽度
-            test_line = current_line[0] + (" " if current_line[0] else "") + word
-            text_width = draw.textlength(test_line, font=font)
-            if text_width <= max_width:
-                current_line = (test_line, text_width)
-            else:
-                if current_line:
+        if self.has_chinese:
+            # 中文文本按字符切分
+            for char, char_width in zip(self.tokens, self.widths):
+                text_width = self._join_width(current_line[0], current_line[1], char, char_width)
+                if text_width <= max_width:
+                    current_line = (current_line[0] + char, text_width)
+                else:
                     lines.append(current_line)
-                current_line = (word, draw.textlength(word, font=font))
+                    current_line = (char, char_width)
+        else:
+            # 英文文本按单词切分
+            for word, word_width in zip(self.tokens, self.widths):
+                # 测试添加这个单词后是否超出宽度
+                text_width = self._join_width(current_line[0], current_line[1], word, word_width)
+                if text_width <= max_width:
+                    current_line = (current_line[0] + (" " if current_line[0] else "") + word, text_width)
+                    continue
+                lines.append(current_line)
+                current_line = (word, word_width)
                 
-                # 检查单个单词是否超过最大宽度
-                if draw.textlength(word, font=font) > max_width:
-                    # 如果单个单词就超过宽度，则需要逐字分割
-                    word_line = ""
-                    for char in word:
-                        test_word_line = word_line + char
-                        if draw.textlength(test_word_line, font=font) <= max_width:
-                            word_line = test_word_line
-                        else:
-                            word_line = word_line + "-"
-                            lines.append((word_line, draw.textlength(word_line, font=font)))
-                            word_line = char
-                    
-                    if word_line:
-                        current_line = (word_line, draw.textlength(word_line, font=font))
+                # 单个单词就超过宽度时逐字分割
+                if word_width > max_width:
+                    pieces = self._split_long_word(word, max_width)
+                    lines.extend(pieces[:-1])
+                    if pieces[-1][0]:
+                        current_line = pieces[-1]
                         if current_line not in lines:
                             lines.append(current_line)
                             current_line = ("", 0)
         
         # 添加最后一行
-        if current_line:
-            lines.append(current_line)
-    
-    # 确保至少有一行
-    if not lines:
-        lines = [(text, draw.textlength(text, font=font))]
-            
-    return lines
+        lines.append(current_line)
+        return lines
+
+    def _optimal(self, max_width: float):
+        # 拆开超长单词：带连字符的片段必须独占一行，最后一段可以和后面的单词同行
+        pieces, widths, glues, forced = [], [], [], []
+        for index, (token, width) in enumerate(zip(self.tokens, self.widths)):
+            parts = self._split_long_word(token, max_width) if width > max_width and not self.has_chinese else [(token, width)]
+            for part_index, (part, part_width) in enumerate(parts):
+                if pieces:
+                    glue = self.glues[index - 1] if part_index == 0 else 0
+                    glues.append(glue)
+                pieces.append(part)
+                widths.append(part_width)
+                forced.append(part_index < len(parts) - 1)
+        count = len(pieces)
+        if count == 0:
+            return [("", 0)]
+        
+        # best[j]: 前j个片段折行的最小代价；line_start[j]: 最后一行的起始片段
+        best = [0.0] + [float('inf')] * count
+        line_start = [0] * (count + 1)
+        for end in range(1, count + 1):
+            line_width = widths[end - 1]
+            for start in range(end - 1, -1, -1):
+                if start < end - 1:
+                    # 带连字符的片段前后都不能有其他片段
+                    if forced[start] or forced[end - 1]:
+                        break
+                    line_width += widths[start] + glues[start]
+                    if line_width > max_width:
+                        break
+                # 最后一行不计代价；单个片段超宽时也只能独占一行
+                slack = max(max_width - line_width, 0)
+                cost = best[start] + (0 if end == count else slack * slack)
+                if cost < best[end]:
+                    best[end] = cost
+                    line_start[end] = start
+        
+        lines = []
+        end = count
+        while end > 0:
+            start = line_start[end]
+            text = self.separator.join(pieces[start:end])
+            width = sum(widths[start:end]) + sum(glues[start:end - 1])
+            if not self.metrics.exact:
+                width = self.metrics.text_length(text)
+            lines.append((text, width))
+            end = start
+        lines.reverse()
+        return lines
+
+    def break_lines(self, max_width: float, mode: str = None):
+        """
+        按最大宽度折行
+
+        Args:
+            max_width: 每行的最大宽度
+            mode: "greedy" 或 "optimal"，默认使用 TITLE_LINE_BREAK_MODE
+
+        Returns:
+            [(行文本, 行宽度)]
+        """
+        mode = mode or TITLE_LINE_BREAK_MODE
+        if mode == "optimal":
+            lines = self._optimal(max_width)
+        elif mode == "greedy":
+            lines = self._greedy(max_width)
+        else:
+            raise ValueError(f"Unknown line break mode: {mode}")
+        # 确保至少有一行
+        if not lines:
+            lines = [(self.text, self.metrics.text_length(self.text))]
+        return lines
+
+@lru_cache(maxsize=LINE_BREAKER_CACHE_SIZE)
+def _load_line_breaker(text, font_family, font_size, font_weight):
+    return LineBreaker(text, _load_font_metrics(font_family, font_size, font_weight))
+
+def get_line_breaker(text, font_family="Arial", font_size=16, font_weight="normal") -> LineBreaker:
+    """获取文本的折行引擎；同一文本和字体在不同宽度下复用同一次测量"""
+    return _load_line_breaker(text, *_normalize_font_args(font_family, font_size, font_weight))
+
+def split_text_into_lines(text, max_width, font_family="Arial", font_size=16, font_weight="normal", mode=None):
+    """将文本按照给定的宽度限制拆分成多行"""
+    return get_line_breaker(text, font_family, font_size, font_weight).break_lines(max_width, mode)
 
 class TitleGenerator:
-    def __init__(self, json_data: Dict, max_width = 0, text_align = "left", show_embellishment = True, show_sub_title = True, font_family = None):
+    def __init__(self, json_data: Dict, max_width = 0, text_align = "left", show_embellishment = True, show_sub_title = True, font_family = None, line_break_mode = None):
         self.json_data = json_data
         self.max_width = max_width
         self.text_align = text_align  # 保留接口，但内部只实现左对齐
         self.show_embellishment = show_embellishment
         self.show_sub_title = show_sub_title
         self.font_family = font_family
+        self.line_break_mode = line_break_mode
 
     def generate(self):
         self.main_title_svg, self.main_title_bounding_box = self.generate_main_title()
@@ -374,7 +561,7 @@ class TitleGenerator:
         font_weight = typography.get('font_weight', 'normal')
         
         # 使用拆分文本函数获取多行
-        lines = split_text_into_lines(text, max_width, font_family, font_size, font_weight)
+        lines = split_text_into_lines(text, max_width, font_family, font_size, font_weight, mode=self.line_break_mode)
         
         # 生成多行SVG
         if isinstance(font_size, str):
@@ -436,7 +623,8 @@ def process(
     text_align: str = "left",
     show_embellishment: bool = True,
     show_sub_title: bool = True,
-    font_family: str = None
+    font_family: str = None,
+    line_break_mode: str = None
 ) -> Union[bool, str]:
     """
     Process function for generating styled title SVG from input data.
@@ -450,6 +638,7 @@ def process(
         show_embellishment (bool, optional): Whether to show the decoration element. Defaults to True.
         show_sub_title (bool, optional): Whether to show the subtitle. Defaults to True.
         font_family (str, optional): Font family to use for all text. Defaults to None (use from typography).
+        line_break_mode (str, optional): "greedy" or "optimal" line breaking. Defaults to None (TITLE_LINE_BREAK_MODE).
 
     Returns:
         Union[bool, str]:
@@ -471,7 +660,8 @@ def process(
                                          text_align=text_align, 
                                          show_embellishment=show_embellishment,
                                          show_sub_title=show_sub_title,
-                                         font_family=font_family)
+                                         font_family=font_family,
+                                         line_break_mode=line_break_mode)
         svg_content, bounding_box = title_generator.generate()
 
         if output:
@@ -496,6 +686,8 @@ def main():
     parser.add_argument('--no-embellishment', action='store_true', help='Hide the decoration element')
     parser.add_argument('--no-subtitle', action='store_true', help='Hide the subtitle')
     parser.add_argument('--font', type=str, help='Font family to use for all text (e.g. Arial, Comic, Times)')
+    parser.add_argument('--line-break', type=str, choices=['greedy', 'optimal'],
+                        help='Line breaking mode (default: TITLE_LINE_BREAK_MODE or greedy)')
     
     args = parser.parse_args()
     
@@ -510,7 +702,8 @@ def main():
         text_align=args.text_align,
         show_embellishment=not args.no_embellishment,
         show_sub_title=not args.no_subtitle,
-        font_family=args.font
+        font_family=args.font,
+        line_break_mode=args.line_break
     )
     
     if success:
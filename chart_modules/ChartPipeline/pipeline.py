@@ -6,6 +6,7 @@ ChartPipeline: 完整可视化生成管道
 """
 
 import os
+import copy
 import json
 import argparse
 import logging
@@ -28,6 +29,7 @@ from config import (
     image_resource_path
 )
 import random
+import multiprocessing
 from concurrent.futures import ProcessPoolExecutor
 
 # 配置日志
@@ -37,6 +39,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger("ChartPipeline")
 
+# 处理目录时worker进程的启动方式(fork/spawn/forkserver)，默认使用平台默认值
+WORKER_START_METHOD = os.environ.get("PIPELINE_START_METHOD") or None
+# fork模式下是否在父进程中加载模型和索引，由worker以写时复制的方式共享
+SHARE_INDEXES = os.environ.get("PIPELINE_SHARE_INDEXES", "0") == "1"
+
 # 模块配置
 MODULES = [
     {
@@ -108,7 +115,175 @@ MODULES = [
 ]
 
 
-def run_pipeline(input_path, output_path=None, temp_dir=None, modules_to_run=None, threads=None, chart_name=None):
+# 只读写JSON文档的模块，run_single_file在内存中依次执行，模块名 -> (模块路径, 额外参数)
+DOCUMENT_STAGES = {
+    "preprocess": ("modules.preprocess.preprocess", {}),
+    "chart_type_recommender": ("modules.chart_type_recommender.chart_type_recommender", {}),
+    "datafact_generator": ("modules.datafact_generator.datafact_generator", {}),
+    "title_generator": ("modules.title_generator.title_generator", {
+        "base_url": base_url,
+        "api_key": api_key,
+        "embed_model_path": embed_model_path,
+        "topk": topk,
+        "data_path": text_data_path,
+        "index_path": text_index_path
+    }),
+    "color_recommender": ("modules.color_recommender.color_recommender", {
+        "base_url": base_url,
+        "api_key": api_key,
+        "embed_model_path": embed_model_path,
+        "data_path": color_data_path,
+        "index_path": color_index_path
+    }),
+    "image_recommender": ("modules.image_recommender.image_recommender", {
+        "base_url": base_url,
+        "api_key": api_key,
+        "embed_model_path": embed_model_path,
+        "data_path": image_data_path,
+        "index_path": image_index_path,
+        "resource_path": image_resource_path
+    }),
+}
+
+# all模块依次执行的子模块，(模块名, 检查跳过条件时使用的名称)
+# 与原有行为一致，all中的preprocess按"all"检查跳过条件，即总是执行
+ALL_MODULE_STAGES = [
+    ("preprocess", "all"),
+    ("datafact_generator", "datafact_generator"),
+    ("title_generator", "title_generator"),
+    ("color_recommender", "color_recommender"),
+    ("image_recommender", "image_recommender"),
+]
+
+# 模块的跳过条件，在当前文档上判断
+SKIP_CONDITIONS = {
+    "preprocess": lambda d: "metadata" in d and "data" in d and "variables" in d and "processed" in d,
+    "chart_type_recommender": lambda d: "chart_type" in d,
+    "datafact_generator": lambda d: "datafacts" in d,
+    "title_generator": lambda d: False,#"titles" in d,
+    "color_recommender": lambda d: "colors" in d,
+    "image_recommender": lambda d: "images" in d
+}
+
+
+class PipelineDocument:
+    """
+    run_single_file中在各模块之间传递的JSON文档
+
+    文档在第一次用到时从输入文件读取，之后各模块直接在内存中修改，只在检查点、
+    需要读文件的模块（信息图、图表引擎、标题样式）之前以及管道结束时写入输出文件。
+
+    Args:
+        input_path: 输入JSON文件路径
+        output_path: 输出JSON文件路径
+    """
+
+    def __init__(self, input_path: Path, output_path: Path):
+        self.input_path = Path(input_path)
+        self.output_path = Path(output_path)
+        self._data = None
+        self.dirty = False
+        # 是否已有模块更新过文档
+        self.updated = False
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            with open(self.input_path, "r", encoding="utf-8") as f:
+                self._data = json.load(f)
+        return self._data
+
+    def update(self, data: dict) -> None:
+        self._data = data
+        self.dirty = True
+        self.updated = True
+
+    def should_skip(self, module_name: str) -> bool:
+        """
+        检查是否需要跳过模块
+
+        与逐个模块读写文件时一致：还没有模块更新过文档时，按已有的输出文件判断；
+        之后输出文件的内容就是内存中的文档，直接在文档上判断。
+        """
+        if self.updated or self.output_path == self.input_path:
+            return should_skip_module(module_name, data=self.data)
+        return should_skip_module(module_name, self.output_path)
+
+    def checkpoint(self) -> bool:
+        """将修改过的文档写入输出文件（先写临时文件再替换），返回是否写入"""
+        if not self.dirty:
+            return False
+        temp_path = self.output_path.with_name(f".{self.output_path.name}.{os.getpid()}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, self.output_path)
+        self.dirty = False
+        return True
+
+
+def run_document_stage(module_name: str, document: PipelineDocument, skip_name: str = None) -> bool:
+    """
+    在内存中对文档执行一个JSON模块
+
+    Args:
+        module_name: 模块名称，见DOCUMENT_STAGES
+        document: 当前文档
+        skip_name: 检查跳过条件时使用的名称，默认与模块名称相同
+
+    Returns:
+        模块是否产生了新的文档
+    """
+    if document.should_skip(skip_name or module_name):
+        return False
+    module_path, kwargs = DOCUMENT_STAGES[module_name]
+    module = import_module(module_path)
+    # 部分模块会直接修改input_data，传入副本，模块失败时文档保持不变
+    result = module.process(input_data=copy.deepcopy(document.data), **kwargs)
+    # 模块失败时返回False/None，保留原文档
+    if not isinstance(result, dict):
+        logger.warning(f"模块 {module_name} 没有返回结果: {document.input_path}")
+        return False
+    document.update(result)
+    return True
+
+
+# 需要加载模型和索引的模块 -> 获取进程内共享实例的函数，参数与DOCUMENT_STAGES中的一致
+SERVICE_LOADERS = {
+    "title_generator": "get_title_generator",
+    "color_recommender": "get_color_recommender",
+    "image_recommender": "get_image_recommender",
+}
+
+def load_services(modules_to_run=None):
+    """
+    导入要运行的模块，并创建其进程内共享的模型和索引实例
+
+    Args:
+        modules_to_run (list, optional): 要运行的模块列表，默认所有模块
+    """
+    module_names = modules_to_run or [m["name"] for m in MODULES]
+    if "all" in module_names:
+        module_names = list(module_names) + [stage_name for stage_name, _ in ALL_MODULE_STAGES]
+    for module_name in dict.fromkeys(module_names):
+        if module_name in ("all", "create_index"):
+            continue
+        module_path, kwargs = DOCUMENT_STAGES.get(module_name, (f"modules.{module_name}.{module_name}", {}))
+        try:
+            module = import_module(module_path)
+            if module_name in SERVICE_LOADERS:
+                kwargs = {key: value for key, value in kwargs.items() if key != "topk"}
+                getattr(module, SERVICE_LOADERS[module_name])(**kwargs)
+        except Exception as e:
+            # 预加载失败不影响处理，模块会在处理文件时再次尝试并报告错误
+            logger.warning(f"预加载模块 {module_name} 失败: {str(e)}")
+
+def init_worker(modules_to_run=None):
+    """ProcessPoolExecutor的worker初始化函数，每个进程只加载一次模型和索引"""
+    load_services(modules_to_run)
+
+
+def run_pipeline(input_path, output_path=None, temp_dir=None, modules_to_run=None, threads=None, chart_name=None, checkpoints=None,
+                 start_method=None, share_indexes=None):
     """
     执行完整的图表生成管道
 
@@ -117,8 +292,12 @@ def run_pipeline(input_path, output_path=None, temp_dir=None, modules_to_run=Non
         output_path (str, optional): 输出文件路径(可以是文件或目录)，如果为None则原地修改
         temp_dir (str, optional): 临时文件目录，默认使用./tmp
         modules_to_run (list, optional): 要运行的模块列表，默认运行所有模块
-        threads (int, optional): 处理目录时的并发线程数，仅在input_path为目录时生效
+        threads (int, optional): 处理目录时的并发线程数，仅在input_path为目录时生效；
+            只运行chart_engine时图表批量渲染，不使用该参数
         chart_name (str, optional): 指定图表名称，仅对infographics_generator模块有效
+        checkpoints (list, optional): 执行完后立即写出文档的JSON模块，默认只在需要时和结束时写出
+        start_method (str, optional): worker进程的启动方式(fork/spawn/forkserver)，默认取PIPELINE_START_METHOD
+        share_indexes (bool, optional): fork模式下在父进程中加载模型和索引供worker共享，默认取PIPELINE_SHARE_INDEXES
     """
     # try:
     if chart_name is not None:
@@ -134,7 +313,8 @@ def run_pipeline(input_path, output_path=None, temp_dir=None, modules_to_run=Non
             output_path=output_path,
             temp_dir=temp_dir,
             modules_to_run=modules_to_run,
-            chart_name=chart_name
+            chart_name=chart_name,
+            checkpoints=checkpoints
         )
 
     input_path = Path(input_path)
@@ -150,9 +330,36 @@ def run_pipeline(input_path, output_path=None, temp_dir=None, modules_to_run=Non
         input_files = list(input_path.glob('*.json'))
         random.shuffle(input_files)  # 随机打乱文件顺序
 
+        # 只运行chart_engine时，整个目录的图表在同一批次中渲染（由渲染池并发，不使用threads）
+        if modules_to_run == ["chart_engine"]:
+            if threads and threads > 1:
+                logger.info("只运行chart_engine时目录中的图表批量渲染，忽略threads参数")
+            output_files = [
+                (input_file if output_path == input_path else output_path / input_file.name).with_suffix('.svg')
+                for input_file in input_files
+            ]
+            module = import_module("modules.chart_engine.chart_engine")
+            results = module.process_batch(
+                inputs=[str(f) for f in input_files],
+                outputs=[str(f) for f in output_files]
+            )
+            return all(results)
+
         if threads and threads > 1:
-            # 使用线程池并行处理文件
-            with ProcessPoolExecutor(max_workers=threads) as executor:
+            mp_context = multiprocessing.get_context(start_method or WORKER_START_METHOD)
+            share_indexes = SHARE_INDEXES if share_indexes is None else share_indexes
+            initializer = init_worker
+            if share_indexes:
+                if mp_context.get_start_method() == "fork":
+                    # 在父进程中加载一次，fork出的worker直接继承（只读索引的内存页以写时复制方式共享）
+                    load_services(modules_to_run)
+                    initializer = None
+                else:
+                    logger.warning(f"share_indexes只在fork模式下有效，当前为{mp_context.get_start_method()}，改为在每个worker中加载")
+
+            # 使用进程池并行处理文件，每个worker初始化时加载模型和索引
+            with ProcessPoolExecutor(max_workers=threads, mp_context=mp_context,
+                                     initializer=initializer, initargs=(modules_to_run,)) as executor:
                 futures = []
                 for input_file in input_files:
                     # 如果是inplace处理，输出路径就是输入路径
@@ -168,7 +375,8 @@ def run_pipeline(input_path, output_path=None, temp_dir=None, modules_to_run=Non
                         output_path=output_file,
                         temp_dir=temp_dir,
                         modules_to_run=modules_to_run,
-                        chart_name=chart_name
+                        chart_name=chart_name,
+                        checkpoints=checkpoints
                     )
                     futures.append(future)
 
@@ -189,7 +397,8 @@ def run_pipeline(input_path, output_path=None, temp_dir=None, modules_to_run=Non
                     output_path=output_file,
                     temp_dir=temp_dir,
                     modules_to_run=modules_to_run,
-                    chart_name=chart_name
+                    chart_name=chart_name,
+                    checkpoints=checkpoints
                 )
             return success
     else:
@@ -206,14 +415,15 @@ def run_pipeline(input_path, output_path=None, temp_dir=None, modules_to_run=Non
             output_path=output_file,
             temp_dir=temp_dir,
             modules_to_run=modules_to_run,
-            chart_name=chart_name
+            chart_name=chart_name,
+            checkpoints=checkpoints
         )
 
     # except Exception as e:
     #     logger.error(f"管道执行失败: {str(e)}")
     #     return False
 
-def run_single_file(input_path, output_path, temp_dir=None, modules_to_run=None, chart_name=None):
+def run_single_file(input_path, output_path, temp_dir=None, modules_to_run=None, chart_name=None, checkpoints=None):
     """
     处理单个文件的管道逻辑
 
@@ -223,6 +433,7 @@ def run_single_file(input_path, output_path, temp_dir=None, modules_to_run=None,
         temp_dir (Path): 临时文件目录，默认为./tmp
         modules_to_run (list): 要运行的模块列表
         chart_name (str, optional): 指定图表名称，仅对infographics_generator模块有效
+        checkpoints (list, optional): 执行完后立即把文档写入output_path的JSON模块
     """
     # try:
     # 如果要运行create_index，单独处理并直接返回
@@ -270,134 +481,41 @@ def run_single_file(input_path, output_path, temp_dir=None, modules_to_run=None,
     # 确保输出目录存在
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # 当前输入文件
+    # 当前输入文件（供需要读文件的模块使用）
     current_input = input_path
+    # JSON模块之间在内存中传递的文档
+    document = PipelineDocument(input_path, output_path)
+    checkpoints = set(checkpoints or [])
 
     # 确定要运行的模块
     if not modules_to_run:
         modules_to_run = [m["name"] for m in MODULES]
 
-    # 获取最后一个模块的配置
-    last_module = [m for m in MODULES if m["name"] in modules_to_run][-1]
-
-    # 根据最后一个模块的输出类型决定最终输出文件的扩展名
-    if last_module["name"] in ["chart_engine", "title_styler"]:
-        final_output = output_path.with_suffix('.svg')
-    elif last_module["name"] == "infographics_generator":
-        final_output = output_path.parent / f"{output_path.stem}_final.svg"
-    else:
-        final_output = output_path.with_suffix('.json')
-
-    # 记录执行过程
-    processing_log = []
     # 依次执行各模块
     for i, module_config in enumerate([m for m in MODULES if m["name"] in modules_to_run]):
         module_name = module_config["name"]
         module_desc = module_config["description"]
         # logger.info(f"执行模块 {i+1}/{len(modules_to_run)}: {module_name} - {module_desc}")
 
-        # 特殊处理all模块，依次执行datafact_generator、title_generator、color_recommender和image_recommender
+        # 特殊处理all模块，依次执行preprocess、datafact_generator、title_generator、color_recommender和image_recommender
         if module_name == "all":
-            # 数据洞察模块
-            preprocess_module = import_module(f"modules.preprocess.preprocess")
-            if not should_skip_module(module_name, output_path):
-                preprocess_module.process(input=str(current_input), output=str(output_path))
-                current_input = output_path
-
-            datafact_module = import_module("modules.datafact_generator.datafact_generator")
-            if not should_skip_module("datafact_generator", output_path):
-                datafact_module.process(input=str(current_input), output=str(output_path))
-                current_input = output_path
-
-            # 标题生成模块
-            title_module = import_module("modules.title_generator.title_generator")
-            if not should_skip_module("title_generator", output_path):
-                title_module.process(
-                    input=str(current_input),
-                    output=str(output_path),
-                    base_url=base_url,
-                    api_key=api_key,
-                    embed_model_path=embed_model_path,
-                    topk=topk,
-                    data_path=text_data_path,
-                    index_path=text_index_path
-                )
-                current_input = output_path
-
-            # 色彩推荐模块
-            color_module = import_module("modules.color_recommender.color_recommender")
-            if not should_skip_module("color_recommender", output_path):
-                color_module.process(
-                    input=str(current_input),
-                    output=str(output_path),
-                    base_url=base_url,
-                    api_key=api_key,
-                    embed_model_path=embed_model_path,
-                    data_path=color_data_path,
-                    index_path=color_index_path
-                )
+            for stage_name, skip_name in ALL_MODULE_STAGES:
+                run_document_stage(stage_name, document, skip_name)
+                if stage_name in checkpoints and document.checkpoint():
+                    current_input = output_path
+            continue
+
+        if module_name in DOCUMENT_STAGES:
+            run_document_stage(module_name, document)
+            if module_name in checkpoints and document.checkpoint():
                 current_input = output_path
+            continue
 
-            # 图像推荐模块
-            image_module = import_module("modules.image_recommender.image_recommender")
-            if not should_skip_module("image_recommender", output_path):
-                image_module.process(
-                    input=str(current_input),
-                    output=str(output_path),
-                    base_url=base_url,
-                    api_key=api_key,
-                    embed_model_path=embed_model_path,
-                    data_path=image_data_path,
-                    index_path=image_index_path,
-                    resource_path=image_resource_path
-                )
-                current_input = output_path
+        # 以下模块从文件读取输入，先把内存中的文档写出
+        if document.checkpoint():
+            current_input = output_path
 
-        # 特殊处理title_generator模块，传入配置参数
-        elif module_name == "title_generator":
-            module = import_module(f"modules.{module_name}.{module_name}")
-            if not should_skip_module(module_name, output_path):
-                module.process(
-                    input=str(current_input),
-                    output=str(output_path),
-                    base_url=base_url,
-                    api_key=api_key,
-                    embed_model_path=embed_model_path,
-                    topk=topk,
-                    data_path=text_data_path,
-                    index_path=text_index_path
-                )
-                current_input = output_path
-        elif module_name == "color_recommender":
-            module = import_module(f"modules.{module_name}.{module_name}")
-            if not should_skip_module(module_name, output_path):
-                module.process(
-                    input=str(current_input),
-                    output=str(output_path),
-                    base_url=base_url,
-                    api_key=api_key,
-                    embed_model_path=embed_model_path,
-                    data_path=color_data_path,
-                    index_path=color_index_path
-                )
-                current_input = output_path
-        elif module_name == "image_recommender":
-            module = import_module(f"modules.{module_name}.{module_name}")
-            print("image_recommender")
-            if not should_skip_module(module_name, output_path):
-                print("process")
-                module.process(
-                    input=str(current_input),
-                    output=str(output_path),
-                    base_url=base_url,
-                    api_key=api_key,
-                    embed_model_path=embed_model_path,
-                    data_path=image_data_path,
-                    index_path=image_index_path,
-                    resource_path=image_resource_path
-                )
-                current_input = output_path
-        elif module_name == "infographics_generator":
+        if module_name == "infographics_generator":
             module = import_module(f"modules.{module_name}.{module_name}")
             if not should_skip_module(module_name, output_path):
                 module.process(
@@ -424,42 +542,36 @@ def run_single_file(input_path, output_path, temp_dir=None, modules_to_run=None,
                 module.process(input=str(current_input), output=str(title_svg))
             current_input = title_svg  # 更新为标题SVG作为下一个模块的输入
 
-        else:
-            # 普通模块：输入JSON，输出JSON
-            module = import_module(f"modules.{module_name}.{module_name}")
-            if not should_skip_module(module_name, output_path):
-                module.process(input=str(current_input), output=str(output_path))
-                current_input = output_path
-
+    # 管道结束时写出文档
+    document.checkpoint()
     return True
 
     # except Exception as e:
     #     logger.error(f"文件处理失败 {input_path}: {str(e)}")
     #     return False
 
-def should_skip_module(module_name: str, output_path: Path) -> bool:
-    """检查是否需要跳过模块执行"""
+def should_skip_module(module_name: str, output_path: Path = None, data: dict = None) -> bool:
+    """
+    检查是否需要跳过模块执行
+
+    Args:
+        module_name: 模块名称
+        output_path: 输出JSON文件路径，未传入data时从该文件读取
+        data: 当前文档，传入时直接在文档上判断
+    """
     try:
-        if not output_path.exists():
+        if module_name not in SKIP_CONDITIONS:
             return False
 
-        # 检查JSON文件中的特定字段
-        with open(output_path) as f:
-            data = json.load(f)
-
-        skip_conditions = {
-            "preprocess": lambda d: "metadata" in d and "data" in d and "variables" in d and "processed" in d,
-            "chart_type_recommender": lambda d: "chart_type" in d,
-            "datafact_generator": lambda d: "datafacts" in d,
-            "title_generator": lambda d: False,#"titles" in d,
-            "color_recommender": lambda d: "colors" in d,
-            "image_recommender": lambda d: "images" in d
-        }
+        if data is None:
+            if output_path is None or not output_path.exists():
+                return False
 
-        if module_name in skip_conditions:
-            return skip_conditions[module_name](data)
+            # 检查JSON文件中的特定字段
+            with open(output_path) as f:
+                data = json.load(f)
 
-        return False
+        return SKIP_CONDITIONS[module_name](data)
 
     except Exception as e:
         logger.warning(f"检查跳过条件时出错: {str(e)}")
@@ -471,8 +583,11 @@ def parse_args():
     parser.add_argument('--output', type=str, help='Output json file path', default='output')
     parser.add_argument('--temp-dir', type=str, default='tmp')
     parser.add_argument('--modules', type=str, nargs='+', help='Modules to run', default = 'infographics_generator')
-    parser.add_argument('--threads', type=int, help='Number of threads for directory processing', default=1)
+    parser.add_argument('--threads', type=int, help='Number of threads for directory processing (ignored when only chart_engine runs: the directory is rendered in one batch)', default=1)
     parser.add_argument('--chart-name', type=str, help='Specific chart name to use for infographics_generator')
+    parser.add_argument('--checkpoints', type=str, nargs='*', help='JSON modules after which the document is written to the output file')
+    parser.add_argument('--start-method', type=str, choices=['fork', 'spawn', 'forkserver'], help='Start method for worker processes')
+    parser.add_argument('--share-indexes', action='store_true', default=None, help='Load models and indexes in the parent and share them with forked workers')
     
     args = parser.parse_args()
     # 如果没有指定input，从data_resource_path随机选择
@@ -499,7 +614,10 @@ def main():
         temp_dir=args.temp_dir,
         modules_to_run=modules_to_run,
         threads=args.threads,
-        chart_name=args.chart_name
+        chart_name=args.chart_name,
+        checkpoints=args.checkpoints,
+        start_method=args.start_method,
+        share_indexes=args.share_indexes
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+mask二值化的微基准测试：对比逐网格循环实现与向量化实现的耗时，并校验结果逐位一致
+
+用法:
+    python scripts/benchmark_mask_binarization.py
+    python scripts/benchmark_mask_binarization.py --sizes 800x600 1500x1500 --repeat 5
+
+使用随机生成的合成图像（背景色上叠加若干矩形块和噪点），不依赖SVG栅格化。
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from modules.infographics_generator.mask_utils import binarize_grid, fill_small_gaps
+
+
+def legacy_grid_mask_v2(img_array, background_color, grid_size=5, max_difference=15):
+    """calculate_mask_v2 原有的逐网格实现"""
+    height, width = img_array.shape[:2]
+    mask = np.ones((height, width), dtype=np.uint8)
+    for y in range(0, height, grid_size):
+        for x in range(0, width, grid_size):
+            y_end = min(y + grid_size, height)
+            x_end = min(x + grid_size, width)
+            if y_end > y and x_end > x:
+                grid = img_array[y:y_end, x:x_end]
+                if grid.size > 0:
+                    background_diff = np.sqrt(np.sum((grid - background_color) ** 2, axis=2))
+                    white_ratio = np.mean(background_diff < max_difference)
+                    mask[y:y_end, x:x_end] = 0 if white_ratio > 0.95 else 1
+    return mask
+
+
+def legacy_grid_mask(img_array, grid_size=5, bg_threshold=220):
+    """calculate_mask 原有的逐网格实现"""
+    height, width = img_array.shape[:2]
+    mask = np.ones((height, width), dtype=np.uint8)
+    for y in range(0, height, grid_size):
+        for x in range(0, width, grid_size):
+            y_end = min(y + grid_size, height)
+            x_end = min(x + grid_size, width)
+            if y_end > y and x_end > x:
+                grid = img_array[y:y_end, x:x_end]
+                if grid.size > 0:
+                    white_pixels = np.all(grid >= bg_threshold, axis=2)
+                    white_ratio = np.mean(white_pixels)
+                    mask[y:y_end, x:x_end] = 0 if white_ratio > 0.95 else 1
+    return mask
+
+
+def legacy_fill_gaps(mask, mask_padding=3):
+    """calculate_mask_v3 原有的逐像素空隙填充（先按行后按列）"""
+    height, width = mask.shape
+    fill_mask = np.zeros((height, width), dtype=np.uint8)
+    for i in range(height):
+        last_j = -mask_padding
+        for j in range(width):
+            if mask[i, j] == 1:
+                if j - last_j < mask_padding:
+                    fill_mask[i, last_j:j+1] = 1
+                else:
+                    fill_mask[i, j] = 1
+                last_j = j
+    for j in range(width):
+        last_i = -mask_padding
+        for i in range(height):
+            if mask[i, j] == 1:
+                if i - last_i < mask_padding:
+                    fill_mask[last_i:i+1, j] = 1
+                else:
+                    fill_mask[i, j] = 1
+                last_i = i
+    return fill_mask
+
+
+def vectorized_grid_mask_v2(img_array, background_color, grid_size=5, max_difference=15):
+    background_diff = np.sqrt(np.sum((img_array - background_color) ** 2, axis=2))
+    return binarize_grid(background_diff < max_difference, grid_size)
+
+
+def vectorized_grid_mask(img_array, grid_size=5, bg_threshold=220):
+    return binarize_grid(np.all(img_array >= bg_threshold, axis=2), grid_size)
+
+
+def make_image(width, height, background_color, rng):
+    """生成背景色上叠加随机色块和噪点的RGB图像"""
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[:] = background_color
+    for _ in range(40):
+        x0, y0 = rng.integers(0, width), rng.integers(0, height)
+        w, h = rng.integers(5, max(6, width // 4)), rng.integers(5, max(6, height // 4))
+        img[y0:y0 + h, x0:x0 + w] = rng.integers(0, 256, size=3)
+    # 抗锯齿边缘一类的噪点，使部分网格的背景占比落在阈值附近
+    noise = rng.random((height, width)) < 0.03
+    img[noise] = rng.integers(0, 256, size=(int(noise.sum()), 3))
+    return img
+
+
+def time_call(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark grid mask binarization')
+    parser.add_argument('--sizes', nargs='*', default=['600x400', '1200x800', '1500x1500'],
+                        help='图像尺寸，格式为 宽x高')
+    parser.add_argument('--grid-size', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    background_hex = '#f5f0e6'
+    background_color = tuple(int(background_hex[i:i+2], 16) for i in (1, 3, 5))
+    all_identical = True
+
+    print(f"{'case':<12} {'size':<11} {'legacy(s)':>10} {'vectorized(s)':>14} {'speedup':>8}  identical")
+    for size in args.sizes:
+        width, height = (int(v) for v in size.lower().split('x'))
+        img = make_image(width, height, background_color, rng)
+        text_mask = (np.sqrt(np.sum((img - background_color) ** 2, axis=2)) >= 15).astype(np.uint8)
+
+        cases = [
+            ('mask_v2',
+             lambda: legacy_grid_mask_v2(img, background_color, args.grid_size),
+             lambda: vectorized_grid_mask_v2(img, background_color, args.grid_size)),
+            ('mask',
+             lambda: legacy_grid_mask(img, args.grid_size),
+             lambda: vectorized_grid_mask(img, args.grid_size)),
+            ('fill_gaps',
+             lambda: legacy_fill_gaps(text_mask),
+             lambda: fill_small_gaps(text_mask)),
+        ]
+        for name, legacy_fn, vectorized_fn in cases:
+            legacy_time, legacy_result = time_call(legacy_fn, args.repeat)
+            vectorized_time, vectorized_result = time_call(vectorized_fn, args.repeat)
+            identical = legacy_result.dtype == vectorized_result.dtype and \
+                np.array_equal(legacy_result, vectorized_result)
+            all_identical &= identical
+            print(f"{name:<12} {size:<11} {legacy_time:>10.4f} {vectorized_time:>14.4f} "
+                  f"{legacy_time / max(vectorized_time, 1e-9):>7.1f}x  {identical}")
+
+    return 0 if all_identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
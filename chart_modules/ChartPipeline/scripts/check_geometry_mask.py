@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+对比几何mask与栅格mask（calculate_mask_v2）的一致性和耗时
+
+用法:
+    python scripts/check_geometry_mask.py --input test/input.json --limit 30
+    python scripts/check_geometry_mask.py --svg-dir output/charts --background "#ffffff"
+
+--input 模式下用模板库中的模板渲染图表SVG；--svg-dir 模式直接使用已有的SVG文件。
+对每张图表分别以 mode="raster" 和 mode="geometry" 计算mask，按网格统计IoU、精确率和召回率，
+帮助判断哪些图表可以使用 LAYOUT_MASK_MODE=geometry。
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import random
+import argparse
+import tempfile
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from modules.infographics_generator.mask_utils import calculate_mask_v2
+
+SIZE_PATTERN = re.compile(r'<svg[^>]*?\swidth=["\']([\d.]+)(?:px)?["\'][^>]*?\sheight=["\']([\d.]+)(?:px)?["\']', re.DOTALL)
+
+
+def svg_size(svg_content):
+    match = SIZE_PATTERN.search(svg_content)
+    if not match:
+        return None
+    return int(float(match.group(1))), int(float(match.group(2)))
+
+
+def render_corpus(json_data, names=None, limit=20, seed=0):
+    """用模板库渲染图表，返回 [(模板名, SVG字符串)]"""
+    from modules.chart_engine.template.template_registry import scan_templates
+    from modules.chart_engine.utils.load_charts import render_chart_to_svg
+
+    templates = scan_templates()
+    entries = []
+    for engine, chart_types in templates.items():
+        if engine not in ('echarts-js', 'echarts_py', 'd3-js'):
+            continue
+        for charts in chart_types.values():
+            for name, info in charts.items():
+                if names and name not in names:
+                    continue
+                entries.append((name, engine, info['template']))
+    entries.sort(key=lambda entry: entry[0])
+    if not names and len(entries) > limit:
+        random.Random(seed).shuffle(entries)
+        entries = sorted(entries[:limit], key=lambda entry: entry[0])
+
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for index, (name, engine, template) in enumerate(entries):
+            framework = 'd3' if engine == 'd3-js' else 'echarts'
+            framework_type = 'py' if engine == 'echarts_py' else 'js'
+            svg_path = os.path.join(temp_dir, f'{index}.svg')
+            try:
+                render_chart_to_svg(json_data, svg_path, js_file=template, framework=framework, framework_type=framework_type)
+                with open(svg_path, 'r', encoding='utf-8') as f:
+                    results.append((name, f.read()))
+            except Exception as e:
+                print(f"[RENDER ERROR] {name}: {e}")
+    return results
+
+
+def compare_masks(raster_mask, geometry_mask, grid_size):
+    """按网格比较两个mask"""
+    raster_cells = raster_mask[::grid_size, ::grid_size].astype(bool)
+    geometry_cells = geometry_mask[::grid_size, ::grid_size].astype(bool)
+    intersection = np.sum(raster_cells & geometry_cells)
+    union = np.sum(raster_cells | geometry_cells)
+    return {
+        'iou': intersection / union if union else 1.0,
+        'precision': intersection / np.sum(geometry_cells) if np.any(geometry_cells) else float(not np.any(raster_cells)),
+        'recall': intersection / np.sum(raster_cells) if np.any(raster_cells) else 1.0,
+        'agreement': float(np.mean(raster_cells == geometry_cells))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare geometry-derived masks with raster masks')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='输入数据JSON文件，用模板库渲染图表')
+    source.add_argument('--svg-dir', help='已有SVG文件目录')
+    parser.add_argument('--names', nargs='*', help='要检查的模板名称（默认随机抽样）')
+    parser.add_argument('--limit', type=int, default=20, help='随机抽样的模板数量')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--background', help='背景色（默认取输入数据中的background_color或#FFFFFF）')
+    parser.add_argument('--grid-size', type=int, default=5)
+    parser.add_argument('--min-iou', type=float, default=0.8, help='低于该IoU的图表列为需要检查')
+    parser.add_argument('--output', help='将逐图表结果写入JSON文件')
+    args = parser.parse_args()
+
+    background_color = args.background or '#FFFFFF'
+    if args.input:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            json_data = json.load(f)
+        background_color = args.background or json_data.get('colors', {}).get('background_color', '#FFFFFF')
+        charts = render_corpus(json_data, args.names, args.limit, args.seed)
+    else:
+        charts = []
+        for path in sorted(glob.glob(os.path.join(args.svg_dir, '*.svg'))):
+            with open(path, 'r', encoding='utf-8') as f:
+                charts.append((os.path.splitext(os.path.basename(path))[0], f.read()))
+
+    results = []
+    print(f"{'chart':<40} {'IoU':>6} {'prec':>6} {'recall':>6} {'raster(s)':>10} {'geometry(s)':>12}")
+    for name, svg_content in charts:
+        size = svg_size(svg_content)
+        if size is None:
+            print(f"[SKIP] {name}: SVG has no width/height")
+            continue
+        width, height = size
+        try:
+            start = time.perf_counter()
+            raster_mask = calculate_mask_v2(svg_content, width, height, background_color, args.grid_size, mode='raster')
+            raster_time = time.perf_counter() - start
+            start = time.perf_counter()
+            geometry_mask = calculate_mask_v2(svg_content, width, height, background_color, args.grid_size, mode='geometry')
+            geometry_time = time.perf_counter() - start
+        except Exception as e:
+            print(f"[ERROR] {name}: {e}")
+            continue
+        metrics = compare_masks(raster_mask, geometry_mask, args.grid_size)
+        metrics.update({'name': name, 'raster_time': raster_time, 'geometry_time': geometry_time})
+        results.append(metrics)
+        print(f"{name:<40} {metrics['iou']:>6.3f} {metrics['precision']:>6.3f} {metrics['recall']:>6.3f} "
+              f"{raster_time:>10.4f} {geometry_time:>12.4f}")
+
+    if not results:
+        print("No charts compared")
+        return 1
+
+    ious = np.array([r['iou'] for r in results])
+    raster_total = sum(r['raster_time'] for r in results)
+    geometry_total = sum(r['geometry_time'] for r in results)
+    print(f"\n{len(results)} charts: mean IoU {ious.mean():.3f}, median {np.median(ious):.3f}, min {ious.min():.3f}")
+    print(f"mean precision {np.mean([r['precision'] for r in results]):.3f}, "
+          f"mean recall {np.mean([r['recall'] for r in results]):.3f}")
+    print(f"total time: raster {raster_total:.2f}s, geometry {geometry_total:.2f}s "
+          f"({raster_total / max(geometry_total, 1e-9):.1f}x)")
+    low = [r['name'] for r in results if r['iou'] < args.min_iou]
+    if low:
+        print(f"Charts below IoU {args.min_iou} (keep LAYOUT_MASK_MODE=raster for these):")
+        for name in low:
+            print(f"  {name}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, default=float)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
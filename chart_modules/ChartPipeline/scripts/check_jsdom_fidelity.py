@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+对比D3模板在jsdom后端和浏览器后端的渲染结果
+
+用法:
+    python scripts/check_jsdom_fidelity.py --input test/input.json --limit 20
+    python scripts/check_jsdom_fidelity.py --input test/input.json --names donut_chart_01 bar_chart_02
+
+对每个模板分别用jsdom和无头浏览器渲染，比较元素数量、文本内容以及几何属性的差异，
+用于确认哪些模板可以安全地使用jsdom（不安全的可在模板REQUIREMENTS中设置 "render_backend": "browser"）。
+"""
+import os
+import re
+import sys
+import json
+import random
+import argparse
+import tempfile
+from collections import Counter
+import xml.etree.ElementTree as ET
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from modules.chart_engine.template.template_registry import scan_templates, detect_render_backend
+from modules.chart_engine.utils.ssr_renderer import get_ssr_worker
+from modules.chart_engine.utils.load_charts import _write_chart_html
+from modules.chart_engine.utils.html_to_svg import html_to_svg
+
+GEOMETRY_ATTRS = ['x', 'y', 'width', 'height', 'cx', 'cy', 'r', 'x1', 'y1', 'x2', 'y2']
+NUMBER_PATTERN = re.compile(r'-?\d+\.?\d*(?:e[-+]?\d+)?')
+
+
+def list_d3_templates(names=None):
+    """返回 [(模板名, 模板路径)]，只包含标记为jsdom安全的D3模板"""
+    templates = scan_templates()
+    result = []
+    for chart_type, charts in templates['d3-js'].items():
+        for name, info in charts.items():
+            if names and name not in names:
+                continue
+            if info.get('render_backend', detect_render_backend(info['template'])) != 'jsdom':
+                continue
+            result.append((name, info['template']))
+    return sorted(result)
+
+
+def parse_svg(svg_content):
+    root = ET.fromstring(svg_content)
+    elements = list(root.iter())
+    return root, elements
+
+
+def local_tag(element):
+    return element.tag.split('}')[-1]
+
+
+def geometry_values(element):
+    values = []
+    for attr in GEOMETRY_ATTRS:
+        value = element.get(attr)
+        if value is not None:
+            values.extend(float(v) for v in NUMBER_PATTERN.findall(value))
+    values.extend(float(v) for v in NUMBER_PATTERN.findall(element.get('transform', '')))
+    return values
+
+
+def compare_svgs(jsdom_svg, browser_svg):
+    """
+    比较两份SVG
+
+    Returns:
+        dict: 元素数量差异、文本差异和几何属性的最大偏差（结构一致时）
+    """
+    _, jsdom_elements = parse_svg(jsdom_svg)
+    _, browser_elements = parse_svg(browser_svg)
+
+    jsdom_tags = Counter(local_tag(e) for e in jsdom_elements)
+    browser_tags = Counter(local_tag(e) for e in browser_elements)
+    tag_diff = {tag: jsdom_tags[tag] - browser_tags[tag]
+                for tag in set(jsdom_tags) | set(browser_tags)
+                if jsdom_tags[tag] != browser_tags[tag]}
+
+    jsdom_texts = [e.text.strip() for e in jsdom_elements if local_tag(e) in ('text', 'tspan') and e.text and e.text.strip()]
+    browser_texts = [e.text.strip() for e in browser_elements if local_tag(e) in ('text', 'tspan') and e.text and e.text.strip()]
+    text_mismatch = sum(1 for a, b in zip(jsdom_texts, browser_texts) if a != b) + abs(len(jsdom_texts) - len(browser_texts))
+
+    max_geometry_diff = None
+    text_geometry_diff = None
+    if not tag_diff:
+        max_geometry_diff = 0.0
+        text_geometry_diff = 0.0
+        for a, b in zip(jsdom_elements, browser_elements):
+            va, vb = geometry_values(a), geometry_values(b)
+            if len(va) != len(vb):
+                continue
+            diff = max((abs(x - y) for x, y in zip(va, vb)), default=0.0)
+            max_geometry_diff = max(max_geometry_diff, diff)
+            if local_tag(a) in ('text', 'tspan'):
+                text_geometry_diff = max(text_geometry_diff, diff)
+
+    return {
+        'elements': (len(jsdom_elements), len(browser_elements)),
+        'tag_diff': tag_diff,
+        'text_mismatch': text_mismatch,
+        'max_geometry_diff': max_geometry_diff,
+        'text_geometry_diff': text_geometry_diff
+    }
+
+
+def render_with_browser(json_data, js_file, width, height, temp_dir, index):
+    html_file = os.path.join(temp_dir, f'fidelity_{index}.html')
+    svg_file = os.path.join(temp_dir, f'fidelity_{index}.svg')
+    _write_chart_html(json_data, html_file, js_file, width, height, 'd3')
+    if html_to_svg(html_file, svg_file, width=width, height=height) is None:
+        return None
+    with open(svg_file, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare jsdom and browser rendering of D3 templates')
+    parser.add_argument('--input', required=True, help='输入数据JSON文件')
+    parser.add_argument('--names', nargs='*', help='要检查的模板名称（默认随机抽样）')
+    parser.add_argument('--limit', type=int, default=20, help='随机抽样的模板数量')
+    parser.add_argument('--tolerance', type=float, default=2.0, help='几何属性允许的最大偏差(px)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.input, 'r', encoding='utf-8') as f:
+        json_data = json.load(f)
+    width = json_data.get('variables', {}).get('width', 1200)
+    height = json_data.get('variables', {}).get('height', 800)
+
+    templates = list_d3_templates(args.names)
+    if not args.names and len(templates) > args.limit:
+        random.Random(args.seed).shuffle(templates)
+        templates = sorted(templates[:args.limit])
+
+    worker = get_ssr_worker()
+    if worker is None:
+        print("SSR server unavailable, nothing to compare")
+        return 1
+
+    failures = []
+    skipped = 0
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for index, (name, js_file) in enumerate(templates):
+            try:
+                jsdom_svg = worker.render_d3(json_data, js_file, width=width, height=height)
+            except Exception as e:
+                print(f"[JSDOM ERROR] {name}: {e}")
+                failures.append(name)
+                continue
+            browser_svg = render_with_browser(json_data, js_file, width, height, temp_dir, index)
+            if browser_svg is None:
+                print(f"[BROWSER ERROR] {name}: browser rendering failed, skipped")
+                skipped += 1
+                continue
+
+            result = compare_svgs(jsdom_svg, browser_svg)
+            ok = not result['tag_diff'] and result['text_mismatch'] == 0 and \
+                result['max_geometry_diff'] is not None and result['max_geometry_diff'] <= args.tolerance
+            if not ok:
+                failures.append(name)
+            print(f"[{'OK' if ok else 'DIFF'}] {name}: elements={result['elements']} "
+                  f"tag_diff={result['tag_diff']} text_mismatch={result['text_mismatch']} "
+                  f"max_geometry_diff={result['max_geometry_diff']} text_geometry_diff={result['text_geometry_diff']}")
+
+    compared = len(templates) - skipped
+    print(f"\n{compared - len(failures)}/{compared} templates match within {args.tolerance}px ({skipped} skipped)")
+    if failures:
+        print("Templates to review (consider \"render_backend\": \"browser\" in REQUIREMENTS):")
+        for name in failures:
+            print(f"  {name}")
+    return 0 if not failures else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+近似最近邻索引的召回率/延迟评估：以IndexFlatL2的精确结果为基准，对比utils/faiss_index.py
+支持的各类索引（ivf_flat、ivf_pq、hnsw）在不同查询参数（nprobe/efSearch）下的recall@k和查询延迟
+
+用法:
+    python scripts/evaluate_ann_index.py --index ./static/color_palette.index
+    python scripts/evaluate_ann_index.py --embeddings vectors.npy --types ivf_flat hnsw --k 10
+    python scripts/evaluate_ann_index.py --synthetic 50000 --dim 384 --nprobe 1 4 16 --ef-search 32 128
+
+向量来源三选一：已有的FAISS索引文件（取出其中全部向量）、.npy矩阵或随机生成的聚类数据。
+查询向量从库中抽取并加少量噪声。评估结果可用于选择FAISS_INDEX_TYPE、FAISS_NPROBE和FAISS_EF_SEARCH。
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import faiss
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from utils.faiss_index import apply_search_params, build_index, reconstruct_all
+
+
+def load_vectors(args) -> np.ndarray:
+    if args.index:
+        return reconstruct_all(faiss.read_index(args.index)).astype(np.float32)
+    if args.embeddings:
+        return np.load(args.embeddings).astype(np.float32)
+    # 随机聚类数据，模拟嵌入向量在语义空间中的分布
+    rng = np.random.default_rng(args.seed)
+    centers = rng.normal(size=(max(1, args.synthetic // 100), args.dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), size=args.synthetic)
+    vectors = centers[labels] + 0.3 * rng.normal(size=(args.synthetic, args.dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(vectors: np.ndarray, num_queries: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    picks = rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)
+    noise = rng.normal(scale=0.05 * float(np.std(vectors)), size=(len(picks), vectors.shape[1]))
+    return np.ascontiguousarray(vectors[picks] + noise, dtype=np.float32)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(row_found.tolist()) & set(row_truth.tolist())) for row_found, row_truth in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def time_search(index, queries: np.ndarray, k: int):
+    """返回 (逐条查询的结果, 逐条查询的平均毫秒数, 整批查询的平均毫秒数)"""
+    start = time.perf_counter()
+    results = np.vstack([index.search(queries[i:i + 1], k)[1] for i in range(len(queries))])
+    single_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    start = time.perf_counter()
+    index.search(queries, k)
+    batch_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return results, single_ms, batch_ms
+
+
+def index_size_mb(index) -> float:
+    return faiss.serialize_index(index).size / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate ANN index recall and latency against the flat baseline')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--index', help='已有的FAISS索引文件')
+    source.add_argument('--embeddings', help='形状为 (n, dim) 的.npy向量文件')
+    source.add_argument('--synthetic', type=int, default=20000, help='随机生成的向量数量')
+    parser.add_argument('--dim', type=int, default=384, help='随机向量的维度')
+    parser.add_argument('--types', nargs='+', default=['ivf_flat', 'ivf_pq', 'hnsw'], help='要评估的索引类型')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32], help='IVF索引的nprobe取值')
+    parser.add_argument('--ef-search', type=int, nargs='+', default=[16, 32, 64, 128], help='HNSW索引的efSearch取值')
+    parser.add_argument('--queries', type=int, default=500, help='查询数量')
+    parser.add_argument('--k', type=int, default=5, help='recall@k中的k（推荐模块默认top_k=5）')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    vectors = load_vectors(args)
+    queries = make_queries(vectors, args.queries, args.seed)
+    print(f"{len(vectors)} vectors of dim {vectors.shape[1]}, {len(queries)} queries, k={args.k}")
+
+    baseline, _ = build_index(vectors, 'flat')
+    truth, flat_single_ms, flat_batch_ms = time_search(baseline, queries, args.k)
+    print(f"{'index':<24}{'param':<16}{'recall':>8}{'ms/query':>10}{'ms/batch q':>12}{'build s':>9}{'size MB':>9}")
+    print(f"{'Flat':<24}{'-':<16}{1.0:>8.3f}{flat_single_ms:>10.3f}{flat_batch_ms:>12.4f}{0.0:>9.1f}{index_size_mb(baseline):>9.1f}")
+
+    for index_type in args.types:
+        start = time.perf_counter()
+        index, config = build_index(vectors, index_type)
+        build_seconds = time.perf_counter() - start
+        if config['index_type'] == 'flat':
+            print(f"{index_type:<24}skipped: too few vectors to train, build_index falls back to flat")
+            continue
+        if config['index_type'] == 'hnsw':
+            sweep = [('ef_search', value) for value in args.ef_search]
+        else:
+            sweep = [('nprobe', value) for value in args.nprobe if value <= config['params']['nlist']]
+        size_mb = index_size_mb(index)
+        for name, value in sweep:
+            apply_search_params(index, {name: value})
+            found, single_ms, batch_ms = time_search(index, queries, args.k)
+            print(f"{config['factory']:<24}{f'{name}={value}':<16}{recall_at_k(found, truth):>8.3f}"
+                  f"{single_ms:>10.3f}{batch_ms:>12.4f}{build_seconds:>9.1f}{size_mb:>9.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
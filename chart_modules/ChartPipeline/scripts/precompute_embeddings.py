@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+离线预计算图标/插图元数据的嵌入并写入嵌入缓存（utils/embedding_cache.py）
+
+用法:
+    python scripts/precompute_embeddings.py --embed-model-path /path/to/model --resource-path /path/to/resources
+    python scripts/precompute_embeddings.py --image-data-path /path/to/image_data.json --batch-size 512
+
+包括特殊图标的名称（process_special_icons）、attribute_icons索引中图标的语义文本和图像索引数据的语义文本
+（process_normal_icons）。预计算之后，推荐时只需要对查询文本做嵌入。
+未指定的路径取自config.py中的embed_model_path、image_resource_path和image_data_path。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from utils.model_loader import ModelLoader
+from utils.embedding_cache import encode_cached, get_embedding_store
+from modules.image_recommender.image_recommender import get_image_semantic_text
+
+
+def load_config_defaults():
+    try:
+        import config
+    except ImportError:
+        return {}
+    return {
+        'embed_model_path': getattr(config, 'embed_model_path', None),
+        'resource_path': getattr(config, 'image_resource_path', None),
+        'image_data_path': getattr(config, 'image_data_path', None),
+    }
+
+
+def collect_texts(resource_path=None, image_data_path=None):
+    """收集需要预计算的文本，返回 {来源: [文本]}"""
+    sources = {}
+    if resource_path:
+        special_icon_index = os.path.join(resource_path, 'special_icons', 'data.json')
+        if os.path.exists(special_icon_index):
+            with open(special_icon_index, 'r') as f:
+                special_icons = json.load(f)
+            sources['special icon names'] = [
+                icon['name']
+                for icon_types in special_icons.values()
+                for icons in icon_types.values()
+                for icon in icons
+            ]
+        newicon_data_path = os.path.join(resource_path, 'attribute_icons', 'index.json')
+        if os.path.exists(newicon_data_path):
+            with open(newicon_data_path, 'r') as f:
+                newicon_data = json.load(f)
+            sources['attribute icons'] = [get_image_semantic_text(entry['data']) for entry in newicon_data['index'].values()]
+    if image_data_path and os.path.exists(image_data_path):
+        with open(image_data_path, 'r') as f:
+            image_data = json.load(f)
+        sources['image index'] = [get_image_semantic_text(data) for data in image_data['data']]
+    return sources
+
+
+def main():
+    defaults = load_config_defaults()
+    parser = argparse.ArgumentParser(description='Precompute icon and clipart metadata embeddings')
+    parser.add_argument('--embed-model-path', default=defaults.get('embed_model_path'), help='嵌入模型路径')
+    parser.add_argument('--resource-path', default=defaults.get('resource_path'), help='图像资源目录（包含special_icons和attribute_icons）')
+    parser.add_argument('--image-data-path', default=defaults.get('image_data_path'), help='图像索引数据JSON')
+    parser.add_argument('--batch-size', type=int, default=256)
+    args = parser.parse_args()
+
+    sources = collect_texts(args.resource_path, args.image_data_path)
+    if not sources:
+        print("No icon metadata found, check --resource-path and --image-data-path")
+        return 1
+
+    model = ModelLoader.get_model(args.embed_model_path)
+    model_id = ModelLoader.get_model_id(model)
+    store = get_embedding_store(model_id)
+    for source, texts in sources.items():
+        texts = [text for text in dict.fromkeys(texts) if text]
+        start = time.perf_counter()
+        for offset in range(0, len(texts), args.batch_size):
+            encode_cached(model, texts[offset:offset + args.batch_size], model_id=model_id)
+        print(f"{source}: {len(texts)} texts in {time.perf_counter() - start:.1f}s")
+    print(f"Embedding cache for {model_id}: {len(store)} entries in {store.directory}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
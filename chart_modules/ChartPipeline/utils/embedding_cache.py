@@ -0,0 +1,251 @@
+import os
+import hashlib
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 嵌入缓存目录，可通过环境变量 EMBEDDING_CACHE_DIR 指定；EMBEDDING_CACHE=0 关闭缓存
+EMBEDDING_CACHE_DIR = os.environ.get('EMBEDDING_CACHE_DIR', os.path.join(PROJECT_ROOT, 'cache', 'embeddings'))
+EMBEDDING_CACHE_ENABLED = os.environ.get('EMBEDDING_CACHE', '1') != '0'
+# 每个模型在内存中保留的嵌入数量（LRU）
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', '20000'))
+# 等待其他进程释放写锁的秒数
+SQLITE_BUSY_TIMEOUT = 30
+
+
+def normalize_text(text) -> str:
+    """缓存键使用的文本：合并连续空白并去掉首尾空白"""
+    return ' '.join(str(text).split())
+
+
+def text_key(text) -> str:
+    return hashlib.sha1(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    单个嵌入模型的持久化嵌入缓存
+
+    嵌入按行追加到内存映射的float32矩阵文件（vectors.f32）中，文本键到行号的哈希索引保存在
+    同目录的SQLite数据库中，多个进程可以同时读写；最近使用的嵌入另外保存在进程内的LRU中。
+
+    Args:
+        model_id: 模型标识（模型路径或名称）
+        cache_dir: 缓存根目录，每个模型使用其中的一个子目录
+        memory_size: 进程内LRU保留的嵌入数量
+    """
+
+    def __init__(self, model_id: str, cache_dir: str = None, memory_size: int = None):
+        self.model_id = model_id
+        model_digest = hashlib.sha1(model_id.encode('utf-8')).hexdigest()[:16]
+        self.directory = os.path.join(cache_dir or EMBEDDING_CACHE_DIR, model_digest)
+        self.vectors_path = os.path.join(self.directory, 'vectors.f32')
+        self.index_path = os.path.join(self.directory, 'index.db')
+        self.memory_size = EMBEDDING_CACHE_SIZE if memory_size is None else memory_size
+        self.dim = None
+        self._memory = OrderedDict()
+        self._vectors = None
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pid = None
+        # 命中/未命中统计
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # fork出的子进程不能复用父进程的连接
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        os.makedirs(self.directory, exist_ok=True)
+        conn = sqlite3.connect(self.index_path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, row INTEGER NOT NULL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('model_id', ?)", (self.model_id,))
+        self._conn = conn
+        self._load_dim()
+        self._pid = os.getpid()
+        self._vectors = None
+        return conn
+
+    def _load_dim(self) -> None:
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self.dim = int(row[0]) if row else None
+
+    def _select_keys(self, conn: sqlite3.Connection, column_sql: str, keys: List[str]) -> List[tuple]:
+        # SQLite对单条语句的参数数量有限制，分批查询
+        rows = []
+        batch_size = 500
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            placeholders = ', '.join('?' * len(batch))
+            rows.extend(conn.execute(f'SELECT {column_sql} FROM embeddings WHERE key IN ({placeholders})', batch).fetchall())
+        return rows
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        if self.memory_size <= 0:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _read_rows(self, rows: List[int]) -> np.ndarray:
+        """从内存映射的矩阵中读取若干行，文件被其他进程追加后重新映射"""
+        needed = max(rows) + 1
+        if self._vectors is None or self._vectors.shape[0] < needed:
+            file_rows = os.path.getsize(self.vectors_path) // (self.dim * 4)
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(file_rows, self.dim))
+        return np.array(self._vectors[rows])
+
+    def get_many(self, texts: Sequence[str]) -> Dict[str, np.ndarray]:
+        """
+        查询已缓存的嵌入
+
+        Returns:
+            {文本键: 嵌入向量}，只包含命中的文本
+        """
+        keys = list(dict.fromkeys(text_key(text) for text in texts))
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                    self.memory_hits += 1
+                else:
+                    missing.append(key)
+            if not missing:
+                return found
+            conn = self._connect()
+            if self.dim is None:
+                # 其他进程可能已经写入了第一批嵌入
+                self._load_dim()
+                if self.dim is None:
+                    return found
+            key_rows = self._select_keys(conn, 'key, row', missing)
+            if key_rows:
+                vectors = self._read_rows([row for _, row in key_rows])
+                for (key, _), vector in zip(key_rows, vectors):
+                    found[key] = vector
+                    self._remember(key, vector)
+                self.disk_hits += len(key_rows)
+        return found
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray) -> None:
+        """将嵌入追加到缓存中，已存在的文本跳过"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(texts) == 0:
+            return
+        if vectors.ndim != 2 or vectors.shape[0] != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got shape {vectors.shape}")
+        entries = dict(zip((text_key(text) for text in texts), vectors))
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+                if row is None:
+                    conn.execute("INSERT INTO meta (name, value) VALUES ('dim', ?)", (str(vectors.shape[1]),))
+                    self.dim = vectors.shape[1]
+                else:
+                    self.dim = int(row[0])
+                if vectors.shape[1] != self.dim:
+                    raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match cache dimension {self.dim}")
+                existing = {key for (key,) in self._select_keys(conn, 'key', list(entries))}
+                new_keys = [key for key in entries if key not in existing]
+                if new_keys:
+                    # 行号连续，写在矩阵末尾；未提交的写入会在下次写入时被覆盖
+                    next_row = conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+                    mode = 'r+b' if os.path.exists(self.vectors_path) else 'w+b'
+                    with open(self.vectors_path, mode) as f:
+                        f.seek(next_row * self.dim * 4)
+                        f.write(np.stack([entries[key] for key in new_keys]).astype(np.float32).tobytes())
+                    conn.executemany('INSERT INTO embeddings (key, row) VALUES (?, ?)',
+                                     [(key, next_row + i) for i, key in enumerate(new_keys)])
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            for key, vector in entries.items():
+                self._remember(key, vector)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+            self._vectors = None
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_embedding_store(model_id: str) -> EmbeddingStore:
+    """获取模型对应的进程内共享嵌入缓存"""
+    store = _stores.get(model_id)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(model_id)
+            if store is None:
+                store = EmbeddingStore(model_id)
+                _stores[model_id] = store
+    return store
+
+
+def encode_cached(model, texts: Sequence[str], model_id: Optional[str] = None) -> np.ndarray:
+    """
+    带缓存的批量编码：命中缓存的文本直接读取，其余文本一次性交给model.encode后写入缓存
+
+    Args:
+        model: SentenceTransformer等提供encode(list)的模型
+        texts: 要编码的文本列表
+        model_id: 模型标识；默认从ModelLoader查询，查询不到（模型不是由ModelLoader加载的）时不使用缓存
+
+    Returns:
+        形状为 (len(texts), dim) 的float32数组
+    """
+    texts = [str(text) for text in texts]
+    if model_id is None and EMBEDDING_CACHE_ENABLED:
+        from utils.model_loader import ModelLoader
+        model_id = ModelLoader.get_model_id(model)
+    if not texts or not model_id or not EMBEDDING_CACHE_ENABLED:
+        return np.asarray(model.encode(texts), dtype=np.float32)
+
+    store = get_embedding_store(model_id)
+    try:
+        found = store.get_many(texts)
+    except Exception as e:
+        logger.warning(f"Embedding cache lookup failed, encoding directly: {e}")
+        return np.asarray(model.encode(texts), dtype=np.float32)
+
+    keys = [text_key(text) for text in texts]
+    # 未命中的文本去重后一次性编码
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+    store.misses += len(missing)
+    if missing:
+        encoded = np.asarray(model.encode(list(missing.values())), dtype=np.float32)
+        found.update(zip(missing.keys(), encoded))
+        try:
+            store.put_many(list(missing.values()), encoded)
+        except Exception as e:
+            logger.warning(f"Failed to write embedding cache: {e}")
+    return np.stack([found[key] for key in keys]).astype(np.float32, copy=False)
@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import math
+import logging
+from typing import Dict, Optional
+
+import numpy as np
+import faiss
+
+logger = logging.getLogger(__name__)
+
+# 新建索引的类型，可通过环境变量 FAISS_INDEX_TYPE 指定：
+#   flat      暴力搜索（IndexFlatL2，默认）
+#   ivf_flat  倒排+原始向量
+#   ivf_pq    倒排+乘积量化，内存最小，召回略低
+#   hnsw      HNSW图，查询最快，内存比flat略大
+FAISS_INDEX_TYPE = os.environ.get('FAISS_INDEX_TYPE', 'flat').lower()
+INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+# 向量数少于该值时ANN没有收益，直接使用flat
+FAISS_ANN_MIN_SIZE = int(os.environ.get('FAISS_ANN_MIN_SIZE', '2000'))
+# 构建参数，0表示按数据量自动选择
+DEFAULT_BUILD_PARAMS = {
+    'nlist': int(os.environ.get('FAISS_NLIST', '0')),
+    'pq_m': int(os.environ.get('FAISS_PQ_M', '0')),
+    'pq_nbits': int(os.environ.get('FAISS_PQ_NBITS', '8')),
+    'hnsw_m': int(os.environ.get('FAISS_HNSW_M', '32')),
+    'ef_construction': int(os.environ.get('FAISS_EF_CONSTRUCTION', '40')),
+}
+# 查询参数，未设置时使用索引元数据中记录的值
+DEFAULT_SEARCH_PARAMS = {'nprobe': 8, 'ef_search': 64}
+SEARCH_PARAM_OVERRIDES = {
+    'nprobe': os.environ.get('FAISS_NPROBE'),
+    'ef_search': os.environ.get('FAISS_EF_SEARCH'),
+}
+METADATA_SUFFIX = '.meta.json'
+
+
+def _auto_nlist(num_vectors: int) -> int:
+    # 经验值 4*sqrt(n)，且每个聚类中心至少有39个训练样本
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+
+def _auto_pq_m(dim: int) -> int:
+    # 每个子量化器约8维，m必须整除维度
+    for m in range(max(1, dim // 8), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def resolve_index_config(num_vectors: int, dim: int, index_type: Optional[str] = None, **params) -> Dict:
+    """
+    根据数据量确定实际使用的索引类型和参数
+
+    数据量太小无法训练所请求的索引时退回到更简单的类型（ivf_pq -> ivf_flat -> flat）。
+
+    Returns:
+        {"index_type", "factory", "params"}
+    """
+    index_type = (index_type or FAISS_INDEX_TYPE).lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type: {index_type}, expected one of {INDEX_TYPES}")
+    build_params = dict(DEFAULT_BUILD_PARAMS)
+    build_params.update({key: value for key, value in params.items() if value is not None})
+
+    if index_type != 'flat' and num_vectors < FAISS_ANN_MIN_SIZE:
+        logger.info(f"{num_vectors} vectors is below FAISS_ANN_MIN_SIZE={FAISS_ANN_MIN_SIZE}, using a flat index")
+        index_type = 'flat'
+    if index_type == 'ivf_pq':
+        pq_m = build_params['pq_m'] or _auto_pq_m(dim)
+        # PQ码本训练需要约39*2^nbits个样本
+        if dim % pq_m != 0 or num_vectors < 39 * 2 ** build_params['pq_nbits']:
+            logger.info(f"Cannot train PQ{pq_m}x{build_params['pq_nbits']} on {num_vectors} vectors of dim {dim}, using ivf_flat")
+            index_type = 'ivf_flat'
+        else:
+            build_params['pq_m'] = pq_m
+
+    if index_type == 'flat':
+        return {'index_type': 'flat', 'factory': 'Flat', 'params': {}}
+    if index_type == 'hnsw':
+        return {
+            'index_type': 'hnsw',
+            'factory': f"HNSW{build_params['hnsw_m']}",
+            'params': {'hnsw_m': build_params['hnsw_m'], 'ef_construction': build_params['ef_construction'],
+                       'ef_search': params.get('ef_search') or DEFAULT_SEARCH_PARAMS['ef_search']}
+        }
+    nlist = build_params['nlist'] or _auto_nlist(num_vectors)
+    nlist = max(1, min(nlist, num_vectors))
+    search_params = {'nlist': nlist, 'nprobe': min(nlist, params.get('nprobe') or DEFAULT_SEARCH_PARAMS['nprobe'])}
+    if index_type == 'ivf_pq':
+        search_params.update({'pq_m': build_params['pq_m'], 'pq_nbits': build_params['pq_nbits']})
+        return {'index_type': 'ivf_pq', 'factory': f"IVF{nlist},PQ{build_params['pq_m']}x{build_params['pq_nbits']}",
+                'params': search_params}
+    return {'index_type': 'ivf_flat', 'factory': f"IVF{nlist},Flat", 'params': search_params}
+
+
+def _with_search_overrides(params: Dict) -> Dict:
+    """环境变量 FAISS_NPROBE / FAISS_EF_SEARCH 优先于索引元数据中记录的查询参数"""
+    params = dict(params)
+    params.update({name: int(value) for name, value in SEARCH_PARAM_OVERRIDES.items() if value})
+    return params
+
+
+def apply_search_params(index, params: Dict) -> None:
+    """设置查询参数（nprobe/efSearch），索引类型不支持的参数忽略"""
+    nprobe = params.get('nprobe')
+    ef_search = params.get('ef_search')
+    try:
+        ivf_index = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf_index = None
+    if ivf_index is not None and nprobe:
+        ivf_index.nprobe = int(nprobe)
+    if hasattr(index, 'hnsw') and ef_search:
+        index.hnsw.efSearch = int(ef_search)
+
+
+def build_index(embeddings: np.ndarray, index_type: Optional[str] = None, **params):
+    """
+    按配置创建、训练并填充FAISS索引
+
+    Args:
+        embeddings: 形状为 (n, dim) 的向量
+        index_type: flat/ivf_flat/ivf_pq/hnsw，默认取 FAISS_INDEX_TYPE
+        params: 覆盖默认构建/查询参数（nlist、pq_m、pq_nbits、hnsw_m、ef_construction、nprobe、ef_search）
+
+    Returns:
+        (索引, 索引配置)，索引配置用于write_index记录元数据
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if embeddings.ndim != 2:
+        raise ValueError(f"Expected a 2-D embedding matrix, got shape {embeddings.shape}")
+    num_vectors, dim = embeddings.shape
+    config = resolve_index_config(num_vectors, dim, index_type, **params)
+
+    start = time.perf_counter()
+    index = faiss.index_factory(dim, config['factory'], faiss.METRIC_L2)
+    if config['index_type'] == 'hnsw':
+        index.hnsw.efConstruction = config['params']['ef_construction']
+    if not index.is_trained:
+        index.train(embeddings)
+    if num_vectors:
+        index.add(embeddings)
+    apply_search_params(index, _with_search_overrides(config['params']))
+    logger.info(f"Built {config['factory']} index over {num_vectors} vectors in {time.perf_counter() - start:.2f}s")
+    return index, config
+
+
+def index_config_of(index) -> Dict:
+    """推断已有索引的配置（没有元数据文件时使用）"""
+    if hasattr(index, 'hnsw'):
+        return {'index_type': 'hnsw', 'factory': 'HNSW', 'params': {'ef_search': index.hnsw.efSearch}}
+    try:
+        ivf_index = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf_index = None
+    if ivf_index is not None:
+        index_type = 'ivf_pq' if isinstance(faiss.downcast_index(ivf_index), faiss.IndexIVFPQ) else 'ivf_flat'
+        return {'index_type': index_type, 'factory': 'IVF', 'params': {'nlist': ivf_index.nlist, 'nprobe': ivf_index.nprobe}}
+    return {'index_type': 'flat', 'factory': 'Flat', 'params': {}}
+
+
+def read_index_metadata(index_path: str) -> Optional[Dict]:
+    metadata_path = index_path + METADATA_SUFFIX
+    if not os.path.exists(metadata_path):
+        return None
+    try:
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to read index metadata {metadata_path}: {e}")
+        return None
+
+
+def read_index_config(index_path: str, index) -> Dict:
+    """索引的配置：优先取元数据文件中记录的值，没有元数据时从索引推断"""
+    metadata = read_index_metadata(index_path)
+    if metadata:
+        return {'index_type': metadata['index_type'], 'factory': metadata['factory'], 'params': metadata['params']}
+    return index_config_of(index)
+
+
+def write_index(index, index_path: str, config: Optional[Dict] = None, **extra) -> None:
+    """
+    保存索引，并在 <index_path>.meta.json 中记录索引类型和参数
+
+    两个文件都先写临时文件再原子替换。
+
+    Args:
+        index: FAISS索引
+        index_path: 索引文件路径
+        config: build_index返回的索引配置，None时从索引推断
+        extra: 额外记录到元数据中的字段
+    """
+    config = config or index_config_of(index)
+    temp_path = f"{index_path}.{os.getpid()}.tmp"
+    faiss.write_index(index, temp_path)
+    os.replace(temp_path, index_path)
+
+    metadata = {
+        'index_type': config['index_type'],
+        'factory': config['factory'],
+        'params': config['params'],
+        'dim': index.d,
+        'ntotal': index.ntotal,
+        'metric': 'L2',
+        'faiss_version': getattr(faiss, '__version__', None),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    metadata.update(extra)
+    metadata_path = index_path + METADATA_SUFFIX
+    temp_path = f"{metadata_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(temp_path, metadata_path)
+
+
+def read_index(index_path: str):
+    """读取索引，并按元数据（或环境变量）设置查询参数；flat索引与faiss.read_index完全相同"""
+    index = faiss.read_index(index_path)
+    apply_search_params(index, _with_search_overrides(read_index_config(index_path, index)['params']))
+    return index
+
+
+def reconstruct_all(index) -> np.ndarray:
+    """取出索引中的全部向量（IVF索引需要先建立direct map；PQ索引得到的是量化后的近似值）"""
+    try:
+        ivf_index = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf_index = None
+    if ivf_index is not None:
+        ivf_index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
@@ -1,30 +1,146 @@
+import os
+import logging
+import threading
 from sentence_transformers import SentenceTransformer
-from typing import Optional
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+# 加载设备（cpu/cuda），未设置时由SentenceTransformer自动选择
+EMBED_MODEL_DEVICE = os.environ.get('EMBED_MODEL_DEVICE') or None
+# EMBED_MODEL_QUANTIZE=1 时对CPU上的模型做int8动态量化（Linear层），内存更小、编码更快，嵌入略有差异
+EMBED_MODEL_QUANTIZE = os.environ.get('EMBED_MODEL_QUANTIZE', '0') == '1'
+# 编码使用的线程数（torch.set_num_threads），0表示使用torch的默认值；多个pipeline worker时建议设为 CPU核数/worker数
+EMBED_MODEL_THREADS = int(os.environ.get('EMBED_MODEL_THREADS', '0'))
+
 
 class ModelLoader:
+    """
+    进程内的嵌入模型注册表，按模型路径缓存
+
+    模型在第一次get_model时才加载，不同路径的模型各自独立；unload显式释放。
+    同一路径的量化模型和原始模型嵌入不同，分别注册，模型标识（get_model_id）带 "@int8" 后缀，
+    嵌入缓存不会混用两者的向量。
+    """
     _instance = None
-    _model = None
-    
+    # 模型标识 -> 模型
+    _models: Dict[str, SentenceTransformer] = {}
+    # id(模型) -> 模型标识
+    _model_ids: Dict[int, str] = {}
+    _lock = threading.RLock()
+    _num_threads = None
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(ModelLoader, cls).__new__(cls)
         return cls._instance
-    
+
+    @staticmethod
+    def _model_key(model_path: str, quantize: bool) -> str:
+        return f"{model_path}@int8" if quantize else model_path
+
     @classmethod
-    def get_model(cls, model_path: Optional[str] = None) -> SentenceTransformer:
+    def get_model(cls, model_path: Optional[str] = None, device: Optional[str] = None,
+                  quantize: Optional[bool] = None) -> SentenceTransformer:
         """
-        Get the SentenceTransformer model instance. If it hasn't been loaded yet,
-        load it with the provided model path.
-        
+        Get the SentenceTransformer model for model_path, loading it on first use.
+
         Args:
-            model_path: Path to the model. If None, use default model.
-            
+            model_path: Path to the model. If None or empty, use the default model.
+            device: Device to load the model on. Defaults to EMBED_MODEL_DEVICE.
+            quantize: Apply int8 dynamic quantization (CPU only). Defaults to EMBED_MODEL_QUANTIZE.
+
         Returns:
             SentenceTransformer instance
         """
-        if cls._model is None:
-            if model_path:
-                cls._model = SentenceTransformer(model_path)
+        model_path = model_path or DEFAULT_MODEL
+        quantize = EMBED_MODEL_QUANTIZE if quantize is None else quantize
+        key = cls._model_key(model_path, quantize)
+        model = cls._models.get(key)
+        if model is None:
+            with cls._lock:
+                model = cls._models.get(key)
+                if model is None:
+                    model = cls._load(model_path, device or EMBED_MODEL_DEVICE, quantize)
+                    cls._models[key] = model
+                    # 无法量化时复用原始模型，模型标识保持为原始模型的路径
+                    cls._model_ids.setdefault(id(model), key)
+        return model
+
+    @classmethod
+    def _load(cls, model_path: str, device: Optional[str], quantize: bool) -> SentenceTransformer:
+        if EMBED_MODEL_THREADS > 0 and cls._num_threads is None:
+            cls.set_num_threads(EMBED_MODEL_THREADS)
+        if not quantize:
+            logger.info(f"Loading embedding model {model_path}")
+            return SentenceTransformer(model_path, device=device)
+
+        # 量化模型从原始模型复制得到，原始模型已加载时不必重新读取
+        model = cls._models.get(model_path) or SentenceTransformer(model_path, device=device)
+        if model.device.type != 'cpu':
+            logger.warning(f"int8 dynamic quantization only runs on CPU, keeping {model_path} on {model.device} in fp32")
+            cls._models.setdefault(model_path, model)
+            cls._model_ids.setdefault(id(model), model_path)
+            return model
+        import torch
+        logger.info(f"Loading embedding model {model_path} with int8 dynamic quantization")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    @classmethod
+    def set_num_threads(cls, num_threads: int) -> None:
+        """Set the number of CPU threads used by the encoders (process-wide, torch.set_num_threads)."""
+        import torch
+        torch.set_num_threads(num_threads)
+        cls._num_threads = num_threads
+
+    @classmethod
+    def unload(cls, model_path: Optional[str] = None, quantize: Optional[bool] = None) -> bool:
+        """
+        Drop a model from the registry so it can be garbage-collected. Objects that still
+        hold a reference (e.g. recommenders in utils.service_registry) keep it alive.
+
+        Args:
+            model_path: Path of the model to unload. If None, unload all models.
+            quantize: Which variant to unload; None unloads both the fp32 and the int8 model.
+
+        Returns:
+            True if any model was unloaded
+        """
+        with cls._lock:
+            if model_path is None:
+                keys = list(cls._models)
             else:
-                cls._model = SentenceTransformer("all-MiniLM-L6-v2")
-        return cls._model 
\ No newline at end of file
+                model_path = model_path or DEFAULT_MODEL
+                variants = [False, True] if quantize is None else [quantize]
+                keys = [cls._model_key(model_path, variant) for variant in variants]
+            unloaded = False
+            for key in keys:
+                model = cls._models.pop(key, None)
+                if model is not None:
+                    if all(other is not model for other in cls._models.values()):
+                        cls._model_ids.pop(id(model), None)
+                    unloaded = True
+        if unloaded:
+            try:
+                import torch
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+            except ImportError:
+                pass
+        return unloaded
+
+    @classmethod
+    def loaded_models(cls) -> List[str]:
+        """Identifiers of the currently loaded models."""
+        return list(cls._models)
+
+    @classmethod
+    def get_model_id(cls, model) -> Optional[str]:
+        """
+        Return the path/name the given model instance was loaded from ("@int8" appended for
+        quantized models), or None if it was not loaded through ModelLoader. Used to key cached embeddings.
+        """
+        if model is None:
+            return None
+        return cls._model_ids.get(id(model))
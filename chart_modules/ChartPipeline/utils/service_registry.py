@@ -0,0 +1,40 @@
+import threading
+from typing import Any, Callable, Hashable
+
+# 进程内共享的服务实例（模型、索引等），键通常包含构造参数
+_services = {}
+_lock = threading.RLock()
+
+
+def get_service(key: Hashable, factory: Callable[[], Any]) -> Any:
+    """
+    获取进程内共享的服务实例，不存在时调用factory创建
+
+    pipeline在worker初始化时预先创建这些实例，之后每个文件的处理直接复用，
+    不再重复读取FAISS索引和元数据。fork出的worker会继承父进程中已创建的实例。
+
+    Args:
+        key: 服务的键，构造参数不同的实例应使用不同的键
+        factory: 创建实例的函数
+
+    Returns:
+        服务实例
+    """
+    service = _services.get(key)
+    if service is None:
+        with _lock:
+            service = _services.get(key)
+            if service is None:
+                service = factory()
+                _services[key] = service
+    return service
+
+
+def has_service(key: Hashable) -> bool:
+    return key in _services
+
+
+def clear_services() -> None:
+    """清空所有服务实例（例如索引文件重建之后）"""
+    with _lock:
+        _services.clear()
@@ -17,6 +17,7 @@ import random
 #import fcntl
 import time
 import traceback
+from threading import Thread
 from pathlib import Path
 from bs4 import BeautifulSoup
 
@@ -25,13 +26,15 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'ChartPipeline'))
 print("sys.path:",sys.path)
 
 from chart_modules.ChartPipeline.modules.chart_engine.chart_engine import get_template_for_chart_name
-from chart_modules.ChartPipeline.modules.chart_engine.utils.paint_innerchart import render_chart_to_svg
+from chart_modules.ChartPipeline.modules.chart_engine.utils.paint_innerchart import render_chart_to_svg, render_charts_to_svg
 from chart_modules.ChartPipeline.modules.infographics_generator.svg_utils import extract_svg_content, adjust_and_get_bbox
 from chart_modules.ChartPipeline.modules.infographics_generator.template_utils import select_template
 from chart_modules.ChartPipeline.modules.infographics_generator.data_utils import process_temporal_data, process_numerical_data, deduplicate_combinations
 from chart_modules.ChartPipeline.modules.chart_engine.template.template_registry import get_template_for_chart_type, get_template_for_chart_name
 from chart_modules.reference_recognize.generate_color import generate_distinct_palette, rgb_to_hex
 
+logger = getLogger(__name__)
+
 padding = 50
 between_padding = 35
 
@@ -70,6 +73,88 @@ def make_infographic(data: Dict, chart_svg_content: str, output_dir: str, bg_col
     return output_dir
 
 
+def _prepare_variation(input: str, chart_template, main_colors = None, bg_color = None):
+    """
+    读取数据并选择模板，准备渲染所需的参数
+
+    Args:
+        input: 输入JSON文件路径
+        chart_template: 可以是字符串（模板路径）或列表 [模板路径, 字段列表]
+
+    Returns:
+        (data, render_kwargs)，模板不可用时返回None
+    """
+    print(f"[DEBUG generate_variation] input: {input}")
+    print(f"[DEBUG generate_variation] chart_template: {chart_template}")
+    print(f"[DEBUG generate_variation] main_colors: {main_colors}")
+    print(f"[DEBUG generate_variation] bg_color: {bg_color}")
+
+    # 处理 chart_template 格式
+    if isinstance(chart_template, list):
+        # 格式: [template_path, fields] 或 [[template_path, fields]]
+        if len(chart_template) >= 2 and isinstance(chart_template[1], list):
+            template_path = chart_template[0]
+            template_fields = chart_template[1]
+        else:
+            template_path = chart_template[0]
+            template_fields = []
+        template_for_select = [(template_path, template_fields)]
+    else:
+        # 字符串格式的模板路径
+        template_path = chart_template
+        template_for_select = [(template_path, [])]
+
+    print("chart_template:", chart_template)
+    print("template_for_select:", template_for_select)
+    # 读取输入文件
+    with open(input, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data["name"] = input
+
+    # 选择模板
+    engine, chart_type, chart_name, ordered_fields = select_template(template_for_select)
+
+    # 检查模板是否被过滤（在block_list中）
+    if engine is None or chart_name is None:
+        print(f"[跳过] 模板在block_list中，不生成: {chart_template}")
+        return None
+
+    # 颜色
+    # print(data["colors"])
+    data = generate_distinct_palette(data, main_colors, bg_color)
+    # print(data)
+    # 处理数据
+    for i, field in enumerate(ordered_fields):
+        data["data"]["columns"][i]["role"] = field
+    process_temporal_data(data)
+    process_numerical_data(data)
+    deduplicate_combinations(data)
+    
+    # 获取图表模板
+    print("chart_name:",chart_name)
+    engine_obj, template = get_template_for_chart_name(chart_name)
+    if engine_obj is None or template is None:
+        logger.error(f"Failed to load template: {engine}/{chart_type}/{chart_name}")
+        return None
+
+    if '-' in engine:
+        framework, framework_type = engine.split('-')
+    elif '_' in engine:
+        framework, framework_type = engine.split('_')
+    else:
+        framework = engine
+        framework_type = None
+
+    data["chart_type"] = chart_type
+    render_kwargs = {
+        'json_data': data,
+        'js_file': template,
+        'framework': framework,
+        'framework_type': framework_type
+    }
+    return data, render_kwargs
+
+
 def generate_variation(input: str, output: str, chart_template, main_colors = None, bg_color = None) -> bool:
     """
     Pipeline入口函数，处理单个文件的信息图生成
@@ -84,93 +169,16 @@ def generate_variation(input: str, output: str, chart_template, main_colors = No
     """
     try:
         print(f"[DEBUG generate_variation] 开始")
-        print(f"[DEBUG generate_variation] input: {input}")
         print(f"[DEBUG generate_variation] output: {output}")
-        print(f"[DEBUG generate_variation] chart_template: {chart_template}")
-        print(f"[DEBUG generate_variation] main_colors: {main_colors}")
-        print(f"[DEBUG generate_variation] bg_color: {bg_color}")
-
-        # 处理 chart_template 格式
-        if isinstance(chart_template, list):
-            # 格式: [template_path, fields] 或 [[template_path, fields]]
-            if len(chart_template) >= 2 and isinstance(chart_template[1], list):
-                template_path = chart_template[0]
-                template_fields = chart_template[1]
-            else:
-                template_path = chart_template[0]
-                template_fields = []
-            template_for_select = [(template_path, template_fields)]
-        else:
-            # 字符串格式的模板路径
-            template_path = chart_template
-            template_for_select = [(template_path, [])]
-
-        print("chart_template:", chart_template)
-        print("template_for_select:", template_for_select)
-        # 读取输入文件
-        with open(input, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        data["name"] = input
-
-        # 选择模板
-        engine, chart_type, chart_name, ordered_fields = select_template(template_for_select)
-
-        # 检查模板是否被过滤（在block_list中）
-        if engine is None or chart_name is None:
-            print(f"[跳过] 模板在block_list中，不生成: {chart_template}")
-            return False
-
-        # 颜色
-        # print(data["colors"])
-        data = generate_distinct_palette(data, main_colors, bg_color)
-        # print(data)
-        # 处理数据
-        process_data_start = time.time()
-        for i, field in enumerate(ordered_fields):
-            data["data"]["columns"][i]["role"] = field
-        process_temporal_data(data)
-        process_numerical_data(data)
-        deduplicate_combinations(data)
-        
-        # print("数据:",time.time())
-        
-        # 获取图表模板
-        get_template_start = time.time()
-        print("chart_name:",chart_name)
-        engine_obj, template = get_template_for_chart_name(chart_name)
-        if engine_obj is None or template is None:
-            logger.error(f"Failed to load template: {engine}/{chart_type}/{chart_name}")
+        prepared = _prepare_variation(input, chart_template, main_colors, bg_color)
+        if prepared is None:
             return False
-
-        # print("模板:",time.time())
-        
-        # 处理输出文件名，将路径分隔符替换为下划线
-        title_font_family = "Arial"
-        if "hand" in chart_name:
-            title_font_family = "Comics"
-        
-        if '-' in engine:
-            framework, framework_type = engine.split('-')
-        elif '_' in engine:
-            framework, framework_type = engine.split('_')
-        else:
-            framework = engine
-            framework_type = None
+        data, render_kwargs = prepared
 
         # print("开始渲染:",time.time())
-        _, chart_svg_content = render_chart_to_svg(
-            json_data=data,
-            js_file=template,
-            framework=framework,
-            framework_type=framework_type
-        )
+        _, chart_svg_content = render_chart_to_svg(**render_kwargs)
         chart_inner_content = extract_svg_content(chart_svg_content)
         
-        assemble_start = time.time()
-        data["chart_type"] = chart_type
-        
-        # print("渲染结束:",time.time())
-        
         print("bg_color:",bg_color)
         return make_infographic(
             data=data,
@@ -182,6 +190,57 @@ def generate_variation(input: str, output: str, chart_template, main_colors = No
     except Exception as e:
         print(f"Error processing infographics: {e} {traceback.format_exc()}")
         return False
+
+
+def generate_variations(jobs: List[Dict], main_colors = None, bg_color = None) -> List[bool]:
+    """
+    批量生成多个预览图，所有图表在同一批次中渲染，避免每个模板单独启动浏览器页面
+
+    Args:
+        jobs: 任务列表，每项为 {'input': 输入JSON路径, 'output': 输出SVG路径, 'chart_template': 模板}
+        main_colors: 主色列表
+        bg_color: 背景色
+
+    Returns:
+        与jobs一一对应的处理结果列表
+    """
+    results = [False] * len(jobs)
+    prepared_jobs = []
+    for index, job in enumerate(jobs):
+        try:
+            prepared = _prepare_variation(job['input'], job['chart_template'], main_colors, bg_color)
+        except Exception as e:
+            print(f"Error processing infographics: {e} {traceback.format_exc()}")
+            continue
+        if prepared is not None:
+            prepared_jobs.append((index, prepared))
+
+    svg_contents = render_charts_to_svg([render_kwargs for _, (_, render_kwargs) in prepared_jobs])
+
+    def assemble_task(index, data, chart_svg_content):
+        try:
+            chart_inner_content = extract_svg_content(chart_svg_content)
+            results[index] = bool(make_infographic(
+                data=data,
+                chart_svg_content=chart_inner_content,
+                output_dir=jobs[index]['output'],
+                bg_color=bg_color
+            ))
+        except Exception as e:
+            print(f"Error processing infographics: {e} {traceback.format_exc()}")
+
+    # 渲染完成后并行组装和截图
+    threads = []
+    for (index, (data, _)), chart_svg_content in zip(prepared_jobs, svg_contents):
+        if chart_svg_content is None:
+            print(f"[跳过] 图表渲染失败: {jobs[index]['chart_template']}")
+            continue
+        thread = Thread(target=assemble_task, args=(index, data, chart_svg_content))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return results
     
     
 
@@ -15,7 +15,7 @@ from chart_modules.layout_extraction import get_compatible_extraction
 from chart_modules.ChartGalaxy.example_based_generation.generate_infographic import InfographicImageGenerator
 from chart_modules.reference_recognize.extract_chart_type import extract_chart_type
 from chart_modules.reference_recognize.extract_main_color import extract_main_color
-from chart_modules.generate_variation import generate_variation
+from chart_modules.generate_variation import generate_variations
 from chart_modules.ChartPipeline.modules.infographics_generator.template_utils import block_list
 from chart_modules.reference_describe import get_reference_descriptions
 
@@ -263,7 +263,7 @@ def conduct_chart_type_preview_generation(chart_types_to_generate, generation_st
 
     # 存储生成的预览图信息，用于前端正确请求文件名
     chart_type_previews = {}
-    threads = []  # 保存所有线程
+    jobs = []  # 所有预览图在同一批次中渲染
 
     try:
         templates = generation_status.get('extraction_templates', [])
@@ -309,23 +309,18 @@ def conduct_chart_type_preview_generation(chart_types_to_generate, generation_st
                 }
 
                 # 生成预览图 - 传入完整的 template 信息 [path, fields]
-                thread = Thread(target=generate_variation, kwargs={
+                jobs.append({
                     'input': generation_status["selected_data"],
                     'output': output_path,
                     'chart_template': [template_path, template_fields],
-                    'main_colors': DEFAULT_COLORS,
-                    'bg_color': DEFAULT_BG_COLOR,
                 })
-                thread.start()
-                threads.append(thread)
-                print(f"[DEBUG] 启动线程生成 {variation_name}")
+                print(f"[DEBUG] 加入批量生成 {variation_name}")
             else:
                 print(f"[DEBUG] 没有找到匹配的 template for {chart_type}")
 
-        # 等待所有线程完成
-        for thread in threads:
-            thread.join()
-        print(f"[DEBUG] 所有预览图生成线程完成")
+        # 批量渲染所有预览图
+        generate_variations(jobs, main_colors=DEFAULT_COLORS, bg_color=DEFAULT_BG_COLOR)
+        print(f"[DEBUG] 所有预览图生成完成")
 
         # 保存预览图信息到 generation_status
         generation_status['chart_type_previews'] = chart_type_previews
@@ -349,7 +344,7 @@ def conduct_variation_preview_generation(variations_to_generate, generation_stat
     generation_status['progress'] = '生成图表样式预览...'
     generation_status['completed'] = False
 
-    threads = []  # 保存所有线程
+    jobs = []  # 所有预览图在同一批次中渲染
 
     try:
         for variation_info in variations_to_generate:
@@ -370,20 +365,15 @@ def conduct_variation_preview_generation(variations_to_generate, generation_stat
             print(f"[DEBUG]   template_fields: {template_fields}")
 
             # 生成预览图 - 传入完整的 template 信息 [path, fields]
-            thread = Thread(target=generate_variation, kwargs={
+            jobs.append({
                 'input': generation_status["selected_data"],
                 'output': output_svg,
                 'chart_template': [template_path, template_fields],
-                'main_colors': DEFAULT_COLORS,
-                'bg_color': DEFAULT_BG_COLOR,
             })
-            thread.start()
-            threads.append(thread)
 
-        # 等待所有线程完成
-        for thread in threads:
-            thread.join()
-        print(f"[DEBUG] 所有 variation 预览图生成线程完成")
+        # 批量渲染所有预览图
+        generate_variations(jobs, main_colors=DEFAULT_COLORS, bg_color=DEFAULT_BG_COLOR)
+        print(f"[DEBUG] 所有 variation 预览图生成完成")
 
         generation_status['status'] = 'completed'
         generation_status['completed'] = True